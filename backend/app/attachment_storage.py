@@ -1,16 +1,50 @@
-"""Serialize and parse conversation attachment payloads (vision images, text files)."""
+"""
+Serialize and parse conversation attachment payloads (vision images, text files).
+
+Image bytes live in the content-addressed blob store; ``file_contents`` keeps only each
+image's ``blob_key``. Rows written before that still carry inline ``base64_data`` and are
+returned as they are. Images generated by image models are offloaded the same way, and
+messages keep their blob URLs. While a comparison streams, before its conversation is
+saved, the user is sent signed blob URLs (``signed_blob_url``) that the attachment route
+serves without a conversation reference.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import io
 import json
-from typing import Any
+import logging
+import re
+import time
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import select
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+from .blob_store import LocalBlobStore, blob_store, is_blob_key
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Keys looked up per reference query when sweeping the blob store
+_SWEEP_BATCH_SIZE = 500
+
+_DATA_URL_RE = re.compile(r"^data:(image/[\w.+-]+);base64,", re.IGNORECASE)
+_BLOB_URL_RE = re.compile(r"/attachments/([0-9a-f]{64})$")
 
 
 def serialize_attached_images(attached_images: list[Any] | None) -> str | None:
-    """Build file_contents JSON from compare-stream attached_images."""
+    """Store compare-stream attached_images in the blob store; returns file_contents JSON."""
     if not attached_images:
         return None
-    items: list[dict[str, str]] = []
+    items: list[dict[str, Any]] = []
     for img in attached_images:
         if hasattr(img, "model_dump"):
             data = img.model_dump()
@@ -22,13 +56,19 @@ def serialize_attached_images(attached_images: list[Any] | None) -> str | None:
         if not b64:
             continue
         name = data.get("filename") or "image"
-        placeholder = data.get("placeholder") or f"[image: {name}]"
+        try:
+            raw = base64.b64decode(b64, validate=True)
+        except (binascii.Error, ValueError):
+            logger.warning(f"Attachment {name!r} is not valid base64; not stored")
+            continue
+        mime_type = data.get("mime_type") or "image/png"
         items.append(
             {
                 "name": name,
-                "placeholder": placeholder,
-                "mime_type": data.get("mime_type") or "image/png",
-                "base64_data": b64,
+                "placeholder": data.get("placeholder") or f"[image: {name}]",
+                "mime_type": mime_type,
+                "blob_key": blob_store.put(raw, mime_type),
+                "size": len(raw),
             }
         )
     if not items:
@@ -47,3 +87,138 @@ def parse_file_contents(raw: str | None) -> list[dict[str, Any]]:
     if not isinstance(parsed, list):
         return []
     return [item for item in parsed if isinstance(item, dict)]
+
+
+def attachment_blob_keys(raw: str | None) -> list[str]:
+    """Distinct blob keys referenced by a file_contents value, in order."""
+    keys: list[str] = []
+    for item in parse_file_contents(raw):
+        key = item.get("blob_key")
+        if isinstance(key, str) and is_blob_key(key) and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def blob_url(key: str) -> str:
+    return f"/api/attachments/{key}"
+
+
+def blob_url_signature(key: str, user_id: int) -> str:
+    """Signature letting ``user_id`` fetch blob ``key`` before any saved conversation refers to it."""
+    message = f"attachment:{user_id}:{key}".encode()
+    return hmac.new(settings.secret_key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_blob_url(url: str, user_id: int) -> str:
+    """``url`` with a ``sig`` for ``user_id`` if it is a blob URL; other URLs unchanged."""
+    match = _BLOB_URL_RE.search(url)
+    if not match:
+        return url
+    return f"{url}?sig={blob_url_signature(match.group(1), user_id)}"
+
+
+def blob_url_signature_valid(key: str, user_id: int, signature: str) -> bool:
+    return hmac.compare_digest(blob_url_signature(key, user_id), signature)
+
+
+def blob_url_keys(urls: list[Any]) -> list[str]:
+    """Distinct blob keys of the blob URLs among ``urls`` (others are skipped), in order."""
+    keys: list[str] = []
+    for url in urls:
+        match = _BLOB_URL_RE.search(url) if isinstance(url, str) else None
+        if match and match.group(1) not in keys:
+            keys.append(match.group(1))
+    return keys
+
+
+def make_thumbnail(data: bytes, max_px: int) -> bytes | None:
+    """WebP thumbnail of an image, at most ``max_px`` on its longer side; None if undecodable."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((max_px, max_px))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            out = io.BytesIO()
+            image.save(out, format="WEBP", quality=80)
+            return out.getvalue()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.warning(f"Generated image thumbnail failed: {e}")
+        return None
+
+
+def offload_generated_image(url: str) -> tuple[str, str | None]:
+    """
+    Move a generated ``data:`` image into the blob store.
+
+    Returns its blob URL and, if thumbnails are enabled, a thumbnail's blob URL. Other URLs
+    (and data URLs that do not decode) are returned unchanged, without a thumbnail.
+    Decodes, hashes and writes multi-megabyte images: call it off the event loop.
+    """
+    match = _DATA_URL_RE.match(url)
+    if not match:
+        return url, None
+    try:
+        raw = base64.b64decode(url[match.end() :], validate=True)
+    except (binascii.Error, ValueError):
+        return url, None
+    image_url = blob_url(blob_store.put(raw, match.group(1).lower()))
+    thumbnail_url = None
+    if settings.generated_image_thumbnail_px > 0:
+        thumbnail = make_thumbnail(raw, settings.generated_image_thumbnail_px)
+        if thumbnail is not None:
+            thumbnail_url = blob_url(blob_store.put(thumbnail, "image/webp"))
+    return image_url, thumbnail_url
+
+
+def collect_unreferenced_blobs(
+    db: Session, grace_seconds: float, store: LocalBlobStore | None = None
+) -> int:
+    """
+    Delete blobs no conversation refers to; returns how many were deleted.
+
+    Blobs younger than ``grace_seconds`` are kept: a comparison stores its images before
+    the write-behind queue commits the conversation that refers to them.
+    """
+    from .models import AttachmentBlobRef
+
+    store = store or blob_store
+    cutoff = time.time() - grace_seconds
+    candidates = [info.key for info in store.list_objects() if info.modified_at < cutoff]
+    deleted = 0
+    for start in range(0, len(candidates), _SWEEP_BATCH_SIZE):
+        batch = candidates[start : start + _SWEEP_BATCH_SIZE]
+        referenced = set(
+            db.scalars(
+                select(AttachmentBlobRef.blob_key)
+                .where(AttachmentBlobRef.blob_key.in_(batch))
+                .distinct()
+            )
+        )
+        for key in batch:
+            if key not in referenced:
+                store.delete_object(key)
+                deleted += 1
+    if deleted:
+        logger.info(f"Blob store: deleted {deleted} unreferenced blob(s)")
+    return deleted
+
+
+async def run_blob_collector(interval_seconds: float, grace_seconds: float) -> None:
+    """Sweep unreferenced blobs every ``interval_seconds`` for the lifetime of a worker."""
+    from .database import SessionLocal
+
+    def sweep() -> None:
+        db = SessionLocal()
+        try:
+            collect_unreferenced_blobs(db, grace_seconds)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception as e:
+            logger.warning(f"Blob store sweep failed: {e}")
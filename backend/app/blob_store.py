@@ -0,0 +1,146 @@
+"""
+Content-addressed blob store for conversation attachments.
+
+Blobs are keyed by the SHA-256 of their bytes, so an image attached to many conversations
+(breakouts, follow-ups that re-send it) is stored once. Conversations keep only the key;
+see ``attachment_storage`` for the references and the sweep that deletes blobs nothing
+refers to any more.
+
+The interface follows S3 object semantics (put/head/get/delete by key, inclusive byte
+ranges on get, listing) so an object-storage backend can stand in for ``LocalBlobStore``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+from .config import settings
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+
+def blob_key(data: bytes) -> str:
+    """Key of a blob: hex SHA-256 of its bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_blob_key(value: str) -> bool:
+    return bool(_KEY_RE.match(value))
+
+
+@dataclass(frozen=True)
+class BlobInfo:
+    """Object metadata, as returned by ``head_object`` and ``list_objects``."""
+
+    key: str
+    size: int
+    content_type: str
+    modified_at: float  # POSIX timestamp of the write
+
+
+class LocalBlobStore:
+    """
+    Blobs as files under ``root``, fanned out as ``ab/cd/<key>``.
+
+    Writes go to a temporary file renamed into place, so readers never see a partial
+    blob; the content type is kept in a ``<key>.json`` sidecar written first.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        if not is_blob_key(key):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return self.root / key[:2] / key[2:4] / key
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def put_object(self, key: str, data: bytes, content_type: str) -> bool:
+        """
+        Store a blob; returns False when it was already stored (nothing is written).
+
+        Storing an existing blob again refreshes its modification time, so the sweep's
+        grace period also covers a new reference to a blob that was about to be collected.
+        """
+        path = self._path(key)
+        if path.exists():
+            try:
+                os.utime(path)
+                return False
+            except FileNotFoundError:
+                pass  # Swept in the meantime: write it again
+        meta = json.dumps({"content_type": content_type or DEFAULT_CONTENT_TYPE})
+        self._write_atomic(path.with_name(f"{key}.json"), meta.encode("utf-8"))
+        self._write_atomic(path, data)
+        return True
+
+    def head_object(self, key: str) -> BlobInfo | None:
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        try:
+            meta = json.loads(path.with_name(f"{key}.json").read_text("utf-8"))
+            content_type = meta.get("content_type") or DEFAULT_CONTENT_TYPE
+        except (OSError, ValueError):
+            content_type = DEFAULT_CONTENT_TYPE
+        return BlobInfo(key, stat.st_size, content_type, stat.st_mtime)
+
+    def get_object(self, key: str, start: int = 0, end: int | None = None) -> bytes | None:
+        """Bytes ``start`` through ``end`` (inclusive; None: to the end), or None if missing."""
+        try:
+            with self._path(key).open("rb") as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(max(0, end - start + 1))
+        except FileNotFoundError:
+            return None
+
+    def delete_object(self, key: str) -> None:
+        path = self._path(key)
+        path.unlink(missing_ok=True)
+        path.with_name(f"{key}.json").unlink(missing_ok=True)
+
+    def list_objects(self) -> Iterator[BlobInfo]:
+        if not self.root.is_dir():
+            return
+        for path in self.root.glob("??/??/*"):
+            if is_blob_key(path.name):
+                info = self.head_object(path.name)
+                if info is not None:
+                    yield info
+
+    def put(self, data: bytes, content_type: str) -> str:
+        """Store ``data`` under its content key and return the key."""
+        key = blob_key(data)
+        self.put_object(key, data, content_type)
+        return key
+
+
+blob_store = LocalBlobStore(
+    Path(settings.blob_store_dir)
+    if settings.blob_store_dir
+    else Path(__file__).resolve().parent.parent / "data" / "blobs"
+)
@@ -6,11 +6,15 @@ rarely-changing data like AppSettings and model lists.
 """
 
 import logging
+import threading
+import time
 from collections.abc import Callable
 from datetime import datetime, timedelta
 from functools import wraps
 from typing import TypeVar
 
+from .config.settings import settings
+
 logger = logging.getLogger(__name__)
 
 T = TypeVar("T")
@@ -113,8 +117,6 @@ def cached(ttl_seconds: int = 300, key_prefix: str = ""):
 
 # Cache key constants
 CACHE_KEY_APP_SETTINGS = "app_settings:single"
-CACHE_KEY_MODELS = "models:all"
-CACHE_KEY_USER_PREFIX = "user:"
 
 
 def get_cached_app_settings(getter_func: Callable[[], T]) -> T | None:
@@ -146,47 +148,76 @@ def invalidate_app_settings_cache() -> None:
     logger.info("AppSettings cache invalidated")
 
 
-def get_cached_models(getter_func: Callable[[], T]) -> T:
+def invalidate_models_cache() -> None:
     """
-    Get models list from cache or call getter function.
+    Invalidate the precomputed /models responses.
 
-    Args:
-        getter_func: Function that returns models list
-
-    Returns:
-        Models list (cached for 1 hour since it's static)
+    Call this after adding or deleting models to ensure fresh data is returned.
     """
-    from app.llm.registry import get_registry_path
-
-    registry_path = get_registry_path()
-    try:
-        current_mtime_ns = registry_path.stat().st_mtime_ns
-    except OSError:
-        current_mtime_ns = None
-
-    cached_value = cache.get(CACHE_KEY_MODELS)
-    if cached_value is not None:
-        if isinstance(cached_value, tuple) and len(cached_value) == 2:
-            data, cached_mtime_ns = cached_value
-            if cached_mtime_ns == current_mtime_ns:
-                return data
-        else:
-            # Legacy: cached payload without mtime — drop so registry edits take effect
-            cache.delete(CACHE_KEY_MODELS)
+    from app.services.model_catalog import model_catalog
 
-    models = getter_func()
-    cache.set(CACHE_KEY_MODELS, (models, current_mtime_ns), ttl_seconds=3600)
-    return models
+    model_catalog.invalidate()
+    logger.info("Models cache invalidated")
 
 
-def invalidate_models_cache() -> None:
+class UserSnapshotCache:
     """
-    Invalidate the models cache.
+    Per-worker cache of detached User rows, so authenticating a request needs no query.
 
-    Call this after adding or deleting models to ensure fresh data is returned.
+    Entries are version-stamped: ``invalidate`` (run when a user row is updated or deleted)
+    bumps the user's version, and ``put`` refuses a row whose load began before the latest
+    bump, so a load racing with an update cannot cache the old row. Other workers' updates
+    are only seen once the entry expires, hence the short TTL.
     """
-    cache.delete(CACHE_KEY_MODELS)
-    logger.info("Models cache invalidated")
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: dict[int, tuple[object, int, float]] = {}  # id -> (user, version, expiry)
+        self._versions: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_id: int) -> int:
+        """Stamp to take before loading a user, and to hand to ``put`` with the row."""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def get(self, user_id: int) -> object | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, version, expiry = entry
+            if time.monotonic() > expiry or version != self._versions.get(user_id, 0):
+                del self._entries[user_id]
+                return None
+            return user
+
+    def put(self, user_id: int, user: object, version: int) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if version != self._versions.get(user_id, 0):
+                return
+            self._entries.pop(user_id, None)
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[user_id] = (user, version, time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+        logger.debug(f"User cache invalidated for user_id={user_id}")
+
+    def clear(self) -> None:
+        with self._lock:
+            for user_id in self._entries:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.clear()
+
+
+user_cache = UserSnapshotCache(ttl_seconds=settings.user_cache_ttl_seconds)
 
 
 def get_cached_user(user_id: int, getter_func: Callable[[int], T | None]) -> T | None:
@@ -195,28 +226,26 @@ def get_cached_user(user_id: int, getter_func: Callable[[int], T | None]) -> T |
 
     Args:
         user_id: User ID
-        getter_func: Function that takes user_id and returns User from database
+        getter_func: Function that takes user_id and returns a User detached from its session
 
     Returns:
         User or None
 
-    Note: User cache has short TTL (1 minute) since user data can change.
+    Note: Entries live for settings.user_cache_ttl_seconds and are dropped whenever the
+    user row is updated (see ``UserSnapshotCache``).
     """
-    cache_key = f"{CACHE_KEY_USER_PREFIX}{user_id}"
-    cached_value = cache.get(cache_key)
+    cached_value = user_cache.get(user_id)
     if cached_value is not None:
         return cached_value
 
-    # Get from database and cache for 1 minute
+    version = user_cache.version(user_id)
     user = getter_func(user_id)
     if user is not None:
-        cache.set(cache_key, user, ttl_seconds=60)
+        user_cache.put(user_id, user, version)
 
     return user
 
 
 def invalidate_user_cache(user_id: int) -> None:
-    """Invalidate user cache (call after user updates)."""
-    cache_key = f"{CACHE_KEY_USER_PREFIX}{user_id}"
-    cache.delete(cache_key)
-    logger.debug(f"User cache invalidated for user_id={user_id}")
+    """Invalidate user cache (call after user updates made outside the ORM)."""
+    user_cache.invalidate(user_id)
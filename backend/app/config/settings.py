@@ -82,6 +82,18 @@ class Settings(BaseSettings):
     # User-facing message displays "1 minute" for cleaner UX.
     model_inactivity_timeout: int = 55
 
+    # OpenRouter connection pool (shared by all models in a worker; one pool per event loop
+    # for async calls). Every request goes to openrouter.ai, so max_connections is also the
+    # per-host cap. HTTP/2 is only used when the optional h2 package is installed.
+    openrouter_max_connections: int = 100
+    openrouter_max_keepalive_connections: int = 20
+    openrouter_keepalive_expiry: float = 30.0
+    openrouter_http2: bool = True
+
+    # Comparison SSE stream: text chunks arriving within this window (milliseconds) are
+    # merged into one frame per model. 0 only merges chunks that are already queued.
+    sse_coalesce_window_ms: int = 5
+
     # Search Rate Limiter Configuration
     # These settings control rate limiting for search API requests across all providers
     # Can be overridden via environment variables for provider-specific tuning
@@ -103,6 +115,45 @@ class Settings(BaseSettings):
     search_cache_enabled: bool = True  # Enable request deduplication/caching
     search_cache_ttl_seconds: int = 300  # Cache results for 5 minutes
 
+    # fetch_url tool page cache (shared by all models and requests in a worker)
+    fetch_url_cache_size: int = 256  # Max cached pages (LRU)
+    fetch_url_cache_ttl_seconds: int = 600  # Fresh for 10 minutes, then revalidated
+    fetch_url_max_bytes: int = 2_000_000  # Stop downloading a page after this many bytes
+
+    # Token-count memo (per worker): counts keyed by tokenizer and content hash
+    token_count_cache_size: int = 4096  # Max cached counts (LRU)
+    # HuggingFace tokenizer files persist here across restarts (default: data/tokenizer_cache)
+    tokenizer_cache_dir: str | None = None
+    tokenizer_prewarm: bool = True  # Start loading registry models' tokenizers at startup
+
+    # Model token limits: served from the bundled openrouter_models.json snapshot at once,
+    # then refreshed from OpenRouter in the background (never on a request path)
+    token_limits_refresh_interval_seconds: int = 3600  # 0 disables the background refresh
+    token_limits_retry_seconds: int = 60  # Retry delay after a failed refresh
+
+    # Post-stream bookkeeping (usage log, conversation history) is written behind the stream:
+    # writes from many comparisons share one transaction, flushed at most this long
+    # (milliseconds) after the first of them was queued
+    write_behind_max_delay_ms: int = 200
+    write_behind_max_batch: int = 100  # Writes per transaction
+    write_behind_max_attempts: int = 3  # Tries of a batch hitting a transient database error
+
+    # Conversation attachments are kept in a content-addressed blob store (default: data/blobs)
+    blob_store_dir: str | None = None
+    # Blobs no conversation refers to are deleted by a periodic sweep; 0 disables it
+    blob_gc_interval_seconds: int = 3600
+    blob_gc_grace_seconds: int = 3600  # Never delete blobs younger than this (save in flight)
+    # Signed-in users' generated images are streamed and saved as blob URLs, with a WebP
+    # thumbnail at most this many pixels on its longer side; 0 disables thumbnails
+    generated_image_thumbnail_px: int = 256
+
+    # Authenticated users are served from a per-worker snapshot of their row, dropped when the
+    # row changes in this worker; other workers' changes show once it expires. 0 disables it
+    user_cache_ttl_seconds: int = 30
+    # last_access updates are coalesced per user and written every this many seconds
+    # (0: queued on each request that records one)
+    last_access_flush_interval_seconds: int = 30
+
     # Redis configuration for distributed rate limiting (optional)
     redis_url: str | None = None  # e.g., "redis://localhost:6379/0"
     redis_enabled: bool = False  # Set to True to enable Redis-based distributed rate limiting
@@ -0,0 +1,342 @@
+"""
+Daily credit balances of unregistered users, shared by all workers.
+
+Each ``ip:`` / ``fp:`` identifier has one balance: credits used on its current local day.
+With Redis configured, a balance is a hash updated by a Lua script that rolls the day over
+and applies the charge in one atomic step, so every Gunicorn worker sees and enforces the
+same numbers. Without Redis, or while it is unreachable, a process-local ledger with the
+same rules is used.
+
+A reservation is admitted and applied in one such step: it is refused, leaving the balance
+untouched, when it would take the balance past the cap, so concurrent requests cannot all
+pass a check that only one of them fits. Plain charges (settling a reservation, refunds as
+negative charges) are clamped to 0..cap instead.
+
+Day rollover rules (both backends):
+- A balance restarts at 0 when its local date is not today, unless it already restarted
+  within the last 20 hours (changing the timezone must not buy a second daily allowance).
+- A timezone change is only accepted when such a restart would be allowed.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+try:
+    import redis
+
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+from .config.settings import settings
+from .type_defs import AnonymousRateLimitData
+
+logger = logging.getLogger(__name__)
+
+MIN_SECONDS_BETWEEN_RESETS = 20 * 3600
+
+# Idle balances expire; a balance that is gone restarts at 0 like any new day
+_REDIS_KEY_TTL_SECONDS = 2 * 24 * 3600
+_REDIS_KEY_PREFIX = "anon_credits:"
+
+
+class LedgerEntry(NamedTuple):
+    """One identifier's balance after a ledger operation."""
+
+    count: int  # credits used on ``date``
+    date: str  # local date (YYYY-MM-DD) of the balance
+    timezone: str
+    started: bool  # the day's balance was started by this call (new identifier or new day)
+    allowed: bool = True  # False when a reservation was refused
+
+
+def _default_rate_limit_data() -> AnonymousRateLimitData:
+    """Default factory for the local ledger's records."""
+    return {"count": 0, "date": "", "first_seen": None, "timezone": "UTC", "last_reset_at": None}
+
+
+class LocalCreditLedger:
+    """Process-local balances; authoritative only when there is a single worker."""
+
+    def __init__(self) -> None:
+        self.records: dict[str, AnonymousRateLimitData] = defaultdict(_default_rate_limit_data)
+        self._lock = threading.Lock()
+
+    def charge(
+        self, identifier: str, timezone_str: str, today: str, credits: int, cap: int
+    ) -> LedgerEntry:
+        """Roll the balance over to ``today`` if due, then add ``credits`` (kept in 0..cap)."""
+        return self._apply(identifier, timezone_str, today, credits, cap, reserve=False)
+
+    def reserve(
+        self, identifier: str, timezone_str: str, today: str, credits: int, cap: int
+    ) -> LedgerEntry:
+        """Roll the balance over to ``today`` if due, then add ``credits`` unless that
+        would exceed ``cap``."""
+        return self._apply(identifier, timezone_str, today, credits, cap, reserve=True)
+
+    def _apply(
+        self,
+        identifier: str,
+        timezone_str: str,
+        today: str,
+        credits: int,
+        cap: int,
+        reserve: bool,
+    ) -> LedgerEntry:
+        now = datetime.now(UTC)
+        with self._lock:
+            record = self.records[identifier]
+            last_reset_at = record.get("last_reset_at")
+            can_reset = (
+                last_reset_at is None
+                or (now - last_reset_at).total_seconds() >= MIN_SECONDS_BETWEEN_RESETS
+            )
+            started = False
+            if not record.get("timezone") or record.get("timezone") == timezone_str or can_reset:
+                record["timezone"] = timezone_str
+                if record.get("date") != today and can_reset:
+                    record["count"] = 0
+                    record["date"] = today
+                    record["last_reset_at"] = now
+                    started = True
+            if not record.get("first_seen"):
+                record["first_seen"] = now
+            count = record.get("count", 0) + credits
+            allowed = not reserve or count <= cap
+            if allowed:
+                record["count"] = max(0, min(count, cap))
+            return LedgerEntry(
+                record["count"], record["date"] or "", record["timezone"], started, allowed
+            )
+
+    def seed(self, identifier: str, date: str, count: int, cap: int) -> int:
+        """Raise the balance for ``date`` to at least ``count``; returns the balance."""
+        with self._lock:
+            record = self.records[identifier]
+            if record.get("date") == date:
+                record["count"] = max(record.get("count", 0), min(count, cap))
+            return record.get("count", 0)
+
+    def balances(self) -> dict[str, int]:
+        with self._lock:
+            return {key: record.get("count", 0) for key, record in self.records.items()}
+
+    def zero_all(self, today: str) -> list[str]:
+        """Give every tracked identifier its full allowance back; returns the identifiers."""
+        now = datetime.now(UTC)
+        with self._lock:
+            for record in self.records.values():
+                record["count"] = 0
+                record["date"] = today
+                record["last_reset_at"] = now
+            return list(self.records)
+
+    def delete(self, *identifiers: str) -> None:
+        with self._lock:
+            for identifier in identifiers:
+                self.records.pop(identifier, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+
+class RedisCreditLedger:
+    """Balances in Redis, with the local ledger standing in while Redis is unreachable."""
+
+    # KEYS[1] balance hash; ARGV: timezone, today, now (epoch s), min seconds between
+    # resets, credits to add, cap, key TTL, reserve (1: refuse to exceed the cap, 0: clamp
+    # to 0..cap). Returns {count, date, timezone, started, allowed}.
+    CHARGE_SCRIPT = """
+    local key = KEYS[1]
+    local now = tonumber(ARGV[3])
+    local record = redis.call('HMGET', key, 'count', 'date', 'tz', 'last_reset')
+    local count = tonumber(record[1]) or 0
+    local date = record[2] or ''
+    local tz = record[3]
+    local last_reset = tonumber(record[4])
+    local can_reset = (last_reset == nil) or (now - last_reset >= tonumber(ARGV[4]))
+    local started = 0
+
+    if (not tz) or tz == ARGV[1] or can_reset then
+        tz = ARGV[1]
+        if date ~= ARGV[2] and can_reset then
+            count = 0
+            date = ARGV[2]
+            started = 1
+            redis.call('HSET', key, 'last_reset', ARGV[3])
+        end
+    end
+
+    local charged = count + tonumber(ARGV[5])
+    local cap = tonumber(ARGV[6])
+    local allowed = 1
+    if ARGV[8] == '1' and charged > cap then
+        allowed = 0
+    else
+        count = math.max(0, math.min(charged, cap))
+    end
+    redis.call('HSET', key, 'count', count, 'date', date, 'tz', tz)
+    redis.call('EXPIRE', key, tonumber(ARGV[7]))
+    return {count, date, tz, started, allowed}
+    """
+
+    # KEYS[1] balance hash; ARGV: date, count, cap. Returns the balance.
+    SEED_SCRIPT = """
+    local count = tonumber(redis.call('HGET', KEYS[1], 'count')) or 0
+    if redis.call('HGET', KEYS[1], 'date') == ARGV[1] then
+        count = math.max(count, math.min(tonumber(ARGV[2]), tonumber(ARGV[3])))
+        redis.call('HSET', KEYS[1], 'count', count)
+    end
+    return count
+    """
+
+    def __init__(self, redis_url: str, fallback: LocalCreditLedger):
+        self.redis = redis.Redis.from_url(
+            redis_url, socket_connect_timeout=2, socket_timeout=2, decode_responses=True
+        )
+        self.fallback = fallback
+        self._charge = self.redis.register_script(self.CHARGE_SCRIPT)
+        self._seed = self.redis.register_script(self.SEED_SCRIPT)
+        self._failing = False
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        if not self._failing:
+            logger.warning(f"Credit ledger: Redis {operation} failed ({error}); using local ledger")
+        self._failing = True
+
+    def _recovered(self) -> None:
+        if self._failing:
+            logger.info("Credit ledger: Redis reachable again")
+        self._failing = False
+
+    @staticmethod
+    def _key(identifier: str) -> str:
+        return _REDIS_KEY_PREFIX + identifier
+
+    def _identifiers(self) -> list[str]:
+        return [
+            key[len(_REDIS_KEY_PREFIX) :]
+            for key in self.redis.scan_iter(match=_REDIS_KEY_PREFIX + "*", count=500)
+        ]
+
+    def charge(
+        self, identifier: str, timezone_str: str, today: str, credits: int, cap: int
+    ) -> LedgerEntry:
+        """Roll the balance over to ``today`` if due, then add ``credits`` (kept in 0..cap)."""
+        return self._apply(identifier, timezone_str, today, credits, cap, reserve=False)
+
+    def reserve(
+        self, identifier: str, timezone_str: str, today: str, credits: int, cap: int
+    ) -> LedgerEntry:
+        """Roll the balance over to ``today`` if due, then add ``credits`` unless that
+        would exceed ``cap``."""
+        return self._apply(identifier, timezone_str, today, credits, cap, reserve=True)
+
+    def _apply(
+        self,
+        identifier: str,
+        timezone_str: str,
+        today: str,
+        credits: int,
+        cap: int,
+        reserve: bool,
+    ) -> LedgerEntry:
+        try:
+            count, date, tz, started, allowed = self._charge(
+                keys=[self._key(identifier)],
+                args=[
+                    timezone_str,
+                    today,
+                    datetime.now(UTC).timestamp(),
+                    MIN_SECONDS_BETWEEN_RESETS,
+                    credits,
+                    cap,
+                    _REDIS_KEY_TTL_SECONDS,
+                    1 if reserve else 0,
+                ],
+            )
+        except redis.RedisError as e:
+            self._failed("charge", e)
+            return self.fallback._apply(identifier, timezone_str, today, credits, cap, reserve)
+        self._recovered()
+        return LedgerEntry(int(count), date, tz, bool(started), bool(allowed))
+
+    def seed(self, identifier: str, date: str, count: int, cap: int) -> int:
+        """Raise the balance for ``date`` to at least ``count``; returns the balance."""
+        try:
+            return int(self._seed(keys=[self._key(identifier)], args=[date, count, cap]))
+        except redis.RedisError as e:
+            self._failed("seed", e)
+            return self.fallback.seed(identifier, date, count, cap)
+
+    def balances(self) -> dict[str, int]:
+        try:
+            identifiers = self._identifiers()
+            pipe = self.redis.pipeline(transaction=False)
+            for identifier in identifiers:
+                pipe.hget(self._key(identifier), "count")
+            counts = pipe.execute()
+        except redis.RedisError as e:
+            self._failed("scan", e)
+            return self.fallback.balances()
+        return {i: int(c or 0) for i, c in zip(identifiers, counts, strict=True)}
+
+    def zero_all(self, today: str) -> list[str]:
+        """Give every tracked identifier its full allowance back; returns the identifiers."""
+        reset = self.fallback.zero_all(today)
+        try:
+            identifiers = self._identifiers()
+            now = datetime.now(UTC).timestamp()
+            pipe = self.redis.pipeline(transaction=False)
+            for identifier in identifiers:
+                pipe.hset(
+                    self._key(identifier), mapping={"count": 0, "date": today, "last_reset": now}
+                )
+            pipe.execute()
+        except redis.RedisError as e:
+            self._failed("reset", e)
+            return reset
+        return sorted(set(reset) | set(identifiers))
+
+    def delete(self, *identifiers: str) -> None:
+        self.fallback.delete(*identifiers)
+        if not identifiers:
+            return
+        try:
+            self.redis.delete(*(self._key(i) for i in identifiers))
+        except redis.RedisError as e:
+            self._failed("delete", e)
+
+    def clear(self) -> None:
+        self.fallback.clear()
+        try:
+            keys = list(self.redis.scan_iter(match=_REDIS_KEY_PREFIX + "*", count=500))
+            if keys:
+                self.redis.delete(*keys)
+        except redis.RedisError as e:
+            self._failed("clear", e)
+
+
+def _create_ledger(local: LocalCreditLedger) -> LocalCreditLedger | RedisCreditLedger:
+    if settings.redis_enabled and settings.redis_url:
+        if not REDIS_AVAILABLE:
+            logger.warning("Credit ledger: redis package not installed; using local ledger")
+            return local
+        try:
+            ledger = RedisCreditLedger(settings.redis_url, fallback=local)
+        except Exception as e:
+            logger.warning(f"Credit ledger: Redis client creation failed ({e}); using local ledger")
+            return local
+        logger.info("Credit ledger: Redis (shared by all workers)")
+        return ledger
+    return local
+
+
+local_credit_ledger = LocalCreditLedger()
+anonymous_credit_ledger: LocalCreditLedger | RedisCreditLedger = _create_ledger(local_credit_ledger)
@@ -4,22 +4,370 @@ Data retention and cleanup utilities for UsageLog entries.
 This module provides functions to aggregate old UsageLog entries into monthly
 summaries and delete detailed entries older than a specified retention period.
 This helps manage database growth while preserving aggregated data for analysis.
+
+Old entries are processed in keyset batches of a fixed number of entries, each ending
+at the batch_size-th old id after the previous batch, so gaps in the ids never produce
+empty or oversized batches. Each batch is aggregated with a
+server-side GROUP BY, merged into the monthly summaries and deleted in one short
+transaction, so memory and lock time stay flat however large the table is, and an
+interrupted cleanup simply resumes with the entries that are still there.
 """
 
 import json
 from collections import defaultdict
+from collections.abc import Iterator
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
 from typing import Any
 
-from sqlalchemy import and_
+from sqlalchemy import and_, extract, func
 from sqlalchemy.orm import Session
 
-from .models import UsageLog, UsageLogMonthlyAggregate
+from .models import AnonymousUsageRollup, UsageLog, UsageLogMonthlyAggregate
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _empty_month_stats() -> dict[str, Any]:
+    return {
+        "total_comparisons": 0,
+        "total_models_requested": 0,
+        "total_models_successful": 0,
+        "total_models_failed": 0,
+        "total_input_tokens": 0,
+        "total_output_tokens": 0,
+        "total_effective_tokens": 0,
+        "total_credits_used": Decimal(0),
+        "total_actual_cost": Decimal(0),
+        "total_estimated_cost": Decimal(0),
+        "model_breakdown": defaultdict(
+            lambda: {
+                "count": 0,
+                "total_input": 0,
+                "total_output": 0,
+                "total_credits": Decimal(0),
+            }
+        ),
+    }
+
+
+def _aggregate_batch(
+    db: Session, after_id: int, upper_id: int, cutoff_date: datetime
+) -> dict[tuple[int, int], dict[str, Any]]:
+    """
+    Monthly statistics of the old entries with ``after_id < id <= upper_id``.
+
+    Grouping also by ``models_used`` (few distinct combinations) lets the per-model
+    breakdown be built from the grouped rows without reading individual entries.
+    """
+    year = extract("year", UsageLog.created_at)
+    month = extract("month", UsageLog.created_at)
+    rows = (
+        db.query(
+            year,
+            month,
+            UsageLog.models_used,
+            func.count(UsageLog.id),
+            func.sum(UsageLog.models_requested),
+            func.sum(UsageLog.models_successful),
+            func.sum(UsageLog.models_failed),
+            func.sum(UsageLog.input_tokens),
+            func.sum(UsageLog.output_tokens),
+            func.sum(UsageLog.effective_tokens),
+            func.sum(UsageLog.credits_used),
+            func.sum(UsageLog.actual_cost),
+            func.sum(UsageLog.estimated_cost),
+        )
+        .filter(
+            UsageLog.id > after_id,
+            UsageLog.id <= upper_id,
+            UsageLog.created_at < cutoff_date,
+        )
+        .group_by(year, month, UsageLog.models_used)
+    )
+
+    monthly: dict[tuple[int, int], dict[str, Any]] = defaultdict(_empty_month_stats)
+    for (
+        row_year,
+        row_month,
+        models_used,
+        comparisons,
+        models_requested,
+        models_successful,
+        models_failed,
+        input_tokens,
+        output_tokens,
+        effective_tokens,
+        credits_used,
+        actual_cost,
+        estimated_cost,
+    ) in rows:
+        stats = monthly[(int(row_year), int(row_month))]
+        stats["total_comparisons"] += comparisons
+        stats["total_models_requested"] += models_requested or 0
+        stats["total_models_successful"] += models_successful or 0
+        stats["total_models_failed"] += models_failed or 0
+        stats["total_input_tokens"] += input_tokens or 0
+        stats["total_output_tokens"] += output_tokens or 0
+        stats["total_effective_tokens"] += effective_tokens or 0
+        stats["total_credits_used"] += Decimal(credits_used or 0)
+        stats["total_actual_cost"] += Decimal(actual_cost or 0)
+        stats["total_estimated_cost"] += Decimal(estimated_cost or 0)
+
+        # Model breakdown - parse models_used JSON once per distinct combination
+        if models_used:
+            try:
+                models = json.loads(models_used)
+                if isinstance(models, list):
+                    for model_id in models:
+                        model_stats = stats["model_breakdown"][model_id]
+                        model_stats["count"] += comparisons
+                        model_stats["total_input"] += input_tokens or 0
+                        model_stats["total_output"] += output_tokens or 0
+                        model_stats["total_credits"] += Decimal(credits_used or 0)
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                # Skip invalid JSON or non-list models_used
+                pass
+    return monthly
+
+
+def _merge_month(db: Session, year: int, month: int, stats: dict[str, Any]) -> bool:
+    """Add one month's statistics to its aggregate; returns True if it was created."""
+    total_comparisons = stats["total_comparisons"]
+
+    # Convert model breakdown to JSON
+    model_breakdown_json = {}
+    for model_id, model_stats in stats["model_breakdown"].items():
+        if model_stats["count"] > 0:
+            model_breakdown_json[model_id] = {
+                "count": model_stats["count"],
+                "avg_input_tokens": float(model_stats["total_input"] / model_stats["count"]),
+                "avg_output_tokens": float(model_stats["total_output"] / model_stats["count"]),
+                "total_credits": float(model_stats["total_credits"]),
+            }
+
+    # Check if aggregate already exists
+    existing = (
+        db.query(UsageLogMonthlyAggregate)
+        .filter(
+            and_(
+                UsageLogMonthlyAggregate.year == year,
+                UsageLogMonthlyAggregate.month == month,
+            )
+        )
+        .first()
+    )
+
+    if existing:
+        # Update existing aggregate (merge with existing data)
+        existing.total_comparisons += stats["total_comparisons"]
+        existing.total_models_requested += stats["total_models_requested"]
+        existing.total_models_successful += stats["total_models_successful"]
+        existing.total_models_failed += stats["total_models_failed"]
+        existing.total_input_tokens += stats["total_input_tokens"]
+        existing.total_output_tokens += stats["total_output_tokens"]
+        existing.total_effective_tokens += stats["total_effective_tokens"]
+        existing.total_credits_used += stats["total_credits_used"]
+        existing.total_actual_cost += stats["total_actual_cost"]
+        existing.total_estimated_cost += stats["total_estimated_cost"]
+
+        # Recalculate averages
+        existing.avg_input_tokens = (
+            Decimal(existing.total_input_tokens) / existing.total_comparisons
+            if existing.total_comparisons > 0
+            else Decimal(0)
+        )
+        existing.avg_output_tokens = (
+            Decimal(existing.total_output_tokens) / existing.total_comparisons
+            if existing.total_comparisons > 0
+            else Decimal(0)
+        )
+        existing.avg_output_ratio = (
+            existing.avg_output_tokens / existing.avg_input_tokens
+            if existing.avg_input_tokens > 0
+            else Decimal(0)
+        )
+        existing.avg_credits_per_comparison = (
+            existing.total_credits_used / existing.total_comparisons
+            if existing.total_comparisons > 0
+            else Decimal(0)
+        )
+
+        # Merge model breakdowns
+        existing_breakdown = (
+            json.loads(existing.model_breakdown) if existing.model_breakdown else {}
+        )
+        for model_id, model_stats in model_breakdown_json.items():
+            if model_id in existing_breakdown:
+                existing_breakdown[model_id]["count"] += model_stats["count"]
+                existing_breakdown[model_id]["total_credits"] += model_stats["total_credits"]
+                # Recalculate averages
+                existing_breakdown[model_id]["avg_input_tokens"] = (
+                    existing_breakdown[model_id]["avg_input_tokens"]
+                    * (existing_breakdown[model_id]["count"] - model_stats["count"])
+                    + model_stats["avg_input_tokens"] * model_stats["count"]
+                ) / existing_breakdown[model_id]["count"]
+                existing_breakdown[model_id]["avg_output_tokens"] = (
+                    existing_breakdown[model_id]["avg_output_tokens"]
+                    * (existing_breakdown[model_id]["count"] - model_stats["count"])
+                    + model_stats["avg_output_tokens"] * model_stats["count"]
+                ) / existing_breakdown[model_id]["count"]
+            else:
+                existing_breakdown[model_id] = model_stats
+        existing.model_breakdown = json.dumps(existing_breakdown)
+        return False
+
+    # Calculate averages
+    avg_input = Decimal(stats["total_input_tokens"]) / total_comparisons
+    avg_output = Decimal(stats["total_output_tokens"]) / total_comparisons
+    avg_output_ratio = avg_output / avg_input if avg_input > 0 else Decimal(0)
+    avg_credits = stats["total_credits_used"] / total_comparisons
+
+    db.add(
+        UsageLogMonthlyAggregate(
+            year=year,
+            month=month,
+            total_comparisons=stats["total_comparisons"],
+            total_models_requested=stats["total_models_requested"],
+            total_models_successful=stats["total_models_successful"],
+            total_models_failed=stats["total_models_failed"],
+            total_input_tokens=stats["total_input_tokens"],
+            total_output_tokens=stats["total_output_tokens"],
+            total_effective_tokens=stats["total_effective_tokens"],
+            avg_input_tokens=avg_input,
+            avg_output_tokens=avg_output,
+            avg_output_ratio=avg_output_ratio,
+            total_credits_used=stats["total_credits_used"],
+            avg_credits_per_comparison=avg_credits,
+            total_actual_cost=stats["total_actual_cost"],
+            total_estimated_cost=stats["total_estimated_cost"],
+            model_breakdown=json.dumps(model_breakdown_json) if model_breakdown_json else None,
+        )
+    )
+    # Flush so the next batch of the same month finds this aggregate
+    db.flush()
+    return True
+
+
+def iter_usage_log_cleanup(
+    db: Session, keep_days: int = 90, batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[dict[str, Any]]:
+    """
+    Aggregate and delete UsageLog entries older than keep_days, one keyset batch at a time.
+
+    Each batch (the next ``batch_size`` old entries by id, however sparse the ids) is
+    aggregated into the monthly summaries and deleted in its own transaction. Safe to interrupt and run again: a batch either
+    commits completely or not at all.
+
+    Args:
+        db: Database session
+        keep_days: Number of days of detailed data to keep
+        batch_size: Old entries per batch
+
+    Yields:
+        A progress dictionary (status "running") after every committed batch, then the
+        final result (status "success" or "no_data", same keys as cleanup_old_usage_logs)
+    """
+    cutoff_date = datetime.now(UTC) - timedelta(days=keep_days)
+    first_id, max_id = (
+        db.query(func.min(UsageLog.id), func.max(UsageLog.id))
+        .filter(UsageLog.created_at < cutoff_date)
+        .one()
+    )
+
+    progress: dict[str, Any] = {
+        "status": "running",
+        "cutoff_date": cutoff_date.isoformat(),
+        "batches": 0,
+        "aggregates_created": 0,
+        "aggregates_updated": 0,
+        "entries_deleted": 0,
+        "months_processed": 0,
+        "last_id_processed": None,
+        "max_id": max_id,
+    }
+    months: set[tuple[int, int]] = set()
+    created_months: set[tuple[int, int]] = set()
+    updated_months: set[tuple[int, int]] = set()
+
+    last_id = first_id - 1 if first_id is not None else 0
+    while first_id is not None and last_id < max_id:
+        # The batch ends at the batch_size-th old id after the last one processed
+        upper_id = (
+            db.query(UsageLog.id)
+            .filter(UsageLog.id > last_id, UsageLog.created_at < cutoff_date)
+            .order_by(UsageLog.id)
+            .offset(batch_size - 1)
+            .limit(1)
+            .scalar()
+        )
+        upper_id = max_id if upper_id is None else min(upper_id, max_id)
+        try:
+            for (year, month), stats in _aggregate_batch(
+                db, last_id, upper_id, cutoff_date
+            ).items():
+                months.add((year, month))
+                if _merge_month(db, year, month, stats):
+                    created_months.add((year, month))
+                elif (year, month) not in created_months:
+                    updated_months.add((year, month))
+            deleted = (
+                db.query(UsageLog)
+                .filter(
+                    UsageLog.id > last_id,
+                    UsageLog.id <= upper_id,
+                    UsageLog.created_at < cutoff_date,
+                )
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        progress["batches"] += 1
+        progress["entries_deleted"] += deleted
+        progress["aggregates_created"] = len(created_months)
+        progress["aggregates_updated"] = len(updated_months)
+        progress["months_processed"] = len(months)
+        progress["last_id_processed"] = upper_id
+        yield dict(progress)
+        last_id = upper_id
+
+    # Rollup buckets for unregistered credit balances only matter for the current day
+    rollups_deleted = (
+        db.query(AnonymousUsageRollup)
+        .filter(AnonymousUsageRollup.bucket_start < cutoff_date.replace(tzinfo=None))
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+
+    if first_id is None:
+        yield {
+            "status": "no_data",
+            "message": f"No UsageLog entries older than {keep_days} days",
+            "cutoff_date": cutoff_date.isoformat(),
+            "entries_to_process": 0,
+            "rollups_deleted": rollups_deleted,
+        }
+        return
+    yield {
+        "status": "success",
+        "cutoff_date": cutoff_date.isoformat(),
+        "aggregates_created": progress["aggregates_created"],
+        "aggregates_updated": progress["aggregates_updated"],
+        "entries_deleted": progress["entries_deleted"],
+        "rollups_deleted": rollups_deleted,
+        "months_processed": progress["months_processed"],
+        "batches": progress["batches"],
+    }
 
 
 def cleanup_old_usage_logs(
-    db: Session, keep_days: int = 90, dry_run: bool = False
+    db: Session,
+    keep_days: int = 90,
+    dry_run: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
 ) -> dict[str, Any]:
     """
     Cleanup old UsageLog entries by:
@@ -30,10 +378,13 @@ def cleanup_old_usage_logs(
     removing detailed entries that are no longer needed for token estimation
     (which typically requires ~30 days of detailed data).
 
+    Runs ``iter_usage_log_cleanup`` to completion; use that directly to report progress.
+
     Args:
         db: Database session
         keep_days: Number of days of detailed data to keep (default: 90)
         dry_run: If True, only report what would be deleted, don't actually delete
+        batch_size: Old entries aggregated and deleted per transaction
 
     Returns:
         Dictionary with cleanup statistics including:
@@ -44,272 +395,40 @@ def cleanup_old_usage_logs(
         - entries_deleted: Number of UsageLog entries deleted
         - months_processed: Number of months aggregated
     """
-    cutoff_date = datetime.now(UTC) - timedelta(days=keep_days)
-
-    # Find all entries older than cutoff_date
-    old_logs_query = db.query(UsageLog).filter(UsageLog.created_at < cutoff_date)
-    old_logs = old_logs_query.all()
+    if not dry_run:
+        result: dict[str, Any] = {}
+        for result in iter_usage_log_cleanup(db, keep_days=keep_days, batch_size=batch_size):
+            pass
+        return result
 
-    if not old_logs:
+    cutoff_date = datetime.now(UTC) - timedelta(days=keep_days)
+    year = extract("year", UsageLog.created_at)
+    month = extract("month", UsageLog.created_at)
+    monthly_counts = (
+        db.query(year, month, func.count(UsageLog.id))
+        .filter(UsageLog.created_at < cutoff_date)
+        .group_by(year, month)
+        .order_by(year, month)
+        .all()
+    )
+    entries = sum(count for _, _, count in monthly_counts)
+    if not entries:
         return {
             "status": "no_data",
             "message": f"No UsageLog entries older than {keep_days} days",
             "cutoff_date": cutoff_date.isoformat(),
             "entries_to_process": 0,
         }
-
-    # Group entries by year/month for aggregation
-    monthly_data = defaultdict(
-        lambda: {
-            "year": None,
-            "month": None,
-            "entries": [],
-            "stats": {
-                "total_comparisons": 0,
-                "total_models_requested": 0,
-                "total_models_successful": 0,
-                "total_models_failed": 0,
-                "total_input_tokens": 0,
-                "total_output_tokens": 0,
-                "total_effective_tokens": 0,
-                "total_credits_used": Decimal(0),
-                "total_actual_cost": Decimal(0),
-                "total_estimated_cost": Decimal(0),
-                "model_breakdown": defaultdict(
-                    lambda: {
-                        "count": 0,
-                        "total_input": 0,
-                        "total_output": 0,
-                        "total_credits": Decimal(0),
-                    }
-                ),
-            },
-        }
-    )
-
-    # Process each old log entry
-    for log in old_logs:
-        year = log.created_at.year
-        month = log.created_at.month
-        key = f"{year}-{month:02d}"
-
-        monthly_data[key]["year"] = year
-        monthly_data[key]["month"] = month
-        monthly_data[key]["entries"].append(log)
-
-        stats = monthly_data[key]["stats"]
-        stats["total_comparisons"] += 1
-        stats["total_models_requested"] += log.models_requested or 0
-        stats["total_models_successful"] += log.models_successful or 0
-        stats["total_models_failed"] += log.models_failed or 0
-
-        if log.input_tokens:
-            stats["total_input_tokens"] += log.input_tokens
-        if log.output_tokens:
-            stats["total_output_tokens"] += log.output_tokens
-        if log.effective_tokens:
-            stats["total_effective_tokens"] += log.effective_tokens
-        if log.credits_used:
-            stats["total_credits_used"] += log.credits_used
-        if log.actual_cost:
-            stats["total_actual_cost"] += log.actual_cost
-        if log.estimated_cost:
-            stats["total_estimated_cost"] += log.estimated_cost
-
-        # Model breakdown - parse models_used JSON
-        if log.models_used:
-            try:
-                models = (
-                    json.loads(log.models_used)
-                    if isinstance(log.models_used, str)
-                    else log.models_used
-                )
-                if isinstance(models, list):
-                    for model_id in models:
-                        model_stats = stats["model_breakdown"][model_id]
-                        model_stats["count"] += 1
-                        if log.input_tokens:
-                            model_stats["total_input"] += log.input_tokens
-                        if log.output_tokens:
-                            model_stats["total_output"] += log.output_tokens
-                        if log.credits_used:
-                            model_stats["total_credits"] += log.credits_used
-            except (json.JSONDecodeError, TypeError, AttributeError):
-                # Skip invalid JSON or non-list models_used
-                pass
-
-    # Create or update monthly aggregates
-    aggregates_created = 0
-    aggregates_updated = 0
-
-    if not dry_run:
-        for key, data in monthly_data.items():
-            stats = data["stats"]
-            total_comparisons = stats["total_comparisons"]
-
-            if total_comparisons == 0:
-                continue
-
-            # Calculate averages
-            avg_input = (
-                Decimal(stats["total_input_tokens"]) / total_comparisons
-                if total_comparisons > 0
-                else Decimal(0)
-            )
-            avg_output = (
-                Decimal(stats["total_output_tokens"]) / total_comparisons
-                if total_comparisons > 0
-                else Decimal(0)
-            )
-            avg_output_ratio = avg_output / avg_input if avg_input > 0 else Decimal(0)
-            avg_credits = (
-                stats["total_credits_used"] / total_comparisons
-                if total_comparisons > 0
-                else Decimal(0)
-            )
-
-            # Convert model breakdown to JSON
-            model_breakdown_json = {}
-            for model_id, model_stats in stats["model_breakdown"].items():
-                if model_stats["count"] > 0:
-                    model_breakdown_json[model_id] = {
-                        "count": model_stats["count"],
-                        "avg_input_tokens": float(
-                            model_stats["total_input"] / model_stats["count"]
-                        ),
-                        "avg_output_tokens": float(
-                            model_stats["total_output"] / model_stats["count"]
-                        ),
-                        "total_credits": float(model_stats["total_credits"]),
-                    }
-
-            # Check if aggregate already exists
-            existing = (
-                db.query(UsageLogMonthlyAggregate)
-                .filter(
-                    and_(
-                        UsageLogMonthlyAggregate.year == data["year"],
-                        UsageLogMonthlyAggregate.month == data["month"],
-                    )
-                )
-                .first()
-            )
-
-            if existing:
-                # Update existing aggregate (merge with existing data)
-                existing.total_comparisons += stats["total_comparisons"]
-                existing.total_models_requested += stats["total_models_requested"]
-                existing.total_models_successful += stats["total_models_successful"]
-                existing.total_models_failed += stats["total_models_failed"]
-                existing.total_input_tokens += stats["total_input_tokens"]
-                existing.total_output_tokens += stats["total_output_tokens"]
-                existing.total_effective_tokens += stats["total_effective_tokens"]
-                existing.total_credits_used += stats["total_credits_used"]
-                existing.total_actual_cost += stats["total_actual_cost"]
-                existing.total_estimated_cost += stats["total_estimated_cost"]
-
-                # Recalculate averages
-                existing.avg_input_tokens = (
-                    Decimal(existing.total_input_tokens) / existing.total_comparisons
-                    if existing.total_comparisons > 0
-                    else Decimal(0)
-                )
-                existing.avg_output_tokens = (
-                    Decimal(existing.total_output_tokens) / existing.total_comparisons
-                    if existing.total_comparisons > 0
-                    else Decimal(0)
-                )
-                existing.avg_output_ratio = (
-                    existing.avg_output_tokens / existing.avg_input_tokens
-                    if existing.avg_input_tokens > 0
-                    else Decimal(0)
-                )
-                existing.avg_credits_per_comparison = (
-                    existing.total_credits_used / existing.total_comparisons
-                    if existing.total_comparisons > 0
-                    else Decimal(0)
-                )
-
-                # Merge model breakdowns
-                existing_breakdown = (
-                    json.loads(existing.model_breakdown) if existing.model_breakdown else {}
-                )
-                for model_id, model_stats in model_breakdown_json.items():
-                    if model_id in existing_breakdown:
-                        existing_breakdown[model_id]["count"] += model_stats["count"]
-                        existing_breakdown[model_id]["total_credits"] += model_stats[
-                            "total_credits"
-                        ]
-                        # Recalculate averages
-                        existing_breakdown[model_id]["avg_input_tokens"] = (
-                            existing_breakdown[model_id]["avg_input_tokens"]
-                            * (existing_breakdown[model_id]["count"] - model_stats["count"])
-                            + model_stats["avg_input_tokens"] * model_stats["count"]
-                        ) / existing_breakdown[model_id]["count"]
-                        existing_breakdown[model_id]["avg_output_tokens"] = (
-                            existing_breakdown[model_id]["avg_output_tokens"]
-                            * (existing_breakdown[model_id]["count"] - model_stats["count"])
-                            + model_stats["avg_output_tokens"] * model_stats["count"]
-                        ) / existing_breakdown[model_id]["count"]
-                    else:
-                        existing_breakdown[model_id] = model_stats
-                existing.model_breakdown = json.dumps(existing_breakdown)
-                aggregates_updated += 1
-            else:
-                # Create new aggregate
-                aggregate = UsageLogMonthlyAggregate(
-                    year=data["year"],
-                    month=data["month"],
-                    total_comparisons=stats["total_comparisons"],
-                    total_models_requested=stats["total_models_requested"],
-                    total_models_successful=stats["total_models_successful"],
-                    total_models_failed=stats["total_models_failed"],
-                    total_input_tokens=stats["total_input_tokens"],
-                    total_output_tokens=stats["total_output_tokens"],
-                    total_effective_tokens=stats["total_effective_tokens"],
-                    avg_input_tokens=avg_input,
-                    avg_output_tokens=avg_output,
-                    avg_output_ratio=avg_output_ratio,
-                    total_credits_used=stats["total_credits_used"],
-                    avg_credits_per_comparison=avg_credits,
-                    total_actual_cost=stats["total_actual_cost"],
-                    total_estimated_cost=stats["total_estimated_cost"],
-                    model_breakdown=json.dumps(model_breakdown_json)
-                    if model_breakdown_json
-                    else None,
-                )
-                db.add(aggregate)
-                aggregates_created += 1
-
-        # Commit aggregates before deleting
-        db.flush()
-
-        # Delete old detailed entries
-        deleted_count = old_logs_query.delete()
-
-        db.commit()
-
-        return {
-            "status": "success",
-            "cutoff_date": cutoff_date.isoformat(),
-            "aggregates_created": aggregates_created,
-            "aggregates_updated": aggregates_updated,
-            "entries_deleted": deleted_count,
-            "months_processed": len(monthly_data),
-        }
     # Dry run - just report what would happen
     return {
         "status": "dry_run",
         "cutoff_date": cutoff_date.isoformat(),
-        "entries_to_process": len(old_logs),
-        "months_to_aggregate": len(monthly_data),
-        "would_create_aggregates": len(monthly_data),
-        "would_delete_entries": len(old_logs),
+        "entries_to_process": entries,
+        "months_to_aggregate": len(monthly_counts),
+        "would_create_aggregates": len(monthly_counts),
+        "would_delete_entries": entries,
         "monthly_breakdown": {
-            f"{data['year']}-{data['month']:02d}": {
-                "entries": len(data["entries"]),
-                "total_comparisons": data["stats"]["total_comparisons"],
-            }
-            for data in monthly_data.values()
+            f"{int(y)}-{int(m):02d}": {"entries": count, "total_comparisons": count}
+            for y, m, count in monthly_counts
         },
     }
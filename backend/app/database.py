@@ -6,9 +6,11 @@ database session management for the FastAPI application.
 """
 
 import os
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 # Import configuration
@@ -114,29 +116,79 @@ else:
         echo=False,
     )
 
+
 # Enable foreign keys and optimize SQLite settings for better concurrency
 # SQLite disables foreign key constraints by default, so we must enable them
 # on every connection for CASCADE deletes to function properly
 # WAL mode improves concurrent read/write performance
-if "sqlite" in DATABASE_URL:
+def set_sqlite_pragma(dbapi_conn, connection_record):
+    """Configure SQLite connection with optimal settings."""
+    cursor = dbapi_conn.cursor()
+    # Enable foreign keys (required for CASCADE deletes)
+    cursor.execute("PRAGMA foreign_keys=ON")
+    # Use WAL mode for better concurrent access
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # Optimize for better performance
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=20000")  # 20 second timeout
+    cursor.close()
 
-    @event.listens_for(engine, "connect")
-    def set_sqlite_pragma(dbapi_conn, connection_record):
-        """Configure SQLite connection with optimal settings."""
-        cursor = dbapi_conn.cursor()
-        # Enable foreign keys (required for CASCADE deletes)
-        cursor.execute("PRAGMA foreign_keys=ON")
-        # Use WAL mode for better concurrent access
-        cursor.execute("PRAGMA journal_mode=WAL")
-        # Optimize for better performance
-        cursor.execute("PRAGMA synchronous=NORMAL")
-        cursor.execute("PRAGMA busy_timeout=20000")  # 20 second timeout
-        cursor.close()
+
+if "sqlite" in DATABASE_URL:
+    event.listen(engine, "connect", set_sqlite_pragma)
 
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def to_async_url(url: str) -> str:
+    """
+    Return the asyncio-driver form of a database URL (asyncpg for PostgreSQL, aiosqlite
+    for SQLite). URLs for other backends are returned unchanged and must already name an
+    async driver.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+# Async engine for handlers that must not block the event loop (it also serves SSE streams):
+# same database and pool settings as the sync engine, through an asyncio driver
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+if is_postgresql:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_timeout=30,
+        connect_args={"timeout": 10},  # asyncpg's name for connect_timeout
+        echo=False,
+    )
+elif is_sqlite:
+    from sqlalchemy.pool import NullPool
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"timeout": 20.0},
+        poolclass=NullPool,
+        echo=False,
+    )
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragma)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, echo=False)
+
+# expire_on_commit=False: an expired attribute would need a lazy load, which AsyncSession
+# cannot do implicitly
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for all models
 Base = declarative_base()
 
@@ -195,6 +247,35 @@ def get_db() -> Generator[Session, None, None]:
                 logger.error(f"[DB] Error closing database session: {type(e).__name__}: {str(e)}")
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency function for FastAPI to get an asyncio database session.
+
+    Queries are awaited instead of blocking the event loop, so ``async def`` handlers
+    using this session don't stall token delivery for other requests on the worker.
+
+    Usage:
+        @app.get("/endpoint")
+        async def endpoint(db: AsyncSession = Depends(get_async_db)):
+            result = await db.execute(select(User))
+
+    Yields:
+        AsyncSession: Database session
+    """
+    import logging
+
+    logger = logging.getLogger(__name__)
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            from fastapi import HTTPException
+
+            if not isinstance(e, HTTPException):
+                logger.error(f"[DB] Async session error: {type(e).__name__}: {str(e)}")
+            raise
+
+
 def init_db() -> None:
     """
     Initialize database tables.
@@ -6,25 +6,61 @@ and checking user permissions.
 """
 
 from collections.abc import Callable
-from datetime import UTC, datetime
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from .auth import verify_token
-from .database import get_db
+from .cache import user_cache
+from .database import get_async_db, get_db
 from .models import User
+from .services.last_access import last_access_recorder
 from .utils.cookies import get_token_from_cookies
 
 # HTTP Bearer token security scheme
 security = HTTPBearer(auto_error=False)
 
 
-def get_current_user(
+async def _load_user(user_id: int, adb: AsyncSession) -> User | None:
+    """
+    Load a user, from the worker's snapshot cache when it has a current one, and record
+    the access.
+
+    A cache miss loads the row on the async session and caches it detached. last_access
+    is not written here: the access is coalesced with the user's others and written in
+    batches (see services.last_access).
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        version = user_cache.version(user_id)
+        user = await adb.get(User, user_id)
+        if user is None:
+            return None
+        adb.expunge(user)
+        user_cache.put(user_id, user, version)
+
+    if user.is_active:
+        last_access_recorder.touch(user.id, user.last_access)
+    return user
+
+
+def _attach(user: User, db: Session) -> User:
+    """
+    Hand the loaded user to the request's sync session without another query.
+
+    Handlers that still refresh or update ``current_user`` through ``get_db`` then work
+    on an instance of their own session, never on the shared cached snapshot.
+    """
+    return db.merge(user, load=False)
+
+
+async def get_current_user(
     request: Request,
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
     db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
 ) -> User | None:
     """
     Get current authenticated user from JWT token.
@@ -36,7 +72,8 @@ def get_current_user(
     Args:
         request: FastAPI Request object
         credentials: HTTP Bearer token credentials (fallback)
-        db: Database session
+        db: Database session the returned user is attached to
+        adb: Async database session used for the lookup
 
     Returns:
         User: Current user if authenticated, None otherwise
@@ -65,34 +102,21 @@ def get_current_user(
     except (ValueError, TypeError):
         return None
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await _load_user(user_id, adb)
     if user is None:
         return None
 
     if not user.is_active:
         return None
 
-    # Update last_access timestamp (only update if more than 1 minute has passed to avoid excessive writes)
-    now = datetime.now(UTC)
-    if user.last_access is None:
-        user.last_access = now
-        db.commit()
-    else:
-        # Normalize last_access to UTC-aware if it's naive (for SQLite compatibility)
-        last_access = user.last_access
-        if last_access.tzinfo is None:
-            last_access = last_access.replace(tzinfo=UTC)
-        if (now - last_access).total_seconds() > 60:
-            user.last_access = now
-            db.commit()
-
-    return user
+    return _attach(user, db)
 
 
-def get_current_user_required(
+async def get_current_user_required(
     request: Request,
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
     db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
 ) -> User:
     """
     Get current authenticated user from JWT token (required).
@@ -104,7 +128,8 @@ def get_current_user_required(
     Args:
         request: FastAPI Request object
         credentials: HTTP Bearer token credentials (fallback)
-        db: Database session
+        db: Database session the returned user is attached to
+        adb: Async database session used for the lookup
 
     Returns:
         User: Current authenticated user
@@ -144,7 +169,7 @@ def get_current_user_required(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials"
         )
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await _load_user(user_id, adb)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
@@ -153,21 +178,7 @@ def get_current_user_required(
             status_code=status.HTTP_403_FORBIDDEN, detail="User account is inactive"
         )
 
-    # Update last_access timestamp (only update if more than 1 minute has passed to avoid excessive writes)
-    now = datetime.now(UTC)
-    if user.last_access is None:
-        user.last_access = now
-        db.commit()
-    else:
-        # Normalize last_access to UTC-aware if it's naive (for SQLite compatibility)
-        last_access = user.last_access
-        if last_access.tzinfo is None:
-            last_access = last_access.replace(tzinfo=UTC)
-        if (now - last_access).total_seconds() > 60:
-            user.last_access = now
-            db.commit()
-
-    return user
+    return _attach(user, db)
 
 
 def get_current_verified_user(current_user: User = Depends(get_current_user_required)) -> User:
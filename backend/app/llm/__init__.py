@@ -1,8 +1,10 @@
 """
-LLM model runner package: registry, tokens, streaming, connection.
+LLM model runner package: clients, registry, tokens, streaming, connection.
 Backward-compatible re-exports for app.model_runner consumers.
 """
 
+from .capabilities import CapabilityIndex, ModelCapabilities
+from .clients import get_client_pool_stats
 from .connection import test_connection_quality
 from .registry import (
     FREE_TIER_MODELS,
@@ -13,6 +15,9 @@ from .registry import (
     client,
     client_with_tool_headers,
     filter_models_by_tier,
+    get_async_client,
+    get_capability_index,
+    get_model_capabilities,
     get_model_supports_image_generation,
     get_model_supports_temperature,
     get_model_supports_vision,
@@ -33,14 +38,18 @@ from .streaming import (
     WEB_SEARCH_TOOL,
     call_openrouter,
     call_openrouter_streaming,
+    call_openrouter_streaming_async,
     fetch_url_content,
     is_time_sensitive_query,
 )
-from .text_processing import clean_model_response, detect_repetition
+from .text_processing import RepetitionDetector, clean_model_response, detect_repetition
+from .token_estimate import TokenBounds, count_tokens_under, token_bounds
+from .tokenizers import get_token_count_stats
 from .tokens import (
     TokenUsage,
     calculate_credits,
     calculate_token_usage,
+    conversation_token_bounds,
     count_conversation_tokens,
     estimate_credits_before_request,
     estimate_reserved_credits_for_compare,
@@ -56,27 +65,35 @@ from .tokens import (
     get_model_token_limits_from_openrouter,
     preload_model_token_limits,
     refresh_model_token_limits,
+    run_token_limits_refresher,
     token_usage_from_openrouter_usage,
     usd_logged_for_text_usage,
     usd_to_fractional_credits,
 )
 
 __all__ = [
+    "CapabilityIndex",
     "FREE_TIER_MODELS",
     "FETCH_URL_TOOL",
     "MODELS_BY_PROVIDER",
     "OPENROUTER_MODELS",
+    "ModelCapabilities",
+    "RepetitionDetector",
+    "TokenBounds",
     "TokenUsage",
     "WEB_SEARCH_TOOL",
     "UNREGISTERED_TIER_MODELS",
     "call_openrouter",
     "call_openrouter_streaming",
+    "call_openrouter_streaming_async",
     "calculate_credits",
     "calculate_token_usage",
     "clean_model_response",
     "client",
     "client_with_tool_headers",
+    "conversation_token_bounds",
     "count_conversation_tokens",
+    "count_tokens_under",
     "detect_repetition",
     "estimate_credits_before_request",
     "estimate_reserved_credits_for_compare",
@@ -86,16 +103,21 @@ __all__ = [
     "fetch_all_models_from_openrouter",
     "fetch_url_content",
     "filter_models_by_tier",
+    "get_async_client",
+    "get_capability_index",
+    "get_client_pool_stats",
     "get_min_max_input_tokens",
     "get_min_max_output_tokens",
     "get_model_max_input_tokens",
     "get_model_max_output_tokens",
     "get_model_max_tokens",
+    "get_model_capabilities",
     "get_model_supports_image_generation",
     "get_model_supports_temperature",
     "get_model_supports_vision",
     "get_model_text_prices_per_token",
     "get_openrouter_thinking_model_flag",
+    "get_token_count_stats",
     "is_thinking_model_registry_file_value",
     "is_thinking_model_from_openrouter_entry",
     "resolve_is_thinking_model_for_ui",
@@ -113,5 +135,7 @@ __all__ = [
     "preload_model_token_limits",
     "reload_registry",
     "refresh_model_token_limits",
+    "run_token_limits_refresher",
     "test_connection_quality",
+    "token_bounds",
 ]
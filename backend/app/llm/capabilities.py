@@ -0,0 +1,116 @@
+"""
+Compiled model capability index: one immutable record per model id.
+
+The registry builds a :class:`CapabilityIndex` from models_registry.json and the bundled
+openrouter_models.json snapshot, and swaps the whole index in one assignment whenever
+either file is reloaded. Readers hold a reference to a complete index, never a
+half-rebuilt one.
+"""
+
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any
+
+# Ceiling for default max_output: OpenRouter may report inflated values (e.g. 256k for StepFun)
+# that cause "input+output exceeds context" errors. Typical chat responses need far less.
+_REASONABLE_MAX_OUTPUT_CEILING = 32768
+
+
+def extract_token_limits(model_data: dict[str, Any]) -> dict[str, int]:
+    """``max_input`` / ``max_output`` for one OpenRouter ``/models`` entry."""
+    limits = {}
+    context_length = model_data.get("context_length")
+    top_provider = model_data.get("top_provider") or {}
+    max_completion_tokens = top_provider.get("max_completion_tokens")
+    if context_length:
+        limits["max_input"] = context_length
+        if max_completion_tokens and max_completion_tokens < context_length:
+            limits["max_output"] = max_completion_tokens
+        else:
+            # OpenRouter sometimes reports max_completion_tokens=context_length (e.g. StepFun);
+            # that's wrong: providers enforce input+output <= context_length. Cap output.
+            limits["max_output"] = min(
+                int(context_length * 0.2),
+                _REASONABLE_MAX_OUTPUT_CEILING,
+            )
+    elif max_completion_tokens:
+        # When no context_length, still sanity-check: output cannot exceed a reasonable ceiling
+        # (some providers report inflated max_completion_tokens that cause context overflow)
+        limits["max_output"] = min(
+            max_completion_tokens,
+            _REASONABLE_MAX_OUTPUT_CEILING,
+        )
+        limits["max_input"] = max_completion_tokens * 4
+    else:
+        limits["max_input"] = 8192
+        limits["max_output"] = 8192
+    return limits
+
+
+@dataclass(frozen=True, slots=True)
+class ModelCapabilities:
+    """Everything the request path asks about one model, resolved at build time."""
+
+    model_id: str
+    name: str | None
+    provider: str | None
+    in_registry: bool
+    in_snapshot: bool
+    supports_web_search: bool
+    # Registry ``supports_image_generation`` flag, and the snapshot's output modalities
+    registry_image_generation: bool
+    outputs_images: bool
+    supports_vision: bool
+    supports_temperature: bool
+    # Snapshot verdict on separable reasoning; None when the id is not in the snapshot
+    streams_reasoning: bool | None
+    is_thinking_model: bool
+    returns_multiple_images: bool
+    # USD per image, as listed (may be 0)
+    image_price: float | None
+    # USD per input token, USD per output token; None unless one of them is positive
+    text_prices: tuple[Decimal, Decimal] | None
+    max_input_tokens: int | None
+    max_output_tokens: int | None
+
+    @property
+    def supports_image_generation(self) -> bool:
+        """Registry flag, falling back to OpenRouter metadata."""
+        return self.registry_image_generation or self.outputs_images
+
+
+class CapabilityIndex:
+    """Read-only ``model_id -> ModelCapabilities`` map with precomputed id sets."""
+
+    __slots__ = ("_records", "registry_model_ids", "web_search_model_ids")
+
+    def __init__(self, records: Mapping[str, ModelCapabilities]):
+        self._records = MappingProxyType(dict(records))
+        # Registry order is kept so listings match models_registry.json
+        self.registry_model_ids: tuple[str, ...] = tuple(
+            mid for mid, rec in self._records.items() if rec.in_registry
+        )
+        self.web_search_model_ids: tuple[str, ...] = tuple(
+            mid for mid in self.registry_model_ids if self._records[mid].supports_web_search
+        )
+
+    def get(self, model_id: str) -> ModelCapabilities | None:
+        return self._records.get(model_id)
+
+    def resolve(self, model_id: str) -> ModelCapabilities | None:
+        """Like :meth:`get`, falling back to the base id of variants such as ``vendor/x:free``."""
+        rec = self._records.get(model_id)
+        if rec is None and ":" in model_id:
+            rec = self._records.get(model_id.split(":")[0])
+        return rec
+
+    def __contains__(self, model_id: object) -> bool:
+        return model_id in self._records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,284 @@
+"""
+Pooled OpenRouter HTTP clients.
+
+One httpx connection pool is shared by every sync OpenAI client in the process, and each
+event loop gets one AsyncOpenAI client with its own pool (httpx async pools are bound to
+the loop that created them). Every client talks only to openrouter.ai, so the pool limits
+double as the per-host connection cap, and with HTTP/2 (httpx[http2]) concurrent
+completions are multiplexed over those connections. Transports are wrapped to count
+in-flight requests and time connection acquisition, so pool saturation can be reported
+via ``get_client_pool_stats``.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Any
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from ..config import settings
+
+try:
+    import h2  # noqa: F401  # Required by httpx for HTTP/2
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+if settings.openrouter_http2 and not HTTP2_AVAILABLE:
+    logger.warning("h2 not installed (httpx[http2]); OpenRouter clients use HTTP/1.1")
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+OPENROUTER_TOOL_HEADERS = {
+    "HTTP-Referer": "https://compareintel.com",
+    "X-Title": "CompareIntel",
+}
+
+
+# A request that took longer than this to get a connection waited for the pool
+POOL_WAIT_THRESHOLD_SECONDS = 0.01
+
+
+class PoolStats:
+    """Thread-safe in-flight counters for one connection pool.
+
+    A request counts as in flight from the moment it is sent until its response body is
+    closed, which for streamed completions is the whole generation. With HTTP/2 many of
+    them share a connection, so in-flight counts say nothing about saturation: instead
+    ``saturated_requests`` counts requests that waited for the pool, timed from the
+    request being handed to the transport to its first connection event (new connection
+    or request headers sent on one).
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.saturated_requests = 0
+        self.max_pool_wait = 0.0
+
+    def acquire(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.total_requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def record_pool_wait(self, seconds: float) -> None:
+        with self._lock:
+            if seconds >= POOL_WAIT_THRESHOLD_SECONDS:
+                self.saturated_requests += 1
+            self.max_pool_wait = max(self.max_pool_wait, seconds)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "total_requests": self.total_requests,
+                "saturated_requests": self.saturated_requests,
+                "max_pool_wait_ms": round(self.max_pool_wait * 1000, 1),
+                "utilization": round(self.in_flight / self.max_connections, 3)
+                if self.max_connections
+                else 0.0,
+            }
+
+
+class _MeteredByteStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, stats: PoolStats):
+        self._stream = stream
+        self._stats = stats
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._stats.release()
+
+
+class _MeteredAsyncByteStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, stats: PoolStats):
+        self._stream = stream
+        self._stats = stats
+        self._released = False
+
+    async def __aiter__(self):
+        async for part in self._stream:
+            yield part
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._stats.release()
+
+
+class MeteredTransport(httpx.BaseTransport):
+    """Sync transport wrapper that records pool usage in a PoolStats."""
+
+    def __init__(self, transport: httpx.BaseTransport, stats: PoolStats):
+        self._transport = transport
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        started = time.monotonic()
+        timed = False
+        inner_trace = request.extensions.get("trace")
+
+        def trace(name: str, info: dict[str, Any]) -> None:
+            nonlocal timed
+            if not timed:
+                timed = True
+                self.stats.record_pool_wait(time.monotonic() - started)
+            if inner_trace is not None:
+                inner_trace(name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self.stats.release()
+            raise
+        response.stream = _MeteredByteStream(response.stream, self.stats)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    """Async transport wrapper that records pool usage in a PoolStats."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: PoolStats):
+        self._transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        started = time.monotonic()
+        timed = False
+        inner_trace = request.extensions.get("trace")
+
+        async def trace(name: str, info: dict[str, Any]) -> None:
+            nonlocal timed
+            if not timed:
+                timed = True
+                self.stats.record_pool_wait(time.monotonic() - started)
+            if inner_trace is not None:
+                await inner_trace(name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.stats.release()
+            raise
+        response.stream = _MeteredAsyncByteStream(response.stream, self.stats)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.openrouter_max_connections,
+        max_keepalive_connections=settings.openrouter_max_keepalive_connections,
+        keepalive_expiry=settings.openrouter_keepalive_expiry,
+    )
+
+
+def _http2_enabled() -> bool:
+    return settings.openrouter_http2 and HTTP2_AVAILABLE
+
+
+def build_transport(**kwargs: Any) -> httpx.HTTPTransport:
+    """Sync OpenRouter transport: pool limits and HTTP/2 from settings."""
+    return httpx.HTTPTransport(limits=_pool_limits(), http2=_http2_enabled(), **kwargs)
+
+
+def build_async_transport(**kwargs: Any) -> httpx.AsyncHTTPTransport:
+    """Async OpenRouter transport: pool limits and HTTP/2 from settings."""
+    return httpx.AsyncHTTPTransport(limits=_pool_limits(), http2=_http2_enabled(), **kwargs)
+
+
+_sync_stats = PoolStats(settings.openrouter_max_connections)
+_sync_http_client = DefaultHttpxClient(transport=MeteredTransport(build_transport(), _sync_stats))
+
+client = OpenAI(
+    api_key=settings.openrouter_api_key,
+    base_url=OPENROUTER_BASE_URL,
+    http_client=_sync_http_client,
+)
+client_with_tool_headers = OpenAI(
+    api_key=settings.openrouter_api_key,
+    base_url=OPENROUTER_BASE_URL,
+    default_headers=OPENROUTER_TOOL_HEADERS,
+    http_client=_sync_http_client,
+)
+
+# AsyncOpenAI clients keyed by event loop, so no pool (or its locks) is ever shared
+# between loops, and a client is dropped when its loop goes away.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_stats: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, PoolStats]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the pooled AsyncOpenAI client for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        stats = PoolStats(settings.openrouter_max_connections)
+        transport = AsyncMeteredTransport(build_async_transport(), stats)
+        async_client = AsyncOpenAI(
+            api_key=settings.openrouter_api_key,
+            base_url=OPENROUTER_BASE_URL,
+            http_client=DefaultAsyncHttpxClient(transport=transport),
+        )
+        _async_clients[loop] = async_client
+        _async_stats[loop] = stats
+    return async_client
+
+
+def get_client_pool_stats() -> dict[str, Any]:
+    """Pool saturation metrics for the shared sync pool and the per-loop async pools."""
+    loop_stats = [stats.snapshot() for stats in list(_async_stats.values())]
+    return {
+        "http2": _http2_enabled(),
+        "sync": _sync_stats.snapshot(),
+        "async": {
+            "loops": len(loop_stats),
+            "in_flight": sum(s["in_flight"] for s in loop_stats),
+            "peak_in_flight": max((s["peak_in_flight"] for s in loop_stats), default=0),
+            "total_requests": sum(s["total_requests"] for s in loop_stats),
+            "saturated_requests": sum(s["saturated_requests"] for s in loop_stats),
+            "max_pool_wait_ms": max((s["max_pool_wait_ms"] for s in loop_stats), default=0.0),
+            "max_connections_per_loop": settings.openrouter_max_connections,
+        },
+    }
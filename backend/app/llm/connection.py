@@ -5,7 +5,7 @@ Connection quality testing.
 import time
 
 from ..type_defs import ConnectionQualityDict
-from .registry import client
+from .clients import client
 
 
 def test_connection_quality() -> ConnectionQualityDict:
@@ -1,5 +1,8 @@
 """
-Model registry: JSON loading, tier filtering, OpenAI client.
+Model registry: JSON loading, tier filtering, compiled capability index.
+
+The pooled OpenRouter clients live in ``clients``; they are re-exported here for
+existing importers.
 """
 
 import json
@@ -11,37 +14,16 @@ from decimal import Decimal
 from pathlib import Path
 from typing import Any
 
-from openai import OpenAI
-
-from ..config import settings
+from .capabilities import CapabilityIndex, ModelCapabilities, extract_token_limits
+from .clients import client, client_with_tool_headers, get_async_client  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
 _REGISTRY_PATH = Path(__file__).resolve().parent.parent.parent / "data" / "models_registry.json"
 _OPENROUTER_MODELS_PATH = Path(__file__).resolve().parent.parent.parent / "openrouter_models.json"
 
-# Cache for model temperature support (model_id -> bool)
-_temperature_support_cache: dict[str, bool] | None = None
-
-# OpenRouter /models: ids that appear in openrouter_models.json snapshot
-_openrouter_known_ids_cache: frozenset[str] | None = None
-# Subset: models that advertise reasoning / include_reasoning parameters (separable thinking traces)
-_openrouter_thinking_model_ids_cache: frozenset[str] | None = None
-
-# Cache for model vision support (model_id -> bool)
-_vision_support_cache: dict[str, bool] | None = None
-
-# Cache for probed vision support from models_registry.json (model_id -> bool)
-_vision_probed_cache: dict[str, bool] | None = None
-
-# Cache for image generation support (model_id -> bool)
-_image_gen_support_cache: dict[str, bool] | None = None
-
-# Cache for pricing.image (model_id -> float, dollars per image)
-_image_price_cache: dict[str, float] | None = None
-
-# Cache for text pricing (model_id -> (prompt_usd_per_token, completion_usd_per_token))
-_text_token_price_cache: dict[str, tuple[Decimal, Decimal]] | None = None
+# Compiled capability index; replaced as a whole when the registry or snapshot reloads
+_capability_index: CapabilityIndex | None = None
 
 # Models that OpenRouter metadata incorrectly marks as vision-capable but the API rejects image input.
 KNOWN_NON_VISION_MODEL_IDS: frozenset[str] = frozenset()
@@ -75,48 +57,9 @@ def openrouter_entry_supports_vision_input(entry: dict[str, Any]) -> bool:
     )
 
 
-def _load_vision_support_map() -> dict[str, bool]:
-    """Load model_id -> supports_vision from openrouter_models.json metadata."""
-    global _vision_support_cache
-    if _vision_support_cache is not None:
-        return _vision_support_cache
-
-    result: dict[str, bool] = {}
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                model_id = model.get("id")
-                if model_id:
-                    result[model_id] = openrouter_entry_supports_vision_input(model)
-    except Exception:
-        pass
-
-    _vision_support_cache = result
-    return result
-
-
-def _load_vision_probed_map() -> dict[str, bool]:
-    """Load model_id -> probed vision result from models_registry.json."""
-    global _vision_probed_cache
-    if _vision_probed_cache is not None:
-        return _vision_probed_cache
-
-    result: dict[str, bool] = {}
-    for models in MODELS_BY_PROVIDER.values():
-        for model in models:
-            mid = model.get("id")
-            if mid and "supports_vision_probed" in model:
-                result[mid] = bool(model["supports_vision_probed"])
-    _vision_probed_cache = result
-    return result
-
-
 def invalidate_vision_probed_cache() -> None:
-    """Clear the in-memory cache of probed vision results (after registry changes)."""
-    global _vision_probed_cache
-    _vision_probed_cache = None
+    """Rebuild the capability index after probed vision results change in the registry."""
+    rebuild_capability_index()
 
 
 def get_model_supports_vision(model_id: str) -> bool:
@@ -124,44 +67,16 @@ def get_model_supports_vision(model_id: str) -> bool:
 
     Resolution order: probed registry result, known non-vision overrides, OpenRouter metadata.
     """
-    probed = _load_vision_probed_map().get(model_id)
-    if probed is not None:
-        return probed
-    if model_id in KNOWN_NON_VISION_MODEL_IDS:
-        return False
-    return _load_vision_support_map().get(model_id, False)
-
-
-def _load_temperature_support_map() -> dict[str, bool]:
-    """Load model_id -> supports_temperature from openrouter_models.json."""
-    global _temperature_support_cache
-    if _temperature_support_cache is not None:
-        return _temperature_support_cache
-
-    result: dict[str, bool] = {}
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                model_id = model.get("id")
-                if model_id:
-                    params = model.get("supported_parameters", [])
-                    result[model_id] = (
-                        "temperature" in params if isinstance(params, list) else False
-                    )
-    except Exception:
-        pass
-
-    _temperature_support_cache = result
-    return result
+    rec = get_capability_index().get(model_id)
+    return rec.supports_vision if rec else False
 
 
 def get_model_supports_temperature(model_id: str) -> bool:
     """Return True if the model supports the temperature parameter."""
-    if model_id in KNOWN_NO_TEMPERATURE_MODEL_IDS:
-        return False
-    return _load_temperature_support_map().get(model_id, True)  # Default True if unknown
+    rec = get_capability_index().get(model_id)
+    if rec is None:
+        return model_id not in KNOWN_NO_TEMPERATURE_MODEL_IDS  # Default True if unknown
+    return rec.supports_temperature
 
 
 def is_thinking_model_from_openrouter_entry(model_data: dict[str, Any] | None) -> bool | None:
@@ -231,33 +146,6 @@ def streams_separable_reasoning_from_openrouter_entry(
     return True
 
 
-def _load_openrouter_model_ids_and_thinking() -> tuple[frozenset[str], frozenset[str]]:
-    """Parse openrouter_models.json once: all ids, and ids that stream separable reasoning."""
-    global _openrouter_known_ids_cache, _openrouter_thinking_model_ids_cache
-    if _openrouter_known_ids_cache is not None and _openrouter_thinking_model_ids_cache is not None:
-        return _openrouter_known_ids_cache, _openrouter_thinking_model_ids_cache
-
-    known: set[str] = set()
-    thinking: set[str] = set()
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                model_id = model.get("id")
-                if not model_id:
-                    continue
-                known.add(model_id)
-                if streams_separable_reasoning_from_openrouter_entry(model) is True:
-                    thinking.add(model_id)
-    except Exception:
-        pass
-
-    _openrouter_known_ids_cache = frozenset(known)
-    _openrouter_thinking_model_ids_cache = frozenset(thinking)
-    return _openrouter_known_ids_cache, _openrouter_thinking_model_ids_cache
-
-
 def get_openrouter_thinking_model_flag(model_id: str) -> bool | None:
     """If ``model_id`` is in the local OpenRouter snapshot, return whether it streams separable reasoning.
 
@@ -265,10 +153,8 @@ def get_openrouter_thinking_model_flag(model_id: str) -> bool | None:
     :func:`streams_separable_reasoning_from_openrouter_entry`). When the id is missing from the
     snapshot, returns ``None``.
     """
-    known, thinking = _load_openrouter_model_ids_and_thinking()
-    if model_id not in known:
-        return None
-    return model_id in thinking
+    rec = get_capability_index().get(model_id)
+    return rec.streams_reasoning if rec else None
 
 
 def resolve_is_thinking_model_for_ui(
@@ -298,12 +184,10 @@ def should_request_openrouter_reasoning_traces(model_id: str) -> bool:
     Without it, many providers (notably Anthropic) omit separable reasoning deltas from the stream,
     so the UI never receives ``delta.reasoning`` / ``reasoning_content`` chunks.
     """
-    reg_entry: dict[str, Any] | None = None
-    for m in OPENROUTER_MODELS:
-        if m.get("id") == model_id:
-            reg_entry = m
-            break
-    return resolve_is_thinking_model_for_ui(model_id, reg_entry)
+    rec = get_capability_index().get(model_id)
+    if rec is not None:
+        return rec.is_thinking_model
+    return resolve_is_thinking_model_for_ui(model_id)
 
 
 def openrouter_reasoning_request_body(model_id: str) -> dict[str, Any]:
@@ -321,109 +205,28 @@ def openrouter_reasoning_request_body(model_id: str) -> dict[str, Any]:
     return {"enabled": True}
 
 
-def _load_image_gen_support_map() -> dict[str, bool]:
-    global _image_gen_support_cache
-    if _image_gen_support_cache is not None:
-        return _image_gen_support_cache
-    result: dict[str, bool] = {}
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                model_id = model.get("id")
-                if model_id:
-                    arch = model.get("architecture") or {}
-                    out_mods = arch.get("output_modalities") if isinstance(arch, dict) else []
-                    out_str = (
-                        " ".join(str(m) for m in out_mods).lower()
-                        if isinstance(out_mods, (list, tuple))
-                        else ""
-                    )
-                    result[model_id] = "image" in out_str
-    except Exception:
-        pass
-    _image_gen_support_cache = result
-    return result
-
-
 def get_model_supports_image_generation(model_id: str) -> bool:
-    return _load_image_gen_support_map().get(model_id, False)
-
-
-def _load_image_price_map() -> dict[str, float]:
-    global _image_price_cache
-    if _image_price_cache is not None:
-        return _image_price_cache
-    result: dict[str, float] = {}
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                model_id = model.get("id")
-                if model_id:
-                    pricing = model.get("pricing") or {}
-                    img_val = pricing.get("image") if isinstance(pricing, dict) else None
-                    if img_val is not None:
-                        try:
-                            result[model_id] = float(img_val)
-                        except (ValueError, TypeError):
-                            pass
-    except Exception:
-        pass
-    _image_price_cache = result
-    return result
+    """True if OpenRouter metadata lists image output (ignores the registry flag)."""
+    rec = get_capability_index().get(model_id)
+    return rec.outputs_images if rec else False
 
 
 def get_model_image_price_per_image(model_id: str) -> float | None:
-    price = _load_image_price_map().get(model_id)
+    rec = get_capability_index().get(model_id)
+    price = rec.image_price if rec else None
     return price if price and price > 0 else None
 
 
-def _load_text_token_price_map() -> dict[str, tuple[Decimal, Decimal]]:
-    global _text_token_price_cache
-    if _text_token_price_cache is not None:
-        return _text_token_price_cache
-    result: dict[str, tuple[Decimal, Decimal]] = {}
-    try:
-        if _OPENROUTER_MODELS_PATH.exists():
-            with _OPENROUTER_MODELS_PATH.open() as f:
-                data = json.load(f)
-            for model in data.get("data", []):
-                mid = model.get("id")
-                if not mid:
-                    continue
-                pricing = model.get("pricing") or {}
-                if not isinstance(pricing, dict):
-                    continue
-                try:
-                    p_raw = pricing.get("prompt")
-                    c_raw = pricing.get("completion")
-                    if p_raw is None and c_raw is None:
-                        continue
-                    p = Decimal(str(p_raw or 0))
-                    c = Decimal(str(c_raw or 0))
-                except Exception as exc:
-                    logger.debug("Skipping model %r pricing row: %s", mid, exc)
-                    continue
-                if p > 0 or c > 0:
-                    result[mid] = (p, c)
-    except Exception:
-        pass
-    _text_token_price_cache = result
-    return result
-
-
 def get_model_text_prices_per_token(model_id: str) -> tuple[Decimal, Decimal] | None:
     """OpenRouter list prices as USD per input token and USD per output token."""
-    m = _load_text_token_price_map()
-    if model_id in m:
-        return m[model_id]
+    index = get_capability_index()
+    rec = index.get(model_id)
+    if rec is not None and rec.text_prices is not None:
+        return rec.text_prices
     if ":" in model_id:
-        base = model_id.split(":")[0]
-        if base in m:
-            return m[base]
+        base = index.get(model_id.split(":")[0])
+        if base is not None:
+            return base.text_prices
     return None
 
 
@@ -432,10 +235,8 @@ def get_model_returns_multiple_images(model_id: str) -> bool:
 
     When True, we only show the first image to the user.
     """
-    for m in OPENROUTER_MODELS:
-        if m.get("id") == model_id:
-            return m.get("returns_multiple_images", False)
-    return False
+    rec = get_capability_index().get(model_id)
+    return rec.returns_multiple_images if rec else False
 
 
 def get_registry_path() -> Path:
@@ -620,25 +421,150 @@ for provider, models in MODELS_BY_PROVIDER.items():
     OPENROUTER_MODELS.extend(models)
 
 
+def _snapshot_text_prices(entry: dict[str, Any]) -> tuple[Decimal, Decimal] | None:
+    pricing = entry.get("pricing") or {}
+    if not isinstance(pricing, dict):
+        return None
+    try:
+        p_raw = pricing.get("prompt")
+        c_raw = pricing.get("completion")
+        if p_raw is None and c_raw is None:
+            return None
+        p = Decimal(str(p_raw or 0))
+        c = Decimal(str(c_raw or 0))
+    except Exception as exc:
+        logger.debug("Skipping model %r pricing row: %s", entry.get("id"), exc)
+        return None
+    return (p, c) if p > 0 or c > 0 else None
+
+
+def _snapshot_image_price(entry: dict[str, Any]) -> float | None:
+    pricing = entry.get("pricing") or {}
+    img_val = pricing.get("image") if isinstance(pricing, dict) else None
+    if img_val is None:
+        return None
+    try:
+        return float(img_val)
+    except (ValueError, TypeError):
+        return None
+
+
+def _snapshot_outputs_images(entry: dict[str, Any]) -> bool:
+    arch = entry.get("architecture") or {}
+    out_mods = arch.get("output_modalities") if isinstance(arch, dict) else []
+    out_str = (
+        " ".join(str(m) for m in out_mods).lower() if isinstance(out_mods, (list, tuple)) else ""
+    )
+    return "image" in out_str
+
+
+def _load_snapshot_entries() -> list[dict[str, Any]]:
+    try:
+        listing = _load_openrouter_snapshot_file().get("data", [])
+    except Exception as exc:
+        logger.warning(f"Could not read {_OPENROUTER_MODELS_PATH.name}: {exc}")
+        return []
+    return [e for e in listing if isinstance(e, dict) and e.get("id")]
+
+
+def build_capability_index(
+    models_by_provider: dict[str, list[dict[str, Any]]],
+    snapshot_entries: list[dict[str, Any]],
+) -> CapabilityIndex:
+    """Compile registry entries and OpenRouter snapshot rows into a :class:`CapabilityIndex`.
+
+    Registry ids come first, in registry order; snapshot-only ids follow. When an id is listed
+    under more than one provider, the first entry wins.
+    """
+    registry: dict[str, tuple[str, dict[str, Any]]] = {}
+    for provider, models in models_by_provider.items():
+        for m in models:
+            mid = m.get("id")
+            if mid and mid not in registry:
+                registry[mid] = (provider, m)
+    snapshot = {str(e["id"]): e for e in snapshot_entries}
+
+    records: dict[str, ModelCapabilities] = {}
+    for mid in [*registry, *(mid for mid in snapshot if mid not in registry)]:
+        provider, reg = registry.get(mid, (None, {}))
+        entry = snapshot.get(mid)
+
+        if "supports_vision_probed" in reg:
+            supports_vision = bool(reg["supports_vision_probed"])
+        elif mid in KNOWN_NON_VISION_MODEL_IDS or entry is None:
+            supports_vision = False
+        else:
+            supports_vision = openrouter_entry_supports_vision_input(entry)
+
+        if mid in KNOWN_NO_TEMPERATURE_MODEL_IDS:
+            supports_temperature = False
+        elif entry is None:
+            supports_temperature = True  # Default True if unknown
+        else:
+            params = entry.get("supported_parameters", [])
+            supports_temperature = "temperature" in params if isinstance(params, list) else False
+
+        streams_reasoning = None
+        if entry is not None:
+            streams_reasoning = streams_separable_reasoning_from_openrouter_entry(entry) is True
+        if streams_reasoning is not None:
+            is_thinking = streams_reasoning
+        else:
+            is_thinking = (
+                mid in STREAMING_REASONING_MODEL_IDS_NOT_IN_SNAPSHOT
+                or reg.get("is_thinking_model") is True
+            )
+
+        limits = extract_token_limits(entry) if entry is not None else {}
+        records[mid] = ModelCapabilities(
+            model_id=mid,
+            name=reg.get("name"),
+            provider=provider,
+            in_registry=mid in registry,
+            in_snapshot=entry is not None,
+            supports_web_search=bool(reg.get("supports_web_search")),
+            registry_image_generation=bool(reg.get("supports_image_generation")),
+            outputs_images=entry is not None and _snapshot_outputs_images(entry),
+            supports_vision=supports_vision,
+            supports_temperature=supports_temperature,
+            streams_reasoning=streams_reasoning,
+            is_thinking_model=is_thinking,
+            returns_multiple_images=bool(reg.get("returns_multiple_images", False)),
+            image_price=_snapshot_image_price(entry) if entry is not None else None,
+            text_prices=_snapshot_text_prices(entry) if entry is not None else None,
+            max_input_tokens=limits.get("max_input"),
+            max_output_tokens=limits.get("max_output"),
+        )
+    return CapabilityIndex(records)
+
+
+def rebuild_capability_index() -> CapabilityIndex:
+    """Compile a fresh index from the loaded registry and snapshot and swap it in."""
+    global _capability_index
+    index = build_capability_index(MODELS_BY_PROVIDER, _load_snapshot_entries())
+    _capability_index = index
+    return index
+
+
+def get_capability_index() -> CapabilityIndex:
+    """The current capability index. Hold the returned object for consistent multi-field reads."""
+    index = _capability_index
+    if index is None:
+        index = rebuild_capability_index()
+    return index
+
+
+def get_model_capabilities(model_id: str) -> ModelCapabilities | None:
+    """O(1) capability record for ``model_id``; None if neither registry nor snapshot lists it."""
+    return get_capability_index().get(model_id)
+
+
+rebuild_capability_index()
+
+
 def invalidate_openrouter_models_json_caches() -> None:
-    """Clear in-memory caches derived from backend/openrouter_models.json after it changes on disk."""
-    global \
-        _temperature_support_cache, \
-        _openrouter_known_ids_cache, \
-        _openrouter_thinking_model_ids_cache, \
-        _vision_support_cache, \
-        _vision_probed_cache, \
-        _image_gen_support_cache, \
-        _image_price_cache, \
-        _text_token_price_cache
-    _temperature_support_cache = None
-    _openrouter_known_ids_cache = None
-    _openrouter_thinking_model_ids_cache = None
-    _vision_support_cache = None
-    _vision_probed_cache = None
-    _image_gen_support_cache = None
-    _image_price_cache = None
-    _text_token_price_cache = None
+    """Rebuild data derived from backend/openrouter_models.json after it changes on disk."""
+    rebuild_capability_index()
     try:
         from .reasoning_probe import invalidate_openrouter_snapshot_cache
 
@@ -663,7 +589,7 @@ def reload_registry() -> None:
     for provider, models in MODELS_BY_PROVIDER.items():
         OPENROUTER_MODELS.extend(models)
 
-    invalidate_vision_probed_cache()
+    rebuild_capability_index()
 
     llm_mod = sys.modules.get("app.llm")
     if llm_mod:
@@ -770,14 +696,3 @@ def filter_models_by_tier(
             model_with_access["trial_unlocked"] = True
         result.append(model_with_access)
     return result
-
-
-client = OpenAI(api_key=settings.openrouter_api_key, base_url="https://openrouter.ai/api/v1")
-client_with_tool_headers = OpenAI(
-    api_key=settings.openrouter_api_key,
-    base_url="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": "https://compareintel.com",
-        "X-Title": "CompareIntel",
-    },
-)
@@ -2,40 +2,46 @@
 OpenRouter streaming API calls, web search tools, URL fetching.
 """
 
+import asyncio
+import inspect
+import json
 import logging
 import re
 import threading
 import time
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
 import httpx  # type: ignore[import-untyped]
-from bs4 import BeautifulSoup  # type: ignore[import-untyped]
 
 from ..config import settings
 from ..mock_responses import stream_mock_response
+from ..search.brave import close_pooled_clients
 from ..search.rate_limiter import get_rate_limiter
 from ..utils.error_handling import (
     classify_api_error,
     format_streaming_error_message,
 )
+from .clients import client, client_with_tool_headers, get_async_client
 from .registry import (
-    client,
-    client_with_tool_headers,
     get_model_returns_multiple_images,
     get_model_supports_temperature,
     get_model_supports_vision,
     openrouter_reasoning_request_body,
     should_request_openrouter_reasoning_traces,
 )
-from .text_processing import clean_model_response, detect_repetition
+from .text_processing import RepetitionDetector, clean_model_response
 from .tokens import TokenUsage, get_model_max_tokens, token_usage_from_openrouter_usage
+from .url_fetch import fetch_page_text
 
 logger = logging.getLogger(__name__)
 
 # Stream event shape for UI (also handled by comparison_stream SSE). Not persisted as assistant text.
 REASONING_STREAM_TYPE = "reasoning"
+# Final event of call_openrouter_streaming_async: {"type": "usage", "usage": TokenUsage | dict | None}
+USAGE_STREAM_TYPE = "usage"
 
 
 def _reasoning_text_delta(delta: Any, choice: Any) -> str | None:
@@ -170,24 +176,11 @@ FETCH_URL_TOOL = {
 
 
 async def fetch_url_content(url: str, max_length: int = 10000) -> str:
-    """Fetch and extract text content from a webpage URL."""
+    """Fetch and extract text content from a webpage URL (served from the shared page cache)."""
     try:
         if not url.startswith(("http://", "https://")):
             raise ValueError(f"Invalid URL format: {url}. URL must start with http:// or https://")
-        async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as http_client:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = await http_client.get(url, headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                script.decompose()
-            text = soup.get_text(separator=" ", strip=True)
-            text = re.sub(r"\s+", " ", text)
-            if len(text) > max_length:
-                text = text[:max_length] + "... [content truncated]"
-            return text.strip()
+        return await fetch_page_text(url, max_length)
     except httpx.HTTPStatusError as e:
         raise Exception(f"HTTP error {e.response.status_code} when fetching URL: {str(e)}")
     except httpx.RequestError as e:
@@ -278,71 +271,55 @@ def _build_user_message_content(
         return result
 
 
-def call_openrouter_streaming(
-    prompt: str,
-    model_id: str,
-    conversation_history: list[Any] | None = None,
-    use_mock: bool = False,
-    max_tokens_override: int | None = None,
-    credits_limited: bool = False,
-    enable_web_search: bool = False,
-    search_provider: Any | None = None,  # SearchProvider instance
-    user_timezone: str | None = None,  # Optional: IANA timezone string (e.g., "America/Chicago")
-    user_location: str | None = None,  # Optional: Location string (e.g., "New York, NY, USA")
-    location_source: str
-    | None = None,  # Optional: Source of location - "user_provided" (accurate) or "ip_based" (approximate)
-    temperature: float | None = None,  # Optional: 0.0-2.0, controls response randomness
-    top_p: float | None = None,  # Optional: 0.0-1.0, nucleus sampling
-    attached_images: list[dict[str, Any]]
-    | None = None,  # Images for vision models [{mime_type, base64_data, filename?, placeholder?}]
-    is_image_generation: bool = False,  # When True, add modalities for image output
-    image_config: dict[str, str] | None = None,  # {aspect_ratio, image_size} for image models
-    _client: Any
-    | None = None,  # Optional: use this OpenAI client instead of global (avoids connection contention in multi-model)
-) -> Generator[Any, None, TokenUsage | dict | None]:
-    """
-    Stream OpenRouter responses token-by-token for faster perceived response time.
-    Yields chunks of text as they arrive from the model.
-    Returns usage data after streaming completes.
-
-    Supports all OpenRouter providers that have streaming enabled:
-    - OpenAI, Azure, Anthropic, Fireworks, Mancer, Recursal
-    - AnyScale, Lepton, OctoAI, Novita, DeepInfra, Together
-    - Cohere, Hyperbolic, Infermatic, Avian, XAI, Cloudflare
-    - SFCompute, Nineteen, Liquid, Friendli, Chutes, DeepSeek
-
-    Args:
-        prompt: User prompt text
-        model_id: Model identifier
-        conversation_history: Optional conversation history
-        use_mock: If True, return mock responses instead of calling API (admin testing feature)
-        max_tokens_override: Optional override for max output tokens (uses model limit if not provided)
-        credits_limited: If True, indicates max_tokens_override was reduced due to low credits
-        enable_web_search: If True, enable web search tool calling for models that support it
-        search_provider: Optional SearchProvider instance for executing web searches
-        user_timezone: Optional IANA timezone string (e.g., "America/Chicago") for context
-        user_location: Optional location string (e.g., "New York, NY, USA") for context
-        location_source: Optional source of location - "user_provided" (accurate) or "ip_based" (approximate)
+# Headers OpenRouter uses to route tool-calling requests to providers that support tools.
+_OPENROUTER_ATTRIBUTION_HEADERS = {
+    "HTTP-Referer": "https://compareintel.com",
+    "X-Title": "CompareIntel",
+}
 
-    Yields:
-        str: Answer content chunks as they arrive
-        dict: ``{"type": "image", "url": ...}`` for image generation streams
-        dict: ``{"type": "reasoning", "content": ...}`` for separable model reasoning (not persisted)
+REPETITION_STOPPED_MESSAGE = "\n\n⚠️ Response stopped - detected repetitive content."
+
+# Prevent infinite tool loops - allows more iterations for complex queries
+MAX_TOOL_CALL_ITERATIONS = 4
+# Hard limit on total tool calls across all iterations
+MAX_TOTAL_TOOL_CALLS = 10
+# Keepalive cadence while a tool runs; matches ACTIVE_STREAMING_WINDOW in the frontend
+TOOL_KEEPALIVE_INTERVAL = 5.0
+# Maximum time to wait for a single web search (2 minutes)
+SEARCH_TIMEOUT = 120.0
+
+# Log wording for each request that can make up one streamed answer
+_PHASE_LABELS = {
+    "initial": "streaming response",
+    "continuation": "continuation streaming response",
+    "final": "final completion response",
+    "completion": "incomplete response completion",
+}
+_TOOL_PHASES = ("initial", "continuation")
+
+_INCOMPLETE_RESPONSE_PATTERNS = (
+    "let me get",
+    "let me try",
+    "let me check",
+    "i'll check",
+    "i'll get",
+    "i'll try",
+)
 
-    Returns:
-        Optional[TokenUsage]: Token usage data, or None if unavailable or in mock mode
-    """
-    # Mock mode: return pre-defined responses for testing
-    if use_mock:
-        print(f"🎭 Mock mode enabled - returning mock response for {model_id}")
-        yield {
-            "type": REASONING_STREAM_TYPE,
-            "content": "[Mock] Simulated planning step before answering.\n\n",
-        }
-        for chunk in stream_mock_response(chunk_size=50):
-            yield chunk
-        return None
 
+def _build_openrouter_messages(
+    prompt: str,
+    model_id: str,
+    conversation_history: list[Any] | None,
+    enable_web_search: bool,
+    user_timezone: str | None,
+    user_location: str | None,
+    location_source: str | None,
+    attached_images: list[dict[str, Any]] | None,
+    is_image_generation: bool,
+    image_config: dict[str, str] | None,
+) -> tuple[list[dict[str, Any]], str]:
+    """Build the chat messages for a request. Returns (messages, prompt as sent)."""
     messages: list[dict[str, Any]] = []
 
     # Debug logging for location/timezone
@@ -440,19 +417,1207 @@ def call_openrouter_streaming(
 
     user_content = _build_user_message_content(prompt, model_id, attached_images)
     messages.append({"role": "user", "content": user_content})
+    return messages, prompt
+
+
+def _completion_params(
+    model_id: str,
+    messages: list[dict[str, Any]],
+    max_tokens: int,
+    temperature: float | None,
+    top_p: float | None,
+) -> dict[str, Any]:
+    """chat.completions.create kwargs shared by every request in a streamed answer."""
+    params: dict[str, Any] = {
+        "model": model_id,
+        "messages": messages,
+        "timeout": settings.individual_model_timeout,
+        "max_tokens": max_tokens,
+        "stream": True,
+        "frequency_penalty": 0.7,  # Reduce token repetition (0.0-2.0, higher = less repetition)
+        "presence_penalty": 0.5,  # Reduce topic/concept repetition (0.0-2.0, higher = less repetition)
+    }
+    if temperature is not None and get_model_supports_temperature(model_id):
+        params["temperature"] = max(0.0, min(2.0, temperature))
+    if top_p is not None:
+        params["top_p"] = max(0.0, min(1.0, top_p))
+    return params
+
+
+def _followup_params(
+    model_id: str,
+    messages: list[dict[str, Any]],
+    max_tokens: int,
+    temperature: float | None,
+    top_p: float | None,
+) -> dict[str, Any]:
+    """Params for continuation / final / completion requests (no image config)."""
+    params = _completion_params(model_id, messages, max_tokens, temperature, top_p)
+    if should_request_openrouter_reasoning_traces(model_id):
+        params["extra_body"] = {"reasoning": openrouter_reasoning_request_body(model_id)}
+    return params
+
+
+def _initial_request_params(
+    model_id: str,
+    messages: list[dict[str, Any]],
+    max_tokens: int,
+    temperature: float | None,
+    top_p: float | None,
+    tools: list[dict[str, Any]] | None,
+    is_image_generation: bool,
+    image_config: dict[str, str] | None,
+) -> dict[str, Any]:
+    """Params for the first request of a streamed answer."""
+    params = _completion_params(model_id, messages, max_tokens, temperature, top_p)
+    if is_image_generation:
+        # Flux, Sourceful, Seedream output only images; Gemini outputs text+image
+        if (
+            model_id.startswith("black-forest-labs/")
+            or model_id.startswith("sourceful/")
+            or model_id.startswith("bytedance-seed/")
+        ):
+            params["modalities"] = ["image"]
+        else:
+            params["modalities"] = ["image", "text"]
+
+    # Add tools if web search is enabled
+    if tools:
+        params["tools"] = tools
+        # Some models (like GPT-5 Chat) may not support tool_choice parameter
+        # However, Mistral models (including Devstral) require tool_choice to actually use tools
+        # Enable tool_choice for Mistral models, but omit for models that don't support it
+        if model_id.startswith("mistralai/"):
+            params["tool_choice"] = "auto"
+        # For other models, omit tool_choice to avoid 404 errors (they'll use tools automatically if supported)
+
+    # Image config: aspect_ratio, image_size; Gemini 3 Pro Image also needs number_of_images
+    extra_body: dict[str, Any] = {}
+    if is_image_generation:
+        ic: dict[str, Any] = {}
+        if image_config:
+            if image_config.get("aspect_ratio"):
+                ic["aspect_ratio"] = image_config["aspect_ratio"]
+            if image_config.get("image_size"):
+                ic["image_size"] = image_config["image_size"]
+        if model_id == "google/gemini-3-pro-image-preview":
+            ic["number_of_images"] = 1
+        if ic:
+            extra_body["image_config"] = ic
+    # OpenRouter: request reasoning tokens so stream deltas include reasoning/thinking (Anthropic etc.)
+    elif should_request_openrouter_reasoning_traces(model_id):
+        extra_body["reasoning"] = openrouter_reasoning_request_body(model_id)
+    if extra_body:
+        params["extra_body"] = extra_body
+    return params
+
+
+def _continuation_params(
+    model_id: str,
+    messages: list[dict[str, Any]],
+    max_tokens: int,
+    temperature: float | None,
+    top_p: float | None,
+    tools: list[dict[str, Any]] | None,
+    tool_call_iteration: int,
+) -> dict[str, Any]:
+    """Params for the request that follows a round of tool results."""
+    params = _followup_params(model_id, messages, max_tokens, temperature, top_p)
+    # Only include tools parameter on first iteration; in continuations tools are already in context.
+    if tools and tool_call_iteration == 1:
+        params["tools"] = tools
+        logger.debug(
+            f"Including tools parameter in continuation request (iteration {tool_call_iteration})"
+        )
+    elif tools and tool_call_iteration > 1:
+        logger.debug(
+            f"Omitting tools parameter in continuation request (iteration {tool_call_iteration}) "
+            f"to avoid potential rs_ resource ID conflicts. Tools are already in conversation context."
+        )
+    return params
+
+
+def _log_request_error(
+    api_error: Exception,
+    model_id: str,
+    tools: list[dict[str, Any]] | None,
+    tool_call_iteration: int | None = None,
+    tool_call_ids: list[str] | None = None,
+) -> None:
+    """Log a failed create() call; continuation failures include the tool call IDs sent."""
+    error_str = str(api_error)
+    error_str_lower = error_str.lower()
+    if tool_call_iteration is not None:
+        logger.error(
+            f"API error for model {model_id} continuation (iteration {tool_call_iteration}): {error_str}"
+        )
+        logger.error(f"Tool call IDs that were sent in continuation request: {tool_call_ids}")
+        if "duplicate" in error_str_lower or "rs_" in error_str:
+            logger.error(
+                f"DUPLICATE ID ERROR DETECTED: Model {model_id} returned duplicate ID error. "
+                f"Error: {error_str}. Tool call IDs sent: {tool_call_ids}."
+            )
+    # Log warning if we get a 404 with tools (model may not support tool calling)
+    if ("404" in error_str_lower or "not found" in error_str_lower) and tools:
+        logger.warning(
+            f"Model {model_id} returned 404 when tools were included. "
+            f"This may indicate the model doesn't support tool calling through OpenRouter. "
+            f"Error: {api_error}"
+        )
+
+
+def _extract_image_url(img: Any) -> str | None:
+    """Read the URL from an image part (SDK object or dict)."""
+    if hasattr(img, "image_url") and img.image_url:
+        return getattr(img.image_url, "url", None) or (
+            img.image_url.get("url") if isinstance(img.image_url, dict) else None
+        )
+    if isinstance(img, dict):
+        iu = img.get("image_url") or img.get("imageUrl")
+        return iu.get("url") if iu else None
+    return None
+
+
+class _StreamState:
+    """Accumulates everything one streamed answer produces across its requests.
+
+    A streamed answer is an initial request, optional continuation requests after tool
+    rounds, and optional final / completion requests. ``consume`` turns one chunk into
+    the events to yield, so the sync and async drivers share the same chunk handling.
+    """
+
+    def __init__(self, model_id: str, is_image_generation: bool):
+        self.model_id = model_id
+        self.is_image_generation = is_image_generation
+        self.full_answer_content = ""
+        self.finish_reason: str | None = None
+        self.repetition_detected = False  # Set True when repetition detection stops the stream
+        self._repetition = RepetitionDetector()
+        self.usage_data: TokenUsage | None = None
+        self.image_count = 0
+        # Deduplicate image URLs (some models return same URL in multiple chunks)
+        self.image_urls_seen: set[str] = set()
+        self.tool_calls_accumulated: dict[int, dict[str, Any]] = {}
+        # Track ALL tool call IDs across entire conversation (never reset)
+        self.all_tool_call_ids_ever_seen: set[str] = set()
+        self.reasoning_details: Any = None  # Capture reasoning details for Gemini models
+        self._reasoning_details_continue: Any = None
+        self.last_chunk: Any = None
+        # True when the last consumed chunk stopped the stream (repetition)
+        self.halted = False
+
+    def begin_continuation(self) -> None:
+        self.tool_calls_accumulated = {}
+        self.finish_reason = None
+        self._reasoning_details_continue = None
+
+    def end_continuation(self) -> None:
+        # Update reasoning_details for next iteration (if we have recursive tool calls)
+        if self._reasoning_details_continue is not None:
+            self.reasoning_details = self._reasoning_details_continue
+
+    def consume(self, chunk: Any, phase: str, response: Any = None) -> list[Any]:
+        """Process one stream chunk and return the events to yield, in order."""
+        events: list[Any] = []
+        self.halted = False
+        if phase != "initial":
+            self.last_chunk = chunk  # Store last chunk for usage data
+        if chunk.choices and len(chunk.choices) > 0:
+            choice = chunk.choices[0]
+            delta = choice.delta
+
+            # Capture reasoning_details if present (required for Gemini models)
+            # Reasoning details may be in delta or in the chunk itself
+            if phase in _TOOL_PHASES:
+                details = None
+                if hasattr(delta, "reasoning_details") and delta.reasoning_details:
+                    details = delta.reasoning_details
+                elif hasattr(choice, "reasoning_details") and choice.reasoning_details:
+                    details = choice.reasoning_details
+                if details is not None:
+                    if phase == "initial":
+                        self.reasoning_details = details
+                    else:
+                        self._reasoning_details_continue = details
+
+            rp = _reasoning_stream_payload(delta, choice)
+            if rp:
+                events.append(rp)
+
+            # Handle tool calls (for web search) - accumulate across chunks
+            if phase in _TOOL_PHASES and hasattr(delta, "tool_calls") and delta.tool_calls:
+                where = "streaming delta" if phase == "initial" else "continuation delta"
+                for tool_call_delta in delta.tool_calls:
+                    self._accumulate_tool_call(
+                        tool_call_delta, tool_call_delta.index, where, incremental=True
+                    )
+
+            if phase == "initial" and self.is_image_generation:
+                if hasattr(delta, "images") and delta.images:
+                    events.extend(self._image_events(delta.images))
+
+            if hasattr(delta, "content") and delta.content:
+                if not self._append_content(delta.content, phase, events):
+                    return events
+
+            # Also check message.content in final chunk (some models like GPT-5 return content here)
+            # This handles cases where content is only in the final chunk's message object
+            if hasattr(choice, "message") and choice.message:
+                message = choice.message
+                if hasattr(message, "content") and message.content:
+                    message_content = message.content
+                    if len(message_content) > len(self.full_answer_content):
+                        # Extract only the new part that hasn't been yielded yet
+                        new_content = message_content[len(self.full_answer_content) :]
+                        if new_content and not self._append_content(new_content, phase, events):
+                            return events
+
+                # Also check message.images in final chunk (Gemini/OpenRouter may return images here)
+                # Deduplicate against delta.images we may have already yielded
+                if phase == "initial" and self.is_image_generation:
+                    if hasattr(message, "images") and message.images:
+                        events.extend(self._image_events(message.images))
+
+                # Also check message.tool_calls in final chunk (some models like GPT-5 Chat return tool_calls here)
+                if phase in _TOOL_PHASES and hasattr(message, "tool_calls") and message.tool_calls:
+                    where = (
+                        "message.tool_calls"
+                        if phase == "initial"
+                        else "continuation message.tool_calls"
+                    )
+                    for tool_call in message.tool_calls:
+                        idx = (
+                            tool_call.index
+                            if hasattr(tool_call, "index")
+                            else len(self.tool_calls_accumulated)
+                        )
+                        # For message tool_calls, arguments are complete, not incremental
+                        self._accumulate_tool_call(tool_call, idx, where, incremental=False)
+
+            # Capture finish reason from last chunk
+            if choice.finish_reason:
+                self.finish_reason = choice.finish_reason
+                # Also check the choice object itself for reasoning_details (may be in final chunk)
+                if phase == "initial":
+                    if hasattr(choice, "reasoning_details") and choice.reasoning_details:
+                        self.reasoning_details = choice.reasoning_details
+
+        # Extract usage data from chunk if available (OpenRouter includes usage.cost on final chunk)
+        if hasattr(chunk, "usage") and chunk.usage:
+            merged = token_usage_from_openrouter_usage(chunk.usage)
+            if merged:
+                self.usage_data = merged
+
+        # Check response object itself for reasoning_details (may be set after streaming)
+        if response is not None:
+            if hasattr(response, "reasoning_details") and response.reasoning_details:
+                self.reasoning_details = response.reasoning_details
+        return events
+
+    def _append_content(self, content_chunk: str, phase: str, events: list[Any]) -> bool:
+        """Append answer text; returns False (and halts) when repetition is detected."""
+        self.full_answer_content += content_chunk
+        repeating = self._repetition.feed(content_chunk)
+        # Only check if we have enough content (avoid false positives early)
+        if len(self.full_answer_content) > 500 and repeating:
+            logger.warning(
+                f"Model {self.model_id} detected repetition in {_PHASE_LABELS[phase]}. "
+                f"Stopping stream early to prevent looping."
+            )
+            events.append(REPETITION_STOPPED_MESSAGE)
+            self.repetition_detected = True
+            # Mark as length-limited to prevent further processing
+            self.finish_reason = "length"
+            self.halted = True
+            return False
+        events.append(content_chunk)
+        return True
+
+    def _image_events(self, images: list[Any]) -> list[dict[str, Any]]:
+        events = []
+        returns_multiple = get_model_returns_multiple_images(self.model_id)
+        for img in images:
+            url = _extract_image_url(img)
+            key = _normalize_image_url_key(url)
+            if url and key and key not in self.image_urls_seen:
+                if returns_multiple and self.image_count >= 1:
+                    continue  # Only show first image to user
+                self.image_urls_seen.add(key)
+                self.image_count += 1
+                events.append({"type": "image", "url": url})
+        return events
+
+    def _accumulate_tool_call(self, tool_call: Any, idx: int, where: str, incremental: bool):
+        tool_call_id = tool_call.id if hasattr(tool_call, "id") and tool_call.id else ""
+
+        # Skip if this tool call ID was already seen anywhere (prevent duplicates)
+        if tool_call_id:
+            if tool_call_id in self.all_tool_call_ids_ever_seen:
+                logger.warning(
+                    f"Model {self.model_id} returned duplicate tool call ID '{tool_call_id}' at index {idx} in {where}, skipping duplicate."
+                )
+                return
+            self.all_tool_call_ids_ever_seen.add(tool_call_id)
+
+        if idx not in self.tool_calls_accumulated:
+            self.tool_calls_accumulated[idx] = {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""},
+            }
+        tc = self.tool_calls_accumulated[idx]
+        if tool_call_id:
+            tc["id"] = tool_call_id
+
+        function = getattr(tool_call, "function", None)
+        if function is not None:
+            name = getattr(function, "name", None)
+            if name:
+                tc["function"]["name"] = name
+            arguments = getattr(function, "arguments", None)
+            if arguments:
+                if incremental:
+                    tc["function"]["arguments"] += arguments
+                else:
+                    tc["function"]["arguments"] = arguments
+
+    def merge_last_chunk_usage(self) -> None:
+        # Extract usage data from last chunk if available (from continuation response)
+        if self.last_chunk is not None and hasattr(self.last_chunk, "usage"):
+            if self.last_chunk.usage:
+                merged = token_usage_from_openrouter_usage(self.last_chunk.usage)
+                if merged:
+                    self.usage_data = merged
+
+    def finish_notices(self, credits_limited: bool) -> list[str]:
+        """Trailing notices for how the stream ended."""
+        # Only show "maximum output length" warning if it wasn't due to repetition detection
+        if self.finish_reason == "length" and not self.repetition_detected:
+            if credits_limited:
+                return ["\n\n⚠️ Response stopped - credits exhausted."]
+            return ["\n\n⚠️ Response truncated - model reached maximum output length."]
+        if self.finish_reason == "content_filter":
+            return ["\n\n⚠️ **Note:** Response stopped by content filter."]
+        return []
+
+    def result(self) -> TokenUsage | dict | None:
+        if self.is_image_generation and self.image_count > 0 and self.usage_data is None:
+            return {"image_count": self.image_count, "model_id": self.model_id}
+        return self.usage_data
+
+
+@dataclass
+class _ToolJob:
+    """One tool call from an assistant turn and the text sent back for it.
+
+    ``content`` is filled in up front for calls that are answered without running the
+    tool (invalid arguments, redundant searches); otherwise the driver runs the job.
+    """
+
+    tool_call_id: str
+    name: str
+    arguments: str
+    argument: str = ""  # Parsed query (search_web) or URL (fetch_url)
+    content: str | None = None
+
+    def as_tool_call(self) -> dict[str, Any]:
+        return {
+            "id": self.tool_call_id,
+            "type": "function",
+            "function": {"name": self.name, "arguments": self.arguments},
+        }
+
+
+def _previous_tool_arguments(messages: list[dict[str, Any]], tool_name: str, key: str) -> list[str]:
+    """Argument values already sent for ``tool_name`` in earlier assistant turns."""
+    values = []
+    for msg in messages:
+        if msg.get("role") == "assistant" and msg.get("tool_calls"):
+            for tc in msg["tool_calls"]:
+                if tc.get("function", {}).get("name") != tool_name:
+                    continue
+                try:
+                    value = json.loads(tc.get("function", {}).get("arguments", "{}")).get(key, "")
+                except Exception as e:
+                    logger.debug(f"Ignoring unparsable {tool_name} arguments in history: {e}")
+                    continue
+                if value:
+                    values.append(value)
+    return values
+
+
+def _parse_tool_argument(arguments: str, key: str, missing_message: str) -> str:
+    # Validate arguments exist and are not empty
+    if not arguments or not arguments.strip():
+        raise ValueError(
+            f"Tool call arguments are missing or empty. Please provide a '{key}' parameter in the arguments."
+        )
+    value = json.loads(arguments).get(key, "")
+    if not value:
+        raise ValueError(missing_message)
+    return value
+
+
+def _plan_tool_round(state: _StreamState, messages: list[dict[str, Any]]) -> list[_ToolJob]:
+    """Turn the accumulated tool calls into jobs, answering invalid or redundant ones."""
+    model_id = state.model_id
+
+    # Deduplicate tool_calls_accumulated by ID; we only process each unique ID once.
+    deduplicated_tool_calls = {}
+    seen_ids_in_dedup: set[str] = set()
+    for idx, tool_call in state.tool_calls_accumulated.items():
+        tool_call_id = (tool_call.get("id") or "").strip()
+        if tool_call_id and tool_call_id in seen_ids_in_dedup:
+            logger.warning(
+                f"Model {model_id} returned duplicate tool call ID '{tool_call_id}' at index {idx} in tool_calls_accumulated, skipping duplicate."
+            )
+            continue
+        deduplicated_tool_calls[idx] = tool_call
+        if tool_call_id:
+            seen_ids_in_dedup.add(tool_call_id)
+
+    jobs: list[_ToolJob] = []
+    for idx, tool_call in sorted(deduplicated_tool_calls.items()):
+        # Validate tool call has required fields before processing
+        tool_call_id = (tool_call.get("id") or "").strip()
+        if not tool_call_id:
+            logger.warning(
+                f"Model {model_id} returned tool call with empty ID at index {idx}, skipping. "
+                f"Tool call: {tool_call}"
+            )
+            continue
+        state.all_tool_call_ids_ever_seen.add(tool_call_id)
+
+        name = tool_call.get("function", {}).get("name")
+        if not name:
+            logger.warning(
+                f"Model {model_id} returned tool call with empty function name at index {idx}, skipping. "
+                f"Tool call: {tool_call}"
+            )
+            continue
+        job = _ToolJob(tool_call_id, name, tool_call["function"].get("arguments", ""))
+
+        if name == "search_web":
+            try:
+                job.argument = _parse_tool_argument(
+                    job.arguments,
+                    "query",
+                    "Search query is missing or empty. Please provide a 'query' parameter with a valid search term.",
+                )
+            except Exception as e:
+                logger.error(f"Error executing web search tool: {e}")
+                job.content = _format_search_error(job.argument, str(e))
+            else:
+                # Check if this is a redundant search (same query as before)
+                # This helps prevent infinite loops where model keeps searching for the same thing
+                previous_searches = [
+                    q.lower().strip()
+                    for q in _previous_tool_arguments(messages, "search_web", "query")
+                ]
+                if job.argument.lower().strip() in previous_searches:
+                    logger.warning(
+                        f"Model {model_id} attempted redundant search with query '{job.argument}' "
+                        f"(already searched in previous iteration). Providing message instead of re-executing."
+                    )
+                    job.content = f"⚠️ This search query ('{job.argument}') was already executed in a previous step. Please review the search results you already received and provide your answer based on that information. Making the same search again will not provide new information."
+            jobs.append(job)
+        elif name == "fetch_url":
+            try:
+                job.argument = _parse_tool_argument(
+                    job.arguments,
+                    "url",
+                    "URL is missing or empty. Please provide a 'url' parameter with a valid URL.",
+                )
+            except Exception as e:
+                logger.error(f"Error executing fetch_url tool: {e}")
+                job.content = f"Error fetching URL content: {str(e)}"
+            else:
+                # Normalize URL (remove query params for comparison)
+                previous_urls = [
+                    u.split("?")[0].lower().strip()
+                    for u in _previous_tool_arguments(messages, "fetch_url", "url")
+                ]
+                if job.argument.split("?")[0].lower().strip() in previous_urls:
+                    logger.warning(
+                        f"Model {model_id} attempted redundant URL fetch: '{job.argument}' "
+                        f"(already fetched in previous iteration). Providing message instead."
+                    )
+                    job.content = f"⚠️ This URL ('{job.argument}') was already fetched in a previous step. The content from that fetch is already available in the conversation. Please review the previously fetched content and provide your answer based on that information. Fetching the same URL again will not provide new information."
+            jobs.append(job)
+    return jobs
+
+
+def _search_provider_name(search_provider: Any) -> str:
+    if search_provider and hasattr(search_provider, "get_provider_name"):
+        return search_provider.get_provider_name()
+    # Fallback: try to infer from search_provider type
+    provider_name = (
+        type(search_provider).__name__.lower().replace("searchprovider", "").replace("provider", "")
+    )
+    if not provider_name or provider_name == "none":
+        provider_name = "default"
+    return provider_name
+
+
+def _search_timestamp() -> tuple[str, str]:
+    current_datetime = datetime.now()
+    return current_datetime.strftime("%A, %B %d, %Y"), current_datetime.strftime("%I:%M %p %Z")
+
+
+def _format_search_results(query: str, search_results: list[Any], search_provider: Any) -> str:
+    """Format search results for the model, including when the search ran."""
+    current_date_str, current_time_str = _search_timestamp()
+
+    # Handle empty search results
+    if not search_results:
+        results_text = "⚠️ SEARCH RETURNED NO RESULTS\n\n"
+        results_text += f"Search query: '{query}'\n"
+        results_text += f"Search executed at: {current_date_str} at {current_time_str}\n\n"
+        results_text += "IMPORTANT: The search returned no results. You MUST explicitly state this to the user. Do NOT fabricate information or provide generic/historical data without clearly stating that current data is unavailable. Consider:\n"
+        results_text += "1. Trying an alternative search query with different keywords\n"
+        results_text += (
+            "2. Explicitly telling the user that current information could not be found\n"
+        )
+        results_text += "3. If you provide historical/average data, clearly label it as such (e.g., 'I was unable to find current weather data, but typically in January...')"
+        return results_text
+
+    results_text = f"✅ SEARCH SUCCESSFUL - {len(search_results)} result(s) found\n\n"
+    results_text += f"Search query: '{query}'\n"
+    results_text += f"Search executed at: {current_date_str} at {current_time_str}\n"
+    results_text += f"Search provider: {search_provider.get_provider_name() if hasattr(search_provider, 'get_provider_name') else 'Unknown'}\n\n"
+    results_text += "Results:\n"
+    for i, result in enumerate(search_results, 1):
+        results_text += f"{i}. {result.title}\n"
+        results_text += f"   URL: {result.url}\n"
+        # Include source if available
+        if hasattr(result, "source") and result.source:
+            results_text += f"   Source: {result.source}\n"
+        results_text += f"   {result.snippet}\n\n"
+
+    # Add instruction to help model provide a complete answer with source citation
+    results_text += "\nCRITICAL: Based on these results, provide a complete answer to the user's question. You MUST:\n"
+    results_text += "1. Cite the specific source URL or service name (e.g., 'According to Weather.com' or 'From https://weather.com/...')\n"
+    results_text += "2. Include the timestamp/data freshness when available\n"
+    results_text += "3. Distinguish between current data and historical/average data\n"
+    results_text += (
+        "4. If you need more detailed information from a specific source, use fetch_url\n"
+    )
+    results_text += "5. Keep your response natural and user-friendly - cite sources clearly but don't mention technical search details"
+    return results_text
+
+
+def _format_search_error(query: str, error_msg: str) -> str:
+    """Detailed search failure message with retry suggestions for the model."""
+    current_date_str, current_time_str = _search_timestamp()
+    error_content = "❌ SEARCH FAILED\n\n"
+    error_content += f"Search query: '{query}'\n"
+    error_content += f"Search attempted at: {current_date_str} at {current_time_str}\n"
+    error_content += f"Error: {error_msg}\n\n"
+    error_content += "IMPORTANT: The web search failed. You MUST explicitly state this to the user. Do NOT fabricate information or provide generic/historical data without clearly stating that the search failed.\n\n"
+    error_content += "OPTIONS:\n"
+    error_content += "1. Try an alternative search query with different keywords or phrasing\n"
+    error_content += "2. Explicitly tell the user that the search failed and current information could not be retrieved\n"
+    error_content += "3. If you provide historical/average data as a fallback, clearly label it as such (e.g., 'I was unable to retrieve current weather data due to a search error, but typically in January...')\n\n"
+
+    # Add retry suggestions based on error type
+    if "rate limit" in error_msg.lower() or "429" in error_msg:
+        error_content += "NOTE: This appears to be a rate limit error. You may want to wait a moment and try again with a slightly modified query."
+    elif "timeout" in error_msg.lower():
+        error_content += "NOTE: The search timed out. Try a more specific or shorter query."
+    else:
+        error_content += "NOTE: Consider trying a different search query or being more specific in your search terms."
+    return error_content
+
+
+async def _execute_search_with_rate_limit(
+    query: str, search_provider: Any, rate_limiter: Any, model_id: str
+) -> list[Any]:
+    """Execute search with rate limiting, caching, and circuit breaker."""
+    provider_name = _search_provider_name(search_provider)
+    logger.warning(
+        f"🔍 Preparing search request for '{query[:50]}...' "
+        f"(model: {model_id}, provider: {provider_name})"
+    )
+
+    # Check cache first for request deduplication
+    # Handle both old and new rate limiter interfaces
+    cache = getattr(rate_limiter, "cache", None)
+    if cache:
+        cached_results = cache.get(provider_name, query)
+        if cached_results is not None:
+            logger.warning(
+                f"✅ Cache HIT - Using cached search results for query: {query[:50]}... "
+                f"(model: {model_id}, provider: {provider_name})"
+            )
+            return cached_results
+
+    logger.warning(
+        f"❌ Cache MISS - Acquiring rate limiter slot for {provider_name} (model: {model_id})"
+    )
+
+    # Identical searches already running for other models are joined, not repeated
+    in_flight = getattr(rate_limiter, "in_flight", None)
+    if in_flight is None:
+        return await _rate_limited_search(query, search_provider, rate_limiter, model_id, cache)
+    return await in_flight.run_search(
+        provider_name,
+        query,
+        lambda: _rate_limited_search(query, search_provider, rate_limiter, model_id, cache),
+    )
+
+
+async def _rate_limited_search(
+    query: str, search_provider: Any, rate_limiter: Any, model_id: str, cache: Any
+) -> list[Any]:
+    """Hit the search provider under the rate limiter and cache the results."""
+    provider_name = _search_provider_name(search_provider)
+    search_start_time = time.time()
+    # Acquire rate limiter permission (waits if necessary)
+    # This coordinates search requests across all concurrent models
+    await rate_limiter.acquire(provider_name)
+    try:
+        logger.warning(
+            f"🚀 Rate limiter slot acquired, executing search for '{query[:50]}...' "
+            f"(model: {model_id}, provider: {provider_name})"
+        )
+        search_results = await search_provider.search(query, max_results=5)
+    except Exception as e:
+        # Record failure for circuit breaker
+        error_msg = str(e).lower()
+        if hasattr(rate_limiter, "record_failure"):
+            error_type = (
+                "rate_limit" if "rate limit" in error_msg or "429" in error_msg else "error"
+            )
+            rate_limiter.record_failure(provider_name, error_type)
+        logger.error(
+            f"❌ Error during search execution for '{query[:50]}...' "
+            f"(model: {model_id}, provider: {provider_name}): {e}",
+            exc_info=True,
+        )
+        raise
+    finally:
+        # Release concurrent slot exactly once, whether the search succeeded or not
+        rate_limiter.release(provider_name)
+
+    # Record success for circuit breaker and adaptive rate limiting
+    response_time = time.time() - search_start_time
+    if hasattr(rate_limiter, "record_success"):
+        rate_limiter.record_success(provider_name, response_time)
+    logger.warning(
+        f"✅ Search completed successfully, caching results for '{query[:50]}...' "
+        f"(model: {model_id}, provider: {provider_name}, results: {len(search_results)}, "
+        f"response_time: {response_time:.2f}s)"
+    )
+
+    # Cache successful results for future requests
+    if cache:
+        cache.set(provider_name, query, search_results)
+    return search_results
+
+
+async def _search_tool_content(
+    query: str, search_provider: Any, rate_limiter: Any, model_id: str
+) -> str:
+    """Run a search_web call and return the text sent back to the model (never raises)."""
+    try:
+        search_results = await _execute_search_with_rate_limit(
+            query, search_provider, rate_limiter, model_id
+        )
+    except Exception as e:
+        error_msg = str(e)
+        if "rate limit" not in error_msg.lower() and "429" not in error_msg:
+            logger.error(f"Error during web search execution: {e}", exc_info=True)
+            return _format_search_error(query, error_msg)
+        # Try to use cached results as graceful degradation
+        provider_name = _search_provider_name(search_provider)
+        cache = getattr(rate_limiter, "cache", None)
+        cached_results = cache.get(provider_name, query) if cache else None
+        if cached_results is None:
+            logger.warning(
+                f"Search API rate limit hit for model {model_id}. "
+                f"This may occur when multiple models make concurrent search requests. "
+                f"No cached results available."
+            )
+            return _format_search_error(
+                query,
+                f"Search API rate limit exceeded. Please try again in a moment. Error: {error_msg}",
+            )
+        logger.info(
+            f"Search API rate limit hit for model {model_id}, "
+            f"using cached results as fallback (provider: {provider_name})"
+        )
+        search_results = cached_results
+    logger.info(f"Web search completed successfully, found {len(search_results)} results")
+    return _format_search_results(query, search_results, search_provider)
+
+
+async def _fetch_tool_content(url: str, rate_limiter: Any) -> str:
+    """Run a fetch_url call and return the text sent back to the model (never raises)."""
+    try:
+        # Acquire rate limiter permission (waits if necessary)
+        await rate_limiter.acquire()
+        try:
+            url_content = await fetch_url_content(url)
+        finally:
+            rate_limiter.release()
+    except Exception as e:
+        logger.error(f"Error executing fetch_url tool: {e}")
+        return f"Error fetching URL content: {str(e)}"
+    logger.info(f"URL fetch completed successfully for {url}")
+    return f"Content from {url}:\n\n{url_content}\n\nBased on this content, provide a complete answer to the user's question. Keep your response natural - don't mention technical details about how you retrieved the information."
+
+
+async def _run_tool_job(
+    job: _ToolJob, search_provider: Any, rate_limiter: Any, model_id: str, iteration: int
+) -> str:
+    if job.name == "search_web":
+        logger.info(
+            f"Executing web search for query: {job.argument} (model: {model_id}, iteration: {iteration})"
+        )
+        return await _search_tool_content(job.argument, search_provider, rate_limiter, model_id)
+    logger.info(f"Fetching URL content: {job.argument} (model: {model_id}, iteration: {iteration})")
+    return await _fetch_tool_content(job.argument, rate_limiter)
+
+
+def _tool_timeout_content(job: _ToolJob, model_id: str) -> str:
+    logger.warning(f"⏱️ Search timeout after {SEARCH_TIMEOUT}s (model: {model_id})")
+    return _format_search_error(job.argument, f"Search timed out after {SEARCH_TIMEOUT}s")
+
+
+async def _tool_job_content(
+    job: _ToolJob, search_provider: Any, rate_limiter: Any, model_id: str, iteration: int
+) -> str:
+    """Run one tool job, turning timeouts and unexpected errors into tool content."""
+    try:
+        if job.name == "search_web":
+            return await asyncio.wait_for(
+                _run_tool_job(job, search_provider, rate_limiter, model_id, iteration),
+                SEARCH_TIMEOUT,
+            )
+        return await _run_tool_job(job, search_provider, rate_limiter, model_id, iteration)
+    except TimeoutError:
+        return _tool_timeout_content(job, model_id)
+    except Exception as e:
+        logger.error(f"Error running {job.name} tool: {e}", exc_info=True)
+        if job.name == "search_web":
+            return _format_search_error(job.argument, str(e))
+        return f"Error fetching URL content: {str(e)}"
+
+
+async def _run_tool_round(
+    jobs: list[_ToolJob], search_provider: Any, rate_limiter: Any, model_id: str, iteration: int
+) -> None:
+    """Run the round's pending tool jobs concurrently and store each job's content.
+
+    Parallel tool calls from one assistant turn overlap; the shared rate limiter still
+    caps how many searches actually hit the provider at once.
+    """
+    pending = [job for job in jobs if job.content is None]
+    if not pending:
+        return
+    contents = await asyncio.gather(
+        *(
+            _tool_job_content(job, search_provider, rate_limiter, model_id, iteration)
+            for job in pending
+        )
+    )
+    for job, content in zip(pending, contents, strict=True):
+        job.content = content
+
+
+# The synchronous driver has no event loop of its own, so its tool rounds are submitted to
+# one long-lived background loop instead of spinning up a thread and loop per tool call.
+_tool_loop: asyncio.AbstractEventLoop | None = None
+_tool_loop_lock = threading.Lock()
+
+
+def _get_tool_loop() -> asyncio.AbstractEventLoop:
+    global _tool_loop
+    with _tool_loop_lock:
+        if _tool_loop is None or _tool_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_run_tool_loop, args=(loop,), name="tool-loop", daemon=True
+            ).start()
+            _tool_loop = loop
+        return _tool_loop
+
+
+def _run_tool_loop(loop: asyncio.AbstractEventLoop) -> None:
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+def shutdown_tool_loop(timeout: float = 5.0) -> None:
+    """Close the tool loop's pooled search client and stop the loop."""
+    global _tool_loop
+    with _tool_loop_lock:
+        loop, _tool_loop = _tool_loop, None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_pooled_clients(), loop).result(timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Closing the tool loop's search client failed: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def _run_tool_round_sync(
+    jobs: list[_ToolJob], search_provider: Any, rate_limiter: Any, model_id: str, iteration: int
+) -> Generator[str, None, None]:
+    """Run a tool round on the background loop, yielding keepalives until it finishes."""
+    future = asyncio.run_coroutine_threadsafe(
+        _run_tool_round(jobs, search_provider, rate_limiter, model_id, iteration),
+        _get_tool_loop(),
+    )
+    try:
+        while True:
+            try:
+                future.result(timeout=TOOL_KEEPALIVE_INTERVAL)
+                return
+            except TimeoutError:
+                # Yield keepalive to reset frontend timeout
+                yield " "
+    finally:
+        if not future.done():
+            future.cancel()
+
+
+def _append_tool_round(
+    messages: list[dict[str, Any]],
+    state: _StreamState,
+    jobs: list[_ToolJob],
+    tool_call_iteration: int,
+    total_tool_calls_made: int,
+) -> tuple[int, bool]:
+    """Append the assistant tool-call turn and its results to ``messages``.
+
+    Returns the updated total tool call count and whether to continue the conversation.
+    """
+    model_id = state.model_id
+
+    # Collect all existing tool call IDs from previous messages to prevent duplicates
+    # This prevents "Duplicate item found with id" errors when the same tool call ID
+    # appears across multiple iterations of the tool call loop
+    existing_tool_call_ids = set(_tool_call_ids_in(messages))
+    tool_call_messages = []
+    for job in jobs:
+        if job.tool_call_id in existing_tool_call_ids:
+            logger.warning(
+                f"Model {model_id} returned tool call with ID '{job.tool_call_id}' that already exists in messages, skipping duplicate. "
+                f"This can occur when the same tool call appears across multiple iterations."
+            )
+            continue
+        existing_tool_call_ids.add(job.tool_call_id)
+        tool_call_messages.append(job.as_tool_call())
+
+    if not tool_call_messages:
+        logger.error(
+            f"Model {model_id} returned tool calls but none had valid IDs after deduplication. "
+            f"Original tool calls: {[job.as_tool_call() for job in jobs]}"
+        )
+        return total_tool_calls_made, False
+
+    # Count total tool calls and check if we've exceeded the limit
+    total_tool_calls_made += len(tool_call_messages)
+    if total_tool_calls_made > MAX_TOTAL_TOOL_CALLS:
+        logger.warning(
+            f"Model {model_id} exceeded max total tool calls ({MAX_TOTAL_TOOL_CALLS}). "
+            f"Total tool calls made: {total_tool_calls_made}. "
+            f"Breaking out of tool call loop to prevent excessive looping."
+        )
+        # Add a message telling the model to stop and provide an answer
+        messages.append(
+            {
+                "role": "user",
+                "content": "🚨 STOP: You have made too many tool calls. Please provide your answer now based on the information you have already gathered. Do not make any more tool calls.",
+            }
+        )
+        return total_tool_calls_made, False
+
+    assistant_message = {
+        "role": "assistant",
+        "content": state.full_answer_content,  # Preserve text content that was streamed
+        "tool_calls": tool_call_messages,
+    }
+    # Only Gemini models require reasoning_details to be echoed back
+    if state.reasoning_details is not None and str(model_id).startswith("google/gemini"):
+        assistant_message["reasoning_details"] = state.reasoning_details
+    messages.append(assistant_message)
+    logger.info(
+        f"Added assistant message with {len(tool_call_messages)} unique tool calls to messages array. "
+        f"Total tool calls made so far: {total_tool_calls_made}/{MAX_TOTAL_TOOL_CALLS}. "
+        f"Tool call IDs: {[tc['id'] for tc in tool_call_messages]}"
+    )
+
+    # Only add tool results that don't already exist in messages
+    existing_tool_result_ids = {
+        msg["tool_call_id"]
+        for msg in messages
+        if msg.get("role") == "tool" and msg.get("tool_call_id")
+    }
+    for job in jobs:
+        if job.tool_call_id in existing_tool_result_ids:
+            logger.warning(
+                f"Model {model_id} returned tool result with duplicate tool_call_id '{job.tool_call_id}', skipping duplicate."
+            )
+            continue
+        content = job.content or ""
+        # If this is the last iteration, add a forceful stop instruction
+        if tool_call_iteration >= MAX_TOOL_CALL_ITERATIONS:
+            content += "\n\nPlease provide your answer now based on the information above."
+        messages.append({"role": "tool", "tool_call_id": job.tool_call_id, "content": content})
+        existing_tool_result_ids.add(job.tool_call_id)
+    return total_tool_calls_made, True
+
+
+def _tool_call_ids_in(messages: list[dict[str, Any]]) -> list[str]:
+    return [
+        tc["id"]
+        for msg in messages
+        if msg.get("role") == "assistant" and msg.get("tool_calls")
+        for tc in msg["tool_calls"]
+        if tc.get("id")
+    ]
+
+
+def _prepare_continuation_messages(
+    messages: list[dict[str, Any]], model_id: str, tool_call_iteration: int
+) -> tuple[list[dict[str, Any]], list[str]]:
+    """Last safety pass before a continuation request: drop duplicate tool call / result IDs.
+
+    Providers reject duplicate IDs (e.g. ``rs_`` resource conflicts). Returns the messages
+    to send and the tool call IDs they contain.
+    """
+    tool_call_ids = _tool_call_ids_in(messages)
+    tool_result_ids = [
+        msg["tool_call_id"]
+        for msg in messages
+        if msg.get("role") == "tool" and msg.get("tool_call_id")
+    ]
+    if len(set(tool_call_ids)) != len(tool_call_ids) or len(set(tool_result_ids)) != len(
+        tool_result_ids
+    ):
+        logger.error(
+            f"CRITICAL: Model {model_id} messages array contains duplicate tool call or tool result IDs "
+            f"before API call. Removing duplicates from messages."
+        )
+        fixed_messages = []
+        seen_call_ids: set[str] = set()
+        seen_result_ids: set[str] = set()
+        for msg in messages:
+            if msg.get("role") == "assistant" and msg.get("tool_calls"):
+                unique_tool_calls = []
+                for tc in msg["tool_calls"]:
+                    tc_id = (tc.get("id") or "").strip()
+                    if tc_id and tc_id not in seen_call_ids:
+                        seen_call_ids.add(tc_id)
+                        unique_tool_calls.append(tc)
+                # Skip assistant message if all tool calls were duplicates
+                if unique_tool_calls:
+                    fixed_messages.append({**msg, "tool_calls": unique_tool_calls})
+            elif msg.get("role") == "tool" and msg.get("tool_call_id"):
+                if msg["tool_call_id"] not in seen_result_ids:
+                    seen_result_ids.add(msg["tool_call_id"])
+                    fixed_messages.append(msg)
+            else:
+                fixed_messages.append(msg)
+        messages[:] = fixed_messages
+        tool_call_ids = _tool_call_ids_in(messages)
+        tool_result_ids = list(seen_result_ids)
+
+    logger.info(
+        f"Making continuation API call for model {model_id} (iteration {tool_call_iteration}). "
+        f"Total messages: {len(messages)}, Tool call IDs: {tool_call_ids}, "
+        f"Tool result IDs: {tool_result_ids}"
+    )
+    return messages, tool_call_ids
+
+
+def _final_answer_prompt(
+    messages: list[dict[str, Any]], enable_web_search: bool, prompt: str
+) -> dict[str, str]:
+    """User turn that forces an answer after the tool iteration limit."""
+    search_tools_used = any(
+        tc.get("function", {}).get("name") == "search_web"
+        for msg in messages
+        if msg.get("role") == "assistant" and msg.get("tool_calls")
+        for tc in msg["tool_calls"]
+    )
+    validation_note = ""
+    # If no search tools were used but query is time-sensitive, add validation note
+    if enable_web_search and not search_tools_used and is_time_sensitive_query(prompt):
+        validation_note = " IMPORTANT: If you did not use search_web for this time-sensitive query, please explicitly state that you were unable to retrieve current information and that any data provided is historical or estimated, not current."
+    return {
+        "role": "user",
+        "content": f"Please provide your answer now based on all the information you have gathered. Do not search for more information.{validation_note}",
+    }
+
+
+def _needs_completion_nudge(
+    messages: list[dict[str, Any]], finish_reason: str | None, model_id: str
+) -> bool:
+    """True when the last assistant turn announced work it never finished ("Let me check:")."""
+    if finish_reason == "tool_calls":
+        return False
+    last_assistant_msg = next(
+        (msg for msg in reversed(messages) if msg.get("role") == "assistant"), None
+    )
+    if not last_assistant_msg:
+        return False
+    last_assistant_content = last_assistant_msg.get("content", "")
+    if not last_assistant_content or not isinstance(last_assistant_content, str):
+        return False
+    content_lower = last_assistant_content.lower().strip()
+    last_sentence = content_lower.split(".")[-1].strip() if "." in content_lower else content_lower
+    if (
+        content_lower.endswith(":")
+        or any(content_lower.startswith(p) for p in _INCOMPLETE_RESPONSE_PATTERNS)
+        or any(p in last_sentence for p in _INCOMPLETE_RESPONSE_PATTERNS)
+    ):
+        logger.info(
+            f"Model {model_id} generated potentially incomplete response: '{last_assistant_content[:100]}...' "
+            f"Detected incomplete pattern. Forcing completion."
+        )
+        return True
+    return False
+
+
+_COMPLETION_NUDGE = {
+    "role": "user",
+    "content": "Please complete your response. Provide the answer to the user's question.",
+}
+
+
+def _reduced_max_tokens(
+    e: Exception, model_id: str, max_tokens: int, can_retry: bool
+) -> int | None:
+    """New max_tokens for a 402 max_tokens retry, or None when the error is final."""
+    if not can_retry or not classify_api_error(e).is_402_max_tokens:
+        return None
+    reduced_max_tokens = max(2048, int(max_tokens * 0.5))
+    if reduced_max_tokens >= max_tokens:
+        return None
+    logger.info(
+        f"[API] 402 max_tokens error for {model_id} - retrying with reduced max_tokens: "
+        f"{max_tokens} -> {reduced_max_tokens}"
+    )
+    return reduced_max_tokens
+
+
+def _stream_error_message(e: Exception, model_id: str) -> str:
+    return format_streaming_error_message(
+        classify_api_error(e), model_id, settings.individual_model_timeout
+    )
+
+
+def call_openrouter_streaming(
+    prompt: str,
+    model_id: str,
+    conversation_history: list[Any] | None = None,
+    use_mock: bool = False,
+    max_tokens_override: int | None = None,
+    credits_limited: bool = False,
+    enable_web_search: bool = False,
+    search_provider: Any | None = None,  # SearchProvider instance
+    user_timezone: str | None = None,  # Optional: IANA timezone string (e.g., "America/Chicago")
+    user_location: str | None = None,  # Optional: Location string (e.g., "New York, NY, USA")
+    location_source: str
+    | None = None,  # Optional: Source of location - "user_provided" (accurate) or "ip_based" (approximate)
+    temperature: float | None = None,  # Optional: 0.0-2.0, controls response randomness
+    top_p: float | None = None,  # Optional: 0.0-1.0, nucleus sampling
+    attached_images: list[dict[str, Any]]
+    | None = None,  # Images for vision models [{mime_type, base64_data, filename?, placeholder?}]
+    is_image_generation: bool = False,  # When True, add modalities for image output
+    image_config: dict[str, str] | None = None,  # {aspect_ratio, image_size} for image models
+    _client: Any
+    | None = None,  # Optional: use this OpenAI client instead of global (avoids connection contention in multi-model)
+) -> Generator[Any, None, TokenUsage | dict | None]:
+    """
+    Stream OpenRouter responses token-by-token for faster perceived response time.
+    Yields chunks of text as they arrive from the model.
+    Returns usage data after streaming completes.
+
+    Blocking driver for scripts and worker threads; comparisons use
+    call_openrouter_streaming_async, which shares all request and chunk handling.
+
+    Supports all OpenRouter providers that have streaming enabled:
+    - OpenAI, Azure, Anthropic, Fireworks, Mancer, Recursal
+    - AnyScale, Lepton, OctoAI, Novita, DeepInfra, Together
+    - Cohere, Hyperbolic, Infermatic, Avian, XAI, Cloudflare
+    - SFCompute, Nineteen, Liquid, Friendli, Chutes, DeepSeek
+
+    Args:
+        prompt: User prompt text
+        model_id: Model identifier
+        conversation_history: Optional conversation history
+        use_mock: If True, return mock responses instead of calling API (admin testing feature)
+        max_tokens_override: Optional override for max output tokens (uses model limit if not provided)
+        credits_limited: If True, indicates max_tokens_override was reduced due to low credits
+        enable_web_search: If True, enable web search tool calling for models that support it
+        search_provider: Optional SearchProvider instance for executing web searches
+        user_timezone: Optional IANA timezone string (e.g., "America/Chicago") for context
+        user_location: Optional location string (e.g., "New York, NY, USA") for context
+        location_source: Optional source of location - "user_provided" (accurate) or "ip_based" (approximate)
+
+    Yields:
+        str: Answer content chunks as they arrive
+        dict: ``{"type": "image", "url": ...}`` for image generation streams
+        dict: ``{"type": "reasoning", "content": ...}`` for separable model reasoning (not persisted)
+
+    Returns:
+        Optional[TokenUsage]: Token usage data, or None if unavailable or in mock mode
+    """
+    # Mock mode: return pre-defined responses for testing
+    if use_mock:
+        print(f"🎭 Mock mode enabled - returning mock response for {model_id}")
+        yield {
+            "type": REASONING_STREAM_TYPE,
+            "content": "[Mock] Simulated planning step before answering.\n\n",
+        }
+        for chunk in stream_mock_response(chunk_size=50):
+            yield chunk
+        return None
+
+    messages, prompt = _build_openrouter_messages(
+        prompt,
+        model_id,
+        conversation_history,
+        enable_web_search,
+        user_timezone,
+        user_location,
+        location_source,
+        attached_images,
+        is_image_generation,
+        image_config,
+    )
 
     # Prepare tools if web search is enabled
-    tools = None
-    if enable_web_search and search_provider:
-        tools = [WEB_SEARCH_TOOL, FETCH_URL_TOOL]
+    tools = [WEB_SEARCH_TOOL, FETCH_URL_TOOL] if enable_web_search and search_provider else None
 
     # Use override if provided (for multi-model comparisons to avoid truncation)
     # Otherwise, use model's maximum capability
-    if max_tokens_override is not None:
-        max_tokens = max_tokens_override
-    else:
-        # Use model's maximum capability
-        max_tokens = get_model_max_tokens(model_id)
+    max_tokens = (
+        max_tokens_override if max_tokens_override is not None else get_model_max_tokens(model_id)
+    )
+
+    # Use client with tool headers when tools are enabled (required by OpenRouter for provider routing)
+    _cl = _client if _client is not None else client
+    _cl_tools = _client if _client is not None else client_with_tool_headers
+
+    def create(params: dict[str, Any], with_tools: bool) -> Any:
+        if not with_tools:
+            return _cl.chat.completions.create(**params)
+        # Try using extra_headers parameter first (if supported by SDK)
+        try:
+            return _cl.chat.completions.create(
+                **params, extra_headers=_OPENROUTER_ATTRIBUTION_HEADERS
+            )
+        except TypeError:
+            # extra_headers not supported, use client with default headers
+            return _cl_tools.chat.completions.create(**params)
 
     # Track retry count for max_tokens reduction on 402 errors
     retry_count = 0
@@ -460,2310 +1625,425 @@ def call_openrouter_streaming(
 
     while retry_count <= max_retries:
         try:
-            api_params = {
-                "model": model_id,
-                "messages": messages,
-                "timeout": settings.individual_model_timeout,
-                "max_tokens": max_tokens,
-                "stream": True,
-                "frequency_penalty": 0.7,  # Reduce token repetition (0.0-2.0, higher = less repetition)
-                "presence_penalty": 0.5,  # Reduce topic/concept repetition (0.0-2.0, higher = less repetition)
-            }
-            if temperature is not None and get_model_supports_temperature(model_id):
-                api_params["temperature"] = max(0.0, min(2.0, temperature))
-            if top_p is not None:
-                api_params["top_p"] = max(0.0, min(1.0, top_p))
-            if is_image_generation:
-                # Flux, Sourceful, Seedream output only images; Gemini outputs text+image
-                if (
-                    model_id.startswith("black-forest-labs/")
-                    or model_id.startswith("sourceful/")
-                    or model_id.startswith("bytedance-seed/")
-                ):
-                    api_params["modalities"] = ["image"]
-                else:
-                    api_params["modalities"] = ["image", "text"]
-
-            # Add tools if web search is enabled
-            if tools:
-                api_params["tools"] = tools
-                # Some models (like GPT-5 Chat) may not support tool_choice parameter
-                # However, Mistral models (including Devstral) require tool_choice to actually use tools
-                # Enable tool_choice for Mistral models, but omit for models that don't support it
-                if model_id.startswith("mistralai/"):
-                    api_params["tool_choice"] = "auto"
-                # For other models, omit tool_choice to avoid 404 errors (they'll use tools automatically if supported)
-
-            # Image config: aspect_ratio, image_size; Gemini 3 Pro Image also needs number_of_images
-            extra_body: dict[str, Any] = {}
-            if is_image_generation:
-                ic: dict[str, Any] = {}
-                if image_config:
-                    if image_config.get("aspect_ratio"):
-                        ic["aspect_ratio"] = image_config["aspect_ratio"]
-                    if image_config.get("image_size"):
-                        ic["image_size"] = image_config["image_size"]
-                if model_id == "google/gemini-3-pro-image-preview":
-                    ic["number_of_images"] = 1
-                if ic:
-                    extra_body["image_config"] = ic
-            # OpenRouter: request reasoning tokens so stream deltas include reasoning/thinking (Anthropic etc.)
-            elif should_request_openrouter_reasoning_traces(model_id):
-                extra_body["reasoning"] = openrouter_reasoning_request_body(model_id)
-
-            # Enable streaming
-            # Use client with tool headers when tools are enabled (required by OpenRouter for provider routing)
-            # OpenRouter needs HTTP-Referer and X-Title headers to route to providers that support tool calling
-            _cl = _client if _client is not None else client
-            _cl_tools = _client if _client is not None else client_with_tool_headers
             try:
-                create_kwargs = dict(api_params)
-                if extra_body:
-                    create_kwargs["extra_body"] = extra_body
-                if tools:
-                    # Try using extra_headers parameter first (if supported by SDK)
-                    # Fall back to _cl_tools if extra_headers doesn't work
-                    try:
-                        response = _cl.chat.completions.create(
-                            **create_kwargs,
-                            extra_headers={
-                                "HTTP-Referer": "https://compareintel.com",
-                                "X-Title": "CompareIntel",
-                            },
-                        )
-                    except TypeError:
-                        # extra_headers not supported, use client with default headers
-                        response = _cl_tools.chat.completions.create(**create_kwargs)
-                else:
-                    response = _cl.chat.completions.create(**create_kwargs)
+                response = create(
+                    _initial_request_params(
+                        model_id,
+                        messages,
+                        max_tokens,
+                        temperature,
+                        top_p,
+                        tools,
+                        is_image_generation,
+                        image_config,
+                    ),
+                    bool(tools),
+                )
             except Exception as api_error:
-                # Log warning if we get a 404 with tools (model may not support tool calling)
-                error_str = str(api_error).lower()
-                if ("404" in error_str or "not found" in error_str) and tools:
-                    logger.warning(
-                        f"Model {model_id} returned 404 when tools were included. "
-                        f"This may indicate the model doesn't support tool calling through OpenRouter. "
-                        f"Error: {api_error}"
-                    )
+                _log_request_error(api_error, model_id, tools)
                 raise
 
-            full_answer_content = ""
-            finish_reason = None
-            repetition_detected = False  # Set True when detect_repetition stops the stream
-            usage_data = None
-            image_count = 0
-            image_urls_seen: set[str] = (
-                set()
-            )  # Deduplicate image URLs (some models return same URL in multiple chunks)
-            tool_calls_accumulated = {}  # Dict to accumulate tool calls by index
-            tool_call_ids_seen = set()  # Track tool call IDs to prevent duplicates across indices
-            all_tool_call_ids_ever_seen = (
-                set()
-            )  # Track ALL tool call IDs across entire conversation (never reset)
-            reasoning_details = None  # Capture reasoning details for Gemini models
-
-            # Iterate through chunks as they arrive
+            state = _StreamState(model_id, is_image_generation)
             for chunk in response:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-
-                    # Capture reasoning_details if present (required for Gemini models)
-                    # Reasoning details may be in delta or in the chunk itself
-                    if hasattr(delta, "reasoning_details") and delta.reasoning_details:
-                        reasoning_details = delta.reasoning_details
-                    elif (
-                        hasattr(chunk.choices[0], "reasoning_details")
-                        and chunk.choices[0].reasoning_details
-                    ):
-                        reasoning_details = chunk.choices[0].reasoning_details
-
-                    rp = _reasoning_stream_payload(delta, chunk.choices[0])
-                    if rp:
-                        yield rp
-
-                    # Handle tool calls (for web search) - accumulate across chunks
-                    if hasattr(delta, "tool_calls") and delta.tool_calls:
-                        for tool_call_delta in delta.tool_calls:
-                            idx = tool_call_delta.index
-
-                            # Get tool call ID if present
-                            tool_call_id_from_delta = ""
-                            if hasattr(tool_call_delta, "id") and tool_call_delta.id:
-                                tool_call_id_from_delta = tool_call_delta.id
-
-                            # Skip if this tool call ID was already seen anywhere (prevent duplicates)
-                            if tool_call_id_from_delta:
-                                if tool_call_id_from_delta in all_tool_call_ids_ever_seen:
-                                    logger.warning(
-                                        f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_delta}' at index {idx} in streaming delta, skipping duplicate."
-                                    )
-                                    continue
-                                all_tool_call_ids_ever_seen.add(tool_call_id_from_delta)
-
-                            # Also check local set for this batch
-                            if (
-                                tool_call_id_from_delta
-                                and tool_call_id_from_delta in tool_call_ids_seen
-                            ):
-                                logger.warning(
-                                    f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_delta}' at index {idx} in streaming delta (local duplicate), skipping."
-                                )
-                                continue
-
-                            # Initialize tool call structure if needed
-                            if idx not in tool_calls_accumulated:
-                                tool_calls_accumulated[idx] = {
-                                    "id": "",
-                                    "type": "function",
-                                    "function": {"name": "", "arguments": ""},
-                                }
-
-                            tc = tool_calls_accumulated[idx]
-
-                            # Update tool call ID
-                            if tool_call_id_from_delta:
-                                tc["id"] = tool_call_id_from_delta
-                                tool_call_ids_seen.add(tool_call_id_from_delta)
-
-                            # Update function name and arguments
-                            if hasattr(tool_call_delta, "function"):
-                                if (
-                                    hasattr(tool_call_delta.function, "name")
-                                    and tool_call_delta.function.name
-                                ):
-                                    tc["function"]["name"] = tool_call_delta.function.name
-                                if (
-                                    hasattr(tool_call_delta.function, "arguments")
-                                    and tool_call_delta.function.arguments
-                                ):
-                                    tc["function"]["arguments"] += (
-                                        tool_call_delta.function.arguments
-                                    )
-
-                    if is_image_generation and hasattr(delta, "images") and delta.images:
-                        returns_multiple = get_model_returns_multiple_images(model_id)
-                        for img in delta.images:
-                            url = None
-                            if hasattr(img, "image_url") and img.image_url:
-                                url = getattr(img.image_url, "url", None) or (
-                                    img.image_url.get("url")
-                                    if isinstance(img.image_url, dict)
-                                    else None
-                                )
-                            elif isinstance(img, dict):
-                                iu = img.get("image_url") or img.get("imageUrl")
-                                url = iu.get("url") if iu else None
-                            key = _normalize_image_url_key(url)
-                            if url and key and key not in image_urls_seen:
-                                if returns_multiple and image_count >= 1:
-                                    pass  # Only show first image to user
-                                else:
-                                    image_urls_seen.add(key)
-                                    image_count += 1
-                                    yield {"type": "image", "url": url}
-
-                    if hasattr(delta, "content") and delta.content:
-                        content_chunk = delta.content
-                        full_answer_content += content_chunk
-
-                        # Check for repetition in streaming content
-                        # Only check if we have enough content (avoid false positives early)
-                        if len(full_answer_content) > 500:
-                            if detect_repetition(full_answer_content):
-                                logger.warning(
-                                    f"Model {model_id} detected repetition in streaming response. "
-                                    f"Stopping stream early to prevent looping."
-                                )
-                                yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                repetition_detected = True  # Mark that repetition was detected
-                                finish_reason = (
-                                    "length"  # Mark as length-limited to prevent further processing
-                                )
-                                break
-
-                        yield content_chunk
-
-                    # Also check message.content in final chunk (some models like GPT-5 return content here)
-                    # This handles cases where content is only in the final chunk's message object
-                    if hasattr(chunk.choices[0], "message") and chunk.choices[0].message:
-                        message = chunk.choices[0].message
-                        if hasattr(message, "content") and message.content:
-                            message_content = message.content
-                            if message_content and len(message_content) > len(full_answer_content):
-                                # Extract only the new part that hasn't been yielded yet
-                                new_content = message_content[len(full_answer_content) :]
-                                if new_content:
-                                    content_chunk = new_content
-                                    full_answer_content += content_chunk
-
-                                    # Check for repetition
-                                    if len(full_answer_content) > 500:
-                                        if detect_repetition(full_answer_content):
-                                            logger.warning(
-                                                f"Model {model_id} detected repetition in streaming response. "
-                                                f"Stopping stream early to prevent looping."
-                                            )
-                                            yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                            repetition_detected = True
-                                            finish_reason = "length"
-                                            break
-
-                                    yield content_chunk
-                            elif message_content and not full_answer_content:
-                                # If we haven't yielded any content yet, yield the entire message content
-                                # This handles cases where GPT-5 models return all content in the final chunk
-                                content_chunk = message_content
-                                full_answer_content += content_chunk
-
-                                # Check for repetition
-                                if len(full_answer_content) > 500:
-                                    if detect_repetition(full_answer_content):
-                                        logger.warning(
-                                            f"Model {model_id} detected repetition in streaming response. "
-                                            f"Stopping stream early to prevent looping."
-                                        )
-                                        yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                        repetition_detected = (
-                                            True  # Mark that repetition was detected
-                                        )
-                                        finish_reason = "length"
-                                        break
-
-                                yield content_chunk
-
-                        # Also check message.images in final chunk (Gemini/OpenRouter may return images here)
-                        # Deduplicate against delta.images we may have already yielded
-                        if is_image_generation and hasattr(message, "images") and message.images:
-                            returns_multiple = get_model_returns_multiple_images(model_id)
-                            for img in message.images:
-                                url = None
-                                if hasattr(img, "image_url") and img.image_url:
-                                    url = getattr(img.image_url, "url", None) or (
-                                        img.image_url.get("url")
-                                        if isinstance(img.image_url, dict)
-                                        else None
-                                    )
-                                elif isinstance(img, dict):
-                                    iu = img.get("image_url") or img.get("imageUrl")
-                                    url = iu.get("url") if iu else None
-                                key = _normalize_image_url_key(url)
-                                if url and key and key not in image_urls_seen:
-                                    if returns_multiple and image_count >= 1:
-                                        pass  # Only show first image to user
-                                    else:
-                                        image_urls_seen.add(key)
-                                        image_count += 1
-                                        yield {"type": "image", "url": url}
-
-                        # Also check message.tool_calls in final chunk (some models like GPT-5 Chat return tool_calls here)
-                        # This handles cases where tool_calls are only in the final chunk's message object
-                        if hasattr(message, "tool_calls") and message.tool_calls:
-                            for tool_call in message.tool_calls:
-                                idx = (
-                                    tool_call.index
-                                    if hasattr(tool_call, "index")
-                                    else len(tool_calls_accumulated)
-                                )
-
-                                # Get tool call ID if present
-                                tool_call_id_from_message = ""
-                                if hasattr(tool_call, "id") and tool_call.id:
-                                    tool_call_id_from_message = tool_call.id
-
-                                # Skip if this tool call ID was already seen anywhere (prevent duplicates)
-                                if tool_call_id_from_message:
-                                    if tool_call_id_from_message in all_tool_call_ids_ever_seen:
-                                        logger.warning(
-                                            f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_message}' at index {idx} in message.tool_calls, skipping duplicate."
-                                        )
-                                        continue
-                                    all_tool_call_ids_ever_seen.add(tool_call_id_from_message)
-
-                                # Also check local set for this batch
-                                if (
-                                    tool_call_id_from_message
-                                    and tool_call_id_from_message in tool_call_ids_seen
-                                ):
-                                    logger.warning(
-                                        f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_message}' at index {idx} in message.tool_calls (local duplicate), skipping."
-                                    )
-                                    continue
-
-                                # Initialize tool call structure if needed
-                                if idx not in tool_calls_accumulated:
-                                    tool_calls_accumulated[idx] = {
-                                        "id": "",
-                                        "type": "function",
-                                        "function": {"name": "", "arguments": ""},
-                                    }
-
-                                tc = tool_calls_accumulated[idx]
-
-                                # Update tool call ID (prefer message tool_call ID as it's complete)
-                                if tool_call_id_from_message:
-                                    tc["id"] = tool_call_id_from_message
-                                    tool_call_ids_seen.add(tool_call_id_from_message)
-
-                                # Update function name and arguments (prefer message tool_call as it's complete)
-                                if hasattr(tool_call, "function"):
-                                    if (
-                                        hasattr(tool_call.function, "name")
-                                        and tool_call.function.name
-                                    ):
-                                        tc["function"]["name"] = tool_call.function.name
-                                    if (
-                                        hasattr(tool_call.function, "arguments")
-                                        and tool_call.function.arguments
-                                    ):
-                                        # For message tool_calls, arguments are complete, not incremental
-                                        tc["function"]["arguments"] = tool_call.function.arguments
-
-                    # Capture finish reason from last chunk
-                    if chunk.choices[0].finish_reason:
-                        finish_reason = chunk.choices[0].finish_reason
-
-                        # Also check the choice object itself for reasoning_details (may be in final chunk)
-                        if (
-                            hasattr(chunk.choices[0], "reasoning_details")
-                            and chunk.choices[0].reasoning_details
-                        ):
-                            reasoning_details = chunk.choices[0].reasoning_details
-
-                # Extract usage data from chunk if available (OpenRouter includes usage.cost on final chunk)
-                if hasattr(chunk, "usage") and chunk.usage:
-                    merged = token_usage_from_openrouter_usage(chunk.usage)
-                    if merged:
-                        usage_data = merged
-
-                # Check response object itself for reasoning_details (may be set after streaming)
-                if hasattr(response, "reasoning_details") and response.reasoning_details:
-                    reasoning_details = response.reasoning_details
+                yield from state.consume(chunk, "initial", response)
+                if state.halted:
+                    break
 
             # Handle tool calls after streaming completes.
             # Some models (e.g. Gemini 2.0 Flash) make aggressive tool calls that can exhaust
             # search API rate limits when models run in parallel; the rate limiter coordinates requests.
-            max_tool_call_iterations = (
-                4  # Prevent infinite loops - allows more iterations for complex queries
-            )
             tool_call_iteration = 0
-            total_tool_calls_made = 0  # Track total tool calls across all iterations
-            max_total_tool_calls = 10  # Hard limit on total tool calls to prevent excessive looping
-            last_chunk = None
-
-            # Get rate limiter for coordinating search requests across models
-            # This prevents API rate limit exhaustion when multiple models make concurrent searches
+            total_tool_calls_made = 0
             rate_limiter = get_rate_limiter()
 
             while (
-                finish_reason == "tool_calls"
-                and tool_calls_accumulated
+                state.finish_reason == "tool_calls"
+                and state.tool_calls_accumulated
                 and search_provider
-                and tool_call_iteration < max_tool_call_iterations
+                and tool_call_iteration < MAX_TOOL_CALL_ITERATIONS
             ):
                 tool_call_iteration += 1
-
-                # Log iteration for debugging
                 logger.info(
                     f"Processing tool calls iteration {tool_call_iteration} for model {model_id}. "
-                    f"Tool calls accumulated: {len(tool_calls_accumulated)}"
+                    f"Tool calls accumulated: {len(state.tool_calls_accumulated)}"
                 )
-
-                # If we're on the last iteration, add a forceful instruction to stop
-                if tool_call_iteration >= max_tool_call_iterations:
+                if tool_call_iteration >= MAX_TOOL_CALL_ITERATIONS:
                     logger.warning(
-                        f"Model {model_id} reached max tool call iterations ({max_tool_call_iterations}). "
+                        f"Model {model_id} reached max tool call iterations ({MAX_TOOL_CALL_ITERATIONS}). "
                         f"This is the final iteration - model must provide answer now."
                     )
 
                 # Yield keepalive at start of each iteration to prevent timeout
-                # This is especially important for slower models that take longer to process tool calls
                 yield " "
 
-                # Deduplicate tool_calls_accumulated by ID; we only process each unique ID once.
-                # all_tool_call_ids_ever_seen is not checked here because IDs are added during accumulation.
-                deduplicated_tool_calls = {}
-                seen_ids_in_dedup = (
-                    set()
-                )  # Track IDs we've added to deduplicated_tool_calls in this pass
-                for idx, tool_call in tool_calls_accumulated.items():
-                    tool_call_id = tool_call.get("id", "").strip() if tool_call.get("id") else ""
-
-                    if not tool_call_id:
-                        # Keep entries without IDs (they'll be validated later)
-                        deduplicated_tool_calls[idx] = tool_call
-                        continue
-
-                    # Check if we already have this ID in deduplicated_tool_calls (within this deduplication pass)
-                    if tool_call_id in seen_ids_in_dedup:
-                        logger.warning(
-                            f"Model {model_id} returned duplicate tool call ID '{tool_call_id}' at index {idx} in tool_calls_accumulated, skipping duplicate."
-                        )
-                        continue
-
-                    # Add to deduplicated_tool_calls and track it
-                    deduplicated_tool_calls[idx] = tool_call
-                    seen_ids_in_dedup.add(tool_call_id)
-                    # DON'T add to all_tool_call_ids_ever_seen here - wait until we actually process it
-
-                # Now process the deduplicated tool calls
-                tool_call_messages = []
-                tool_results = []
-                processed_ids_this_iteration = set()  # Track IDs we've processed in this iteration
-
-                for idx, tool_call in sorted(deduplicated_tool_calls.items()):
-                    # Validate tool call has required fields before processing
-                    if not tool_call.get("id") or not tool_call["id"].strip():
-                        logger.warning(
-                            f"Model {model_id} returned tool call with empty ID at index {idx}, skipping. "
-                            f"Tool call: {tool_call}"
-                        )
-                        continue
+                jobs = _plan_tool_round(state, messages)
+                if not jobs:
+                    continue
+                # Keepalives before/while/after the tools run reset the frontend timeout
+                yield " "
+                yield from _run_tool_round_sync(
+                    jobs, search_provider, rate_limiter, model_id, tool_call_iteration
+                )
+                yield " "
 
-                    tool_call_id = tool_call["id"].strip()
+                total_tool_calls_made, proceed = _append_tool_round(
+                    messages, state, jobs, tool_call_iteration, total_tool_calls_made
+                )
+                if not proceed:
+                    break
 
-                    # Skip if we've already processed this ID in this iteration
-                    if tool_call_id in processed_ids_this_iteration:
-                        logger.warning(
-                            f"Model {model_id} duplicate tool call ID '{tool_call_id}' already processed in this iteration, skipping."
-                        )
-                        continue
-
-                    # Mark as processed and add to global tracker
-                    # This is where we actually add IDs to all_tool_call_ids_ever_seen (not during accumulation)
-                    processed_ids_this_iteration.add(tool_call_id)
-                    all_tool_call_ids_ever_seen.add(tool_call_id)
-
-                    # Double-check it's not already in tool_call_messages (safety)
-                    already_in_messages = any(
-                        tc.get("id", "").strip() == tool_call_id
-                        for tc in tool_call_messages
-                        if tc.get("id")
-                    )
-                    if already_in_messages:
-                        logger.warning(
-                            f"Model {model_id} duplicate tool call ID '{tool_call_id}' already in tool_call_messages, skipping."
-                        )
-                        continue
+                # Keepalive before the continuation call: Gemini 3 Pro Preview can take
+                # time to start streaming after receiving tool results
+                yield " "
 
-                    if not tool_call.get("function", {}).get("name"):
-                        logger.warning(
-                            f"Model {model_id} returned tool call with empty function name at index {idx}, skipping. "
-                            f"Tool call: {tool_call}"
-                        )
-                        continue
-
-                    if tool_call["function"]["name"] == "search_web":
-                        # Initialize search_query before try block to ensure it's always defined
-                        # even if an exception occurs during JSON parsing
-                        search_query = ""
-                        try:
-                            import json
-
-                            # Validate arguments exist and are not empty
-                            arguments_str = tool_call["function"].get("arguments", "")
-                            if not arguments_str or not arguments_str.strip():
-                                raise ValueError(
-                                    "Tool call arguments are missing or empty. Please provide a 'query' parameter in the arguments."
-                                )
-                            # Parse arguments
-                            args = json.loads(arguments_str)
-                            search_query = args.get("query", "")
-                            if not search_query:
-                                raise ValueError(
-                                    "Search query is missing or empty. Please provide a 'query' parameter with a valid search term."
-                                )
-
-                            # Check if this is a redundant search (same query as before)
-                            # This helps prevent infinite loops where model keeps searching for the same thing
-                            previous_searches = []
-                            for msg in messages:
-                                if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                                    for tc in msg["tool_calls"]:
-                                        if tc.get("function", {}).get("name") == "search_web":
-                                            try:
-                                                prev_args = json.loads(
-                                                    tc.get("function", {}).get("arguments", "{}")
-                                                )
-                                                prev_query = prev_args.get("query", "")
-                                                if prev_query:
-                                                    previous_searches.append(
-                                                        prev_query.lower().strip()
-                                                    )
-                                            except:
-                                                pass
-
-                            if search_query and search_query.lower().strip() in previous_searches:
-                                logger.warning(
-                                    f"Model {model_id} attempted redundant search with query '{search_query}' "
-                                    f"(already searched in previous iteration). Providing message instead of re-executing."
-                                )
-                                # Provide a message indicating the search was already done
-                                tool_call_messages.append(
-                                    {
-                                        "id": tool_call_id,
-                                        "type": "function",
-                                        "function": {
-                                            "name": "search_web",
-                                            "arguments": tool_call["function"]["arguments"],
-                                        },
-                                    }
-                                )
-                                tool_results.append(
-                                    {
-                                        "tool_call_id": tool_call_id,
-                                        "content": f"⚠️ This search query ('{search_query}') was already executed in a previous step. Please review the search results you already received and provide your answer based on that information. Making the same search again will not provide new information.",
-                                    }
-                                )
-                                continue
-
-                            if search_query:
-                                # Yield keepalive chunk before websearch to reset frontend timeout
-                                # This prevents timeout during websearch execution which can take several seconds
-                                yield " "
-
-                                # Execute search with rate limiting and periodic keepalives
-                                # Since we're in a thread pool (no event loop), create a new event loop
-                                # and properly clean it up to avoid semaphore leaks
-                                import asyncio
-                                import queue
-
-                                logger.info(
-                                    f"Executing web search for query: {search_query} (model: {model_id}, iteration: {tool_call_iteration})"
-                                )
-
-                                async def execute_search_with_rate_limit():
-                                    """Execute search with rate limiting, caching, and circuit breaker."""
-                                    # Get provider name - ensure we always get the correct provider
-                                    if search_provider and hasattr(
-                                        search_provider, "get_provider_name"
-                                    ):
-                                        provider_name = search_provider.get_provider_name()
-                                    else:
-                                        # Fallback: try to infer from search_provider type
-                                        provider_name = (
-                                            type(search_provider)
-                                            .__name__.lower()
-                                            .replace("searchprovider", "")
-                                            .replace("provider", "")
-                                        )
-                                        if not provider_name or provider_name == "none":
-                                            provider_name = "default"
-
-                                    logger.warning(
-                                        f"🔍 Preparing search request for '{search_query[:50]}...' "
-                                        f"(model: {model_id}, provider: {provider_name})"
-                                    )
-
-                                    # Check cache first for request deduplication
-                                    # Handle both old and new rate limiter interfaces
-                                    cache = getattr(rate_limiter, "cache", None)
-                                    if cache:
-                                        cached_results = cache.get(provider_name, search_query)
-                                        if cached_results is not None:
-                                            logger.warning(
-                                                f"✅ Cache HIT - Using cached search results for query: {search_query[:50]}... "
-                                                f"(model: {model_id}, provider: {provider_name})"
-                                            )
-                                            return cached_results
-
-                                    logger.warning(
-                                        f"❌ Cache MISS - Acquiring rate limiter slot for {provider_name} "
-                                        f"(model: {model_id})"
-                                    )
-
-                                    search_start_time = time.time()
-                                    try:
-                                        # Acquire rate limiter permission (waits if necessary)
-                                        # This coordinates search requests across all concurrent models
-                                        # Uses provider-specific limits if configured
-                                        await rate_limiter.acquire(provider_name)
-                                        logger.warning(
-                                            f"🚀 Rate limiter slot acquired, executing search for '{search_query[:50]}...' "
-                                            f"(model: {model_id}, provider: {provider_name})"
-                                        )
-                                        try:
-                                            # Execute the actual search
-                                            search_results = await search_provider.search(
-                                                search_query, max_results=5
-                                            )
-
-                                            # Record success for circuit breaker and adaptive rate limiting
-                                            response_time = time.time() - search_start_time
-                                            if hasattr(rate_limiter, "record_success"):
-                                                rate_limiter.record_success(
-                                                    provider_name, response_time
-                                                )
-
-                                            logger.warning(
-                                                f"✅ Search completed successfully, caching results for '{search_query[:50]}...' "
-                                                f"(model: {model_id}, provider: {provider_name}, results: {len(search_results)}, "
-                                                f"response_time: {response_time:.2f}s)"
-                                            )
-
-                                            # Cache successful results for future requests
-                                            if cache:
-                                                cache.set(
-                                                    provider_name, search_query, search_results
-                                                )
-
-                                            return search_results
-                                        finally:
-                                            # Release concurrent slot after search completes
-                                            logger.debug(
-                                                f"🔓 Releasing rate limiter slot for {provider_name} "
-                                                f"(model: {model_id})"
-                                            )
-                                            rate_limiter.release(provider_name)
-                                            logger.debug(
-                                                f"✅ Rate limiter release() called for {provider_name} "
-                                                f"(model: {model_id})"
-                                            )
-                                    except Exception as e:
-                                        # Release concurrent slot on error
-                                        rate_limiter.release(provider_name)
-
-                                        # Record failure for circuit breaker
-                                        error_msg = str(e).lower()
-                                        if hasattr(rate_limiter, "record_failure"):
-                                            error_type = (
-                                                "rate_limit"
-                                                if "rate limit" in error_msg or "429" in error_msg
-                                                else "error"
-                                            )
-                                            rate_limiter.record_failure(provider_name, error_type)
-
-                                        logger.error(
-                                            f"❌ Error during search execution for '{search_query[:50]}...' "
-                                            f"(model: {model_id}, provider: {provider_name}): {e}",
-                                            exc_info=True,
-                                        )
-                                        raise
-
-                                # Use threading to run search in background and yield keepalives periodically
-                                # This prevents frontend timeout during long search operations
-                                search_queue = queue.Queue()
-                                search_exception = None
-                                search_results = None
-
-                                def run_search():
-                                    """Run search in thread and put result in queue."""
-                                    nonlocal search_exception
-                                    # Create a new event loop for this thread to avoid semaphore leaks
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-                                    try:
-                                        result = loop.run_until_complete(
-                                            execute_search_with_rate_limit()
-                                        )
-                                        search_queue.put(("success", result))
-                                    except Exception as e:
-                                        search_exception = e
-                                        search_queue.put(("error", None))
-                                    finally:
-                                        # Properly close the event loop to prevent resource leaks
-                                        try:
-                                            # Cancel any pending tasks
-                                            pending = asyncio.all_tasks(loop)
-                                            for task in pending:
-                                                task.cancel()
-                                            # Wait for tasks to complete cancellation
-                                            if pending:
-                                                loop.run_until_complete(
-                                                    asyncio.gather(*pending, return_exceptions=True)
-                                                )
-                                        except Exception:
-                                            pass
-                                        finally:
-                                            loop.close()
-
-                                # Start search in background thread
-                                search_thread = threading.Thread(target=run_search, daemon=True)
-                                search_thread.start()
-
-                                # Yield keepalives every 5 seconds while waiting for search to complete
-                                # This ensures frontend timeout is reset during long search operations
-                                # Use 5 seconds to match ACTIVE_STREAMING_WINDOW in frontend
-                                KEEPALIVE_INTERVAL = 5.0  # Send keepalive every 5 seconds
-                                SEARCH_TIMEOUT = (
-                                    120.0  # Maximum time to wait for search (2 minutes)
-                                )
-                                search_start_time = time.time()
-
-                                try:
-                                    while True:
-                                        try:
-                                            # Check if search completed (non-blocking)
-                                            result_type, result_data = search_queue.get(
-                                                timeout=KEEPALIVE_INTERVAL
-                                            )
-
-                                            if result_type == "success":
-                                                search_results = result_data
-                                                logger.info(
-                                                    f"Web search completed successfully, found {len(search_results)} results"
-                                                )
-                                                # Yield keepalive chunk after websearch to reset frontend timeout
-                                                yield " "
-                                                break
-                                            else:
-                                                # Error occurred in search thread
-                                                raise search_exception
-                                        except queue.Empty:
-                                            # Search still running - check for timeout
-                                            elapsed = time.time() - search_start_time
-                                            if elapsed > SEARCH_TIMEOUT:
-                                                # Search timed out - release rate limiter and raise error
-                                                provider_name = (
-                                                    search_provider.get_provider_name()
-                                                    if hasattr(search_provider, "get_provider_name")
-                                                    else "default"
-                                                )
-                                                logger.warning(
-                                                    f"⏱️ Search timeout after {elapsed:.1f}s for {provider_name} "
-                                                    f"(model: {model_id}), releasing rate limiter slot"
-                                                )
-                                                try:
-                                                    rate_limiter.release(provider_name)
-                                                except Exception as release_error:
-                                                    logger.error(
-                                                        f"Failed to release rate limiter on timeout: {release_error}",
-                                                        exc_info=True,
-                                                    )
-                                                raise Exception(
-                                                    f"Search timed out after {SEARCH_TIMEOUT}s"
-                                                )
-                                            # Yield keepalive to reset frontend timeout
-                                            yield " "
-
-                                    # Search completed successfully, search_results is set
-                                    # Ensure thread is properly joined to clean up resources
-                                    search_thread.join(timeout=5.0)
-                                except Exception:
-                                    # Wait for thread to finish before handling error
-                                    search_thread.join(timeout=5.0)
-                                    if search_exception:
-                                        search_exec_error = search_exception
-                                    error_msg = str(search_exec_error)
-
-                                    try:
-                                        provider_name = (
-                                            search_provider.get_provider_name()
-                                            if hasattr(search_provider, "get_provider_name")
-                                            else "default"
-                                        )
-                                        logger.warning(
-                                            f"🔓 Releasing rate limiter slot for {provider_name} "
-                                            f"due to search error/timeout (model: {model_id})"
-                                        )
-                                        rate_limiter.release(provider_name)
-                                    except Exception as release_error:
-                                        logger.error(
-                                            f"Failed to release rate limiter slot: {release_error}",
-                                            exc_info=True,
-                                        )
-
-                                    # Check if this is a rate limit error
-                                    if "rate limit" in error_msg.lower() or "429" in error_msg:
-                                        # Try to use cached results as graceful degradation
-                                        cached_results = rate_limiter.cache.get(
-                                            provider_name, search_query
-                                        )
-                                        if cached_results is not None:
-                                            logger.info(
-                                                f"Search API rate limit hit for model {model_id}, "
-                                                f"using cached results as fallback (provider: {provider_name})"
-                                            )
-                                            search_results = cached_results
-                                            # Continue with cached results instead of raising error
-                                        else:
-                                            logger.warning(
-                                                f"Search API rate limit hit for model {model_id}. "
-                                                f"This may occur when multiple models make concurrent search requests. "
-                                                f"No cached results available."
-                                            )
-                                            # Provide a helpful error message to the model
-                                            raise Exception(
-                                                f"Search API rate limit exceeded. Please try again in a moment. "
-                                                f"Error: {error_msg}"
-                                            )
-                                    else:
-                                        logger.error(
-                                            f"Error during web search execution: {search_exec_error}",
-                                            exc_info=True,
-                                        )
-                                        raise
-
-                                # Format search results for the model
-                                # Include current date/time context so models know what "today" means
-                                current_datetime = datetime.now()
-                                current_date_str = current_datetime.strftime("%A, %B %d, %Y")
-                                current_time_str = current_datetime.strftime("%I:%M %p %Z")
-
-                                # Handle empty search results
-                                if not search_results or len(search_results) == 0:
-                                    results_text = "⚠️ SEARCH RETURNED NO RESULTS\n\n"
-                                    results_text += f"Search query: '{search_query}'\n"
-                                    results_text += f"Search executed at: {current_date_str} at {current_time_str}\n\n"
-                                    results_text += "IMPORTANT: The search returned no results. You MUST explicitly state this to the user. Do NOT fabricate information or provide generic/historical data without clearly stating that current data is unavailable. Consider:\n"
-                                    results_text += "1. Trying an alternative search query with different keywords\n"
-                                    results_text += "2. Explicitly telling the user that current information could not be found\n"
-                                    results_text += "3. If you provide historical/average data, clearly label it as such (e.g., 'I was unable to find current weather data, but typically in January...')"
-                                else:
-                                    results_text = f"✅ SEARCH SUCCESSFUL - {len(search_results)} result(s) found\n\n"
-                                    results_text += f"Search query: '{search_query}'\n"
-                                    results_text += f"Search executed at: {current_date_str} at {current_time_str}\n"
-                                    results_text += f"Search provider: {search_provider.get_provider_name() if hasattr(search_provider, 'get_provider_name') else 'Unknown'}\n\n"
-                                    results_text += "Results:\n"
-                                    for i, result in enumerate(search_results, 1):
-                                        results_text += f"{i}. {result.title}\n"
-                                        results_text += f"   URL: {result.url}\n"
-                                        # Include source if available
-                                        if hasattr(result, "source") and result.source:
-                                            results_text += f"   Source: {result.source}\n"
-                                        results_text += f"   {result.snippet}\n\n"
-
-                                    # Add instruction to help model provide a complete answer with source citation
-                                    results_text += "\nCRITICAL: Based on these results, provide a complete answer to the user's question. You MUST:\n"
-                                    results_text += "1. Cite the specific source URL or service name (e.g., 'According to Weather.com' or 'From https://weather.com/...')\n"
-                                    results_text += (
-                                        "2. Include the timestamp/data freshness when available\n"
-                                    )
-                                    results_text += "3. Distinguish between current data and historical/average data\n"
-                                    results_text += "4. If you need more detailed information from a specific source, use fetch_url\n"
-                                    results_text += "5. Keep your response natural and user-friendly - cite sources clearly but don't mention technical search details"
-
-                                # Store tool call and result (tool call ID already validated above)
-                                # Final check: ensure this ID isn't already in tool_call_messages
-                                if not any(
-                                    tc.get("id", "").strip() == tool_call_id
-                                    for tc in tool_call_messages
-                                    if tc.get("id")
-                                ):
-                                    tool_call_messages.append(
-                                        {
-                                            "id": tool_call_id,
-                                            "type": "function",
-                                            "function": {
-                                                "name": "search_web",
-                                                "arguments": tool_call["function"]["arguments"],
-                                            },
-                                        }
-                                    )
-                                    tool_results.append(
-                                        {"tool_call_id": tool_call_id, "content": results_text}
-                                    )
-                                else:
-                                    logger.warning(
-                                        f"Model {model_id} attempted to add duplicate tool call ID '{tool_call_id}' (search_web success) to tool_call_messages, skipping."
-                                    )
-                        except Exception as e:
-                            logger.error(f"Error executing web search tool: {e}")
-                            error_msg = str(e)
-                            current_datetime = datetime.now()
-                            current_date_str = current_datetime.strftime("%A, %B %d, %Y")
-                            current_time_str = current_datetime.strftime("%I:%M %p %Z")
-
-                            # Create detailed error message with retry suggestions
-                            error_content = "❌ SEARCH FAILED\n\n"
-                            error_content += f"Search query: '{search_query}'\n"
-                            error_content += (
-                                f"Search attempted at: {current_date_str} at {current_time_str}\n"
-                            )
-                            error_content += f"Error: {error_msg}\n\n"
-                            error_content += "IMPORTANT: The web search failed. You MUST explicitly state this to the user. Do NOT fabricate information or provide generic/historical data without clearly stating that the search failed.\n\n"
-                            error_content += "OPTIONS:\n"
-                            error_content += "1. Try an alternative search query with different keywords or phrasing\n"
-                            error_content += "2. Explicitly tell the user that the search failed and current information could not be retrieved\n"
-                            error_content += "3. If you provide historical/average data as a fallback, clearly label it as such (e.g., 'I was unable to retrieve current weather data due to a search error, but typically in January...')\n\n"
-
-                            # Add retry suggestions based on error type
-                            if "rate limit" in error_msg.lower() or "429" in error_msg:
-                                error_content += "NOTE: This appears to be a rate limit error. You may want to wait a moment and try again with a slightly modified query."
-                            elif "timeout" in error_msg.lower():
-                                error_content += "NOTE: The search timed out. Try a more specific or shorter query."
-                            else:
-                                error_content += "NOTE: Consider trying a different search query or being more specific in your search terms."
-
-                            # Add error result (tool call ID already validated above)
-                            # Final check: ensure this ID isn't already in tool_call_messages
-                            if not any(
-                                tc.get("id", "").strip() == tool_call_id
-                                for tc in tool_call_messages
-                                if tc.get("id")
-                            ):
-                                tool_call_messages.append(
-                                    {
-                                        "id": tool_call_id,
-                                        "type": "function",
-                                        "function": {
-                                            "name": "search_web",
-                                            "arguments": tool_call["function"]["arguments"],
-                                        },
-                                    }
-                                )
-                                tool_results.append(
-                                    {"tool_call_id": tool_call_id, "content": error_content}
-                                )
-                            else:
-                                logger.warning(
-                                    f"Model {model_id} attempted to add duplicate tool call ID '{tool_call_id}' (error case) to tool_call_messages, skipping."
-                                )
-                    elif tool_call["function"]["name"] == "fetch_url":
-                        # Initialize url before try block to ensure it's always defined
-                        # even if an exception occurs during JSON parsing
-                        url = ""
-                        try:
-                            import asyncio
-                            import json
-
-                            # Validate arguments exist and are not empty
-                            arguments_str = tool_call["function"].get("arguments", "")
-                            if not arguments_str or not arguments_str.strip():
-                                raise ValueError(
-                                    "Tool call arguments are missing or empty. Please provide a 'url' parameter in the arguments."
-                                )
-                            # Parse arguments
-                            args = json.loads(arguments_str)
-                            url = args.get("url", "")
-                            if not url:
-                                raise ValueError(
-                                    "URL is missing or empty. Please provide a 'url' parameter with a valid URL."
-                                )
-
-                            # Check if this URL was already fetched (prevent redundant fetches)
-                            previous_urls = []
-                            for msg in messages:
-                                if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                                    for tc in msg["tool_calls"]:
-                                        if tc.get("function", {}).get("name") == "fetch_url":
-                                            try:
-                                                prev_args = json.loads(
-                                                    tc.get("function", {}).get("arguments", "{}")
-                                                )
-                                                prev_url = prev_args.get("url", "")
-                                                if prev_url:
-                                                    # Normalize URL (remove query params for comparison)
-                                                    prev_url_normalized = (
-                                                        prev_url.split("?")[0].lower().strip()
-                                                    )
-                                                    previous_urls.append(prev_url_normalized)
-                                            except:
-                                                pass
-
-                            if url:
-                                url_normalized = url.split("?")[0].lower().strip()
-                                if url_normalized in previous_urls:
-                                    logger.warning(
-                                        f"Model {model_id} attempted redundant URL fetch: '{url}' "
-                                        f"(already fetched in previous iteration). Providing message instead."
-                                    )
-                                    # Provide a message indicating the URL was already fetched
-                                    tool_call_messages.append(
-                                        {
-                                            "id": tool_call_id,
-                                            "type": "function",
-                                            "function": {
-                                                "name": "fetch_url",
-                                                "arguments": tool_call["function"]["arguments"],
-                                            },
-                                        }
-                                    )
-                                    tool_results.append(
-                                        {
-                                            "tool_call_id": tool_call_id,
-                                            "content": f"⚠️ This URL ('{url}') was already fetched in a previous step. The content from that fetch is already available in the conversation. Please review the previously fetched content and provide your answer based on that information. Fetching the same URL again will not provide new information.",
-                                        }
-                                    )
-                                    continue
-
-                            if url:
-                                # Yield keepalive chunk before URL fetch to reset frontend timeout
-                                yield " "
-
-                                logger.info(
-                                    f"Fetching URL content: {url} (model: {model_id}, iteration: {tool_call_iteration})"
-                                )
-
-                                # Execute URL fetch with rate limiting
-                                async def execute_url_fetch():
-                                    """Execute URL fetch with rate limiting."""
-                                    try:
-                                        # Acquire rate limiter permission (waits if necessary)
-                                        await rate_limiter.acquire()
-                                        try:
-                                            # Execute the actual URL fetch
-                                            content = await fetch_url_content(url)
-                                            return content
-                                        finally:
-                                            # Release concurrent slot after fetch completes
-                                            rate_limiter.release()
-                                    except Exception:
-                                        # Release concurrent slot on error
-                                        rate_limiter.release()
-                                        raise
-
-                                # Use threading to run fetch in background and yield keepalives periodically
-                                import queue
-
-                                fetch_queue = queue.Queue()
-                                fetch_exception = None
-                                url_content = None
-
-                                def run_fetch():
-                                    """Run URL fetch in thread and put result in queue."""
-                                    nonlocal fetch_exception
-                                    # Create a new event loop for this thread to avoid semaphore leaks
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-                                    try:
-                                        result = loop.run_until_complete(execute_url_fetch())
-                                        fetch_queue.put(("success", result))
-                                    except Exception as e:
-                                        fetch_exception = e
-                                        fetch_queue.put(("error", None))
-                                    finally:
-                                        # Properly close the event loop to prevent resource leaks
-                                        try:
-                                            # Cancel any pending tasks
-                                            pending = asyncio.all_tasks(loop)
-                                            for task in pending:
-                                                task.cancel()
-                                            # Wait for tasks to complete cancellation
-                                            if pending:
-                                                loop.run_until_complete(
-                                                    asyncio.gather(*pending, return_exceptions=True)
-                                                )
-                                        except Exception:
-                                            pass
-                                        finally:
-                                            loop.close()
-
-                                # Start fetch in background thread
-                                fetch_thread = threading.Thread(target=run_fetch, daemon=True)
-                                fetch_thread.start()
-
-                                # Yield keepalives every 5 seconds while waiting for fetch to complete
-                                KEEPALIVE_INTERVAL = 5.0
-                                fetch_start_time = time.time()
-
-                                try:
-                                    while True:
-                                        try:
-                                            # Check if fetch completed (non-blocking)
-                                            result_type, result_data = fetch_queue.get(
-                                                timeout=KEEPALIVE_INTERVAL
-                                            )
-
-                                            if result_type == "success":
-                                                url_content = result_data
-                                                logger.info(
-                                                    f"URL fetch completed successfully for {url}"
-                                                )
-                                                # Yield keepalive chunk after fetch to reset frontend timeout
-                                                yield " "
-                                                break
-                                            else:
-                                                # Error occurred in fetch thread
-                                                raise fetch_exception
-                                        except queue.Empty:
-                                            # Fetch still running - yield keepalive to reset frontend timeout
-                                            yield " "
-
-                                    # Fetch completed successfully, url_content is set
-                                    # Ensure thread is properly joined to clean up resources
-                                    fetch_thread.join(timeout=5.0)
-                                except Exception:
-                                    # Wait for thread to finish before handling error
-                                    fetch_thread.join(timeout=5.0)
-                                    if fetch_exception:
-                                        fetch_exec_error = fetch_exception
-                                    error_msg = str(fetch_exec_error)
-                                    logger.error(
-                                        f"Error during URL fetch execution: {fetch_exec_error}",
-                                        exc_info=True,
-                                    )
-                                    raise
-
-                                # Format URL content for the model
-                                content_text = f"Content from {url}:\n\n{url_content}\n\nBased on this content, provide a complete answer to the user's question. Keep your response natural - don't mention technical details about how you retrieved the information."
-
-                                # Store tool call and result (tool call ID already validated above)
-                                # Final check: ensure this ID isn't already in tool_call_messages
-                                if not any(
-                                    tc.get("id", "").strip() == tool_call_id
-                                    for tc in tool_call_messages
-                                    if tc.get("id")
-                                ):
-                                    tool_call_messages.append(
-                                        {
-                                            "id": tool_call_id,
-                                            "type": "function",
-                                            "function": {
-                                                "name": "fetch_url",
-                                                "arguments": tool_call["function"]["arguments"],
-                                            },
-                                        }
-                                    )
-                                    tool_results.append(
-                                        {"tool_call_id": tool_call_id, "content": content_text}
-                                    )
-                                else:
-                                    logger.warning(
-                                        f"Model {model_id} attempted to add duplicate tool call ID '{tool_call_id}' (fetch_url) to tool_call_messages, skipping."
-                                    )
-                        except Exception as e:
-                            logger.error(f"Error executing fetch_url tool: {e}")
-                            # Add error result (tool call ID already validated above)
-                            # Final check: ensure this ID isn't already in tool_call_messages
-                            if not any(
-                                tc.get("id", "").strip() == tool_call_id
-                                for tc in tool_call_messages
-                                if tc.get("id")
-                            ):
-                                tool_call_messages.append(
-                                    {
-                                        "id": tool_call_id,
-                                        "type": "function",
-                                        "function": {
-                                            "name": "fetch_url",
-                                            "arguments": tool_call["function"]["arguments"],
-                                        },
-                                    }
-                                )
-                                tool_results.append(
-                                    {
-                                        "tool_call_id": tool_call_id,
-                                        "content": f"Error fetching URL content: {str(e)}",
-                                    }
-                                )
-                            else:
-                                logger.warning(
-                                    f"Model {model_id} attempted to add duplicate tool call ID '{tool_call_id}' (fetch_url error) to tool_call_messages, skipping."
-                                )
-
-                # Add tool calls and results to messages
-                if tool_call_messages:
-                    # Collect all existing tool call IDs from previous messages to prevent duplicates
-                    # This prevents "Duplicate item found with id" errors when the same tool call ID
-                    # appears across multiple iterations of the tool call loop
-                    existing_tool_call_ids = set()
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            for tc in msg["tool_calls"]:
-                                if tc.get("id"):
-                                    existing_tool_call_ids.add(tc["id"])
-
-                    # Validate that all tool calls have IDs before proceeding
-                    # Filter out any tool calls with empty IDs (should not happen, but safety check)
-                    # Also filter out duplicates that already exist in the messages array
-                    valid_tool_call_messages = []
-                    seen_in_batch = set()  # Track IDs within this batch to prevent duplicates
-                    for tc_msg in tool_call_messages:
-                        tc_id = tc_msg.get("id", "").strip() if tc_msg.get("id") else ""
-
-                        if not tc_id:
-                            logger.warning(
-                                f"Model {model_id} returned tool call with empty ID, skipping. "
-                                f"Tool call: {tc_msg}"
-                            )
-                            continue
-
-                        # Skip if this tool call ID already exists in messages from previous iterations
-                        if tc_id in existing_tool_call_ids:
-                            logger.warning(
-                                f"Model {model_id} returned tool call with ID '{tc_id}' that already exists in messages, skipping duplicate. "
-                                f"This can occur when the same tool call appears across multiple iterations."
-                            )
-                            continue
-
-                        # Skip if this tool call ID already seen in this batch
-                        if tc_id in seen_in_batch:
-                            logger.warning(
-                                f"Model {model_id} returned duplicate tool call ID '{tc_id}' within the same batch, skipping duplicate."
-                            )
-                            continue
-
-                        seen_in_batch.add(tc_id)
-                        valid_tool_call_messages.append(tc_msg)
-
-                    if not valid_tool_call_messages:
-                        logger.error(
-                            f"Model {model_id} returned tool calls but none had valid IDs after deduplication. "
-                            f"Original tool calls: {tool_call_messages}"
-                        )
-                        # Skip tool call handling if no valid tool calls
-                        break
+                messages, sent_tool_call_ids = _prepare_continuation_messages(
+                    messages, model_id, tool_call_iteration
+                )
+                try:
+                    response_continue = create(
+                        _continuation_params(
+                            model_id,
+                            messages,
+                            max_tokens,
+                            temperature,
+                            top_p,
+                            tools,
+                            tool_call_iteration,
+                        ),
+                        bool(tools),
+                    )
+                except Exception as api_error:
+                    _log_request_error(
+                        api_error, model_id, tools, tool_call_iteration, sent_tool_call_ids
+                    )
+                    raise
 
-                    # Final deduplication check: ensure no duplicate IDs in valid_tool_call_messages
-                    # This is a safety net in case duplicates somehow got through
-                    final_tool_call_ids = set()
-                    final_valid_tool_call_messages = []
-                    for tc_msg in valid_tool_call_messages:
-                        tc_id = tc_msg.get("id", "").strip() if tc_msg.get("id") else ""
-                        if not tc_id:
-                            # Keep entries without IDs (they'll be validated by API)
-                            final_valid_tool_call_messages.append(tc_msg)
-                            continue
-
-                        if tc_id not in final_tool_call_ids:
-                            final_tool_call_ids.add(tc_id)
-                            final_valid_tool_call_messages.append(tc_msg)
-                        else:
-                            logger.error(
-                                f"CRITICAL: Model {model_id} duplicate tool call ID '{tc_id}' detected in final validation, removing duplicate. "
-                                f"This should not happen - there may be a bug in the deduplication logic. "
-                                f"valid_tool_call_messages had {len(valid_tool_call_messages)} items, final_valid has {len(final_valid_tool_call_messages)}."
-                            )
-
-                    if not final_valid_tool_call_messages:
-                        logger.error(
-                            f"Model {model_id} returned tool calls but all were filtered out during final deduplication. "
-                            f"Original tool calls: {tool_call_messages}"
-                        )
-                        # Skip tool call handling if no valid tool calls
+                state.begin_continuation()
+                for chunk in response_continue:
+                    yield from state.consume(chunk, "continuation")
+                    if state.halted:
                         break
+                state.end_continuation()
 
-                    assistant_message = {
-                        "role": "assistant",
-                        "content": full_answer_content
-                        if full_answer_content
-                        else "",  # Preserve text content that was streamed
-                        "tool_calls": final_valid_tool_call_messages,
-                    }
+                # Break if no more tool calls needed
+                if state.finish_reason != "tool_calls" or not state.tool_calls_accumulated:
+                    break
 
-                    # Only Gemini models require reasoning_details to be echoed back
-                    if reasoning_details is not None and str(model_id).startswith("google/gemini"):
-                        assistant_message["reasoning_details"] = reasoning_details
-
-                    # ULTIMATE FIX: Before adding assistant message, do one final check to ensure
-                    # none of the tool call IDs in this message already exist in messages array
-                    # This is the last line of defense against duplicate tool call IDs
-                    all_existing_ids = set()
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            for tc in msg["tool_calls"]:
-                                tc_id = tc.get("id", "").strip() if tc.get("id") else ""
-                                if tc_id:
-                                    all_existing_ids.add(tc_id)
-
-                    # Also check for duplicates WITHIN this message itself
-                    seen_in_this_message = set()
-                    truly_unique_tool_calls = []
-                    for tc in assistant_message["tool_calls"]:
-                        tc_id = tc.get("id", "").strip() if tc.get("id") else ""
-                        if not tc_id:
-                            # Keep entries without IDs (they'll be validated by API)
-                            truly_unique_tool_calls.append(tc)
-                            continue
-
-                        # Check if this ID already exists in previous messages
-                        if tc_id in all_existing_ids:
-                            logger.error(
-                                f"CRITICAL: Prevented adding duplicate tool call ID '{tc_id}' to messages array. "
-                                f"This ID already exists in a previous assistant message."
-                            )
-                            continue
-
-                        # Check if this ID already exists in this same message
-                        if tc_id in seen_in_this_message:
-                            logger.error(
-                                f"CRITICAL: Prevented adding duplicate tool call ID '{tc_id}' within the same assistant message. "
-                                f"This should have been caught earlier."
-                            )
-                            continue
-
-                        seen_in_this_message.add(tc_id)
-                        all_existing_ids.add(tc_id)  # Track it so we don't add it twice
-                        truly_unique_tool_calls.append(tc)
-
-                    # Only add the assistant message if it has unique tool calls
-                    if truly_unique_tool_calls:
-                        # Count total tool calls and check if we've exceeded the limit
-                        total_tool_calls_made += len(truly_unique_tool_calls)
-                        if total_tool_calls_made > max_total_tool_calls:
-                            logger.warning(
-                                f"Model {model_id} exceeded max total tool calls ({max_total_tool_calls}). "
-                                f"Total tool calls made: {total_tool_calls_made}. "
-                                f"Breaking out of tool call loop to prevent excessive looping."
-                            )
-                            # Add a message telling the model to stop and provide an answer
-                            messages.append(
-                                {
-                                    "role": "user",
-                                    "content": "🚨 STOP: You have made too many tool calls. Please provide your answer now based on the information you have already gathered. Do not make any more tool calls.",
-                                }
-                            )
+            # If loop exited due to max iterations but model wanted more tool calls,
+            # make a final call WITHOUT tools to force the model to provide an answer
+            if (
+                state.finish_reason == "tool_calls"
+                and tool_call_iteration >= MAX_TOOL_CALL_ITERATIONS
+            ):
+                logger.info(
+                    f"Model {model_id} hit max tool call iterations ({MAX_TOOL_CALL_ITERATIONS}) "
+                    f"but still wanted to make tool calls. Making final completion call without tools."
+                )
+                messages.append(_final_answer_prompt(messages, enable_web_search, prompt))
+                try:
+                    final_response = _cl.chat.completions.create(
+                        **_followup_params(model_id, messages, max_tokens, temperature, top_p)
+                    )
+                    for chunk in final_response:
+                        yield from state.consume(chunk, "final")
+                        if state.halted:
                             break
+                except Exception as final_error:
+                    # Don't raise - we've already provided some response
+                    logger.error(
+                        f"Error in final completion call for model {model_id}: {final_error}"
+                    )
 
-                        assistant_message["tool_calls"] = truly_unique_tool_calls
-                        messages.append(assistant_message)
-                        logger.info(
-                            f"Added assistant message with {len(truly_unique_tool_calls)} unique tool calls to messages array. "
-                            f"Total tool calls made so far: {total_tool_calls_made}/{max_total_tool_calls}. "
-                            f"Tool call IDs: {[tc.get('id') for tc in truly_unique_tool_calls if tc.get('id')]}"
-                        )
-                    else:
-                        logger.error(
-                            f"CRITICAL: Skipping assistant message because all tool calls were duplicates. "
-                            f"Original had {len(assistant_message['tool_calls'])} tool calls. "
-                            f"This should not happen - breaking out of tool call loop."
-                        )
-                        # Break out of the tool call loop since we have nothing new to add
-                        break
+            state.merge_last_chunk_usage()
 
-                    # Deduplicate tool results by tool_call_id to prevent duplicates
-                    # Collect existing tool_call_ids from tool messages
-                    existing_tool_result_ids = set()
-                    for msg in messages:
-                        if msg.get("role") == "tool" and msg.get("tool_call_id"):
-                            existing_tool_result_ids.add(msg["tool_call_id"])
-
-                    # Only add tool results that don't already exist in messages
-                    for result in tool_results:
-                        result_id = (
-                            result.get("tool_call_id", "").strip()
-                            if result.get("tool_call_id")
-                            else ""
-                        )
-                        if result_id and result_id not in existing_tool_result_ids:
-                            # If this is the last iteration, add a forceful stop instruction
-                            if tool_call_iteration >= max_tool_call_iterations:
-                                original_content = result.get("content", "")
-                                result["content"] = (
-                                    original_content
-                                    + "\n\nPlease provide your answer now based on the information above."
-                                )
-
-                            messages.append(
-                                {
-                                    "role": "tool",
-                                    "tool_call_id": result_id,
-                                    "content": result["content"],
-                                }
-                            )
-                            existing_tool_result_ids.add(result_id)
-                        elif result_id in existing_tool_result_ids:
-                            logger.warning(
-                                f"Model {model_id} returned tool result with duplicate tool_call_id '{result_id}', skipping duplicate."
-                            )
-
-                    # Continue conversation with search results
-                    # Yield keepalive before making continuation API call to reset frontend timeout
-                    # Gemini 3 Pro Preview can take time to start streaming after receiving tool results
-                    yield " "
-
-                    # Final validation: check entire messages array for duplicate tool call IDs
-                    # This is a last safety check before sending to API
-                    all_tool_call_ids_in_messages = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            for tc in msg["tool_calls"]:
-                                if tc.get("id"):
-                                    all_tool_call_ids_in_messages.append(tc["id"])
-
-                    # Check for duplicates
-                    seen_ids = set()
-                    duplicate_ids = []
-                    for tc_id in all_tool_call_ids_in_messages:
-                        if tc_id in seen_ids:
-                            duplicate_ids.append(tc_id)
-                        else:
-                            seen_ids.add(tc_id)
-
-                    if duplicate_ids:
-                        logger.error(
-                            f"CRITICAL: Model {model_id} messages array contains duplicate tool call IDs before API call: {duplicate_ids}. "
-                            f"This should have been caught earlier. Attempting to fix by removing duplicates from messages."
-                        )
-                        # Remove duplicates by keeping only the first occurrence of each tool call ID
-                        fixed_messages = []
-                        tool_call_ids_added = set()
-                        for msg in messages:
-                            if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                                # Filter out duplicate tool calls
-                                unique_tool_calls = []
-                                for tc in msg["tool_calls"]:
-                                    tc_id = tc.get("id", "").strip() if tc.get("id") else ""
-                                    if tc_id and tc_id not in tool_call_ids_added:
-                                        tool_call_ids_added.add(tc_id)
-                                        unique_tool_calls.append(tc)
-                                    elif tc_id in tool_call_ids_added:
-                                        logger.warning(
-                                            f"Removing duplicate tool call ID '{tc_id}' from assistant message before API call."
-                                        )
-
-                                if unique_tool_calls:
-                                    # Create new message with deduplicated tool calls
-                                    fixed_msg = msg.copy()
-                                    fixed_msg["tool_calls"] = unique_tool_calls
-                                    fixed_messages.append(fixed_msg)
-                                else:
-                                    # Skip assistant message if all tool calls were duplicates
-                                    logger.warning(
-                                        "Skipping assistant message with all duplicate tool calls."
-                                    )
-                            else:
-                                # Keep non-assistant messages as-is
-                                fixed_messages.append(msg)
-
-                        messages = fixed_messages
-                        logger.info(
-                            f"Fixed messages array by removing {len(duplicate_ids)} duplicate tool call IDs."
-                        )
+            # Models sometimes explain what they will do ("Let me check:") and stop
+            if _needs_completion_nudge(messages, state.finish_reason, model_id):
+                messages.append(dict(_COMPLETION_NUDGE))
+                try:
+                    completion_response = _cl.chat.completions.create(
+                        **_followup_params(model_id, messages, max_tokens, temperature, top_p)
+                    )
+                    for chunk in completion_response:
+                        yield from state.consume(chunk, "completion")
+                        if state.halted:
+                            break
+                except Exception as completion_error:
+                    # Don't raise - we've already provided some response
+                    logger.error(
+                        f"Error in incomplete response completion call for model {model_id}: {completion_error}"
+                    )
 
-                    # ONE MORE FINAL CHECK: Verify no duplicates exist before API call
-                    # This is the absolute last check before sending to API
-                    final_check_ids = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            for tc in msg["tool_calls"]:
-                                if tc.get("id"):
-                                    final_check_ids.append(tc["id"])
-
-                    final_check_duplicates = [
-                        id for id in final_check_ids if final_check_ids.count(id) > 1
-                    ]
-                    if final_check_duplicates:
-                        logger.error(
-                            f"CRITICAL: Found {len(set(final_check_duplicates))} duplicate tool call IDs after all fixes: {set(final_check_duplicates)}. "
-                            f"This is a serious bug - attempting emergency fix."
-                        )
-                        # Emergency fix: rebuild messages array with only unique tool calls
-                        emergency_fixed_messages = []
-                        emergency_seen_ids = set()
-                        for msg in messages:
-                            if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                                emergency_unique_tcs = []
-                                for tc in msg["tool_calls"]:
-                                    tc_id = tc.get("id", "").strip() if tc.get("id") else ""
-                                    if tc_id and tc_id not in emergency_seen_ids:
-                                        emergency_seen_ids.add(tc_id)
-                                        emergency_unique_tcs.append(tc)
-                                if emergency_unique_tcs:
-                                    emergency_msg = msg.copy()
-                                    emergency_msg["tool_calls"] = emergency_unique_tcs
-                                    emergency_fixed_messages.append(emergency_msg)
-                            else:
-                                emergency_fixed_messages.append(msg)
-                        messages = emergency_fixed_messages
-                        logger.info(
-                            "Emergency fix applied - messages array rebuilt with unique tool calls only."
-                        )
+            yield from state.finish_notices(credits_limited)
+            return state.result()
 
-                    # Make another API call with updated messages
-                    # Log all tool call IDs in messages for debugging
-                    all_tc_ids_in_final_messages = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            for tc in msg["tool_calls"]:
-                                if tc.get("id"):
-                                    all_tc_ids_in_final_messages.append(tc["id"])
-
-                    # Also log tool result IDs for debugging
-                    all_tool_result_ids_in_messages = []
-                    for msg in messages:
-                        if msg.get("role") == "tool" and msg.get("tool_call_id"):
-                            all_tool_result_ids_in_messages.append(msg["tool_call_id"])
-
-                    # Log detailed message structure for debugging
-                    message_structure = []
-                    for i, msg in enumerate(messages):
-                        msg_info = {"index": i, "role": msg.get("role")}
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            msg_info["tool_calls_count"] = len(msg["tool_calls"])
-                            msg_info["tool_call_ids"] = [
-                                tc.get("id") for tc in msg["tool_calls"] if tc.get("id")
-                            ]
-                            msg_info["tool_call_functions"] = [
-                                tc.get("function", {}).get("name") for tc in msg["tool_calls"]
-                            ]
-                        elif msg.get("role") == "tool":
-                            msg_info["tool_call_id"] = msg.get("tool_call_id")
-                            msg_info["content_length"] = len(msg.get("content", ""))
-                        message_structure.append(msg_info)
-
-                    logger.info(
-                        f"Making continuation API call for model {model_id} (iteration {tool_call_iteration}). "
-                        f"Total messages: {len(messages)}, Tool call IDs: {all_tc_ids_in_final_messages}, "
-                        f"Tool result IDs: {all_tool_result_ids_in_messages}"
-                    )
-                    logger.debug(f"Message structure: {message_structure}")
+        except Exception as e:
+            reduced = _reduced_max_tokens(e, model_id, max_tokens, retry_count < max_retries)
+            if reduced is not None:
+                max_tokens = reduced
+                retry_count += 1
+                continue
+            yield _stream_error_message(e, model_id)
+            return None
 
-                    # Final validation: Check for duplicate tool result IDs
-                    tool_result_id_counts = {}
-                    for result_id in all_tool_result_ids_in_messages:
-                        tool_result_id_counts[result_id] = (
-                            tool_result_id_counts.get(result_id, 0) + 1
-                        )
 
-                    duplicate_tool_result_ids = [
-                        rid for rid, count in tool_result_id_counts.items() if count > 1
-                    ]
-                    if duplicate_tool_result_ids:
-                        logger.error(
-                            f"CRITICAL: Found duplicate tool result IDs before API call: {duplicate_tool_result_ids}. "
-                            f"This will cause 'rs_' resource ID conflicts. Attempting to fix."
-                        )
-                        # Remove duplicate tool results, keeping only the first occurrence
-                        fixed_messages_tool_results = []
-                        seen_tool_result_ids = set()
-                        for msg in messages:
-                            if msg.get("role") == "tool" and msg.get("tool_call_id"):
-                                result_id = msg["tool_call_id"]
-                                if result_id not in seen_tool_result_ids:
-                                    seen_tool_result_ids.add(result_id)
-                                    fixed_messages_tool_results.append(msg)
-                                else:
-                                    logger.warning(
-                                        f"Removing duplicate tool result with tool_call_id '{result_id}'"
-                                    )
-                            else:
-                                fixed_messages_tool_results.append(msg)
-                        messages = fixed_messages_tool_results
-                        logger.info(
-                            f"Fixed messages array by removing {len(duplicate_tool_result_ids)} duplicate tool result IDs."
-                        )
+async def _aclose_stream(stream: Any) -> None:
+    """Close an async completion stream so its connection goes back to the pool."""
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.debug(f"Error closing completion stream: {e}")
 
-                    # ONE MORE CHECK: Verify the entire messages array structure is valid
-                    # Check for any duplicate message content that might cause resource ID conflicts
-                    assistant_messages_with_tools = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                            assistant_messages_with_tools.append(msg)
-
-                    # Check if we have multiple assistant messages with identical tool_calls (would cause rs_ conflicts)
-                    tool_calls_signatures = []
-                    for msg in assistant_messages_with_tools:
-                        # Create a signature based on tool call IDs and function names
-                        signature = tuple(
-                            sorted(
-                                [
-                                    (tc.get("id"), tc.get("function", {}).get("name"))
-                                    for tc in msg.get("tool_calls", [])
-                                    if tc.get("id")
-                                ]
-                            )
-                        )
-                        tool_calls_signatures.append(signature)
-
-                    duplicate_signatures = [
-                        sig for sig in tool_calls_signatures if tool_calls_signatures.count(sig) > 1
-                    ]
-                    if duplicate_signatures:
-                        logger.error(
-                            f"CRITICAL: Found {len(set(duplicate_signatures))} assistant messages with identical tool_calls signatures. "
-                            f"This will cause 'rs_' resource ID conflicts. Signatures: {set(duplicate_signatures)}"
-                        )
 
-                    # Check for duplicate tool result content (API provider might generate rs_ IDs based on content hash)
-                    tool_result_contents = {}
-                    for msg in messages:
-                        if (
-                            msg.get("role") == "tool"
-                            and msg.get("tool_call_id")
-                            and msg.get("content")
-                        ):
-                            result_id = msg["tool_call_id"]
-                            content = msg["content"]
-                            # Create a hash of the content to detect duplicates
-                            content_hash = hash(
-                                content[:1000]
-                            )  # Hash first 1000 chars to detect similar content
-                            if content_hash in tool_result_contents:
-                                existing_id = tool_result_contents[content_hash]
-                                logger.warning(
-                                    f"Found tool result with similar content hash. "
-                                    f"Current tool_call_id: {result_id}, Previous tool_call_id: {existing_id}. "
-                                    f"This might cause rs_ resource ID conflicts."
-                                )
-                            else:
-                                tool_result_contents[content_hash] = result_id
-
-                    api_params_continue = {
-                        "model": model_id,
-                        "messages": messages,
-                        "timeout": settings.individual_model_timeout,
-                        "max_tokens": max_tokens,
-                        "stream": True,
-                        "frequency_penalty": 0.7,  # Reduce token repetition (0.0-2.0, higher = less repetition)
-                        "presence_penalty": 0.5,  # Reduce topic/concept repetition (0.0-2.0, higher = less repetition)
-                    }
-                    if temperature is not None and get_model_supports_temperature(model_id):
-                        api_params_continue["temperature"] = max(0.0, min(2.0, temperature))
-                    if top_p is not None:
-                        api_params_continue["top_p"] = max(0.0, min(1.0, top_p))
-
-                    # Only include tools parameter on first iteration; in continuations tools are already in context.
-                    if tools and tool_call_iteration == 1:
-                        api_params_continue["tools"] = tools
-                        logger.debug(
-                            f"Including tools parameter in continuation request (iteration {tool_call_iteration})"
-                        )
-                    elif tools and tool_call_iteration > 1:
-                        logger.debug(
-                            f"Omitting tools parameter in continuation request (iteration {tool_call_iteration}) "
-                            f"to avoid potential rs_ resource ID conflicts. Tools are already in conversation context."
-                        )
-                        # Omit tool_choice for continuation requests too (same reason as above)
-                        # api_params_continue["tool_choice"] = "auto"
+async def call_openrouter_streaming_async(
+    prompt: str,
+    model_id: str,
+    conversation_history: list[Any] | None = None,
+    use_mock: bool = False,
+    max_tokens_override: int | None = None,
+    credits_limited: bool = False,
+    enable_web_search: bool = False,
+    search_provider: Any | None = None,
+    user_timezone: str | None = None,
+    user_location: str | None = None,
+    location_source: str | None = None,
+    temperature: float | None = None,
+    top_p: float | None = None,
+    attached_images: list[dict[str, Any]] | None = None,
+    is_image_generation: bool = False,
+    image_config: dict[str, str] | None = None,
+    _client: Any | None = None,  # Optional: AsyncOpenAI client (defaults to the current loop's)
+) -> AsyncGenerator[Any, None]:
+    """
+    Native asyncio counterpart of call_openrouter_streaming.
 
-                    if should_request_openrouter_reasoning_traces(model_id):
-                        api_params_continue["extra_body"] = {
-                            "reasoning": openrouter_reasoning_request_body(model_id)
-                        }
+    Runs entirely on the caller's event loop: requests go through AsyncOpenAI, tool calls
+    are awaited directly, and closing the generator closes the upstream stream. Takes the
+    same arguments and yields the same events, followed by one final
+    ``{"type": "usage", "usage": ...}`` event carrying what the sync generator returns.
+    """
+    if use_mock:
+        logger.info(f"Mock mode enabled - returning mock response for {model_id}")
+        yield {
+            "type": REASONING_STREAM_TYPE,
+            "content": "[Mock] Simulated planning step before answering.\n\n",
+        }
+        for mock_chunk in stream_mock_response(chunk_size=50):
+            yield mock_chunk
+            await asyncio.sleep(0)
+        yield {"type": USAGE_STREAM_TYPE, "usage": None}
+        return
+
+    messages, prompt = _build_openrouter_messages(
+        prompt,
+        model_id,
+        conversation_history,
+        enable_web_search,
+        user_timezone,
+        user_location,
+        location_source,
+        attached_images,
+        is_image_generation,
+        image_config,
+    )
+    tools = [WEB_SEARCH_TOOL, FETCH_URL_TOOL] if enable_web_search and search_provider else None
+    max_tokens = (
+        max_tokens_override if max_tokens_override is not None else get_model_max_tokens(model_id)
+    )
+    _cl = _client if _client is not None else get_async_client()
 
-                    try:
-                        # Use client with tool headers when tools are enabled (required by OpenRouter for provider routing)
-                        if tools:
-                            # Try using extra_headers parameter first (if supported by SDK)
-                            # Fall back to _cl_tools if extra_headers doesn't work
-                            try:
-                                response_continue = _cl.chat.completions.create(
-                                    **api_params_continue,
-                                    extra_headers={
-                                        "HTTP-Referer": "https://compareintel.com",
-                                        "X-Title": "CompareIntel",
-                                    },
-                                )
-                            except TypeError:
-                                # extra_headers not supported, use client with default headers
-                                response_continue = _cl_tools.chat.completions.create(
-                                    **api_params_continue
-                                )
-                        else:
-                            response_continue = _cl.chat.completions.create(**api_params_continue)
-                    except Exception as api_error:
-                        # Log detailed error information for debugging
-                        error_str = str(api_error)
-                        error_str_lower = error_str.lower()
-
-                        # Log the full error and messages structure for debugging
-                        logger.error(
-                            f"API error for model {model_id} continuation (iteration {tool_call_iteration}): {error_str}"
-                        )
+    async def create(params: dict[str, Any], with_tools: bool) -> Any:
+        if with_tools:
+            return await _cl.chat.completions.create(
+                **params, extra_headers=_OPENROUTER_ATTRIBUTION_HEADERS
+            )
+        return await _cl.chat.completions.create(**params)
 
-                        # Log tool call IDs that were sent
-                        logger.error(
-                            f"Tool call IDs that were sent in continuation request: {all_tc_ids_in_final_messages}"
-                        )
+    retry_count = 0
+    max_retries = 1  # Only retry once with reduced max_tokens
 
-                        # Check if this is a duplicate ID error
-                        if "duplicate" in error_str_lower or "rs_" in error_str:
-                            logger.error(
-                                f"DUPLICATE ID ERROR DETECTED: Model {model_id} returned duplicate ID error. "
-                                f"Error: {error_str}. "
-                                f"Tool call IDs sent: {all_tc_ids_in_final_messages}. "
-                                f"This suggests duplicates are still reaching the API despite all our checks."
-                            )
-
-                        # Log warning if we get a 404 with tools (model may not support tool calling)
-                        if ("404" in error_str_lower or "not found" in error_str_lower) and tools:
-                            logger.warning(
-                                f"Model {model_id} returned 404 when tools were included in continuation. "
-                                f"Error: {api_error}"
-                            )
-                        raise
-
-                    tool_calls_accumulated = {}
-                    tool_call_ids_seen = set()
-                    finish_reason = None
-                    reasoning_details_continue = None  # Track reasoning details in continuation
-
-                    # Stream the continuation response
-                    for chunk in response_continue:
-                        last_chunk = chunk  # Store last chunk for usage data
-                        if chunk.choices and len(chunk.choices) > 0:
-                            delta = chunk.choices[0].delta
-
-                            # Capture reasoning_details from continuation response (for recursive tool calls)
-                            if hasattr(delta, "reasoning_details") and delta.reasoning_details:
-                                reasoning_details_continue = delta.reasoning_details
-                            elif (
-                                hasattr(chunk.choices[0], "reasoning_details")
-                                and chunk.choices[0].reasoning_details
-                            ):
-                                reasoning_details_continue = chunk.choices[0].reasoning_details
-
-                            rp_cont = _reasoning_stream_payload(delta, chunk.choices[0])
-                            if rp_cont:
-                                yield rp_cont
-
-                            # Handle tool calls in continuation (recursive)
-                            if hasattr(delta, "tool_calls") and delta.tool_calls:
-                                for tool_call_delta in delta.tool_calls:
-                                    idx = tool_call_delta.index
-
-                                    # Get tool call ID if present
-                                    tool_call_id_from_delta = ""
-                                    if hasattr(tool_call_delta, "id") and tool_call_delta.id:
-                                        tool_call_id_from_delta = tool_call_delta.id
-
-                                    # Skip if this tool call ID was already seen anywhere (prevent duplicates)
-                                    if tool_call_id_from_delta:
-                                        if tool_call_id_from_delta in all_tool_call_ids_ever_seen:
-                                            logger.warning(
-                                                f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_delta}' at index {idx} in continuation delta, skipping duplicate."
-                                            )
-                                            continue
-                                        all_tool_call_ids_ever_seen.add(tool_call_id_from_delta)
-
-                                    # Also check local set for this batch
-                                    if (
-                                        tool_call_id_from_delta
-                                        and tool_call_id_from_delta in tool_call_ids_seen
-                                    ):
-                                        logger.warning(
-                                            f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_delta}' at index {idx} in continuation delta (local duplicate), skipping."
-                                        )
-                                        continue
-
-                                    if idx not in tool_calls_accumulated:
-                                        tool_calls_accumulated[idx] = {
-                                            "id": "",
-                                            "type": "function",
-                                            "function": {"name": "", "arguments": ""},
-                                        }
-
-                                    tc = tool_calls_accumulated[idx]
-
-                                    if tool_call_id_from_delta:
-                                        tc["id"] = tool_call_id_from_delta
-                                        tool_call_ids_seen.add(tool_call_id_from_delta)
-
-                                    if hasattr(tool_call_delta, "function"):
-                                        if (
-                                            hasattr(tool_call_delta.function, "name")
-                                            and tool_call_delta.function.name
-                                        ):
-                                            tc["function"]["name"] = tool_call_delta.function.name
-                                        if (
-                                            hasattr(tool_call_delta.function, "arguments")
-                                            and tool_call_delta.function.arguments
-                                        ):
-                                            tc["function"]["arguments"] += (
-                                                tool_call_delta.function.arguments
-                                            )
-
-                            # Yield content chunks
-                            # Check delta.content first (standard streaming)
-                            if hasattr(delta, "content") and delta.content:
-                                content_chunk = delta.content
-                                full_answer_content += content_chunk
-
-                                # Check for repetition in continuation streaming
-                                if len(full_answer_content) > 500:
-                                    if detect_repetition(full_answer_content):
-                                        logger.warning(
-                                            f"Model {model_id} detected repetition in continuation streaming response. "
-                                            f"Stopping stream early to prevent looping."
-                                        )
-                                        yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                        repetition_detected = (
-                                            True  # Mark that repetition was detected
-                                        )
-                                        finish_reason = "length"
-                                        break
-
-                                yield content_chunk
-
-                            # Also check message.content in final chunk (some models like GPT-5 return content here)
-                            # This handles cases where content is only in the final chunk's message object
-                            if hasattr(chunk.choices[0], "message") and chunk.choices[0].message:
-                                message = chunk.choices[0].message
-                                if hasattr(message, "content") and message.content:
-                                    # Only yield if we haven't already yielded this content via delta
-                                    # Check if this is new content by comparing with what we've accumulated
-                                    message_content = message.content
-                                    if message_content and len(message_content) > len(
-                                        full_answer_content
-                                    ):
-                                        # Extract only the new part that hasn't been yielded yet
-                                        new_content = message_content[len(full_answer_content) :]
-                                        if new_content:
-                                            content_chunk = new_content
-                                            full_answer_content += content_chunk
-
-                                            # Check for repetition
-                                            if len(full_answer_content) > 500:
-                                                if detect_repetition(full_answer_content):
-                                                    logger.warning(
-                                                        f"Model {model_id} detected repetition in continuation streaming response. "
-                                                        f"Stopping stream early to prevent looping."
-                                                    )
-                                                    yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                    repetition_detected = True
-                                                    finish_reason = "length"
-                                                    break
-
-                                            yield content_chunk
-                                    elif message_content and not full_answer_content:
-                                        # If we haven't yielded any content yet, yield the entire message content
-                                        # This handles cases where GPT-5 models return all content in the final chunk
-                                        content_chunk = message_content
-                                        full_answer_content += content_chunk
-
-                                        # Check for repetition
-                                        if len(full_answer_content) > 500:
-                                            if detect_repetition(full_answer_content):
-                                                logger.warning(
-                                                    f"Model {model_id} detected repetition in continuation streaming response. "
-                                                    f"Stopping stream early to prevent looping."
-                                                )
-                                                yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                repetition_detected = (
-                                                    True  # Mark that repetition was detected
-                                                )
-                                                finish_reason = "length"
-                                                break
-
-                                        yield content_chunk
-
-                                # Also check message.tool_calls in final chunk (some models like GPT-5 Chat return tool_calls here)
-                                # This handles cases where tool_calls are only in the final chunk's message object
-                                if hasattr(message, "tool_calls") and message.tool_calls:
-                                    for tool_call in message.tool_calls:
-                                        idx = (
-                                            tool_call.index
-                                            if hasattr(tool_call, "index")
-                                            else len(tool_calls_accumulated)
-                                        )
-
-                                        # Get tool call ID if present
-                                        tool_call_id_from_message = ""
-                                        if hasattr(tool_call, "id") and tool_call.id:
-                                            tool_call_id_from_message = tool_call.id
-
-                                        # Skip if this tool call ID was already seen anywhere (prevent duplicates)
-                                        if tool_call_id_from_message:
-                                            if (
-                                                tool_call_id_from_message
-                                                in all_tool_call_ids_ever_seen
-                                            ):
-                                                logger.warning(
-                                                    f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_message}' at index {idx} in continuation message.tool_calls, skipping duplicate."
-                                                )
-                                                continue
-                                            all_tool_call_ids_ever_seen.add(
-                                                tool_call_id_from_message
-                                            )
-
-                                        # Also check local set for this batch
-                                        if (
-                                            tool_call_id_from_message
-                                            and tool_call_id_from_message in tool_call_ids_seen
-                                        ):
-                                            logger.warning(
-                                                f"Model {model_id} returned duplicate tool call ID '{tool_call_id_from_message}' at index {idx} in continuation message.tool_calls (local duplicate), skipping."
-                                            )
-                                            continue
-
-                                        # Initialize tool call structure if needed
-                                        if idx not in tool_calls_accumulated:
-                                            tool_calls_accumulated[idx] = {
-                                                "id": "",
-                                                "type": "function",
-                                                "function": {"name": "", "arguments": ""},
-                                            }
-
-                                        tc = tool_calls_accumulated[idx]
-
-                                        # Update tool call ID (prefer message tool_call ID as it's complete)
-                                        if tool_call_id_from_message:
-                                            tc["id"] = tool_call_id_from_message
-                                            tool_call_ids_seen.add(tool_call_id_from_message)
-
-                                        # Update function name and arguments (prefer message tool_call as it's complete)
-                                        if hasattr(tool_call, "function"):
-                                            if (
-                                                hasattr(tool_call.function, "name")
-                                                and tool_call.function.name
-                                            ):
-                                                tc["function"]["name"] = tool_call.function.name
-                                            if (
-                                                hasattr(tool_call.function, "arguments")
-                                                and tool_call.function.arguments
-                                            ):
-                                                # For message tool_calls, arguments are complete, not incremental
-                                                tc["function"]["arguments"] = (
-                                                    tool_call.function.arguments
-                                                )
-
-                            # Capture finish reason from last chunk
-                            if chunk.choices[0].finish_reason:
-                                finish_reason = chunk.choices[0].finish_reason
-
-                        # Extract usage data from chunk if available
-                        if hasattr(chunk, "usage") and chunk.usage:
-                            merged = token_usage_from_openrouter_usage(chunk.usage)
-                            if merged:
-                                usage_data = merged
-
-                    # Update reasoning_details for next iteration (if we have recursive tool calls)
-                    if reasoning_details_continue is not None:
-                        reasoning_details = reasoning_details_continue
-
-                    # Break if no more tool calls needed
-                    if finish_reason != "tool_calls" or not tool_calls_accumulated:
+    while retry_count <= max_retries:
+        try:
+            try:
+                response = await create(
+                    _initial_request_params(
+                        model_id,
+                        messages,
+                        max_tokens,
+                        temperature,
+                        top_p,
+                        tools,
+                        is_image_generation,
+                        image_config,
+                    ),
+                    bool(tools),
+                )
+            except Exception as api_error:
+                _log_request_error(api_error, model_id, tools)
+                raise
+
+            state = _StreamState(model_id, is_image_generation)
+            try:
+                async for chunk in response:
+                    for event in state.consume(chunk, "initial", response):
+                        yield event
+                    if state.halted:
                         break
+            finally:
+                await _aclose_stream(response)
 
-            # If loop exited due to max iterations but model wanted more tool calls,
-            # make a final call WITHOUT tools to force the model to provide an answer
-            if finish_reason == "tool_calls" and tool_call_iteration >= max_tool_call_iterations:
+            tool_call_iteration = 0
+            total_tool_calls_made = 0
+            rate_limiter = get_rate_limiter()
+
+            while (
+                state.finish_reason == "tool_calls"
+                and state.tool_calls_accumulated
+                and search_provider
+                and tool_call_iteration < MAX_TOOL_CALL_ITERATIONS
+            ):
+                tool_call_iteration += 1
                 logger.info(
-                    f"Model {model_id} hit max tool call iterations ({max_tool_call_iterations}) "
-                    f"but still wanted to make tool calls. Making final completion call without tools."
+                    f"Processing tool calls iteration {tool_call_iteration} for model {model_id}. "
+                    f"Tool calls accumulated: {len(state.tool_calls_accumulated)}"
                 )
+                if tool_call_iteration >= MAX_TOOL_CALL_ITERATIONS:
+                    logger.warning(
+                        f"Model {model_id} reached max tool call iterations ({MAX_TOOL_CALL_ITERATIONS}). "
+                        f"This is the final iteration - model must provide answer now."
+                    )
+                yield " "
 
-                # Add a user message asking for final answer with validation requirements
-                validation_note = ""
-                # Check if any search tools were used
-                search_tools_used = False
-                for msg in messages:
-                    if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                        for tc in msg["tool_calls"]:
-                            if tc.get("function", {}).get("name") == "search_web":
-                                search_tools_used = True
-                                break
-                        if search_tools_used:
-                            break
+                jobs = _plan_tool_round(state, messages)
+                if not jobs:
+                    continue
+                yield " "
+                task = asyncio.ensure_future(
+                    _run_tool_round(
+                        jobs, search_provider, rate_limiter, model_id, tool_call_iteration
+                    )
+                )
+                try:
+                    while not task.done():
+                        done, _ = await asyncio.wait({task}, timeout=TOOL_KEEPALIVE_INTERVAL)
+                        if not done:
+                            yield " "
+                    task.result()
+                finally:
+                    if not task.done():
+                        task.cancel()
+                yield " "
 
-                # If no search tools were used but query is time-sensitive, add validation note
-                if enable_web_search and not search_tools_used and is_time_sensitive_query(prompt):
-                    validation_note = " IMPORTANT: If you did not use search_web for this time-sensitive query, please explicitly state that you were unable to retrieve current information and that any data provided is historical or estimated, not current."
+                total_tool_calls_made, proceed = _append_tool_round(
+                    messages, state, jobs, tool_call_iteration, total_tool_calls_made
+                )
+                if not proceed:
+                    break
+                yield " "
 
-                messages.append(
-                    {
-                        "role": "user",
-                        "content": f"Please provide your answer now based on all the information you have gathered. Do not search for more information.{validation_note}",
-                    }
+                messages, sent_tool_call_ids = _prepare_continuation_messages(
+                    messages, model_id, tool_call_iteration
                 )
+                try:
+                    response_continue = await create(
+                        _continuation_params(
+                            model_id,
+                            messages,
+                            max_tokens,
+                            temperature,
+                            top_p,
+                            tools,
+                            tool_call_iteration,
+                        ),
+                        bool(tools),
+                    )
+                except Exception as api_error:
+                    _log_request_error(
+                        api_error, model_id, tools, tool_call_iteration, sent_tool_call_ids
+                    )
+                    raise
 
-                # Make final API call WITHOUT tools to force completion
+                state.begin_continuation()
                 try:
-                    final_params = {
-                        "model": model_id,
-                        "messages": messages,
-                        "timeout": settings.individual_model_timeout,
-                        "max_tokens": max_tokens,
-                        "stream": True,
-                        "frequency_penalty": 0.7,  # Reduce token repetition
-                        "presence_penalty": 0.5,  # Reduce topic repetition
-                    }
-                    if temperature is not None and get_model_supports_temperature(model_id):
-                        final_params["temperature"] = max(0.0, min(2.0, temperature))
-                    if top_p is not None:
-                        final_params["top_p"] = max(0.0, min(1.0, top_p))
-                    if should_request_openrouter_reasoning_traces(model_id):
-                        final_params["extra_body"] = {
-                            "reasoning": openrouter_reasoning_request_body(model_id)
-                        }
-                    final_response = _cl.chat.completions.create(**final_params)
-
-                    # Stream the final response
-                    for chunk in final_response:
-                        last_chunk = chunk
-                        if chunk.choices and len(chunk.choices) > 0:
-                            delta = chunk.choices[0].delta
-
-                            rp_final = _reasoning_stream_payload(delta, chunk.choices[0])
-                            if rp_final:
-                                yield rp_final
-
-                            if hasattr(delta, "content") and delta.content:
-                                content_chunk = delta.content
-                                full_answer_content += content_chunk
-
-                                # Check for repetition
-                                if len(full_answer_content) > 500:
-                                    if detect_repetition(full_answer_content):
-                                        logger.warning(
-                                            f"Model {model_id} detected repetition in final completion response. "
-                                            f"Stopping stream early to prevent looping."
-                                        )
-                                        yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                        repetition_detected = (
-                                            True  # Mark that repetition was detected
-                                        )
-                                        finish_reason = "length"
-                                        break
-
-                                yield content_chunk
-
-                            # Also check message.content in final chunk
-                            if hasattr(chunk.choices[0], "message") and chunk.choices[0].message:
-                                message = chunk.choices[0].message
-                                if hasattr(message, "content") and message.content:
-                                    message_content = message.content
-                                    if message_content and len(message_content) > len(
-                                        full_answer_content
-                                    ):
-                                        new_content = message_content[len(full_answer_content) :]
-                                        if new_content:
-                                            full_answer_content += new_content
-
-                                            # Check for repetition
-                                            if len(full_answer_content) > 500:
-                                                if detect_repetition(full_answer_content):
-                                                    logger.warning(
-                                                        f"Model {model_id} detected repetition in final completion response. "
-                                                        f"Stopping stream early to prevent looping."
-                                                    )
-                                                    yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                    repetition_detected = (
-                                                        True  # Mark that repetition was detected
-                                                    )
-                                                    finish_reason = "length"
-                                                    break
-
-                                            yield new_content
-                                    elif message_content and not full_answer_content:
-                                        full_answer_content += message_content
-
-                                        # Check for repetition
-                                        if len(full_answer_content) > 500:
-                                            if detect_repetition(full_answer_content):
-                                                logger.warning(
-                                                    f"Model {model_id} detected repetition in final completion response. "
-                                                    f"Stopping stream early to prevent looping."
-                                                )
-                                                yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                repetition_detected = (
-                                                    True  # Mark that repetition was detected
-                                                )
-                                                finish_reason = "length"
-                                                break
-
-                                        yield message_content
-
-                            if chunk.choices[0].finish_reason:
-                                finish_reason = chunk.choices[0].finish_reason
-
-                        if hasattr(chunk, "usage") and chunk.usage:
-                            merged = token_usage_from_openrouter_usage(chunk.usage)
-                            if merged:
-                                usage_data = merged
+                    async for chunk in response_continue:
+                        for event in state.consume(chunk, "continuation"):
+                            yield event
+                        if state.halted:
+                            break
+                finally:
+                    await _aclose_stream(response_continue)
+                state.end_continuation()
+
+                if state.finish_reason != "tool_calls" or not state.tool_calls_accumulated:
+                    break
+
+            if (
+                state.finish_reason == "tool_calls"
+                and tool_call_iteration >= MAX_TOOL_CALL_ITERATIONS
+            ):
+                logger.info(
+                    f"Model {model_id} hit max tool call iterations ({MAX_TOOL_CALL_ITERATIONS}) "
+                    f"but still wanted to make tool calls. Making final completion call without tools."
+                )
+                messages.append(_final_answer_prompt(messages, enable_web_search, prompt))
+                try:
+                    final_response = await create(
+                        _followup_params(model_id, messages, max_tokens, temperature, top_p),
+                        False,
+                    )
+                    try:
+                        async for chunk in final_response:
+                            for event in state.consume(chunk, "final"):
+                                yield event
+                            if state.halted:
+                                break
+                    finally:
+                        await _aclose_stream(final_response)
                 except Exception as final_error:
                     logger.error(
                         f"Error in final completion call for model {model_id}: {final_error}"
                     )
-                    # Don't raise - we've already provided some response
 
-            # Extract usage data from last chunk if available (from continuation response)
-            if last_chunk and hasattr(last_chunk, "usage") and last_chunk.usage:
-                merged = token_usage_from_openrouter_usage(last_chunk.usage)
-                if merged:
-                    usage_data = merged
-
-            # Check if the last assistant message had text content that suggests an incomplete response
-            # Common patterns: ends with ":", "Let me", "I'll", etc.
-            # This handles cases where models generate explanatory text before tool calls but don't complete
-            if messages and len(messages) > 0:
-                # Find the last assistant message
-                last_assistant_msg = None
-                for msg in reversed(messages):
-                    if msg.get("role") == "assistant":
-                        last_assistant_msg = msg
-                        break
+            state.merge_last_chunk_usage()
 
-                if last_assistant_msg:
-                    last_assistant_content = last_assistant_msg.get("content", "")
-                    if last_assistant_content and isinstance(last_assistant_content, str):
-                        # Check for incomplete response patterns
-                        # These patterns indicate the model started to explain what it will do but didn't complete
-                        incomplete_patterns = [
-                            "let me get",
-                            "let me try",
-                            "let me check",
-                            "i'll check",
-                            "i'll get",
-                            "i'll try",
-                        ]
-                        content_lower = last_assistant_content.lower().strip()
-                        ends_with_colon = content_lower.endswith(":")
-                        # Check if content starts with incomplete pattern (strong indicator)
-                        starts_with_incomplete = any(
-                            content_lower.startswith(pattern) for pattern in incomplete_patterns
-                        )
-                        # Check if last sentence contains incomplete pattern (more specific than checking entire content)
-                        last_sentence = (
-                            content_lower.split(".")[-1].strip()
-                            if "." in content_lower
-                            else content_lower
-                        )
-                        last_sentence_incomplete = any(
-                            pattern in last_sentence for pattern in incomplete_patterns
-                        )
-
-                        # If response looks incomplete (ends with colon, starts with incomplete phrase, or last sentence has incomplete phrase),
-                        # and we're not in a tool call loop, force a completion call
-                        if (
-                            ends_with_colon or starts_with_incomplete or last_sentence_incomplete
-                        ) and finish_reason != "tool_calls":
-                            logger.info(
-                                f"Model {model_id} generated potentially incomplete response: '{last_assistant_content[:100]}...' "
-                                f"Detected incomplete pattern. Forcing completion."
-                            )
-
-                            # Add a user message asking for completion
-                            messages.append(
-                                {
-                                    "role": "user",
-                                    "content": "Please complete your response. Provide the answer to the user's question.",
-                                }
-                            )
-
-                            # Make completion call WITHOUT tools
-                            try:
-                                completion_params = {
-                                    "model": model_id,
-                                    "messages": messages,
-                                    "timeout": settings.individual_model_timeout,
-                                    "max_tokens": max_tokens,
-                                    "stream": True,
-                                    "frequency_penalty": 0.7,  # Reduce token repetition
-                                    "presence_penalty": 0.5,  # Reduce topic repetition
-                                }
-                                if temperature is not None and get_model_supports_temperature(
-                                    model_id
-                                ):
-                                    completion_params["temperature"] = max(
-                                        0.0, min(2.0, temperature)
-                                    )
-                                if top_p is not None:
-                                    completion_params["top_p"] = max(0.0, min(1.0, top_p))
-                                if should_request_openrouter_reasoning_traces(model_id):
-                                    completion_params["extra_body"] = {
-                                        "reasoning": openrouter_reasoning_request_body(model_id)
-                                    }
-                                completion_response = _cl.chat.completions.create(
-                                    **completion_params
-                                )
-
-                                # Stream the completion response
-                                for chunk in completion_response:
-                                    last_chunk = chunk
-                                    if chunk.choices and len(chunk.choices) > 0:
-                                        delta = chunk.choices[0].delta
-
-                                        rp_inc = _reasoning_stream_payload(delta, chunk.choices[0])
-                                        if rp_inc:
-                                            yield rp_inc
-
-                                        if hasattr(delta, "content") and delta.content:
-                                            content_chunk = delta.content
-                                            full_answer_content += content_chunk
-
-                                            # Check for repetition
-                                            if len(full_answer_content) > 500:
-                                                if detect_repetition(full_answer_content):
-                                                    logger.warning(
-                                                        f"Model {model_id} detected repetition in incomplete response completion. "
-                                                        f"Stopping stream early to prevent looping."
-                                                    )
-                                                    yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                    repetition_detected = (
-                                                        True  # Mark that repetition was detected
-                                                    )
-                                                    finish_reason = "length"
-                                                    break
-
-                                            yield content_chunk
-
-                                        # Also check message.content in final chunk
-                                        if (
-                                            hasattr(chunk.choices[0], "message")
-                                            and chunk.choices[0].message
-                                        ):
-                                            message = chunk.choices[0].message
-                                            if hasattr(message, "content") and message.content:
-                                                message_content = message.content
-                                                if message_content and len(message_content) > len(
-                                                    full_answer_content
-                                                ):
-                                                    new_content = message_content[
-                                                        len(full_answer_content) :
-                                                    ]
-                                                    if new_content:
-                                                        full_answer_content += new_content
-
-                                                        # Check for repetition
-                                                        if len(full_answer_content) > 500:
-                                                            if detect_repetition(
-                                                                full_answer_content
-                                                            ):
-                                                                logger.warning(
-                                                                    f"Model {model_id} detected repetition in incomplete response completion. "
-                                                                    f"Stopping stream early to prevent looping."
-                                                                )
-                                                                yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                                repetition_detected = True  # Mark that repetition was detected
-                                                                finish_reason = "length"
-                                                                break
-
-                                                        yield new_content
-                                                elif message_content and not full_answer_content:
-                                                    full_answer_content += message_content
-
-                                                    # Check for repetition
-                                                    if len(full_answer_content) > 500:
-                                                        if detect_repetition(full_answer_content):
-                                                            logger.warning(
-                                                                f"Model {model_id} detected repetition in incomplete response completion. "
-                                                                f"Stopping stream early to prevent looping."
-                                                            )
-                                                            yield "\n\n⚠️ Response stopped - detected repetitive content."
-                                                            repetition_detected = True  # Mark that repetition was detected
-                                                            finish_reason = "length"
-                                                            break
-
-                                                    yield message_content
-
-                                        if chunk.choices[0].finish_reason:
-                                            finish_reason = chunk.choices[0].finish_reason
-
-                                    if hasattr(chunk, "usage") and chunk.usage:
-                                        merged = token_usage_from_openrouter_usage(chunk.usage)
-                                        if merged:
-                                            usage_data = merged
-                            except Exception as completion_error:
-                                logger.error(
-                                    f"Error in incomplete response completion call for model {model_id}: {completion_error}"
-                                )
-                                # Don't raise - we've already provided some response
-
-            # After streaming completes, handle finish_reason warnings
-            # Only show "maximum output length" warning if it wasn't due to repetition detection
-            if finish_reason == "length" and not repetition_detected:
-                if credits_limited:
-                    yield "\n\n⚠️ Response stopped - credits exhausted."
-                else:
-                    yield "\n\n⚠️ Response truncated - model reached maximum output length."
-            elif finish_reason == "content_filter":
-                yield "\n\n⚠️ **Note:** Response stopped by content filter."
+            if _needs_completion_nudge(messages, state.finish_reason, model_id):
+                messages.append(dict(_COMPLETION_NUDGE))
+                try:
+                    completion_response = await create(
+                        _followup_params(model_id, messages, max_tokens, temperature, top_p),
+                        False,
+                    )
+                    try:
+                        async for chunk in completion_response:
+                            for event in state.consume(chunk, "completion"):
+                                yield event
+                            if state.halted:
+                                break
+                    finally:
+                        await _aclose_stream(completion_response)
+                except Exception as completion_error:
+                    logger.error(
+                        f"Error in incomplete response completion call for model {model_id}: {completion_error}"
+                    )
 
-            if is_image_generation and image_count > 0 and usage_data is None:
-                return {"image_count": image_count, "model_id": model_id}
-            return usage_data
+            for notice in state.finish_notices(credits_limited):
+                yield notice
+            yield {"type": USAGE_STREAM_TYPE, "usage": state.result()}
+            return
 
         except Exception as e:
-            classified = classify_api_error(e)
-
-            if classified.is_402_max_tokens and retry_count < max_retries:
-                reduced_max_tokens = max(2048, int(max_tokens * 0.5))
-                if reduced_max_tokens < max_tokens:
-                    logger.info(
-                        f"[API] 402 max_tokens error for {model_id} - retrying with reduced max_tokens: "
-                        f"{max_tokens} -> {reduced_max_tokens}"
-                    )
-                    max_tokens = reduced_max_tokens
-                    retry_count += 1
-                    continue
-
-            message = format_streaming_error_message(
-                classified, model_id, settings.individual_model_timeout
-            )
-            yield message
-            return None
+            reduced = _reduced_max_tokens(e, model_id, max_tokens, retry_count < max_retries)
+            if reduced is not None:
+                max_tokens = reduced
+                retry_count += 1
+                continue
+            yield _stream_error_message(e, model_id)
+            yield {"type": USAGE_STREAM_TYPE, "usage": None}
+            return
 
 
 def call_openrouter(
@@ -4,9 +4,51 @@ Text processing: repetition detection, response cleanup.
 
 import logging
 import re
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+# N-grams containing any of these are structural (code, tables, rules), not looping prose
+_REPETITION_SKIP_PATTERNS = (
+    "```",
+    "---",
+    "***",
+    "===",
+    "|",
+    "#",
+    "def ",
+    "class ",
+    "return ",
+    "import ",
+    "function ",
+    "const ",
+    "let ",
+    "var ",
+    "if ",
+    "else ",
+    "for ",
+    "while ",
+)
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def _is_meaningful_ngram(ngram: tuple[str, ...]) -> bool:
+    """False for n-grams whose repetition is expected (short words, numbering, code)."""
+    if all(len(word) <= 3 for word in ngram):
+        return False
+    if any(word.rstrip(".:)").isdigit() for word in ngram):
+        return False
+    ngram_text = " ".join(ngram).lower()
+    return not any(pattern in ngram_text for pattern in _REPETITION_SKIP_PATTERNS)
+
+
+def _log_repetition(ngram: tuple[str, ...], count: int, ratio: float, window_size: int) -> None:
+    logger.warning(
+        f"Repetition detected: n-gram '{' '.join(ngram)}' appears {count} times "
+        f"({ratio:.1%} of window) in last {window_size} characters"
+    )
+
 
 def detect_repetition(
     content: str, window_size: int = 500, ngram_size: int = 5, repetition_threshold: int = 6
@@ -25,42 +67,142 @@ def detect_repetition(
     total_ngrams = len(words) - ngram_size + 1
     for ngram, count in ngrams.items():
         if count >= repetition_threshold:
-            if all(len(word) <= 3 for word in ngram):
+            if not _is_meaningful_ngram(ngram):
                 continue
-            ngram_text = " ".join(ngram).lower()
-            if any(word.rstrip(".:)").isdigit() for word in ngram):
+            repetition_ratio = count / total_ngrams
+            if repetition_ratio < 0.15:
                 continue
-            skip_patterns = [
-                "```",
-                "---",
-                "***",
-                "===",
-                "|",
-                "#",
-                "def ",
-                "class ",
-                "return ",
-                "import ",
-                "function ",
-                "const ",
-                "let ",
-                "var ",
-                "if ",
-                "else ",
-                "for ",
-                "while ",
-            ]
-            if any(pattern in ngram_text for pattern in skip_patterns):
+            _log_repetition(ngram, count, repetition_ratio, window_size)
+            return True
+    return False
+
+
+class RepetitionDetector:
+    """Incremental ``detect_repetition`` for a growing streamed answer.
+
+    ``feed`` takes each new chunk and returns the same verdict ``detect_repetition``
+    would give for everything fed so far, but keeps the words of the trailing window
+    and their n-gram counts between calls, so each chunk costs work proportional to
+    the chunk rather than to the window.
+
+    The window is ``window_size`` characters, as in ``detect_repetition``: a word
+    straddling its start is cut to the part inside the window, and a word still being
+    streamed (no whitespace after it yet) counts as it currently stands. Only the one
+    n-gram starting at the cut word and the one ending at the open word depend on
+    those two, so they are added at check time instead of being counted.
+    """
+
+    def __init__(self, window_size: int = 500, ngram_size: int = 5, repetition_threshold: int = 6):
+        self.window_size = window_size
+        self.ngram_size = ngram_size
+        self.repetition_threshold = repetition_threshold
+        self._length = 0
+        # Completed words starting inside the window, with their offsets in the content
+        self._words: deque[str] = deque()
+        self._starts: deque[int] = deque()
+        # Counts of the n-grams made only of ``_words``
+        self._counts: dict[tuple[str, ...], int] = {}
+        # N-grams of ``_counts`` that reached the threshold on their own
+        self._hot: set[tuple[str, ...]] = set()
+        # Most recently evicted word; it may straddle the window start
+        self._head: tuple[int, str] | None = None
+        # Trailing word not yet followed by whitespace
+        self._open_start = 0
+        self._open = ""
+
+    def feed(self, chunk: str) -> bool:
+        """Append ``chunk`` and report whether the content now looks like a loop."""
+        if chunk:
+            self._extend(chunk)
+        return self._check()
+
+    def _extend(self, chunk: str) -> None:
+        base = self._open_start
+        text = self._open + chunk
+        self._length += len(chunk)
+        ends_open = not text[-1].isspace()
+        matches = list(_WORD_RE.finditer(text))
+        if ends_open:
+            last = matches.pop()
+            self._open_start = base + last.start()
+            self._open = last.group()
+        else:
+            self._open_start = self._length
+            self._open = ""
+        for match in matches:
+            self._push(base + match.start(), match.group())
+        self._evict()
+
+    def _push(self, start: int, word: str) -> None:
+        self._words.append(word)
+        self._starts.append(start)
+        n = self.ngram_size
+        if len(self._words) >= n:
+            words = self._words
+            self._bump(tuple(words[i] for i in range(-n, 0)), 1)
+
+    def _evict(self) -> None:
+        window_start = self._length - self.window_size
+        n = self.ngram_size
+        words = self._words
+        while self._starts and self._starts[0] < window_start:
+            if len(words) >= n:
+                self._bump(tuple(words[i] for i in range(n)), -1)
+            self._head = (self._starts.popleft(), words.popleft())
+
+    def _bump(self, ngram: tuple[str, ...], delta: int) -> None:
+        count = self._counts.get(ngram, 0) + delta
+        if count:
+            self._counts[ngram] = count
+        else:
+            del self._counts[ngram]
+        if count >= self.repetition_threshold:
+            self._hot.add(ngram)
+        else:
+            self._hot.discard(ngram)
+
+    def _check(self) -> bool:
+        if self._length < self.window_size:
+            return False
+        window_start = self._length - self.window_size
+        n = self.ngram_size
+        words = self._words
+
+        head = None
+        if self._head is not None:
+            start, word = self._head
+            if start + len(word) > window_start:
+                head = word[window_start - start :]
+        tail = None
+        if self._open:
+            tail = self._open[max(0, window_start - self._open_start) :]
+
+        word_count = len(words) + (head is not None) + (tail is not None)
+        if word_count < n * self.repetition_threshold:
+            return False
+        total_ngrams = word_count - n + 1
+
+        # Every n-gram with an edge word has at least n - 1 completed words beside it,
+        # since the window holds at least n * repetition_threshold words.
+        candidates = set(self._hot)
+        head_ngram = tail_ngram = None
+        if head is not None:
+            head_ngram = (head, *(words[i] for i in range(n - 1)))
+            candidates.add(head_ngram)
+        if tail is not None:
+            tail_ngram = (*(words[i] for i in range(1 - n, 0)), tail)
+            candidates.add(tail_ngram)
+
+        for ngram in candidates:
+            count = self._counts.get(ngram, 0) + (ngram == head_ngram) + (ngram == tail_ngram)
+            if count < self.repetition_threshold or not _is_meaningful_ngram(ngram):
                 continue
             repetition_ratio = count / total_ngrams
             if repetition_ratio < 0.15:
                 continue
-            logger.warning(
-                f"Repetition detected: n-gram '{' '.join(ngram)}' appears {count} times "
-                f"({repetition_ratio:.1%} of window) in last {window_size} characters"
-            )
+            _log_repetition(ngram, count, repetition_ratio, self.window_size)
             return True
-    return False
+        return False
 
 
 def clean_model_response(text: str) -> str:
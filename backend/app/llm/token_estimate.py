@@ -0,0 +1,309 @@
+"""
+Fast token-count bounds for admission checks and credit reservation.
+
+Tokenizing a large pasted input exactly takes tens of milliseconds per request. These
+checks only need to know on which side of a limit the count falls. This module turns
+byte-class counts (ASCII letters, digits, punctuation, whitespace, multi-byte UTF-8
+characters by script) plus letter runs, digit runs and double spaces into an estimate
+and a lower and upper bound on the exact count.
+
+The per-byte weights are applied with ``bytes.translate`` (each byte becomes its weight
+in 1/128ths of a token) and summed with ``zlib.adler32``, whose low 16 bits are the byte
+sum of the input plus one. Both run in C, so a 100K-token input takes a few milliseconds.
+
+The coefficients were fitted per tokenizer family on ~5,000 chunks of 4K-16K
+characters: English prose and docs, Python / TypeScript / CSS / JSON, numbers, emoji,
+and natural text in 30 languages including Cyrillic, Greek, CJK and Hangul. The bounds
+are linear envelopes (``lower <= exact <= upper`` on every calibration chunk), widened
+by 15% up / 10% down to cover held-out text. Because the features add up over
+concatenated text, the same bounds hold for long inputs made of such text. In addition,
+a byte-level BPE token spans at least one byte, so the upper bound is capped at the
+UTF-8 length.
+
+Texts shorter than :data:`APPROXIMATE_MIN_CHARS` are counted exactly: that is cheap,
+and the envelopes are not calibrated on short text.
+"""
+
+import math
+import string
+import zlib
+from collections.abc import Callable, Iterable, Sequence
+from typing import NamedTuple
+
+from .tokenizers import cached_token_count, count_tokens, count_tokens_batch, tokenizer_key
+
+APPROXIMATE_MIN_CHARS = 4000
+
+
+class TokenBounds(NamedTuple):
+    estimate: int
+    lower: int
+    upper: int
+
+    @property
+    def exact(self) -> bool:
+        return self.lower == self.upper
+
+
+_ASCII_LETTERS = string.ascii_letters.encode()
+_ASCII_DIGITS = string.digits.encode()
+
+# Byte classes; UTF-8 lead bytes are split by the script ranges they start
+_CLASS_BYTES: dict[bytes, Iterable[int]] = {
+    b"L": _ASCII_LETTERS,
+    b"D": _ASCII_DIGITS,
+    b"P": string.punctuation.encode(),
+    b"S": b" ",
+    b"N": b"\n",
+    b"T": b"\t\r\x0b\x0c",
+    b"C": range(0x80, 0xC0),  # continuation bytes
+    b"a": range(0xC0, 0xC6),  # Latin-1 supplement, Latin extended-A
+    b"b": [*range(0xC6, 0xCD), *range(0xD5, 0xE0)],  # other 2-byte (Hebrew, Arabic, ...)
+    b"g": range(0xCD, 0xD0),  # Greek
+    b"c": range(0xD0, 0xD5),  # Cyrillic
+    b"o": [0xE0, 0xE1, 0xE2, 0xEE, 0xEF],  # other 3-byte (Indic, symbols, ...)
+    b"k": [0xE3],  # kana, CJK punctuation
+    b"h": range(0xE4, 0xEA),  # CJK ideographs
+    b"K": range(0xEA, 0xEE),  # Hangul
+    b"4": range(0xF0, 0x100),  # 4-byte (emoji, ...)
+}
+
+
+def _marker_table(marker: bytes, byte_values: Iterable[int]) -> bytes:
+    table = bytearray(b" " * 256)
+    for b in byte_values:
+        table[b] = marker[0]
+    return bytes(table)
+
+
+# Runs of a class are counted as " X" transitions in the marked text
+_LETTER_RUNS = _marker_table(b"L", _ASCII_LETTERS)
+_DIGIT_RUNS = _marker_table(b"D", _ASCII_DIGITS)
+
+
+def _run_features(data: bytes) -> tuple[int, int, int]:
+    return (
+        (b" " + data.translate(_LETTER_RUNS)).count(b" L"),
+        (b" " + data.translate(_DIGIT_RUNS)).count(b" D"),
+        data.count(b"  "),
+    )
+
+
+# Per tokenizer family: (class, estimate, lower, upper) weights per byte, then
+# (estimate, lower, upper) weights for letter runs, digit runs and double spaces.
+# Only the weighted sums are ordered (lower <= estimate <= upper), not single weights.
+_CALIBRATION: dict[
+    str,
+    tuple[tuple[tuple[bytes, float, float, float], ...], tuple[tuple[float, float, float], ...]],
+] = {
+    "cl100k_base": (
+        (
+            (b"L", 0.1187, 0.0632, 0.1679),  # ASCII letters
+            (b"D", 0.1422, 0.2982, 0),  # digits
+            (b"P", 0.5027, 0.0707, 1.1622),  # punctuation
+            (b"S", 0.0134, 0, 0.576),  # spaces
+            (b"N", 0.2633, 1.5573, 0.6953),  # newlines
+            (b"T", 0.8488, 0.6022, 1.9901),  # tabs, other ASCII whitespace
+            (b"C", 0.1665, 0.2327, 0.1394),  # UTF-8 continuation bytes
+            (b"a", 1.4483, 1.213, 1.9901),  # Latin-1 / Latin extended letters
+            (b"b", 0.8761, 0.7118, 0.9479),  # other 2-byte characters
+            (b"g", 1.0196, 0.7571, 1.1256),  # Greek
+            (b"c", 0.6259, 0.2237, 0.8655),  # Cyrillic
+            (b"o", 0.1241, 0, 0),  # other 3-byte characters
+            (b"k", 0.6059, 0.4801, 0.423),  # kana, CJK punctuation
+            (b"h", 0.8347, 0.4813, 0.843),  # CJK ideographs
+            (b"K", 0.8172, 0.6712, 0.4533),  # Hangul
+            (b"4", 1.0859, 1.5573, 0),  # 4-byte characters
+        ),
+        (
+            (0.6049, 0.5753, 0.1945),  # letter runs (words)
+            (1.8218, 0.9378, 2.4243),  # digit runs
+            (0.1137, 0.0831, -0.8334),  # double spaces
+        ),
+    ),
+    "o200k_base": (
+        (
+            (b"L", 0.1882, 0.1202, 0.1524),  # ASCII letters
+            (b"D", 0.1146, 0.2968, 0),  # digits
+            (b"P", 0.4417, 0.0414, 0.7605),  # punctuation
+            (b"S", 0, 0, 0.0952),  # spaces
+            (b"N", 0, 1.335, 0.8683),  # newlines
+            (b"T", 0.8115, 0, 1.5673),  # tabs, other ASCII whitespace
+            (b"C", 0.0983, 0.0388, 0),  # UTF-8 continuation bytes
+            (b"a", 1.3761, 1.0514, 1.6486),  # Latin-1 / Latin extended letters
+            (b"b", 0.6183, 0.6071, 0.8056),  # other 2-byte characters
+            (b"g", 0.6779, 0.3512, 0.9745),  # Greek
+            (b"c", 0.4809, 0.279, 0.8882),  # Cyrillic
+            (b"o", 0.0483, 0, 0.1122),  # other 3-byte characters
+            (b"k", 0.4791, 0.6164, 0.5209),  # kana, CJK punctuation
+            (b"h", 0.665, 0.6826, 0.7673),  # CJK ideographs
+            (b"K", 0.5505, 0.6575, 0.4847),  # Hangul
+            (b"4", 0.4392, 1.5573, 0),  # 4-byte characters
+        ),
+        (
+            (0.3296, 0.3215, 0.5927),  # letter runs (words)
+            (2.0488, 0.9988, 3.0582),  # digit runs
+            (0.1953, 0.1275, 0.6096),  # double spaces
+        ),
+    ),
+    "anthropic": (
+        (
+            (b"L", 0.118, 0.1353, 0.1483),  # ASCII letters
+            (b"D", 0.2346, 0.4244, 0.2826),  # digits
+            (b"P", 0.6732, 0.1247, 1.1908),  # punctuation
+            (b"S", 0, 0, 0.4313),  # spaces
+            (b"N", 0.5816, 1.0146, 1.1049),  # newlines
+            (b"T", 0.8215, 0.6934, 1.9901),  # tabs, other ASCII whitespace
+            (b"C", 0.16, 0.1953, 0.37),  # UTF-8 continuation bytes
+            (b"a", 1.4852, 1.4122, 1.9901),  # Latin-1 / Latin extended letters
+            (b"b", 1.157, 0.9943, 1.0615),  # other 2-byte characters
+            (b"g", 1.1962, 1.0147, 1.1149),  # Greek
+            (b"c", 0.6513, 0.3355, 0.6772),  # Cyrillic
+            (b"o", 0.018, 0, 0),  # other 3-byte characters
+            (b"k", 0.5676, 0.5767, 0.1595),  # kana, CJK punctuation
+            (b"h", 0.5018, 0.4157, 0),  # CJK ideographs
+            (b"K", 0.8404, 0.877, 0.2018),  # Hangul
+            (b"4", 1.729, 1.5573, 0.4989),  # 4-byte characters
+        ),
+        (
+            (0.6081, 0.3014, 0.6777),  # letter runs (words)
+            (1.3424, 0.4782, 1.1059),  # digit runs
+            (0.0657, 0.1432, -0.8624),  # double spaces
+        ),
+    ),
+}
+
+# Per-byte weights are stored in 1/_SCALE token units (at most 255), and adler32 sums
+# chunks of _CHUNK bytes, whose byte sums cannot reach its modulus (65521)
+_SCALE = 128
+_CHUNK = 256
+
+
+class _Weights(NamedTuple):
+    table: bytes
+    runs: tuple[float, float, float]
+
+
+def _weights(
+    byte_weights: dict[bytes, float],
+    run_weights: tuple[float, float, float],
+    rounding: Callable[[float], int],
+) -> _Weights:
+    table = bytearray(256)
+    for cls, weight in byte_weights.items():
+        value = rounding(weight * _SCALE)
+        for b in _CLASS_BYTES[cls]:
+            table[b] = value
+    return _Weights(bytes(table), run_weights)
+
+
+class _Family(NamedTuple):
+    estimate: _Weights
+    lower: _Weights
+    upper: _Weights
+
+
+def _family(
+    byte_rows: Iterable[tuple[bytes, float, float, float]],
+    run_rows: Iterable[tuple[float, float, float]],
+) -> _Family:
+    classes, *byte_columns = zip(*byte_rows, strict=True)
+    run_columns = tuple(zip(*run_rows, strict=True))
+    # Rounding the lower weights down and the upper weights up keeps the bounds valid
+    roundings = (round, math.floor, math.ceil)
+    return _Family(
+        *(
+            _weights(dict(zip(classes, column, strict=True)), runs, rounding)
+            for column, runs, rounding in zip(byte_columns, run_columns, roundings, strict=True)
+        )
+    )
+
+
+_FAMILIES = {family: _family(*rows) for family, rows in _CALIBRATION.items()}
+# Tokenizers that were not calibrated (HuggingFace models, the Anthropic client, which can
+# fall back to cl100k per text) get the union of the calibrated envelopes. All features are
+# non-negative, so the smallest (largest) weight per feature bounds every family from below
+# (above).
+_FAMILIES["generic"] = _Family(
+    estimate=_FAMILIES["cl100k_base"].estimate,
+    lower=_Weights(
+        bytes(map(min, *(f.lower.table for f in _FAMILIES.values()))),
+        tuple(map(min, *(f.lower.runs for f in _FAMILIES.values()))),
+    ),
+    upper=_Weights(
+        bytes(map(max, *(f.upper.table for f in _FAMILIES.values()))),
+        tuple(map(max, *(f.upper.runs for f in _FAMILIES.values()))),
+    ),
+)
+
+_FAMILY_BY_TOKENIZER = {"tiktoken:cl100k_base": "cl100k_base", "tiktoken:o200k_base": "o200k_base"}
+
+
+def _byte_sum(data: bytes) -> int:
+    view = memoryview(data)
+    return sum(
+        (zlib.adler32(view[i : i + _CHUNK]) & 0xFFFF) - 1 for i in range(0, len(data), _CHUNK)
+    )
+
+
+def _weighted_sum(weights: _Weights, data: bytes, runs: tuple[int, int, int]) -> float:
+    return _byte_sum(data.translate(weights.table)) / _SCALE + sum(
+        w * n for w, n in zip(weights.runs, runs, strict=True)
+    )
+
+
+def approximate_token_bounds(text: str, family: str = "cl100k_base") -> TokenBounds:
+    """Estimate and bounds for the token count of ``text`` under a tokenizer family."""
+    if not text:
+        return TokenBounds(0, 0, 0)
+    data = text.encode("utf-8", "surrogatepass")
+    runs = _run_features(data)
+    weights = _FAMILIES[family]
+    lower = max(0, math.floor(_weighted_sum(weights.lower, data, runs)))
+    upper = min(len(data) + 1, math.ceil(_weighted_sum(weights.upper, data, runs)))
+    estimate = min(upper, max(lower, round(_weighted_sum(weights.estimate, data, runs))))
+    return TokenBounds(estimate, lower, upper)
+
+
+def _text_bounds(text: str, model_id: str | None, tokenizer: str) -> TokenBounds:
+    if len(text) >= APPROXIMATE_MIN_CHARS and tokenizer != "approx":
+        count = cached_token_count(text, tokenizer)
+        if count is None:
+            return approximate_token_bounds(text, _FAMILY_BY_TOKENIZER.get(tokenizer, "generic"))
+    else:
+        count = count_tokens(text, model_id)
+    return TokenBounds(count, count, count)
+
+
+def token_bounds(text: str, model_id: str | None = None) -> TokenBounds:
+    """Bounds on ``count_tokens(text, model_id)``; exact for short or already counted texts."""
+    return _text_bounds(text, model_id, tokenizer_key(model_id))
+
+
+def token_bounds_batch(texts: Sequence[str], model_id: str | None = None) -> TokenBounds:
+    """Bounds on the summed token count of ``texts``; short texts are counted in one batch."""
+    exact = sum(count_tokens_batch([t for t in texts if len(t) < APPROXIMATE_MIN_CHARS], model_id))
+    estimate = lower = upper = exact
+    long_texts = [t for t in texts if len(t) >= APPROXIMATE_MIN_CHARS]
+    if long_texts:
+        tokenizer = tokenizer_key(model_id)
+        for text in long_texts:
+            bounds = _text_bounds(text, model_id, tokenizer)
+            estimate += bounds.estimate
+            lower += bounds.lower
+            upper += bounds.upper
+    return TokenBounds(estimate, lower, upper)
+
+
+def count_tokens_under(text: str, model_id: str | None, limit: int) -> int:
+    """
+    ``count_tokens(text, model_id)``, or an upper bound on it when that is within ``limit``.
+
+    The result is never below the exact count and equals it whenever it exceeds ``limit``,
+    so ``result <= limit`` decides a limit check exactly. Only texts whose bounds straddle
+    the limit (or exceed it) are tokenized.
+    """
+    bounds = token_bounds(text, model_id)
+    if bounds.upper <= limit or bounds.exact:
+        return bounds.upper
+    return count_tokens(text, model_id)
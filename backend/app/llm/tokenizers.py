@@ -0,0 +1,402 @@
+"""
+Tokenizer service: per-model tokenizer selection, memoized counts, batched history.
+
+Counts are cached by tokenizer and content hash in a bounded LRU. A conversation that
+is re-sent with every follow-up turn therefore only tokenizes its newest message, and
+the several estimates one compare request makes (admission, credit reservation,
+output cap) share one tokenization. History misses are encoded in one batch call.
+
+HuggingFace and Anthropic tokenizers are slow to construct, so they are loaded on a
+background pool (prewarmed at startup) and never on a request. Until a model's own
+tokenizer is ready its text is counted with cl100k_base.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import tiktoken  # type: ignore[import-untyped]
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_HUGGINGFACE_PROVIDERS = frozenset({"meta-llama", "mistralai", "deepseek", "qwen", "microsoft"})
+
+_TOKENIZER_CACHE_DIR = (
+    Path(settings.tokenizer_cache_dir)
+    if settings.tokenizer_cache_dir
+    else Path(__file__).resolve().parent.parent.parent / "data" / "tokenizer_cache"
+)
+
+
+class _TokenizerSlot:
+    """Load state of one tokenizer; ``lock`` guards only this slot."""
+
+    __slots__ = ("name", "loader", "lock", "state", "tokenizer", "future")
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.state = "pending"  # pending -> loading -> ready | unavailable
+        self.tokenizer: Any = None
+        self.future: Future | None = None
+
+
+class TokenizerRegistry:
+    """
+    Tokenizers that are slow to construct, loaded on a small background pool.
+
+    :meth:`get` never waits: it returns the tokenizer once it is ready and ``None`` while
+    it is still loading (callers then count with a stand-in). A load failure is recorded
+    once and not retried.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._max_workers = max_workers
+        self._slots: dict[str, _TokenizerSlot] = {}
+        # Guards slot creation only; loading holds the slot's own lock
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _slot(self, name: str, loader: Callable[[], Any]) -> _TokenizerSlot:
+        slot = self._slots.get(name)
+        if slot is None:
+            with self._lock:
+                slot = self._slots.setdefault(name, _TokenizerSlot(name, loader))
+        return slot
+
+    def load(self, name: str, loader: Callable[[], Any]) -> Future | None:
+        """Start loading ``name`` in the background unless it has been started already."""
+        slot = self._slot(name, loader)
+        if slot.state != "pending":
+            return slot.future
+        with slot.lock:
+            if slot.state == "pending":
+                slot.state = "loading"
+                if self._executor is None:
+                    with self._lock:
+                        if self._executor is None:
+                            self._executor = ThreadPoolExecutor(
+                                max_workers=self._max_workers, thread_name_prefix="tokenizer_load"
+                            )
+                slot.future = self._executor.submit(self._run_loader, slot)
+        return slot.future
+
+    @staticmethod
+    def _run_loader(slot: _TokenizerSlot) -> None:
+        started = time.monotonic()
+        try:
+            tokenizer = slot.loader()
+        except Exception as e:
+            logger.warning(f"Failed to load tokenizer {slot.name}: {e}")
+            tokenizer = None
+        with slot.lock:
+            slot.tokenizer = tokenizer
+            slot.state = "ready" if tokenizer is not None else "unavailable"
+        if tokenizer is not None:
+            logger.info(f"Loaded tokenizer {slot.name} in {time.monotonic() - started:.1f}s")
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any | None:
+        """The tokenizer if loaded; otherwise schedule the load and return ``None``."""
+        slot = self._slots.get(name)
+        if slot is not None and slot.state == "ready":
+            return slot.tokenizer
+        if slot is None or slot.state == "pending":
+            self.load(name, loader)
+        return None
+
+    def states(self) -> dict[str, str]:
+        return {name: slot.state for name, slot in list(self._slots.items())}
+
+
+tokenizer_registry = TokenizerRegistry()
+
+
+def _get_huggingface_model_name(model_id: str) -> str | None:
+    base_id = model_id.split(":")[0]
+    hf_model_map = {
+        "meta-llama/llama-3.3-70b-instruct": "meta-llama/Llama-3.3-70B-Instruct",
+        "meta-llama/llama-4-scout": "meta-llama/Llama-4-Scout-17B-Instruct",
+        "meta-llama/llama-4-maverick": "meta-llama/Llama-4-Maverick-17B-Instruct",
+        "mistralai/mistral-small-3.2-24b-instruct": "mistralai/Mistral-Small-3.2-24B-Instruct",
+        "mistralai/mistral-medium-3.1": "mistralai/Mistral-Medium-3.1",
+        "mistralai/mistral-large": "mistralai/Mistral-Large-2407",
+        "mistralai/devstral-small": "mistralai/Devstral-Small-1.1",
+        "mistralai/devstral-medium": "mistralai/Devstral-Medium",
+        "mistralai/codestral-2508": "mistralai/Codestral-2508",
+        "deepseek/deepseek-r1": "deepseek-ai/DeepSeek-R1",
+        "deepseek/deepseek-v3.2-exp": "deepseek-ai/DeepSeek-V3.2-Exp",
+        "deepseek/deepseek-chat-v3.1": "deepseek-ai/DeepSeek-V3.1",
+        "qwen/qwen3-30b-a3b-instruct-2507": "Qwen/Qwen3-30B-A3B-Instruct-2507",
+        "qwen/qwen3-next-80b-a3b-instruct": "Qwen/Qwen3-Next-80B-A3B-Instruct",
+        "qwen/qwen3-max": "Qwen/Qwen3-Max",
+        "qwen/qwen3-coder-flash": "Qwen/Qwen3-Coder-Flash",
+        "qwen/qwen3-coder-plus": "Qwen/Qwen3-Coder-Plus",
+        "qwen/qwen3-coder": "Qwen/Qwen3-Coder-480B-A35B",
+        "microsoft/phi-4": "microsoft/Phi-4",
+        "microsoft/phi-4-reasoning-plus": "microsoft/Phi-4-Reasoning-Plus",
+        "microsoft/wizardlm-2-8x22b": "microsoft/WizardLM-2-8x22B",
+    }
+    return hf_model_map.get(base_id) or hf_model_map.get(model_id)
+
+
+def _load_anthropic_tokenizer() -> Any | None:
+    try:
+        from anthropic import Anthropic  # type: ignore[import-untyped]
+    except ImportError:
+        logger.debug("anthropic package not installed, skipping Anthropic tokenizer")
+        return None
+    return Anthropic(api_key="dummy")
+
+
+def _load_huggingface_tokenizer(hf_model_name: str) -> Any | None:
+    try:
+        from transformers import AutoTokenizer  # type: ignore[import-untyped]
+    except ImportError:
+        logger.debug("transformers package not installed, skipping HuggingFace tokenizer")
+        return None
+    options = {"cache_dir": str(_TOKENIZER_CACHE_DIR), "trust_remote_code": True, "use_fast": True}
+    try:
+        # Files persisted by an earlier run: no network round-trip on restart
+        return AutoTokenizer.from_pretrained(hf_model_name, local_files_only=True, **options)
+    except Exception:
+        return AutoTokenizer.from_pretrained(hf_model_name, **options)
+
+
+def _get_anthropic_tokenizer() -> Any | None:
+    return tokenizer_registry.get("anthropic", _load_anthropic_tokenizer)
+
+
+def _get_huggingface_tokenizer(model_id: str) -> Any | None:
+    hf_model_name = _get_huggingface_model_name(model_id)
+    if not hf_model_name:
+        return None
+    return tokenizer_registry.get(hf_model_name, lambda: _load_huggingface_tokenizer(hf_model_name))
+
+
+def prewarm_tokenizers(model_ids: Iterable[str]) -> list[Future]:
+    """
+    Start loading the tokenizers ``model_ids`` will need, without waiting for them.
+
+    Run at startup with the registry's models so no request pays for a first load. The
+    tiktoken encodings are warmed on the pool too, since their first use may download.
+    """
+    futures = [
+        tokenizer_registry.load(f"tiktoken:{name}", lambda name=name: tiktoken.get_encoding(name))
+        for name in ("cl100k_base", "o200k_base")
+    ]
+    for model_id in model_ids:
+        provider = model_id.split("/")[0] if "/" in model_id else ""
+        if provider == "anthropic":
+            futures.append(tokenizer_registry.load("anthropic", _load_anthropic_tokenizer))
+        elif provider in _HUGGINGFACE_PROVIDERS:
+            hf_model_name = _get_huggingface_model_name(model_id)
+            if hf_model_name:
+                futures.append(
+                    tokenizer_registry.load(
+                        hf_model_name,
+                        lambda hf_model_name=hf_model_name: _load_huggingface_tokenizer(
+                            hf_model_name
+                        ),
+                    )
+                )
+    return [f for f in futures if f is not None]
+
+
+class TokenCountCache:
+    """Thread-safe LRU of token counts keyed by ``(tokenizer key, content digest)``."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: tuple[str, bytes], count: int) -> None:
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_count_cache = TokenCountCache(settings.token_count_cache_size)
+
+
+def _content_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class _Encoder:
+    """One tokenizer as a batch counting function, with the cache key of its counts."""
+
+    __slots__ = ("key", "count_batch")
+
+    def __init__(self, key: str, count_batch: Callable[[list[str]], list[int]]):
+        self.key = key
+        self.count_batch = count_batch
+
+
+def _tiktoken_encoder(encoding_name: str) -> _Encoder:
+    encoding = tiktoken.get_encoding(encoding_name)
+    return _Encoder(
+        f"tiktoken:{encoding_name}",
+        lambda texts: [len(ids) for ids in encoding.encode_batch(texts)],
+    )
+
+
+def _huggingface_encoder(model_id: str) -> _Encoder | None:
+    tokenizer = _get_huggingface_tokenizer(model_id)
+    if not tokenizer:
+        return None
+    return _Encoder(
+        f"hf:{_get_huggingface_model_name(model_id)}",
+        lambda texts: [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]],
+    )
+
+
+def _anthropic_encoder() -> _Encoder | None:
+    client = _get_anthropic_tokenizer()
+    if not client:
+        return None
+    return _Encoder("anthropic", lambda texts: [client.count_tokens(t) for t in texts])
+
+
+def _encoder_chain(model_id: str | None) -> list[_Encoder]:
+    """Tokenizers to try for ``model_id``, most specific first, ending with cl100k_base."""
+    chain: list[_Encoder | None] = []
+    if model_id:
+        provider = model_id.split("/")[0] if "/" in model_id else ""
+        try:
+            if provider == "anthropic":
+                chain.append(_anthropic_encoder())
+            elif provider in _HUGGINGFACE_PROVIDERS:
+                chain.append(_huggingface_encoder(model_id))
+            elif provider == "openai":
+                if "gpt-4o" in model_id.lower():
+                    chain.append(_tiktoken_encoder("o200k_base"))
+                else:
+                    chain.append(_tiktoken_encoder("cl100k_base"))
+        except Exception as e:
+            logger.debug(f"Tokenizer for {model_id} unavailable: {e}, falling back to tiktoken")
+    try:
+        chain.append(_tiktoken_encoder("cl100k_base"))
+    except Exception as e:
+        logger.debug(f"cl100k_base unavailable: {e}, falling back to length estimate")
+    return [encoder for encoder in chain if encoder is not None]
+
+
+def _encode_uncached(texts: list[str], chain: list[_Encoder]) -> list[int]:
+    """Counts for ``texts`` from the first tokenizer in ``chain`` that accepts each text."""
+    counts: list[int | None] = [None] * len(texts)
+    pending = list(range(len(texts)))
+    for encoder in chain:
+        if not pending:
+            break
+        batch = [texts[i] for i in pending]
+        try:
+            for i, count in zip(pending, encoder.count_batch(batch), strict=True):
+                counts[i] = count
+            pending = []
+            break
+        except Exception as e:
+            logger.debug(f"Batch tokenization with {encoder.key} failed: {e}, retrying one by one")
+        still_pending = []
+        for i in pending:
+            try:
+                counts[i] = encoder.count_batch([texts[i]])[0]
+            except Exception:
+                still_pending.append(i)
+        pending = still_pending
+    for i in pending:
+        counts[i] = len(texts[i]) // 4
+    return [c if c is not None else 0 for c in counts]
+
+
+def count_tokens_batch(texts: Sequence[str], model_id: str | None = None) -> list[int]:
+    """Token counts for ``texts`` with ``model_id``'s tokenizer, memoized per text."""
+    results = [0] * len(texts)
+    chain = _encoder_chain(model_id) if any(texts) else []
+    # Counts are stored under the tokenizer that is tried first, so they stay valid for as
+    # long as that tokenizer is the one selected for the model
+    cache_key = chain[0].key if chain else "approx"
+    missing: dict[bytes, list[int]] = {}
+    missing_texts: list[str] = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        digest = _content_digest(text)
+        if digest in missing:
+            missing[digest].append(i)
+            continue
+        cached = token_count_cache.get((cache_key, digest))
+        if cached is not None:
+            results[i] = cached
+            continue
+        missing[digest] = [i]
+        missing_texts.append(text)
+    if missing_texts:
+        counts = _encode_uncached(missing_texts, chain)
+        for (digest, indices), count in zip(missing.items(), counts, strict=True):
+            token_count_cache.put((cache_key, digest), count)
+            for i in indices:
+                results[i] = count
+    return results
+
+
+def tokenizer_key(model_id: str | None = None) -> str:
+    """Key of the tokenizer that counts ``model_id``'s text right now (``"approx"`` if none)."""
+    chain = _encoder_chain(model_id)
+    return chain[0].key if chain else "approx"
+
+
+def cached_token_count(text: str, tokenizer: str) -> int | None:
+    """The memoized count of ``text`` under ``tokenizer`` (see :func:`tokenizer_key`), if any."""
+    return token_count_cache.get((tokenizer, _content_digest(text)))
+
+
+def count_tokens(text: str, model_id: str | None = None) -> int:
+    if not text:
+        return 0
+    return count_tokens_batch([text], model_id)[0]
+
+
+def get_token_count_stats() -> dict[str, Any]:
+    """Hit-rate metrics of the token-count memo, and the load state of each tokenizer."""
+    return {**token_count_cache.stats(), "tokenizers": tokenizer_registry.states()}
@@ -1,80 +1,83 @@
 """
-Token counting, tokenizer management, credit calculation.
+Token limits, token counting, credit calculation.
+
+Tokenizers and the token-count memo live in ``tokenizers``.
 """
 
+import asyncio
 import logging
-import threading
+import random
 from decimal import ROUND_CEILING, Decimal
 from typing import Any, NamedTuple
 
 import httpx  # type: ignore[import-untyped]
-import tiktoken  # type: ignore[import-untyped]
 
 from ..config import settings
 from ..config.constants import CREDITS_PER_DOLLAR
-from .registry import OPENROUTER_MODELS
+from .capabilities import extract_token_limits
+from .registry import get_capability_index
+from .token_estimate import TokenBounds, token_bounds, token_bounds_batch
+from .tokenizers import count_tokens, count_tokens_batch
 
 logger = logging.getLogger(__name__)
 
-# Ceiling for default max_output: OpenRouter may report inflated values (e.g. 256k for StepFun)
-# that cause "input+output exceeds context" errors. Typical chat responses need far less.
-_REASONABLE_MAX_OUTPUT_CEILING = 32768
-
+# Live limits from OpenRouter's /models API, filled by the background refresh. Ids it has
+# not covered yet are answered from the bundled snapshot (see the capability index).
 _model_token_limits_cache: dict[str, dict[str, int]] = {}
+# Bumped on every cache write so derived data (e.g. /models responses) can tell it is stale
+_model_token_limits_version = 0
+
+
+def _store_token_limits(limits_dict: dict[str, dict[str, int]]) -> None:
+    global _model_token_limits_version
+    _model_token_limits_cache.update(limits_dict)
+    _model_token_limits_version += 1
+
 
+def get_model_token_limits_version() -> int:
+    return _model_token_limits_version
 
-def preload_model_token_limits() -> None:
+
+def preload_model_token_limits() -> bool:
+    """Fetch live limits for the registry models. Blocks on the network; run off-request."""
     try:
         all_models = fetch_all_models_from_openrouter()
         if all_models:
-            configured_model_ids = {model["id"] for model in OPENROUTER_MODELS}
+            configured_model_ids = get_capability_index().registry_model_ids
             limits_dict = {}
             missing_models = []
             for mid in configured_model_ids:
                 if mid in all_models:
-                    limits = _extract_token_limits(all_models[mid])
+                    limits = extract_token_limits(all_models[mid])
                     limits_dict[mid] = limits
                 else:
                     missing_models.append(mid)
-            _model_token_limits_cache.update(limits_dict)
+            _store_token_limits(limits_dict)
             msg = f"Models: {len(limits_dict)} preloaded"
             if missing_models:
                 msg += f", {len(missing_models)} unavailable"
             logger.info(msg)
-        else:
-            logger.warning("Failed to preload model token limits from OpenRouter")
+            return True
+        logger.warning("Failed to preload model token limits from OpenRouter")
     except Exception as e:
         logger.warning(f"Error preloading model token limits: {e}")
+    return False
 
 
-def _extract_token_limits(model_data: dict[str, Any]) -> dict[str, int]:
-    limits = {}
-    context_length = model_data.get("context_length")
-    top_provider = model_data.get("top_provider", {})
-    max_completion_tokens = top_provider.get("max_completion_tokens")
-    if context_length:
-        limits["max_input"] = context_length
-        if max_completion_tokens and max_completion_tokens < context_length:
-            limits["max_output"] = max_completion_tokens
-        else:
-            # OpenRouter sometimes reports max_completion_tokens=context_length (e.g. StepFun);
-            # that's wrong: providers enforce input+output <= context_length. Cap output.
-            limits["max_output"] = min(
-                int(context_length * 0.2),
-                _REASONABLE_MAX_OUTPUT_CEILING,
-            )
-    elif max_completion_tokens:
-        # When no context_length, still sanity-check: output cannot exceed a reasonable ceiling
-        # (some providers report inflated max_completion_tokens that cause context overflow)
-        limits["max_output"] = min(
-            max_completion_tokens,
-            _REASONABLE_MAX_OUTPUT_CEILING,
-        )
-        limits["max_input"] = max_completion_tokens * 4
-    else:
-        limits["max_input"] = 8192
-        limits["max_output"] = 8192
-    return limits
+async def run_token_limits_refresher(interval_seconds: float, retry_seconds: float) -> None:
+    """
+    Keep live token limits fresh for the lifetime of a worker.
+
+    Lookups never wait for this: until the first refresh lands they are answered from the
+    snapshot, and afterwards from the last successful refresh (stale-while-revalidate).
+    The fetch runs in a thread so the event loop keeps serving requests.
+    """
+    # Spread the first fetch so workers started together don't hit OpenRouter at once
+    delay = random.uniform(0, min(5.0, retry_seconds))
+    while True:
+        await asyncio.sleep(delay)
+        refreshed = await asyncio.to_thread(preload_model_token_limits)
+        delay = interval_seconds if refreshed else min(interval_seconds, retry_seconds)
 
 
 def refresh_model_token_limits(model_id: str | None = None) -> bool:
@@ -84,16 +87,15 @@ def refresh_model_token_limits(model_id: str | None = None) -> bool:
             return False
         if model_id:
             if model_id in all_models:
-                limits = _extract_token_limits(all_models[model_id])
-                _model_token_limits_cache[model_id] = limits
+                limits = extract_token_limits(all_models[model_id])
+                _store_token_limits({model_id: limits})
                 logger.info(f"Refreshed token limits for model: {model_id}")
                 return True
             if ":" in model_id:
                 base_id = model_id.split(":")[0]
                 if base_id in all_models:
-                    limits = _extract_token_limits(all_models[base_id])
-                    _model_token_limits_cache[base_id] = limits
-                    _model_token_limits_cache[model_id] = limits
+                    limits = extract_token_limits(all_models[base_id])
+                    _store_token_limits({base_id: limits, model_id: limits})
                     logger.info(
                         f"Refreshed token limits for model: {model_id} (using base: {base_id})"
                     )
@@ -102,9 +104,9 @@ def refresh_model_token_limits(model_id: str | None = None) -> bool:
             return False
         limits_dict = {}
         for mid, model_data in all_models.items():
-            limits = _extract_token_limits(model_data)
+            limits = extract_token_limits(model_data)
             limits_dict[mid] = limits
-        _model_token_limits_cache.update(limits_dict)
+        _store_token_limits(limits_dict)
         logger.info(f"Refreshed token limits for {len(limits_dict)} models")
         return True
     except Exception as e:
@@ -141,20 +143,13 @@ def fetch_all_models_from_openrouter() -> dict[str, dict[str, Any]] | None:
 def get_model_token_limits_from_openrouter(model_id: str) -> dict[str, int] | None:
     if model_id in _model_token_limits_cache:
         return _model_token_limits_cache[model_id]
-    if ":" in model_id:
-        base_id = model_id.split(":")[0]
-        if base_id in _model_token_limits_cache:
-            return _model_token_limits_cache[base_id]
-    if not _model_token_limits_cache:
-        logger.warning("Model token limits cache is empty, attempting to preload...")
-        preload_model_token_limits()
-        if model_id in _model_token_limits_cache:
-            return _model_token_limits_cache[model_id]
-        if ":" in model_id:
-            base_id = model_id.split(":")[0]
-            if base_id in _model_token_limits_cache:
-                return _model_token_limits_cache[base_id]
-    return None
+    base_id = model_id.split(":")[0] if ":" in model_id else None
+    if base_id and base_id in _model_token_limits_cache:
+        return _model_token_limits_cache[base_id]
+    rec = get_capability_index().resolve(model_id)
+    if rec is None or rec.max_input_tokens is None or rec.max_output_tokens is None:
+        return None
+    return {"max_input": rec.max_input_tokens, "max_output": rec.max_output_tokens}
 
 
 def get_model_max_input_tokens(model_id: str) -> int:
@@ -182,81 +177,6 @@ def get_min_max_output_tokens(model_ids: list[str]) -> int:
     return min(max_outputs) if max_outputs else 8192
 
 
-_tokenizer_cache: dict[str, Any] = {}
-_cache_lock = threading.Lock()
-
-
-def _get_huggingface_model_name(model_id: str) -> str | None:
-    base_id = model_id.split(":")[0]
-    hf_model_map = {
-        "meta-llama/llama-3.3-70b-instruct": "meta-llama/Llama-3.3-70B-Instruct",
-        "meta-llama/llama-4-scout": "meta-llama/Llama-4-Scout-17B-Instruct",
-        "meta-llama/llama-4-maverick": "meta-llama/Llama-4-Maverick-17B-Instruct",
-        "mistralai/mistral-small-3.2-24b-instruct": "mistralai/Mistral-Small-3.2-24B-Instruct",
-        "mistralai/mistral-medium-3.1": "mistralai/Mistral-Medium-3.1",
-        "mistralai/mistral-large": "mistralai/Mistral-Large-2407",
-        "mistralai/devstral-small": "mistralai/Devstral-Small-1.1",
-        "mistralai/devstral-medium": "mistralai/Devstral-Medium",
-        "mistralai/codestral-2508": "mistralai/Codestral-2508",
-        "deepseek/deepseek-r1": "deepseek-ai/DeepSeek-R1",
-        "deepseek/deepseek-v3.2-exp": "deepseek-ai/DeepSeek-V3.2-Exp",
-        "deepseek/deepseek-chat-v3.1": "deepseek-ai/DeepSeek-V3.1",
-        "qwen/qwen3-30b-a3b-instruct-2507": "Qwen/Qwen3-30B-A3B-Instruct-2507",
-        "qwen/qwen3-next-80b-a3b-instruct": "Qwen/Qwen3-Next-80B-A3B-Instruct",
-        "qwen/qwen3-max": "Qwen/Qwen3-Max",
-        "qwen/qwen3-coder-flash": "Qwen/Qwen3-Coder-Flash",
-        "qwen/qwen3-coder-plus": "Qwen/Qwen3-Coder-Plus",
-        "qwen/qwen3-coder": "Qwen/Qwen3-Coder-480B-A35B",
-        "microsoft/phi-4": "microsoft/Phi-4",
-        "microsoft/phi-4-reasoning-plus": "microsoft/Phi-4-Reasoning-Plus",
-        "microsoft/wizardlm-2-8x22b": "microsoft/WizardLM-2-8x22B",
-    }
-    return hf_model_map.get(base_id) or hf_model_map.get(model_id)
-
-
-def _get_anthropic_tokenizer():
-    cache_key = "anthropic"
-    with _cache_lock:
-        if cache_key not in _tokenizer_cache:
-            try:
-                from anthropic import Anthropic  # type: ignore[import-untyped]
-
-                client = Anthropic(api_key="dummy")
-                _tokenizer_cache[cache_key] = client
-            except ImportError:
-                logger.debug("anthropic package not installed, skipping Anthropic tokenizer")
-                _tokenizer_cache[cache_key] = None
-            except Exception as e:
-                logger.warning(f"Failed to initialize Anthropic tokenizer: {e}")
-                _tokenizer_cache[cache_key] = None
-        return _tokenizer_cache[cache_key]
-
-
-def _get_huggingface_tokenizer(model_id: str) -> Any | None:
-    hf_model_name = _get_huggingface_model_name(model_id)
-    if not hf_model_name:
-        return None
-    with _cache_lock:
-        if hf_model_name not in _tokenizer_cache:
-            try:
-                from transformers import AutoTokenizer  # type: ignore[import-untyped]
-
-                tokenizer = AutoTokenizer.from_pretrained(
-                    hf_model_name,
-                    trust_remote_code=True,
-                    use_fast=True,
-                )
-                _tokenizer_cache[hf_model_name] = tokenizer
-                logger.debug(f"Loaded tokenizer for {hf_model_name}")
-            except ImportError:
-                logger.debug("transformers package not installed, skipping HuggingFace tokenizer")
-                _tokenizer_cache[hf_model_name] = None
-            except Exception as e:
-                logger.warning(f"Failed to load tokenizer for {hf_model_name}: {e}")
-                _tokenizer_cache[hf_model_name] = None
-        return _tokenizer_cache.get(hf_model_name)
-
-
 def get_model_max_tokens(model_id: str) -> int:
     limits = get_model_token_limits_from_openrouter(model_id)
     if limits:
@@ -273,40 +193,7 @@ def get_model_max_tokens(model_id: str) -> int:
 
 
 def estimate_token_count(text: str, model_id: str | None = None) -> int:
-    if not text:
-        return 0
-    if model_id:
-        provider = model_id.split("/")[0] if "/" in model_id else ""
-        if provider == "anthropic":
-            try:
-                client = _get_anthropic_tokenizer()
-                if client:
-                    return client.count_tokens(text)
-            except Exception as e:
-                logger.debug(f"Anthropic tokenizer failed: {e}, falling back to tiktoken")
-        elif provider in ["meta-llama", "mistralai", "deepseek", "qwen", "microsoft"]:
-            try:
-                tokenizer = _get_huggingface_tokenizer(model_id)
-                if tokenizer:
-                    return len(tokenizer.encode(text, add_special_tokens=False))
-            except Exception as e:
-                logger.debug(
-                    f"HuggingFace tokenizer failed for {model_id}: {e}, falling back to tiktoken"
-                )
-        elif provider == "openai":
-            try:
-                if "gpt-4o" in model_id.lower():
-                    encoding = tiktoken.get_encoding("o200k_base")
-                else:
-                    encoding = tiktoken.get_encoding("cl100k_base")
-                return len(encoding.encode(text))
-            except Exception as e:
-                logger.debug(f"OpenAI tokenizer failed: {e}, falling back to default")
-    try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
-    except Exception:
-        return len(text) // 4
+    return count_tokens(text, model_id)
 
 
 class TokenUsage(NamedTuple):
@@ -445,19 +332,31 @@ def estimate_reserved_credits_for_compare(
     conversation_history: list[Any] | None,
     tokenizer_model_id: str | None,
     is_image_generation_by_model: dict[str, bool],
+    approximate: bool = False,
 ) -> Decimal:
     """
     Upper-bound credits to reserve before compare-stream (matches post-hoc billing rules).
+
+    With ``approximate`` the input and history are not tokenized but priced at the upper
+    bound of their token count, which can only overstate the reservation.
     """
     from .image_credits import calculate_image_credits_fractional
 
     total_frac = Decimal(0)
-    base_input = estimate_token_count(input_data, model_id=tokenizer_model_id)
-    hist_tok = (
-        count_conversation_tokens(conversation_history, model_id=tokenizer_model_id)
-        if conversation_history
-        else 0
-    )
+    if approximate:
+        base_input = token_bounds(input_data, tokenizer_model_id).upper
+        hist_tok = (
+            conversation_token_bounds(conversation_history, model_id=tokenizer_model_id).upper
+            if conversation_history
+            else 0
+        )
+    else:
+        base_input = estimate_token_count(input_data, model_id=tokenizer_model_id)
+        hist_tok = (
+            count_conversation_tokens(conversation_history, model_id=tokenizer_model_id)
+            if conversation_history
+            else 0
+        )
     for mid in model_ids:
         if is_image_generation_by_model.get(mid):
             total_frac += calculate_image_credits_fractional(mid, 1)
@@ -489,13 +388,26 @@ def estimate_credits_before_request(
     return credits_per_model * num_models
 
 
-def count_conversation_tokens(messages: list[Any], model_id: str | None = None) -> int:
-    total_tokens = 0
+def _message_contents(messages: list[Any]) -> list[str]:
+    contents = []
     for msg in messages:
         if isinstance(msg, dict):
             content = msg.get("content", "")
         else:
             content = msg.content if hasattr(msg, "content") else ""
-        total_tokens += estimate_token_count(str(content), model_id=model_id)
-        total_tokens += 4
-    return total_tokens
+        contents.append(str(content))
+    return contents
+
+
+def count_conversation_tokens(messages: list[Any], model_id: str | None = None) -> int:
+    contents = _message_contents(messages)
+    # One batch: only messages not seen before (usually just the newest turn) are tokenized
+    return sum(count_tokens_batch(contents, model_id)) + 4 * len(contents)
+
+
+def conversation_token_bounds(messages: list[Any], model_id: str | None = None) -> TokenBounds:
+    """Bounds on :func:`count_conversation_tokens` without tokenizing long messages."""
+    contents = _message_contents(messages)
+    bounds = token_bounds_batch(contents, model_id)
+    overhead = 4 * len(contents)
+    return TokenBounds(*(value + overhead for value in bounds))
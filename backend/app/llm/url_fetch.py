@@ -0,0 +1,255 @@
+"""
+fetch_url tool: page download, text extraction and a shared page cache.
+
+Pages are cached per normalized URL in a process-wide LRU with a TTL, so several models
+(and later requests) fetching the same page share one download. Expired entries that
+carry an ETag or Last-Modified are revalidated with a conditional request instead of
+being downloaded again. Downloads are streamed and stop at ``fetch_url_max_bytes`` or as
+soon as enough text has been extracted.
+"""
+
+import asyncio
+import codecs
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from ..config import settings
+from ..utils.single_flight import SingleFlight
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+)
+
+TRUNCATION_MARKER = "... [content truncated]"
+
+_SKIPPED_TAGS = frozenset({"script", "style", "nav", "header", "footer", "aside"})
+
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text, skipping boilerplate elements, until ``limit`` is passed."""
+
+    def __init__(self, limit: int):
+        super().__init__(convert_charrefs=True)
+        self._limit = limit
+        self._skip_depth = 0
+        self._pieces: list[str] = []
+        self._length = 0
+
+    @property
+    def full(self) -> bool:
+        return self._length > self._limit
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth or self.full:
+            return
+        text = " ".join(data.split())
+        if text:
+            # Length of the pieces joined with single spaces
+            self._length += len(text) + (1 if self._pieces else 0)
+            self._pieces.append(text)
+
+    def text(self) -> str:
+        text = " ".join(self._pieces)
+        if len(text) > self._limit:
+            text = text[: self._limit] + TRUNCATION_MARKER
+        return text.strip()
+
+
+def extract_text(html: str, max_length: int) -> str:
+    """Visible text of an HTML (or plain text) document, truncated to ``max_length``."""
+    extractor = _TextExtractor(max_length)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
+
+
+def normalize_url(url: str) -> str:
+    """Cache key for a URL: lowercase scheme/host, no default port, no fragment."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    if parts.username or parts.password:
+        host = f"{parts.username or ''}:{parts.password or ''}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+@dataclass
+class _CachedPage:
+    text: str
+    expires_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class PageCache:
+    """Thread-safe LRU of extracted page text with a freshness TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, int], _CachedPage] = OrderedDict()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, int]) -> _CachedPage | None:
+        """Entry for ``key`` (fresh or stale), marking it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple[str, int], entry: _CachedPage) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: tuple[str, int]) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+            }
+
+
+page_cache = PageCache(settings.fetch_url_cache_size, settings.fetch_url_cache_ttl_seconds)
+
+# Pooled clients per event loop (httpx async pools are bound to their loop)
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+# Concurrent fetches of the same page share one download
+_page_fetches = SingleFlight()
+
+
+def _get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=15.0,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        _clients[loop] = client
+    return client
+
+
+def _decoder(response: httpx.Response) -> codecs.IncrementalDecoder:
+    try:
+        return codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+async def _download(
+    url: str, max_length: int, cached: _CachedPage | None
+) -> tuple[_CachedPage | None, str]:
+    """Fetch ``url`` (conditionally when ``cached`` has validators).
+
+    Returns the entry to cache (None when the response must not be cached) and the text.
+    """
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    async with _get_client().stream("GET", url, headers=headers) as response:
+        expires_at = time.monotonic() + page_cache.ttl_seconds
+        if response.status_code == 304 and cached is not None:
+            page_cache.revalidations += 1
+            cached.expires_at = expires_at
+            return cached, cached.text
+        response.raise_for_status()
+
+        extractor = _TextExtractor(max_length)
+        decoder = _decoder(response)
+        remaining = settings.fetch_url_max_bytes
+        async for chunk in response.aiter_bytes():
+            extractor.feed(decoder.decode(chunk[:remaining]))
+            remaining -= len(chunk)
+            # Stop downloading once the cap is hit or there is enough text to truncate
+            if remaining <= 0 or extractor.full:
+                break
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+        text = extractor.text()
+
+        if "no-store" in response.headers.get("Cache-Control", "").lower():
+            return None, text
+        entry = _CachedPage(
+            text=text,
+            expires_at=expires_at,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        return entry, text
+
+
+async def _fetch_page(url: str, key: tuple[str, int]) -> str:
+    max_length = key[1]
+    cached = page_cache.get(key)
+    if cached is not None and cached.expires_at > time.monotonic():
+        page_cache.hits += 1
+        return cached.text
+    if cached is not None and not cached.revalidatable:
+        page_cache.discard(key)
+        cached = None
+    if cached is None:
+        page_cache.misses += 1
+
+    entry, text = await _download(url, max_length, cached)
+    if entry is not None:
+        page_cache.put(key, entry)
+    elif cached is not None:
+        page_cache.discard(key)
+    return text
+
+
+async def fetch_page_text(url: str, max_length: int) -> str:
+    """Extracted text for ``url`` via the shared page cache.
+
+    Identical fetches already running are joined instead of repeated.
+    """
+    key = (normalize_url(url), max_length)
+    return await _page_fetches.run(key, lambda: _fetch_page(url, key))
@@ -1,6 +1,6 @@
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
@@ -18,7 +18,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 
 from .model_runner import (
-    preload_model_token_limits,
+    run_token_limits_refresher,
 )
 
 # Load environment variables from .env file
@@ -33,7 +33,7 @@ from .config import (
     settings,
     validate_config,
 )
-from .database import Base, engine, get_db
+from .database import Base, async_engine, engine, get_db
 from .models import UsageLog
 from .routers import admin, api, auth
 
@@ -129,6 +129,9 @@ async def lifespan(app: FastAPI):
     """
     global _blocking_executor
 
+    token_limits_task: asyncio.Task | None = None
+    blob_collector_task: asyncio.Task | None = None
+    last_access_task: asyncio.Task | None = None
     loop = asyncio.get_running_loop()
     pool_workers = _blocking_pool_max_workers()
     _blocking_executor = ThreadPoolExecutor(
@@ -141,6 +144,13 @@ async def lifespan(app: FastAPI):
         pool_workers,
     )
 
+    from .llm.streaming import shutdown_tool_loop
+    from .search.brave import close_pooled_clients
+    from .services.last_access import last_access_recorder, run_last_access_flusher
+    from .services.write_behind import write_behind_queue
+
+    await write_behind_queue.start()
+
     try:
         # Startup
         try:
@@ -151,7 +161,37 @@ async def lifespan(app: FastAPI):
             if environment != "production":
                 Base.metadata.create_all(bind=engine, checkfirst=True)
 
-            preload_model_token_limits()
+            if settings.tokenizer_prewarm:
+                from .llm.registry import get_capability_index
+                from .llm.tokenizers import prewarm_tokenizers
+
+                prewarm_tokenizers(get_capability_index().registry_model_ids)
+
+            # Limits are served from the bundled snapshot until the first refresh lands
+            if settings.token_limits_refresh_interval_seconds > 0:
+                token_limits_task = asyncio.create_task(
+                    run_token_limits_refresher(
+                        settings.token_limits_refresh_interval_seconds,
+                        settings.token_limits_retry_seconds,
+                    ),
+                    name="token-limits-refresh",
+                )
+
+            if settings.blob_gc_interval_seconds > 0:
+                from .attachment_storage import run_blob_collector
+
+                blob_collector_task = asyncio.create_task(
+                    run_blob_collector(
+                        settings.blob_gc_interval_seconds, settings.blob_gc_grace_seconds
+                    ),
+                    name="blob-collector",
+                )
+
+            if settings.last_access_flush_interval_seconds > 0:
+                last_access_task = asyncio.create_task(
+                    run_last_access_flusher(settings.last_access_flush_interval_seconds),
+                    name="last-access-flush",
+                )
 
             from .search.rate_limiter import get_rate_limiter
 
@@ -169,6 +209,17 @@ async def lifespan(app: FastAPI):
 
         yield
     finally:
+        for task in (token_limits_task, blob_collector_task, last_access_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        # Post-stream bookkeeping and accesses still queued are written before the worker exits
+        last_access_recorder.flush()
+        await write_behind_queue.stop()
+        await async_engine.dispose()
+        await close_pooled_clients()
+        await asyncio.to_thread(shutdown_tool_loop)
         if _blocking_executor is not None:
             _blocking_executor.shutdown(wait=True, cancel_futures=True)
 
@@ -76,8 +76,11 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Permissions-Policy"] = permissions_policy
 
         # Cache-Control for API endpoints
-        # API responses should not be cached by default
+        # API responses should not be cached by default; routes that set their own
+        # Cache-Control (e.g. ETag-validated /models) keep it
         if request.url.path.startswith("/api"):
+            if "Cache-Control" in response.headers:
+                return response
             response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
             response.headers["Pragma"] = "no-cache"
             response.headers["Expires"] = "0"
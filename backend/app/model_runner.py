@@ -12,18 +12,22 @@ from app.llm import (
     calculate_token_usage,
     call_openrouter,
     call_openrouter_streaming,
+    call_openrouter_streaming_async,
     clean_model_response,
     client,
     client_with_tool_headers,
     count_conversation_tokens,
+    count_tokens_under,
     detect_repetition,
     estimate_credits_before_request,
     estimate_token_count,
     fetch_all_models_from_openrouter,
     fetch_url_content,
     filter_models_by_tier,
+    get_capability_index,
     get_min_max_input_tokens,
     get_min_max_output_tokens,
+    get_model_capabilities,
     get_model_max_input_tokens,
     get_model_max_output_tokens,
     get_model_max_tokens,
@@ -40,6 +44,7 @@ from app.llm import (
     preload_model_token_limits,
     refresh_model_token_limits,
     resolve_is_thinking_model_for_ui,
+    run_token_limits_refresher,
     should_request_openrouter_reasoning_traces,
     sort_models_by_tier_and_version,
     streams_separable_reasoning_from_openrouter_entry,
@@ -55,22 +60,26 @@ __all__ = [
     "UNREGISTERED_TIER_MODELS",
     "call_openrouter",
     "call_openrouter_streaming",
+    "call_openrouter_streaming_async",
     "calculate_credits",
     "calculate_token_usage",
     "clean_model_response",
     "client",
     "client_with_tool_headers",
     "count_conversation_tokens",
+    "count_tokens_under",
     "detect_repetition",
     "estimate_credits_before_request",
     "estimate_token_count",
     "fetch_all_models_from_openrouter",
     "fetch_url_content",
     "filter_models_by_tier",
+    "get_capability_index",
     "get_min_max_input_tokens",
     "get_min_max_output_tokens",
     "get_model_max_input_tokens",
     "get_model_max_output_tokens",
+    "get_model_capabilities",
     "get_model_max_tokens",
     "get_model_supports_image_generation",
     "get_model_supports_temperature",
@@ -88,6 +97,7 @@ __all__ = [
     "is_time_sensitive_query",
     "preload_model_token_limits",
     "refresh_model_token_limits",
+    "run_token_limits_refresher",
     "sort_models_by_tier_and_version",
     "test_connection_quality",
 ]
@@ -5,6 +5,8 @@ This module defines all database models including users, preferences,
 conversations, and usage tracking.
 """
 
+import hashlib
+import json
 from datetime import UTC
 
 from sqlalchemy import (
@@ -16,14 +18,20 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     UniqueConstraint,
+    delete,
+    event,
+    select,
+    text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, object_session, relationship
 from sqlalchemy.sql import func
 
+from .cache import user_cache
 from .database import Base
 
 
@@ -142,6 +150,32 @@ class User(Base):
         return now < trial_end
 
 
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, user: User) -> None:
+    """
+    Drop the user's cached snapshot (admin edits, billing, credits: every ORM write).
+
+    Invalidated again after the commit, so a snapshot loaded between the flush and the
+    commit (still seeing the old row) is not served either.
+    """
+    user_cache.invalidate(user.id)
+    session = object_session(user)
+    if session is not None:
+        session.info.setdefault("invalidated_user_ids", set()).add(user.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop("invalidated_user_ids", ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_users(session: Session, previous_transaction) -> None:
+    session.info.pop("invalidated_user_ids", None)
+
+
 class UserPreference(Base):
     """User preferences and settings."""
 
@@ -224,9 +258,14 @@ class Conversation(Base):
     composer_aspect_ratio = Column(String(32), nullable=True)
     composer_image_size = Column(String(32), nullable=True)
 
-    # JSON array: text extracts and/or vision images (base64) for follow-ups from history
+    # JSON array: text extracts and/or vision images for follow-ups from history; images are
+    # blob store keys (legacy rows: inline base64), see attachment_storage
     file_contents = Column(Text, nullable=True)
 
+    # conversation_thread_fingerprint(models, input_data), set on insert; follow-ups sent
+    # without a conversation_id find their thread by it
+    thread_fingerprint = Column(String(64), nullable=True)
+
     # Timestamps
     created_at = Column(DateTime, default=func.now(), index=True)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -240,6 +279,50 @@ class Conversation(Base):
         "Conversation", remote_side=[id], backref="breakout_conversations"
     )
 
+    __table_args__ = (
+        Index("ix_conversations_user_thread_fingerprint", "user_id", "thread_fingerprint"),
+        # History is listed newest first and paged by (created_at, id)
+        Index("ix_conversations_user_created_id", "user_id", "created_at", "id"),
+    )
+
+
+def conversation_thread_fingerprint(models: list[str], first_user_message: str) -> str:
+    """Hash identifying a conversation thread: its model set (in any order) and opening message."""
+    payload = json.dumps([sorted(models), first_user_message], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@event.listens_for(Conversation, "before_insert")
+def _set_thread_fingerprint(mapper, connection, conversation: Conversation) -> None:
+    if conversation.thread_fingerprint is not None:
+        return
+    try:
+        models = json.loads(conversation.models_used) if conversation.models_used else []
+    except (json.JSONDecodeError, TypeError):
+        models = []
+    conversation.thread_fingerprint = conversation_thread_fingerprint(
+        models, conversation.input_data or ""
+    )
+
+
+def conversation_history_trim(user_id: int, keep: int):
+    """
+    One DELETE of a user's conversations beyond their ``keep`` newest (the tier's history cap).
+
+    Messages and blob references go with them through their ON DELETE CASCADE foreign keys.
+    """
+    newest = (
+        select(Conversation.id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(keep)
+    )
+    return (
+        delete(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.id.not_in(newest.scalar_subquery()))
+        .execution_options(synchronize_session=False)
+    )
+
 
 class ConversationMessage(Base):
     """Individual messages within a conversation (for follow-ups)."""
@@ -258,6 +341,8 @@ class ConversationMessage(Base):
     images = Column(
         Text, nullable=True
     )  # JSON array of image URLs (for image-generation responses)
+    # JSON array parallel to images: thumbnail URL of each (null where there is none)
+    image_thumbnails = Column(Text, nullable=True)
 
     # Token usage (from OpenRouter API responses)
     input_tokens = Column(Integer)  # Input tokens for user messages (null for assistant messages)
@@ -273,6 +358,67 @@ class ConversationMessage(Base):
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        # Messages of a conversation are read in order and paged by (created_at, id)
+        Index(
+            "ix_conversation_messages_conversation_created_id",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+    )
+
+
+class AttachmentBlobRef(Base):
+    """
+    A conversation's reference to a blob in the attachment blob store: an attached image
+    (``file_contents``) or an image generated in one of its messages.
+
+    A blob's reference count is its number of rows here. They are removed with their
+    conversation by the database (ON DELETE CASCADE), so bulk deletes and account deletion
+    keep the count exact; ``attachment_storage.collect_unreferenced_blobs`` deletes blobs
+    whose count reached zero.
+    """
+
+    __tablename__ = "attachment_blob_refs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    blob_key = Column(String(64), nullable=False, index=True)  # SHA-256 of the blob bytes
+    conversation_id = Column(
+        Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    created_at = Column(DateTime, default=func.now())
+
+
+def _insert_blob_refs(connection, conversation_id: int, keys: list[str]) -> None:
+    if keys:
+        connection.execute(
+            AttachmentBlobRef.__table__.insert(),
+            [{"blob_key": key, "conversation_id": conversation_id} for key in keys],
+        )
+
+
+@event.listens_for(Conversation, "after_insert")
+def _add_attachment_blob_refs(mapper, connection, conversation: Conversation) -> None:
+    from .attachment_storage import attachment_blob_keys
+
+    _insert_blob_refs(connection, conversation.id, attachment_blob_keys(conversation.file_contents))
+
+
+@event.listens_for(ConversationMessage, "after_insert")
+def _add_generated_image_blob_refs(mapper, connection, message: ConversationMessage) -> None:
+    from .attachment_storage import blob_url_keys
+
+    urls: list = []
+    for raw in (message.images, message.image_thumbnails):
+        try:
+            parsed = json.loads(raw) if raw else []
+        except (json.JSONDecodeError, TypeError):
+            parsed = []
+        if isinstance(parsed, list):
+            urls.extend(parsed)
+    _insert_blob_refs(connection, message.conversation_id, blob_url_keys(urls))
+
 
 class UsageLog(Base):
     """Detailed usage tracking for analytics and cost analysis."""
@@ -320,6 +466,73 @@ class UsageLog(Base):
     user = relationship("User", back_populates="usage_logs")
     credit_transactions = relationship("CreditTransaction", back_populates="usage_log")
 
+    # Unregistered usage by IP / fingerprint over a time range, answered from the index alone
+    # (user_id is always NULL in them, but SQLite only treats indexed columns as covered)
+    __table_args__ = (
+        Index(
+            "ix_usage_logs_anon_ip_created",
+            "ip_address",
+            "created_at",
+            "credits_used",
+            "user_id",
+            postgresql_where=text("user_id IS NULL"),
+            sqlite_where=text("user_id IS NULL"),
+        ),
+        Index(
+            "ix_usage_logs_anon_fp_created",
+            "browser_fingerprint",
+            "created_at",
+            "credits_used",
+            "user_id",
+            postgresql_where=text("user_id IS NULL AND browser_fingerprint IS NOT NULL"),
+            sqlite_where=text("user_id IS NULL AND browser_fingerprint IS NOT NULL"),
+        ),
+    )
+
+
+class AnonymousUsageRollup(Base):
+    """
+    Credits used by one unregistered identifier in one 15-minute UTC bucket.
+
+    Maintained alongside each unregistered UsageLog insert. Every timezone offset is a
+    multiple of 15 minutes, so any local day is an exact range of buckets.
+    """
+
+    __tablename__ = "anonymous_usage_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    identifier = Column(String(80), nullable=False)  # "ip:<address>" or "fp:<fingerprint>"
+    bucket_start = Column(DateTime, nullable=False)  # UTC, floored to 15 minutes
+    credits_used = Column(DECIMAL(12, 4), nullable=False, default=0)
+    comparisons = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "identifier", "bucket_start", name="uq_anonymous_usage_rollups_identifier_bucket"
+        ),
+    )
+
+
+class VisitorDailyActivity(Base):
+    """
+    One visitor (IP or browser fingerprint) on one UTC day, materialized from UsageLog.
+
+    Backs the admin visitor analytics; see ``visitor_analytics.refresh_visitor_daily_activity``.
+    """
+
+    __tablename__ = "visitor_daily_activity"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # UTC date of UsageLog.created_at
+    kind = Column(String(2), nullable=False)  # "ip" or "fp"
+    value = Column(String(64))  # IP address / fingerprint (NULL: comparisons without an IP)
+    comparisons = Column(Integer, nullable=False, default=0)
+    authenticated_comparisons = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "day", "value", name="uq_visitor_daily_activity_kind_day_value"),
+    )
+
 
 class SubscriptionHistory(Base):
     """Track subscription changes (upgrades, downgrades, renewals)."""
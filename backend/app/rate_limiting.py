@@ -5,13 +5,14 @@ Paid tiers: monthly credit pools. Free and unregistered: daily credit limits.
 Legacy daily model-response fields in API stats are unused (zeros); enforcement is credits-only.
 """
 
-from collections import defaultdict
 from datetime import UTC, date, datetime, timedelta
 from decimal import ROUND_CEILING, Decimal
 from typing import Any
 
 import pytz
 from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 # Import configuration constants
@@ -22,30 +23,25 @@ from .config.constants import (
 )
 
 # Import credit management functions
+from .credit_ledger import LedgerEntry, anonymous_credit_ledger, local_credit_ledger
 from .credit_manager import (
     check_and_reset_credits_if_needed,
     check_credits_sufficient,
     deduct_credits,
     ensure_credits_allocated,
 )
-from .models import UsageLog, User
+from .models import AnonymousUsageRollup, User
 from .type_defs import (
     AnonymousRateLimitData,
     FullUsageStatsDict,
     UsageStatsDict,
 )
 
+# Process-local balances: the local ledger's records (only authoritative without Redis)
+anonymous_rate_limit_storage: dict[str, AnonymousRateLimitData] = local_credit_ledger.records
 
-# In-memory storage for anonymous rate limiting
-# Structure: { "identifier": { "count": int, "date": str, "first_seen": datetime, "timezone": str, "last_reset_at": datetime } }
-def _default_rate_limit_data() -> AnonymousRateLimitData:
-    """Default factory for anonymous rate limit storage."""
-    return {"count": 0, "date": "", "first_seen": None, "timezone": "UTC", "last_reset_at": None}
-
-
-anonymous_rate_limit_storage: dict[str, AnonymousRateLimitData] = defaultdict(
-    _default_rate_limit_data
-)
+# Granularity of AnonymousUsageRollup; every UTC offset is a multiple of it
+ROLLUP_BUCKET_MINUTES = 15
 
 
 def _validate_timezone(timezone_str: str) -> str:
@@ -100,27 +96,6 @@ def _get_next_local_midnight(timezone_str: str) -> datetime:
     return tomorrow_local.astimezone(UTC)
 
 
-def _can_reset_credits(last_reset_at: datetime | None, min_hours_between_resets: int = 20) -> bool:
-    """
-    Check if credits can be reset (safeguard against abuse).
-
-    Prevents multiple resets within a short time period (e.g., by changing timezone).
-
-    Args:
-        last_reset_at: UTC timestamp of last reset (None if never reset)
-        min_hours_between_resets: Minimum hours between resets (default 20 to allow for timezone changes)
-
-    Returns:
-        True if reset is allowed, False otherwise
-    """
-    if last_reset_at is None:
-        return True
-
-    now = datetime.now(UTC)
-    hours_since_reset = (now - last_reset_at).total_seconds() / 3600
-    return hours_since_reset >= min_hours_between_resets
-
-
 def check_user_credits(user: User, required_credits: Decimal, db: Session) -> tuple[bool, int, int]:
     """
     Check if authenticated user has sufficient credits for a request.
@@ -169,161 +144,203 @@ def deduct_user_credits(
     deduct_credits(user.id, credits, usage_log_id, db, description)
 
 
+def _rollup_bucket(at: datetime) -> datetime:
+    """Naive UTC start of the 15-minute rollup bucket containing ``at``."""
+    at = at.astimezone(UTC).replace(tzinfo=None) if at.tzinfo else at
+    return at.replace(minute=at.minute - at.minute % ROLLUP_BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def anonymous_identifiers(ip_address: str | None, browser_fingerprint: str | None) -> list[str]:
+    """The ``ip:`` / ``fp:`` identifiers an unregistered request is counted against."""
+    return [
+        identifier
+        for identifier in (
+            f"ip:{ip_address}" if ip_address else None,
+            f"fp:{browser_fingerprint}" if browser_fingerprint else None,
+        )
+        if identifier
+    ]
+
+
+def record_anonymous_usage(
+    db: Session,
+    ip_address: str | None,
+    browser_fingerprint: str | None,
+    credits: Decimal,
+    at: datetime | None = None,
+) -> None:
+    """
+    Add one unregistered comparison to the per-identifier usage rollup.
+
+    Call with the session that inserts the matching UsageLog so both commit together.
+    Uses an INSERT ... ON CONFLICT upsert, so concurrent workers never lose an update.
+    """
+    identifiers = anonymous_identifiers(ip_address, browser_fingerprint)
+    if not identifiers:
+        return
+    bucket = _rollup_bucket(at or datetime.now(UTC))
+    rows = [
+        {"identifier": i, "bucket_start": bucket, "credits_used": credits, "comparisons": 1}
+        for i in identifiers
+    ]
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(AnonymousUsageRollup).values(rows)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["identifier", "bucket_start"],
+            set_={
+                "credits_used": AnonymousUsageRollup.credits_used + stmt.excluded.credits_used,
+                "comparisons": AnonymousUsageRollup.comparisons + stmt.excluded.comparisons,
+            },
+        )
+    )
+
+
+def _anonymous_credits_used_today(db: Session, identifier: str, timezone_str: str) -> int:
+    """Credits an ``ip:`` / ``fp:`` identifier used today per the usage rollup (rounded up)."""
+    tz = pytz.timezone(timezone_str)
+    now_local = datetime.now(tz)
+    today_start_utc = now_local.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(UTC)
+    today_end_utc = (
+        (now_local + timedelta(days=1))
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+        .astimezone(UTC)
+    )
+    credits_used = db.query(func.sum(AnonymousUsageRollup.credits_used)).filter(
+        AnonymousUsageRollup.identifier == identifier,
+        AnonymousUsageRollup.bucket_start >= _rollup_bucket(today_start_utc),
+        AnonymousUsageRollup.bucket_start < _rollup_bucket(today_end_utc),
+    ).scalar() or Decimal(0)
+    # Round UP to be conservative - never give free credits
+    return (
+        int(credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING)) if credits_used > 0 else 0
+    )
+
+
+def _charge_anonymous(
+    identifier: str, credits: int, timezone_str: str, db: Session | None = None
+) -> LedgerEntry:
+    """Apply ``credits`` to an identifier's balance in the shared ledger."""
+    timezone_str = _validate_timezone(timezone_str)
+    allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
+    entry = anonymous_credit_ledger.charge(
+        identifier, timezone_str, _get_local_date(timezone_str), credits, allocated
+    )
+    if entry.started and db is not None:
+        # A balance that starts mid-day (first request after a restart or a Redis flush) picks
+        # up the usage already logged today; afterwards the ledger alone is the source of truth
+        logged = _anonymous_credits_used_today(db, identifier, entry.timezone)
+        if logged > entry.count:
+            count = anonymous_credit_ledger.seed(identifier, entry.date, logged, allocated)
+            entry = entry._replace(count=count)
+    return entry
+
+
 def check_anonymous_credits(
     identifier: str, required_credits: Decimal, timezone_str: str = "UTC", db: Session | None = None
 ) -> tuple[bool, int, int]:
     """
     Check if unregistered user has sufficient credits for a request.
 
-    Uses in-memory storage to track daily credits. If db is provided, syncs with database for persistence.
+    Reads the balance from the shared credit ledger (one atomic Redis call when configured).
+    This is only a read: admitting a request reserves with reserve_anonymous_credits.
+    If db is provided, a balance that starts with this call is seeded from today's usage rollup.
 
     Args:
         identifier: Unique identifier (e.g., "ip:192.168.1.1" or "fp:xxx")
         required_credits: Credits needed for the request (as Decimal)
         timezone_str: IANA timezone string (e.g., "America/Chicago"), defaults to "UTC"
-        db: Optional database session to sync credits from database
+        db: Optional database session to seed a new balance from the database
 
     Returns:
         tuple: (is_allowed, credits_remaining, credits_allocated)
     """
-    # Validate and normalize timezone
-    timezone_str = _validate_timezone(timezone_str)
-
-    # Get today's date in user's timezone
-    today = _get_local_date(timezone_str)
-    user_data = anonymous_rate_limit_storage[identifier]
-
-    # Initialize timezone if not set
-    if not user_data.get("timezone"):
-        user_data["timezone"] = timezone_str
-
-    # Sync with database if db session is provided (for persistence across restarts)
-    # Skip sync if admin reset flag is set (prevents overwriting admin reset)
-    if db is not None and not user_data.get("_admin_reset", False):
-        # Extract IP or fingerprint from identifier
-        if identifier.startswith("ip:"):
-            ip_address = identifier[3:]  # Remove "ip:" prefix
-            # Query UsageLog for credits used today in user's timezone
-            # Note: Database queries use UTC dates, but we filter by UTC date range that covers the local day
-            tz = pytz.timezone(timezone_str)
-            now_local = datetime.now(tz)
-            today_start_utc = now_local.replace(
-                hour=0, minute=0, second=0, microsecond=0
-            ).astimezone(UTC)
-            today_end_utc = (
-                (now_local + timedelta(days=1))
-                .replace(hour=0, minute=0, second=0, microsecond=0)
-                .astimezone(UTC)
-            )
-
-            credits_query = db.query(func.sum(UsageLog.credits_used)).filter(
-                UsageLog.user_id.is_(None),  # Unregistered users only
-                UsageLog.ip_address == ip_address,
-                UsageLog.created_at >= today_start_utc,
-                UsageLog.created_at < today_end_utc,
-                UsageLog.credits_used.isnot(None),
-            )
-            db_credits_used = credits_query.scalar() or Decimal(0)
-            # Sync memory with database (round UP to be conservative - never give free credits)
-            user_data["count"] = (
-                int(db_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-                if db_credits_used > 0
-                else 0
-            )
-            user_data["date"] = today
-            if not user_data.get("first_seen"):
-                user_data["first_seen"] = datetime.now(UTC)
-            print(
-                f"[SYNC] {identifier}: synced from DB, credits_used={db_credits_used}, count={user_data['count']}, date_range={today_start_utc} to {today_end_utc}"
-            )
-        elif identifier.startswith("fp:"):
-            fingerprint = identifier[3:]  # Remove "fp:" prefix
-            # Query UsageLog for credits used today in user's timezone
-            tz = pytz.timezone(timezone_str)
-            now_local = datetime.now(tz)
-            today_start_utc = now_local.replace(
-                hour=0, minute=0, second=0, microsecond=0
-            ).astimezone(UTC)
-            today_end_utc = (
-                (now_local + timedelta(days=1))
-                .replace(hour=0, minute=0, second=0, microsecond=0)
-                .astimezone(UTC)
-            )
-
-            credits_query = db.query(func.sum(UsageLog.credits_used)).filter(
-                UsageLog.user_id.is_(None),  # Unregistered users only
-                UsageLog.browser_fingerprint == fingerprint,
-                UsageLog.created_at >= today_start_utc,
-                UsageLog.created_at < today_end_utc,
-                UsageLog.credits_used.isnot(None),
-            )
-            db_credits_used = credits_query.scalar() or Decimal(0)
-            # Sync memory with database (round UP to be conservative - never give free credits)
-            user_data["count"] = (
-                int(db_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-                if db_credits_used > 0
-                else 0
-            )
-            user_data["date"] = today
-            if not user_data.get("first_seen"):
-                user_data["first_seen"] = datetime.now(UTC)
-            print(
-                f"[SYNC] {identifier}: synced from DB, credits_used={db_credits_used}, count={user_data['count']}, date_range={today_start_utc} to {today_end_utc}"
-            )
-    elif db is not None and user_data.get("_admin_reset", False):
-        print(
-            f"[SYNC] {identifier}: skipping sync due to admin reset flag, count={user_data.get('count', 0)}"
-        )
+    entry = _charge_anonymous(identifier, 0, timezone_str, db)
 
-    # Check if timezone changed (user might be traveling or using VPN)
-    stored_timezone = user_data.get("timezone", "UTC")
-    if stored_timezone != timezone_str:
-        # Timezone changed - check if we can reset (abuse prevention)
-        if _can_reset_credits(user_data.get("last_reset_at")):
-            # Allow timezone change, update stored timezone
-            user_data["timezone"] = timezone_str
-            # Check if it's a new day in the new timezone
-            if user_data["date"] != today:
-                user_data["count"] = 0
-                user_data["date"] = today
-                user_data["last_reset_at"] = datetime.now(UTC)
-        else:
-            # Too soon to reset - keep using old timezone for now
-            timezone_str = stored_timezone
-            today = _get_local_date(timezone_str)
-
-    # Reset credits if it's a new day in user's timezone (with abuse prevention)
-    if user_data["date"] != today:
-        # Check if reset is allowed (prevent abuse)
-        if _can_reset_credits(user_data.get("last_reset_at")):
-            user_data["count"] = 0  # Credits used (stored as integer)
-            user_data["date"] = today
-            user_data["timezone"] = timezone_str
-            user_data["last_reset_at"] = datetime.now(UTC)
-            if not user_data.get("first_seen"):
-                user_data["first_seen"] = datetime.now(UTC)
-
-    # Get daily credit limit for unregistered users
     credits_allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
-    credits_used = user_data["count"]
-    credits_remaining = max(0, credits_allocated - credits_used)
+    credits_remaining = max(0, credits_allocated - entry.count)
 
     # Convert required_credits to int (round up to be conservative)
     required_int = int(required_credits.quantize(Decimal("1"), rounding=ROUND_CEILING))
 
-    is_allowed = credits_remaining >= required_int
+    return credits_remaining >= required_int, credits_remaining, credits_allocated
+
+
+def reserve_anonymous_credits(
+    identifiers: list[str],
+    required_credits: Decimal,
+    timezone_str: str = "UTC",
+    db: Session | None = None,
+) -> tuple[bool, int, int]:
+    """
+    Reserve credits for a request on every identifier of an unregistered user, or on none.
+
+    Each reservation is checked and applied in one ledger step (one Redis script call when
+    configured), so concurrent requests cannot together overdraw a balance. When one
+    identifier refuses, those already reserved are refunded. Settle the reservation with
+    settle_anonymous_credits once the request's cost is known.
+
+    Args:
+        identifiers: ``ip:`` / ``fp:`` identifiers (see anonymous_identifiers)
+        required_credits: Credits to reserve (as Decimal, rounded up)
+        timezone_str: IANA timezone string (e.g., "America/Chicago"), defaults to "UTC"
+        db: Optional database session to seed a new balance from the database
+
+    Returns:
+        tuple: (is_allowed, credits_remaining, credits_allocated); credits_remaining is the
+        lowest balance after the reservation, or before it when refused
+    """
+    timezone_str = _validate_timezone(timezone_str)
+    today = _get_local_date(timezone_str)
+    allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
+    required_int = int(required_credits.quantize(Decimal("1"), rounding=ROUND_CEILING))
 
-    # Clear admin reset flag after first check (allows normal syncing going forward)
-    if user_data.get("_admin_reset", False):
-        print(
-            f"[CHECK] {identifier}: admin reset flag cleared after check, credits_used={credits_used}, credits_remaining={credits_remaining}, is_allowed={is_allowed}"
+    counts: list[int] = []
+    for index, identifier in enumerate(identifiers):
+        if db is not None:
+            # Start (and seed) the day's balance first, so the reservation counts against it
+            _charge_anonymous(identifier, 0, timezone_str, db)
+        entry = anonymous_credit_ledger.reserve(
+            identifier, timezone_str, today, required_int, allocated
         )
-        user_data.pop("_admin_reset", None)
+        if not entry.allowed:
+            refunded = [
+                anonymous_credit_ledger.charge(
+                    reserved, timezone_str, today, -required_int, allocated
+                ).count
+                for reserved in identifiers[:index]
+            ]
+            return False, max(0, allocated - max([entry.count, *refunded])), allocated
+        counts.append(entry.count)
 
-    return is_allowed, credits_remaining, credits_allocated
+    return True, max(0, allocated - max(counts, default=0)), allocated
 
 
-def deduct_anonymous_credits(identifier: str, credits: Decimal, timezone_str: str = "UTC") -> None:
+def settle_anonymous_credits(
+    identifiers: list[str], reserved_credits: int, credits: Decimal, timezone_str: str = "UTC"
+) -> int:
+    """
+    Replace a reservation made by reserve_anonymous_credits with the request's actual cost.
+
+    Args:
+        identifiers: The identifiers the reservation was made on
+        reserved_credits: Credits reserved
+        credits: Credits the request actually used (0 refunds the whole reservation)
+        timezone_str: IANA timezone string (e.g., "America/Chicago"), defaults to "UTC"
+
+    Returns:
+        int: Lowest balance left across the identifiers
+    """
+    credits_int = int(credits.quantize(Decimal("1"), rounding=ROUND_CEILING))
+    allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
+    counts = [
+        _charge_anonymous(identifier, credits_int - reserved_credits, timezone_str).count
+        for identifier in identifiers
+    ]
+    return max(0, allocated - max(counts, default=0))
+
+
+def deduct_anonymous_credits(identifier: str, credits: Decimal, timezone_str: str = "UTC") -> int:
     """
     Deduct credits from unregistered user's daily balance.
 
@@ -334,59 +351,21 @@ def deduct_anonymous_credits(identifier: str, credits: Decimal, timezone_str: st
         identifier: Unique identifier (e.g., "ip:192.168.1.1" or "fp:xxx")
         credits: Credits to deduct (as Decimal)
         timezone_str: IANA timezone string (e.g., "America/Chicago"), defaults to "UTC"
-    """
-    from .config.constants import DAILY_CREDIT_LIMITS
-
-    # Validate and normalize timezone
-    timezone_str = _validate_timezone(timezone_str)
-
-    # Get today's date in user's timezone
-    today = _get_local_date(timezone_str)
-    user_data = anonymous_rate_limit_storage[identifier]
-
-    # Initialize timezone if not set
-    if not user_data.get("timezone"):
-        user_data["timezone"] = timezone_str
-
-    # Reset if new day in user's timezone (with abuse prevention)
-    stored_timezone = user_data.get("timezone", "UTC")
-    if stored_timezone != timezone_str:
-        # Timezone changed - check if we can reset
-        if _can_reset_credits(user_data.get("last_reset_at")):
-            user_data["timezone"] = timezone_str
-            if user_data["date"] != today:
-                user_data["count"] = 0
-                user_data["date"] = today
-                user_data["last_reset_at"] = datetime.now(UTC)
-        else:
-            # Too soon - use stored timezone
-            timezone_str = stored_timezone
-            today = _get_local_date(timezone_str)
-
-    if user_data["date"] != today:
-        # Check if reset is allowed (prevent abuse)
-        if _can_reset_credits(user_data.get("last_reset_at")):
-            user_data["count"] = 0
-            user_data["date"] = today
-            user_data["timezone"] = timezone_str
-            user_data["last_reset_at"] = datetime.now(UTC)
-            if not user_data.get("first_seen"):
-                user_data["first_seen"] = datetime.now(UTC)
 
+    Returns:
+        int: Credits remaining after the deduction
+    """
     # Convert Decimal to int (round UP to be conservative - never give free credits)
     # Use ceiling to ensure we always deduct at least 1 credit for any usage
     credits_int = int(credits.quantize(Decimal("1"), rounding=ROUND_CEILING))
 
-    # Get allocated amount for unregistered users (50 credits)
+    entry = _charge_anonymous(identifier, credits_int, timezone_str)
     allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
 
-    # Cap credits at allocated amount (zero out, don't go negative)
-    new_count = user_data["count"] + credits_int
-    user_data["count"] = min(new_count, allocated)
-
     print(
-        f"[DEBUG] deduct_anonymous_credits - {identifier}: deducted {credits_int} credits (from {float(credits):.4f}), new count: {user_data['count']} (capped at {allocated})"
+        f"[DEBUG] deduct_anonymous_credits - {identifier}: deducted {credits_int} credits (from {float(credits):.4f}), new count: {entry.count} (capped at {allocated})"
     )
+    return max(0, allocated - entry.count)
 
 
 def get_user_usage_stats(user: User) -> FullUsageStatsDict:
@@ -442,35 +421,11 @@ def get_anonymous_usage_stats(identifier: str, timezone_str: str = "UTC") -> Usa
     Returns:
         dict: Usage statistics including credits and legacy daily usage
     """
-    # Validate and normalize timezone
-    timezone_str = _validate_timezone(timezone_str)
-
     # Get credit-based stats
     credits_allocated = DAILY_CREDIT_LIMITS.get("unregistered", 50)
-    today = _get_local_date(timezone_str)
-    user_data = anonymous_rate_limit_storage[identifier]
-
-    # Initialize timezone if not set
-    if not user_data.get("timezone"):
-        user_data["timezone"] = timezone_str
-
-    # Use stored timezone if available (to be consistent)
-    stored_timezone = user_data.get("timezone", timezone_str)
-    today = _get_local_date(stored_timezone)
-
-    # Reset if new day in user's timezone
-    if user_data["date"] != today:
-        # Check if reset is allowed (prevent abuse)
-        if _can_reset_credits(user_data.get("last_reset_at")):
-            credits_used = 0
-            user_data["date"] = today
-            user_data["timezone"] = stored_timezone
-            user_data["last_reset_at"] = datetime.now(UTC)
-        else:
-            # Too soon to reset - use existing count
-            credits_used = user_data["count"]
-    else:
-        credits_used = user_data["count"]
+    entry = _charge_anonymous(identifier, 0, timezone_str)
+    credits_used = entry.count
+    today = entry.date
 
     credits_remaining = max(0, credits_allocated - credits_used)
 
@@ -512,7 +467,7 @@ def reset_anonymous_rate_limits() -> None:
     Clear all anonymous rate limit storage.
     For development/testing only. In production, rate limits reset automatically at midnight.
     """
-    anonymous_rate_limit_storage.clear()
+    anonymous_credit_ledger.clear()
 
 
 # get_model_limit is now imported from config module
@@ -585,5 +540,5 @@ def get_rate_limit_info() -> dict[str, Any]:
     return {
         "monthly_credit_allocations": MONTHLY_CREDIT_ALLOCATIONS,
         "model_limits": MODEL_LIMITS,
-        "anonymous_users_tracked": len(anonymous_rate_limit_storage),
+        "anonymous_users_tracked": len(anonymous_credit_ledger.balances()),
     }
@@ -10,8 +10,9 @@ from sqlalchemy.orm import Session
 
 from ...database import get_db
 from ...dependencies import get_current_admin_user
-from ...models import AdminActionLog, UsageLog, User
+from ...models import AdminActionLog, User, VisitorDailyActivity
 from ...schemas import AdminStatsResponse, VisitorAnalyticsResponse
+from ...visitor_analytics import refresh_visitor_daily_activity
 
 router = APIRouter()
 
@@ -21,31 +22,27 @@ async def get_admin_stats(
     current_user: User = Depends(get_current_admin_user), db: Session = Depends(get_db)
 ):
     """Get admin dashboard statistics."""
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    verified_users = db.query(User).filter(User.is_verified == True).count()
-
-    users_by_tier = {}
-    for tier in ["free", "starter", "starter_plus", "pro", "pro_plus"]:
-        count = db.query(User).filter(User.subscription_tier == tier).count()
-        users_by_tier[tier] = count
-
-    users_by_role = {}
-    for role in ["user", "moderator", "admin", "super_admin"]:
-        count = db.query(User).filter(User.role == role).count()
-        users_by_role[role] = count
-
+    tiers = ["free", "starter", "starter_plus", "pro", "pro_plus"]
+    roles = ["user", "moderator", "admin", "super_admin"]
     week_ago = datetime.now(UTC) - timedelta(days=7)
-    recent_registrations = db.query(User).filter(User.created_at >= week_ago).count()
 
-    today = datetime.now(UTC).date()
-    total_usage_today = (
-        db.query(func.sum(User.credits_used_this_period))
-        .filter(User.credits_reset_at.isnot(None))
-        .scalar()
-        or 0
-    )
+    # One pass over users: every count is a FILTERed aggregate of the same scan
+    counts = db.query(
+        func.count(User.id),
+        func.count(User.id).filter(User.is_active == True),
+        func.count(User.id).filter(User.is_verified == True),
+        func.count(User.id).filter(User.created_at >= week_ago),
+        func.coalesce(
+            func.sum(User.credits_used_this_period).filter(User.credits_reset_at.isnot(None)), 0
+        ),
+        *(func.count(User.id).filter(User.subscription_tier == tier) for tier in tiers),
+        *(func.count(User.id).filter(User.role == role) for role in roles),
+    ).one()
+    total_users, active_users, verified_users, recent_registrations, total_usage_today = counts[:5]
+    users_by_tier = dict(zip(tiers, counts[5 : 5 + len(tiers)], strict=True))
+    users_by_role = dict(zip(roles, counts[5 + len(tiers) :], strict=True))
 
+    today = datetime.now(UTC).date()
     admin_actions_today = (
         db.query(AdminActionLog).filter(func.date(AdminActionLog.created_at) == today).count()
     )
@@ -67,96 +64,59 @@ async def get_visitor_analytics(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db),
 ):
-    """Get visitor analytics statistics."""
-    now = datetime.now(UTC)
-    today_start = datetime.combine(now.date(), datetime.min.time())
-    week_ago = now - timedelta(days=7)
-    month_ago = now - timedelta(days=30)
-
-    total_unique_visitors = db.query(func.count(func.distinct(UsageLog.ip_address))).scalar() or 0
-    total_unique_devices = (
-        db.query(func.count(func.distinct(UsageLog.browser_fingerprint)))
-        .filter(UsageLog.browser_fingerprint.isnot(None))
-        .scalar()
-        or 0
-    )
-    total_comparisons = db.query(func.count(UsageLog.id)).scalar() or 0
-
-    unique_visitors_today = (
-        db.query(func.count(func.distinct(UsageLog.ip_address)))
-        .filter(UsageLog.created_at >= today_start)
-        .scalar()
-        or 0
-    )
-
-    unique_visitors_this_week = (
-        db.query(func.count(func.distinct(UsageLog.ip_address)))
-        .filter(UsageLog.created_at >= week_ago)
-        .scalar()
-        or 0
-    )
-
-    unique_visitors_this_month = (
-        db.query(func.count(func.distinct(UsageLog.ip_address)))
-        .filter(UsageLog.created_at >= month_ago)
-        .scalar()
-        or 0
-    )
-
-    authenticated_visitors = (
-        db.query(func.count(func.distinct(UsageLog.ip_address)))
-        .filter(UsageLog.user_id.isnot(None))
-        .scalar()
-        or 0
-    )
-
-    anonymous_visitors = (
-        db.query(func.count(func.distinct(UsageLog.ip_address)))
-        .filter(UsageLog.user_id.is_(None))
-        .scalar()
-        or 0
-    )
-
-    comparisons_today = (
-        db.query(func.count(UsageLog.id)).filter(UsageLog.created_at >= today_start).scalar() or 0
-    )
-
-    comparisons_this_week = (
-        db.query(func.count(UsageLog.id)).filter(UsageLog.created_at >= week_ago).scalar() or 0
-    )
+    """
+    Get visitor analytics statistics.
 
-    comparisons_this_month = (
-        db.query(func.count(UsageLog.id)).filter(UsageLog.created_at >= month_ago).scalar() or 0
-    )
-
-    daily_breakdown = []
-    for i in range(30):
-        day_start = datetime.combine((now - timedelta(days=i)).date(), datetime.min.time())
-        day_end = day_start + timedelta(days=1)
-
-        day_unique_visitors = (
-            db.query(func.count(func.distinct(UsageLog.ip_address)))
-            .filter(UsageLog.created_at >= day_start, UsageLog.created_at < day_end)
-            .scalar()
-            or 0
-        )
+    Served from VisitorDailyActivity (one row per visitor per UTC day), refreshed first.
+    Week and month windows are the last 7 and 30 UTC days, today included.
+    """
+    refresh_visitor_daily_activity(db)
 
-        day_comparisons = (
-            db.query(func.count(UsageLog.id))
-            .filter(UsageLog.created_at >= day_start, UsageLog.created_at < day_end)
-            .scalar()
-            or 0
+    today = datetime.now(UTC).date()
+    week_start = today - timedelta(days=6)
+    month_start = today - timedelta(days=29)
+
+    activity = VisitorDailyActivity
+    is_ip = activity.kind == "ip"
+    visitor = func.count(func.distinct(activity.value))
+    (
+        total_unique_visitors,
+        total_unique_devices,
+        total_comparisons,
+        unique_visitors_this_week,
+        unique_visitors_this_month,
+        authenticated_visitors,
+        anonymous_visitors,
+    ) = db.query(
+        visitor.filter(is_ip),
+        visitor.filter(activity.kind == "fp"),
+        func.coalesce(func.sum(activity.comparisons).filter(is_ip), 0),
+        visitor.filter(is_ip, activity.day >= week_start),
+        visitor.filter(is_ip, activity.day >= month_start),
+        visitor.filter(is_ip, activity.authenticated_comparisons > 0),
+        visitor.filter(is_ip, activity.comparisons > activity.authenticated_comparisons),
+    ).one()
+
+    by_day = {
+        str(day): (visitors, comparisons)
+        for day, visitors, comparisons in db.query(
+            activity.day, func.count(activity.value), func.sum(activity.comparisons)
         )
-
+        .filter(is_ip, activity.day >= month_start)
+        .group_by(activity.day)
+    }
+    daily_breakdown = []
+    for i in range(29, -1, -1):
+        day = (today - timedelta(days=i)).isoformat()
+        visitors, comparisons = by_day.get(day, (0, 0))
         daily_breakdown.append(
-            {
-                "date": day_start.date().isoformat(),
-                "unique_visitors": day_unique_visitors,
-                "total_comparisons": day_comparisons,
-            }
+            {"date": day, "unique_visitors": visitors, "total_comparisons": comparisons}
         )
 
-    daily_breakdown.reverse()
+    unique_visitors_today = daily_breakdown[-1]["unique_visitors"]
+    comparisons_today = daily_breakdown[-1]["total_comparisons"]
+    comparisons_this_week = sum(d["total_comparisons"] for d in daily_breakdown[-7:])
+    comparisons_this_month = sum(d["total_comparisons"] for d in daily_breakdown)
 
     return VisitorAnalyticsResponse(
         total_unique_visitors=total_unique_visitors,
@@ -2,15 +2,18 @@
 Admin app settings and maintenance endpoints.
 """
 
+import json
 from datetime import UTC, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from ...credit_ledger import anonymous_credit_ledger
+from ...data_retention import DEFAULT_BATCH_SIZE, cleanup_old_usage_logs, iter_usage_log_cleanup
 from ...database import get_db
 from ...dependencies import get_current_admin_user, require_admin_role
-from ...models import AppSettings, UsageLog
-from ...rate_limiting import anonymous_rate_limit_storage
+from ...models import AnonymousUsageRollup, AppSettings, UsageLog
 from .helpers import log_admin_action
 
 router = APIRouter()
@@ -46,9 +49,8 @@ async def get_app_settings(
     anonymous_db_usage_count = 0
 
     if is_development:
-        for key in list(anonymous_rate_limit_storage.keys()):
+        for key, count in anonymous_credit_ledger.balances().items():
             if (key.startswith("ip:") or key.startswith("fp:")) and not key.endswith("_extended"):
-                count = anonymous_rate_limit_storage[key].get("count", 0)
                 if count > 0:
                     anonymous_users_with_usage += 1
 
@@ -140,18 +142,14 @@ async def zero_anonymous_usage(
             detail="Unregistered credit reset is only available in development environment",
         )
 
-    keys_reset = []
-    reset_timestamp = datetime.now(UTC)
-    for key in list(anonymous_rate_limit_storage.keys()):
-        if key.startswith("ip:") or key.startswith("fp:"):
-            if not key.endswith("_extended"):
-                anonymous_rate_limit_storage[key]["count"] = 0
-                anonymous_rate_limit_storage[key]["date"] = datetime.now(UTC).date().isoformat()
-                anonymous_rate_limit_storage[key]["last_reset_at"] = reset_timestamp
-                anonymous_rate_limit_storage[key]["_admin_reset"] = True
-                keys_reset.append(key)
+    keys_reset = [
+        key
+        for key in anonymous_credit_ledger.zero_all(datetime.now(UTC).date().isoformat())
+        if (key.startswith("ip:") or key.startswith("fp:")) and not key.endswith("_extended")
+    ]
 
     usage_logs_deleted = db.query(UsageLog).filter(UsageLog.user_id.is_(None)).delete()
+    db.query(AnonymousUsageRollup).delete()
     db.commit()
 
     log_admin_action(
@@ -181,14 +179,48 @@ async def cleanup_usage_logs(
     request: Request,
     keep_days: int = 90,
     dry_run: bool = False,
+    stream: bool = False,
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=100, le=100_000),
     current_user=Depends(require_admin_role("admin")),
     db: Session = Depends(get_db),
 ):
-    """Cleanup old UsageLog entries by aggregating them into monthly summaries."""
-    from ...data_retention import cleanup_old_usage_logs
+    """
+    Cleanup old UsageLog entries by aggregating them into monthly summaries.
+
+    With ``stream=true`` the cleanup runs as it is reported: one SSE ``progress`` event per
+    committed batch, then ``complete`` (or ``error``). Progress already committed is kept if
+    the cleanup stops early; running it again continues from there.
+    """
+    if stream and not dry_run:
+        # The request session stays open until the streamed response is finished
+        def generate_progress_stream():
+            progress: dict = {}
+            try:
+                for progress in iter_usage_log_cleanup(
+                    db, keep_days=keep_days, batch_size=batch_size
+                ):
+                    if progress["status"] == "running":
+                        yield f"data: {json.dumps({'type': 'progress', **progress})}\n\n"
+                log_admin_action(
+                    db=db,
+                    admin_user=current_user,
+                    action_type="cleanup_usage_logs",
+                    action_description=f"Cleanup UsageLog entries older than {keep_days} days (dry_run=False)",
+                    target_user_id=None,
+                    details=progress,
+                    request=request,
+                )
+                yield f"data: {json.dumps({'type': 'complete', **progress})}\n\n"
+            except Exception as e:
+                db.rollback()
+                yield f"data: {json.dumps({**progress, 'type': 'error', 'message': f'Error during cleanup: {str(e)}'})}\n\n"
+
+        return StreamingResponse(generate_progress_stream(), media_type="text/event-stream")
 
     try:
-        result = cleanup_old_usage_logs(db, keep_days=keep_days, dry_run=dry_run)
+        result = cleanup_old_usage_logs(
+            db, keep_days=keep_days, dry_run=dry_run, batch_size=batch_size
+        )
 
         log_admin_action(
             db=db,
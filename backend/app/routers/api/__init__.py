@@ -1,8 +1,9 @@
-"""API router - combines core, conversations, credits, preferences, dev."""
+"""API router - combines core, conversations, attachments, credits, preferences, dev."""
 
 from fastapi import APIRouter
 
 from ..billing import router as billing_router
+from .attachments import router as attachments_router
 from .conversations import router as conversations_router
 from .core import router as core_router
 from .credits import router as credits_router
@@ -17,6 +18,7 @@ router.include_router(core_router, tags=["API"])
 router.include_router(geo_router, tags=["API"])
 router.include_router(billing_router, tags=["Billing"])
 router.include_router(conversations_router, tags=["API"])
+router.include_router(attachments_router, tags=["API"])
 router.include_router(credits_router, tags=["API"])
 router.include_router(preferences_router, tags=["API"])
 router.include_router(dev_router, tags=["API"])
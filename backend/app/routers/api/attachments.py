@@ -0,0 +1,112 @@
+"""Attachment blob routes: conversation images served from the content-addressed blob store."""
+
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ...attachment_storage import blob_url_signature_valid
+from ...blob_store import DEFAULT_CONTENT_TYPE, blob_store, is_blob_key
+from ...database import get_async_db
+from ...dependencies import get_current_user
+from ...models import AttachmentBlobRef, Conversation, User
+
+router = APIRouter(tags=["API - Attachments"])
+
+# A blob never changes under its key, but it is only served to its owner: browser cache only
+_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Served as-is; anything else (e.g. SVG, HTML) is sent as an opaque download
+_INLINE_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif"})
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) inclusive for a single ``bytes=`` range, or None to send the whole blob.
+
+    Raises 416 for a range outside the blob. Multi-range requests get the whole blob,
+    which RFC 9110 allows.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+@router.get("/attachments/{blob_key}")
+async def get_attachment(
+    blob_key: str,
+    request: Request,
+    sig: str | None = Query(None, description="Signature from a live comparison stream"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User | None = Depends(get_current_user),
+):
+    """
+    Serve a blob by key, with ETag revalidation and single byte ranges.
+
+    Only to a user with a conversation referencing the blob, or with a URL signed for them
+    (images a comparison sends while it streams, before its conversation is saved): the
+    key is the SHA-256 of the content, which anyone who has seen a URL, or can guess the
+    bytes, can name. Any other key is a 404, whether or not the blob exists.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not is_blob_key(blob_key):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if not (sig and blob_url_signature_valid(blob_key, current_user.id, sig)):
+        referenced = await db.scalar(
+            select(AttachmentBlobRef.id)
+            .join(Conversation, Conversation.id == AttachmentBlobRef.conversation_id)
+            .where(AttachmentBlobRef.blob_key == blob_key, Conversation.user_id == current_user.id)
+            .limit(1)
+        )
+        if referenced is None:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+    info = await run_in_threadpool(blob_store.head_object, blob_key)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    etag = f'"{info.key}"'
+    content_type = info.content_type if info.content_type in _INLINE_TYPES else DEFAULT_CONTENT_TYPE
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in if_none_match):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, info.size)
+
+    if byte_range is None:
+        data = await run_in_threadpool(blob_store.get_object, blob_key)
+        status_code = 200
+    else:
+        start, end = byte_range
+        data = await run_in_threadpool(blob_store.get_object, blob_key, start, end)
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+        status_code = 206
+    if data is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return Response(content=data, status_code=status_code, media_type=content_type, headers=headers)
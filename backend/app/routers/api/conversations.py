@@ -2,15 +2,15 @@
 
 import json
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ...attachment_storage import parse_file_contents
+from ...attachment_storage import blob_url, parse_file_contents
 from ...config import get_history_entry_limit
-from ...database import get_db
+from ...database import get_async_db
 from ...dependencies import get_current_user
-from ...models import Conversation, User
+from ...models import Conversation, User, conversation_history_trim
 from ...models import ConversationMessage as ConversationMessageModel
 from ...schemas import (
     BreakoutConversationCreate,
@@ -18,74 +18,179 @@ from ...schemas import (
     ConversationSummary,
     StoredFileContent,
 )
+from ...schemas import ConversationMessage as ConversationMessageSchema
 
 router = APIRouter(tags=["API - Conversations"])
 
+MESSAGE_PAGE_MAX = 500
+# The history list shows a prompt preview; GET /conversations/{id} returns the full text
+SUMMARY_INPUT_PREVIEW_CHARS = 200
+
+
+def _stored_file_contents(raw: str | None) -> list[StoredFileContent]:
+    """Attachments of a conversation; images carry their blob store key and URL, not bytes."""
+    file_contents = []
+    for item in parse_file_contents(raw):
+        blob_key = item.get("blob_key")
+        file_contents.append(
+            StoredFileContent(
+                name=item.get("name") or "attachment",
+                placeholder=item.get("placeholder") or "",
+                content=item.get("content"),
+                mime_type=item.get("mime_type"),
+                base64_data=item.get("base64_data"),
+                blob_key=blob_key,
+                url=blob_url(blob_key) if blob_key else None,
+                size=item.get("size"),
+            )
+        )
+    return file_contents
+
+
+_SUMMARY_COLUMNS = (
+    Conversation.id,
+    func.substr(Conversation.input_data, 1, SUMMARY_INPUT_PREVIEW_CHARS).label("input_data"),
+    (func.length(Conversation.input_data) > SUMMARY_INPUT_PREVIEW_CHARS).label("input_truncated"),
+    Conversation.models_used,
+    Conversation.conversation_type,
+    Conversation.parent_conversation_id,
+    Conversation.breakout_model_id,
+    Conversation.created_at,
+    Conversation.composer_temperature,
+    Conversation.composer_top_p,
+    Conversation.composer_max_tokens,
+    Conversation.composer_aspect_ratio,
+    Conversation.composer_image_size,
+)
+
+
+def _before(model, scope, before_id: int):
+    """
+    Keyset filter: rows of ``scope`` that come before row ``before_id`` in (created_at, id) order.
+
+    The boundary's created_at is read from the row itself, so it compares in the column's own
+    storage format; an unknown ``before_id`` matches nothing.
+    """
+    boundary = select(model.created_at).where(model.id == before_id, scope).scalar_subquery()
+    return or_(
+        model.created_at < boundary,
+        and_(model.created_at == boundary, model.id < before_id),
+    )
+
+
+def _message_schema(msg: ConversationMessageModel) -> ConversationMessageSchema:
+    return ConversationMessageSchema(
+        id=msg.id,
+        model_id=msg.model_id,
+        role=msg.role,
+        content=msg.content,
+        input_tokens=msg.input_tokens,
+        output_tokens=msg.output_tokens,
+        success=msg.success,
+        processing_time_ms=msg.processing_time_ms,
+        created_at=msg.created_at,
+        images=json.loads(msg.images) if msg.images else None,
+        image_thumbnails=json.loads(msg.image_thumbnails) if msg.image_thumbnails else None,
+    )
+
+
+async def _latest_messages(
+    db: AsyncSession, conversation_id: int, limit: int, before: int | None = None
+) -> tuple[list[ConversationMessageModel], bool]:
+    """Up to ``limit`` newest messages (before message ``before``), oldest first, and whether
+    earlier ones remain."""
+    scope = ConversationMessageModel.conversation_id == conversation_id
+    query = select(ConversationMessageModel).filter(scope)
+    if before is not None:
+        query = query.filter(_before(ConversationMessageModel, scope, before))
+    messages = (
+        await db.scalars(
+            query.order_by(
+                ConversationMessageModel.created_at.desc(), ConversationMessageModel.id.desc()
+            ).limit(limit + 1)
+        )
+    ).all()
+    return list(reversed(messages[:limit])), len(messages) > limit
+
 
 @router.get("/conversations", response_model=list[ConversationSummary])
 async def get_conversations(
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int | None = Query(None, ge=1, description="Page size (at most the history cap)"),
+    before: int | None = Query(
+        None, description="Return conversations older than this one (X-Next-Before of a page)"
+    ),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
-    """Get list of user's conversations, limited by subscription tier history cap."""
+    """
+    Get the user's conversations, newest first, limited by subscription tier history cap.
+
+    Pages are keyset-paged: when more conversations follow, the X-Next-Before header holds the
+    ``before`` value for the next page.
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
     tier = current_user.subscription_tier or "free"
     history_limit = get_history_entry_limit(tier)
-
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.user_id == current_user.id)
-        .order_by(Conversation.created_at.desc())
-        .limit(history_limit + 1)
-        .all()
+    page_size = min(limit or history_limit, history_limit)
+
+    message_count = (
+        select(func.count(ConversationMessageModel.id))
+        .where(ConversationMessageModel.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+        .label("message_count")
     )
-
-    if len(conversations) > history_limit:
-        conversations_to_delete = conversations[history_limit:]
-        for conv_to_delete in conversations_to_delete:
-            db.delete(conv_to_delete)
-        db.commit()
-        conversations = conversations[:history_limit]
-
-    conversation_ids = [conv.id for conv in conversations]
-    message_counts = {}
-    if conversation_ids:
-        count_results = (
-            db.query(
-                ConversationMessageModel.conversation_id,
-                func.count(ConversationMessageModel.id).label("count"),
+    scope = Conversation.user_id == current_user.id
+    # Conversations past the cap (say, after a downgrade) are left to the next save's trim
+    within_cap = (
+        select(Conversation.id)
+        .filter(scope)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(history_limit)
+    )
+    query = select(*_SUMMARY_COLUMNS, message_count).filter(
+        scope, Conversation.id.in_(within_cap.scalar_subquery())
+    )
+    if before is not None:
+        query = query.filter(_before(Conversation, scope, before))
+    rows = (
+        await db.execute(
+            query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(
+                page_size + 1
             )
-            .filter(ConversationMessageModel.conversation_id.in_(conversation_ids))
-            .group_by(ConversationMessageModel.conversation_id)
-            .all()
         )
-        message_counts = {conv_id: count for conv_id, count in count_results}
+    ).all()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        response.headers["X-Next-Before"] = str(rows[-1].id)
 
     summaries = []
-    for conv in conversations:
+    for row in rows:
         try:
-            models_used = json.loads(conv.models_used) if conv.models_used else []
+            models_used = json.loads(row.models_used) if row.models_used else []
         except (json.JSONDecodeError, TypeError):
             models_used = []
 
-        message_count = message_counts.get(conv.id, 0)
         summaries.append(
             ConversationSummary(
-                id=conv.id,
-                input_data=conv.input_data,
+                id=row.id,
+                input_data=row.input_data,
+                input_truncated=bool(row.input_truncated),
                 models_used=models_used,
-                conversation_type=conv.conversation_type or "comparison",
-                parent_conversation_id=conv.parent_conversation_id,
-                breakout_model_id=conv.breakout_model_id,
-                created_at=conv.created_at,
-                message_count=message_count,
-                composer_temperature=conv.composer_temperature,
-                composer_top_p=conv.composer_top_p,
-                composer_max_tokens=conv.composer_max_tokens,
-                composer_aspect_ratio=conv.composer_aspect_ratio,
-                composer_image_size=conv.composer_image_size,
+                conversation_type=row.conversation_type or "comparison",
+                parent_conversation_id=row.parent_conversation_id,
+                breakout_model_id=row.breakout_model_id,
+                created_at=row.created_at,
+                message_count=row.message_count,
+                composer_temperature=row.composer_temperature,
+                composer_top_p=row.composer_top_p,
+                composer_max_tokens=row.composer_max_tokens,
+                composer_aspect_ratio=row.composer_aspect_ratio,
+                composer_image_size=row.composer_image_size,
             )
         )
 
@@ -95,20 +200,26 @@ async def get_conversations(
 @router.get("/conversations/{conversation_id}", response_model=ConversationDetail)
 async def get_conversation(
     conversation_id: int,
-    db: Session = Depends(get_db),
+    message_limit: int | None = Query(
+        None, ge=1, le=MESSAGE_PAGE_MAX, description="Only return this many latest messages"
+    ),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
-    """Get full conversation with all messages."""
+    """
+    Get full conversation with its messages.
+
+    With ``message_limit`` only the latest messages are returned; ``has_earlier_messages`` tells
+    whether the rest should be paged in from /conversations/{id}/messages.
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    conversation = (
-        db.query(Conversation)
-        .filter(
+    conversation = await db.scalar(
+        select(Conversation).filter(
             Conversation.id == conversation_id,
             Conversation.user_id == current_user.id,
         )
-        .first()
     )
 
     if not conversation:
@@ -119,58 +230,37 @@ async def get_conversation(
     except (json.JSONDecodeError, TypeError):
         models_used = []
 
-    messages = (
-        db.query(ConversationMessageModel)
-        .filter(ConversationMessageModel.conversation_id == conversation.id)
-        .order_by(ConversationMessageModel.created_at.asc())
-        .all()
-    )
+    has_earlier_messages = False
+    if message_limit is None:
+        messages = (
+            await db.scalars(
+                select(ConversationMessageModel)
+                .filter(ConversationMessageModel.conversation_id == conversation.id)
+                .order_by(
+                    ConversationMessageModel.created_at.asc(), ConversationMessageModel.id.asc()
+                )
+            )
+        ).all()
+    else:
+        messages, has_earlier_messages = await _latest_messages(db, conversation.id, message_limit)
 
     already_broken_out_models: list[str] = []
     if conversation.conversation_type != "breakout":
-        existing_breakouts = (
-            db.query(Conversation)
-            .filter(
-                Conversation.parent_conversation_id == conversation.id,
-                Conversation.conversation_type == "breakout",
-                Conversation.user_id == current_user.id,
-            )
-            .all()
-        )
         already_broken_out_models = [
-            breakout.breakout_model_id
-            for breakout in existing_breakouts
-            if breakout.breakout_model_id is not None
+            model_id
+            for model_id in (
+                await db.scalars(
+                    select(Conversation.breakout_model_id).filter(
+                        Conversation.parent_conversation_id == conversation.id,
+                        Conversation.conversation_type == "breakout",
+                        Conversation.user_id == current_user.id,
+                    )
+                )
+            ).all()
+            if model_id is not None
         ]
 
-    from ...schemas import ConversationMessage as ConversationMessageSchema
-
-    message_schemas = [
-        ConversationMessageSchema(
-            id=msg.id,
-            model_id=msg.model_id,
-            role=msg.role,
-            content=msg.content,
-            input_tokens=msg.input_tokens,
-            output_tokens=msg.output_tokens,
-            success=msg.success,
-            processing_time_ms=msg.processing_time_ms,
-            created_at=msg.created_at,
-            images=json.loads(msg.images) if msg.images else None,
-        )
-        for msg in messages
-    ]
-
-    file_contents = [
-        StoredFileContent(
-            name=item.get("name") or "attachment",
-            placeholder=item.get("placeholder") or "",
-            content=item.get("content"),
-            mime_type=item.get("mime_type"),
-            base64_data=item.get("base64_data"),
-        )
-        for item in parse_file_contents(conversation.file_contents)
-    ]
+    file_contents = _stored_file_contents(conversation.file_contents)
 
     return ConversationDetail(
         id=conversation.id,
@@ -182,7 +272,8 @@ async def get_conversation(
         breakout_model_id=conversation.breakout_model_id,
         already_broken_out_models=already_broken_out_models,
         created_at=conversation.created_at,
-        messages=message_schemas,
+        messages=[_message_schema(msg) for msg in messages],
+        has_earlier_messages=has_earlier_messages,
         file_contents=file_contents,
         composer_temperature=conversation.composer_temperature,
         composer_top_p=conversation.composer_top_p,
@@ -192,17 +283,55 @@ async def get_conversation(
     )
 
 
+@router.get(
+    "/conversations/{conversation_id}/messages",
+    response_model=list[ConversationMessageSchema],
+)
+async def get_conversation_messages(
+    conversation_id: int,
+    response: Response,
+    before: int = Query(..., description="Return messages earlier than this message"),
+    limit: int = Query(50, ge=1, le=MESSAGE_PAGE_MAX),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User | None = Depends(get_current_user),
+):
+    """
+    Page of a conversation's messages earlier than ``before``, oldest first.
+
+    When still earlier messages remain, the X-Next-Before header holds the ``before`` value for
+    the next page.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    owned = await db.scalar(
+        select(Conversation.id).filter(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id,
+        )
+    )
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    messages, has_earlier_messages = await _latest_messages(db, conversation_id, limit, before)
+    if has_earlier_messages:
+        response.headers["X-Next-Before"] = str(messages[0].id)
+
+    return [_message_schema(msg) for msg in messages]
+
+
 @router.delete("/conversations/all", status_code=200)
 async def delete_all_conversations(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
     """Delete all conversations for the current user."""
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    deleted_count = db.query(Conversation).filter(Conversation.user_id == current_user.id).delete()
-    db.commit()
+    result = await db.execute(delete(Conversation).filter(Conversation.user_id == current_user.id))
+    deleted_count = result.rowcount
+    await db.commit()
 
     return {
         "message": f"Successfully deleted {deleted_count} conversation(s)",
@@ -213,27 +342,25 @@ async def delete_all_conversations(
 @router.delete("/conversations/{conversation_id}", status_code=200)
 async def delete_conversation(
     conversation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
     """Delete a conversation and all its messages."""
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    conversation = (
-        db.query(Conversation)
-        .filter(
+    conversation = await db.scalar(
+        select(Conversation).filter(
             Conversation.id == conversation_id,
             Conversation.user_id == current_user.id,
         )
-        .first()
     )
 
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
 
     return {"message": "Conversation deleted successfully"}
 
@@ -241,20 +368,18 @@ async def delete_conversation(
 @router.post("/conversations/breakout", response_model=ConversationDetail)
 async def create_breakout_conversation(
     breakout_data: BreakoutConversationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
     """Create a breakout conversation from a multi-model comparison."""
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    parent_conversation = (
-        db.query(Conversation)
-        .filter(
+    parent_conversation = await db.scalar(
+        select(Conversation).filter(
             Conversation.id == breakout_data.parent_conversation_id,
             Conversation.user_id == current_user.id,
         )
-        .first()
     )
 
     if not parent_conversation:
@@ -274,11 +399,12 @@ async def create_breakout_conversation(
         )
 
     parent_messages = (
-        db.query(ConversationMessageModel)
-        .filter(ConversationMessageModel.conversation_id == parent_conversation.id)
-        .order_by(ConversationMessageModel.created_at.asc())
-        .all()
-    )
+        await db.scalars(
+            select(ConversationMessageModel)
+            .filter(ConversationMessageModel.conversation_id == parent_conversation.id)
+            .order_by(ConversationMessageModel.created_at.asc(), ConversationMessageModel.id.asc())
+        )
+    ).all()
 
     breakout_conversation = Conversation(
         user_id=current_user.id,
@@ -296,7 +422,7 @@ async def create_breakout_conversation(
         file_contents=parent_conversation.file_contents,
     )
     db.add(breakout_conversation)
-    db.flush()
+    await db.flush()
 
     for msg in parent_messages:
         if msg.role == "user" or (
@@ -313,47 +439,30 @@ async def create_breakout_conversation(
                 processing_time_ms=msg.processing_time_ms,
                 created_at=msg.created_at,
                 images=msg.images,
+                image_thumbnails=msg.image_thumbnails,
             )
             db.add(new_message)
 
-    db.commit()
-    db.refresh(breakout_conversation)
-
-    new_messages = (
-        db.query(ConversationMessageModel)
-        .filter(ConversationMessageModel.conversation_id == breakout_conversation.id)
-        .order_by(ConversationMessageModel.created_at.asc())
-        .all()
+    await db.flush()
+    await db.execute(
+        conversation_history_trim(
+            current_user.id, get_history_entry_limit(current_user.subscription_tier or "free")
+        )
     )
+    await db.commit()
+    await db.refresh(breakout_conversation)
 
-    from ...schemas import ConversationMessage as ConversationMessageSchema
-
-    message_schemas = [
-        ConversationMessageSchema(
-            id=msg.id,
-            model_id=msg.model_id,
-            role=msg.role,
-            content=msg.content,
-            input_tokens=msg.input_tokens,
-            output_tokens=msg.output_tokens,
-            success=msg.success,
-            processing_time_ms=msg.processing_time_ms,
-            created_at=msg.created_at,
-            images=json.loads(msg.images) if msg.images else None,
-        )
-        for msg in new_messages
-    ]
-
-    breakout_file_contents = [
-        StoredFileContent(
-            name=item.get("name") or "attachment",
-            placeholder=item.get("placeholder") or "",
-            content=item.get("content"),
-            mime_type=item.get("mime_type"),
-            base64_data=item.get("base64_data"),
+    new_messages = (
+        await db.scalars(
+            select(ConversationMessageModel)
+            .filter(ConversationMessageModel.conversation_id == breakout_conversation.id)
+            .order_by(ConversationMessageModel.created_at.asc(), ConversationMessageModel.id.asc())
         )
-        for item in parse_file_contents(breakout_conversation.file_contents)
-    ]
+    ).all()
+
+    message_schemas = [_message_schema(msg) for msg in new_messages]
+
+    breakout_file_contents = _stored_file_contents(breakout_conversation.file_contents)
 
     return ConversationDetail(
         id=breakout_conversation.id,
@@ -5,8 +5,10 @@ import os
 from datetime import datetime
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ...config import ANONYMOUS_MODEL_LIMIT, get_model_limit
@@ -15,16 +17,21 @@ from ...credit_manager import (
     check_and_reset_credits_if_needed,
     ensure_credits_allocated,
 )
-from ...database import get_db
+from ...database import get_async_db, get_db
 from ...dependencies import get_current_user
 from ...model_runner import (
+    count_tokens_under,
     estimate_token_count,
     get_min_max_input_tokens,
     get_model_max_input_tokens,
     is_model_available_for_tier,
 )
 from ...models import AppSettings, User
-from ...rate_limiting import check_anonymous_credits, check_user_credits
+from ...rate_limiting import (
+    anonymous_identifiers,
+    check_user_credits,
+    reserve_anonymous_credits,
+)
 from ...utils.cookies import get_token_from_cookies
 from ...utils.geo import get_location_from_ip, get_timezone_from_request
 from ...utils.request import get_client_ip
@@ -121,17 +128,15 @@ class EstimateTokensResponse(BaseModel):
 
 @router.get("/models")
 async def get_available_models(
+    request: Request,
     current_user: User | None = Depends(get_current_user),
-) -> dict:
-    """Get list of all AI models with tier_access field."""
-    from ...model_runner import (
-        filter_models_by_tier,
-        get_model_supports_image_generation,
-        get_model_supports_temperature,
-        get_model_supports_vision,
-        get_model_token_limits_from_openrouter,
-        resolve_is_thinking_model_for_ui,
-    )
+) -> Response:
+    """Get list of all AI models with tier_access field.
+
+    Bodies are precomputed per tier and carry a strong ETag; a matching
+    ``If-None-Match`` gets ``304 Not Modified``.
+    """
+    from ...services.model_catalog import model_catalog
 
     if current_user:
         tier = current_user.subscription_tier or "free"
@@ -140,108 +145,10 @@ async def get_available_models(
         tier = "unregistered"
         is_trial_active = False
 
-    def get_models():
-        # Reload registry from disk and read via model_runner — `from model_runner import
-        # MODELS_BY_PROVIDER` in this module would stay bound to the initial dict after
-        # reload_registry() reassigns the module globals (admin/UI desync).
-        from ... import model_runner as mr
-        from ...llm.registry import reload_registry
-
-        reload_registry()
-        openrouter_models = mr.OPENROUTER_MODELS
-        models_by_provider = mr.MODELS_BY_PROVIDER
-
-        all_models = filter_models_by_tier(openrouter_models, tier, is_trial_active)
-        for model in all_models:
-            model["supports_temperature"] = get_model_supports_temperature(model["id"])
-            model["supports_vision"] = get_model_supports_vision(model["id"])
-            model["supports_image_generation"] = model.get(
-                "supports_image_generation"
-            ) or get_model_supports_image_generation(model["id"])
-            if model.get("supports_image_generation"):
-                model["image_aspect_ratios"] = model.get("image_aspect_ratios") or [
-                    "9:16",
-                    "2:3",
-                    "3:4",
-                    "4:5",
-                    "1:1",
-                    "5:4",
-                    "4:3",
-                    "3:2",
-                    "16:9",
-                    "21:9",
-                ]
-                model["image_sizes"] = model.get("image_sizes") or ["1K", "2K"]
-            limits = get_model_token_limits_from_openrouter(model["id"])
-            if limits:
-                model["max_input_tokens"] = limits["max_input"]
-                model["max_output_tokens"] = limits["max_output"]
-            else:
-                model["max_input_tokens"] = 8192
-                model["max_output_tokens"] = 8192
-            model["is_thinking_model"] = resolve_is_thinking_model_for_ui(model["id"], model)
-
-        from ...model_runner import sort_models_by_tier_and_version
-
-        models_by_provider_out = {}
-        for provider, models in models_by_provider.items():
-            sorted_models = sort_models_by_tier_and_version(models)
-            provider_models = filter_models_by_tier(sorted_models, tier, is_trial_active)
-            if provider_models:
-                seen_ids: set[str] = set()
-                deduped_models = []
-                for model in provider_models:
-                    mid = model.get("id")
-                    if mid and mid in seen_ids:
-                        continue
-                    if mid:
-                        seen_ids.add(mid)
-                    model["supports_temperature"] = get_model_supports_temperature(model["id"])
-                    model["supports_vision"] = get_model_supports_vision(model["id"])
-                    model["supports_image_generation"] = model.get(
-                        "supports_image_generation"
-                    ) or get_model_supports_image_generation(model["id"])
-                    if model.get("supports_image_generation"):
-                        model["image_aspect_ratios"] = model.get("image_aspect_ratios") or [
-                            "9:16",
-                            "2:3",
-                            "3:4",
-                            "4:5",
-                            "1:1",
-                            "5:4",
-                            "4:3",
-                            "3:2",
-                            "16:9",
-                            "21:9",
-                        ]
-                        model["image_sizes"] = model.get("image_sizes") or ["1K", "2K"]
-                    limits = get_model_token_limits_from_openrouter(model["id"])
-                    if limits:
-                        model["max_input_tokens"] = limits["max_input"]
-                        model["max_output_tokens"] = limits["max_output"]
-                    else:
-                        model["max_input_tokens"] = 8192
-                        model["max_output_tokens"] = 8192
-                    model["is_thinking_model"] = resolve_is_thinking_model_for_ui(
-                        model["id"], model
-                    )
-                    deduped_models.append(model)
-                if deduped_models:
-                    models_by_provider_out[provider] = deduped_models
-
-        return {
-            "models": all_models,
-            "models_by_provider": models_by_provider_out,
-            "user_tier": tier,
-            "is_trial_active": is_trial_active,
-        }
-
-    if is_trial_active:
-        return get_models()
-
-    from ...cache import get_cached_models
-
-    return get_cached_models(get_models)
+    entry = model_catalog.get(tier, is_trial_active)
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=entry.headers)
+    return Response(content=entry.body, media_type="application/json", headers=entry.headers)
 
 
 @router.get("/anonymous-mock-mode-status")
@@ -353,10 +260,16 @@ async def compare_stream(
     request: Request,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
     current_user: User | None = Depends(get_current_user),
 ):
-    """Compare AI models using Server-Sent Events (SSE) streaming."""
-    from decimal import Decimal
+    """Compare AI models using Server-Sent Events (SSE) streaming.
+
+    The preflight must not block the event loop, which also carries every other user's
+    stream: lookups go through the async session, and the sync credit bookkeeping (shared
+    with the stream itself) runs in the threadpool.
+    """
+    from decimal import ROUND_CEILING, Decimal
 
     from ...config.constants import DAILY_CREDIT_LIMITS, SUBSCRIPTION_CONFIG
 
@@ -366,15 +279,13 @@ async def compare_stream(
     if not req.models:
         raise HTTPException(status_code=400, detail="At least one model must be selected")
 
-    from ... import model_runner as mr
-    from ...model_runner import get_model_supports_image_generation
+    from ...model_runner import get_model_capabilities
+
+    capabilities = {mid: get_model_capabilities(mid) for mid in req.models}
 
     def _model_supports_image_gen(mid: str) -> bool:
-        for models in mr.MODELS_BY_PROVIDER.values():
-            for m in models:
-                if m.get("id") == mid and m.get("supports_image_generation"):
-                    return True
-        return get_model_supports_image_generation(mid)
+        rec = capabilities[mid]
+        return bool(rec and rec.supports_image_generation)
 
     has_image_model = any(_model_supports_image_gen(mid) for mid in req.models)
     if has_image_model and current_user is None:
@@ -405,21 +316,16 @@ async def compare_stream(
         input_tokens = req.estimated_input_tokens
     else:
         model_id = req.models[0] if req.models else None
-        input_tokens = estimate_token_count(req.input_data, model_id=model_id)
+        # Long inputs are only tokenized when their estimate comes near the limit
+        input_tokens = count_tokens_under(req.input_data, model_id, min_max_input_tokens)
 
     if input_tokens > min_max_input_tokens:
         problem_models = []
         for model_id in req.models:
             model_max_input = get_model_max_input_tokens(model_id)
             if model_max_input < input_tokens:
-                model_name = None
-                for provider_models in mr.MODELS_BY_PROVIDER.values():
-                    for model in provider_models:
-                        if model.get("id") == model_id:
-                            model_name = model.get("name", model_id)
-                            break
-                    if model_name:
-                        break
+                rec = capabilities[model_id]
+                model_name = (rec.name or model_id) if rec and rec.in_registry else None
                 if not model_name:
                     model_name = model_id.split("/")[-1].replace("-", " ").replace("_", " ").title()
                 problem_models.append(model_name)
@@ -475,11 +381,10 @@ async def compare_stream(
                             if user_id_from_token:
                                 try:
                                     user_id_int = int(user_id_from_token)
-                                    user_from_token = (
-                                        db.query(User).filter(User.id == user_id_int).first()
+                                    user_from_token = await adb.get(
+                                        User, user_id_int, populate_existing=True
                                     )
                                     if user_from_token:
-                                        db.refresh(user_from_token)
                                         if user_from_token.is_active:
                                             subscription_tier = user_from_token.subscription_tier
                                             valid_tiers = [
@@ -574,19 +479,23 @@ async def compare_stream(
 
     num_models = len(req.models)
     client_ip = get_client_ip(request)
-    user_timezone = get_timezone_from_request(req.timezone, current_user, db)
 
-    if current_user and req.timezone:
-        if not current_user.preferences:
-            from ...models import UserPreference
+    def resolve_timezone() -> str:
+        user_timezone = get_timezone_from_request(req.timezone, current_user, db)
+        if current_user and req.timezone:
+            if not current_user.preferences:
+                from ...models import UserPreference
 
-            current_user.preferences = UserPreference(
-                user_id=current_user.id, timezone=user_timezone
-            )
-            db.commit()
-        elif current_user.preferences.timezone != user_timezone:
-            current_user.preferences.timezone = user_timezone
-            db.commit()
+                current_user.preferences = UserPreference(
+                    user_id=current_user.id, timezone=user_timezone
+                )
+                db.commit()
+            elif current_user.preferences.timezone != user_timezone:
+                current_user.preferences.timezone = user_timezone
+                db.commit()
+        return user_timezone
+
+    user_timezone = await run_in_threadpool(resolve_timezone)
 
     user_location = None
     location_source = None
@@ -604,24 +513,57 @@ async def compare_stream(
 
     is_image_by_model = {mid: _model_supports_image_gen(mid) for mid in req.models}
     tokenizer_mid = req.models[0] if req.models else None
-    required_credits = estimate_reserved_credits_for_compare(
-        req.input_data.strip(),
-        req.models,
-        req.conversation_history,
-        tokenizer_mid,
-        is_image_by_model,
-    )
+
+    def reserved_credits(approximate: bool) -> Decimal:
+        return estimate_reserved_credits_for_compare(
+            req.input_data.strip(),
+            req.models,
+            req.conversation_history,
+            tokenizer_mid,
+            is_image_by_model,
+            approximate=approximate,
+        )
+
+    # Priced at the token upper bound first; the exact count only decides a failed check
+    required_credits = reserved_credits(approximate=True)
 
     credits_remaining = 0
     credits_allocated = 0
 
-    if current_user:
+    def check_registered_credits(required: Decimal) -> tuple[bool, int, int, Decimal]:
         check_and_reset_credits_if_needed(current_user.id, db)
         ensure_credits_allocated(current_user.id, db)
         db.refresh(current_user)
-        is_allowed, credits_remaining, credits_allocated = check_user_credits(
-            current_user, required_credits, db
+        is_allowed, remaining, allocated = check_user_credits(current_user, required, db)
+        if not is_allowed:
+            required = reserved_credits(approximate=False)
+            is_allowed, remaining, allocated = check_user_credits(current_user, required, db)
+        return is_allowed, remaining, allocated, required
+
+    identifiers = anonymous_identifiers(client_ip, req.browser_fingerprint)
+    reserved_int = 0
+
+    def reserve_unregistered_credits(required: Decimal) -> tuple[bool, int, int, int]:
+        # Reserved at admission and settled after the stream, so concurrent requests
+        # cannot all pass a check that only one of them fits
+        is_allowed, remaining, allocated = reserve_anonymous_credits(
+            identifiers, required, user_timezone, db
         )
+        if not is_allowed:
+            required = reserved_credits(approximate=False)
+            is_allowed, remaining, allocated = reserve_anonymous_credits(
+                identifiers, required, user_timezone, db
+            )
+        required_int = int(required.quantize(Decimal("1"), rounding=ROUND_CEILING))
+        return is_allowed, remaining, allocated, required_int
+
+    if current_user:
+        (
+            is_allowed,
+            credits_remaining,
+            credits_allocated,
+            required_credits,
+        ) = await run_in_threadpool(check_registered_credits, required_credits)
 
         if not is_allowed:
             tier_name = current_user.subscription_tier or "free"
@@ -668,29 +610,21 @@ async def compare_stream(
                 )
             raise HTTPException(status_code=402, detail=error_msg)
     else:
-        ip_identifier = f"ip:{client_ip}"
-        is_allowed_ip, ip_credits_remaining, ip_credits_allocated = check_anonymous_credits(
-            ip_identifier, required_credits, user_timezone, db
-        )
-        fingerprint_credits_remaining = ip_credits_remaining
-        is_allowed_fp = True
-        if req.browser_fingerprint:
-            fp_identifier = f"fp:{req.browser_fingerprint}"
-            is_allowed_fp, fingerprint_credits_remaining, _ = check_anonymous_credits(
-                fp_identifier, required_credits, user_timezone, db
-            )
-        credits_remaining = min(
-            ip_credits_remaining,
-            fingerprint_credits_remaining if req.browser_fingerprint else ip_credits_remaining,
-        )
-        credits_allocated = ip_credits_allocated
+        (
+            is_allowed,
+            credits_remaining,
+            credits_allocated,
+            reserved_int,
+        ) = await run_in_threadpool(reserve_unregistered_credits, required_credits)
 
-        if not (is_allowed_ip and is_allowed_fp):
+        if not is_allowed:
             raise HTTPException(
                 status_code=402,
                 detail="Not enough credits for this comparison. Credits reset to 50 tomorrow, "
                 "or sign up for a free account to get more credits!",
             )
+        # The reservation is this request's to spend
+        credits_remaining += reserved_int
 
     credits_remaining_ref = [credits_remaining]
     start_time = datetime.now()
@@ -712,6 +646,7 @@ async def compare_stream(
         has_authenticated_user=has_authenticated_user,
         credits_remaining_ref=credits_remaining_ref,
         model_stats=model_stats,
+        reserved_credits=reserved_int,
     )
 
     return StreamingResponse(
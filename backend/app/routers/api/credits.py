@@ -1,12 +1,10 @@
 """Credit routes."""
 
 import json
-from datetime import UTC, datetime, timedelta
-from decimal import ROUND_CEILING, Decimal
+from decimal import Decimal
 
 import pytz
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from ...config.constants import DAILY_CREDIT_LIMITS
@@ -18,11 +16,7 @@ from ...credit_manager import (
 from ...database import get_db
 from ...dependencies import get_current_user
 from ...models import UsageLog, User
-from ...rate_limiting import (
-    _get_local_date,
-    _validate_timezone,
-    anonymous_rate_limit_storage,
-)
+from ...rate_limiting import _validate_timezone, check_anonymous_credits
 from ...utils.request import get_client_ip
 
 router = APIRouter(tags=["API - Credits"])
@@ -83,88 +77,17 @@ async def get_credit_balance(
                 pass
 
     user_timezone = _validate_timezone(user_timezone)
-    tz = pytz.timezone(user_timezone)
-    now_local = datetime.now(tz)
-    today_start_utc = now_local.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(UTC)
-    today_end_utc = (
-        (now_local + timedelta(days=1))
-        .replace(hour=0, minute=0, second=0, microsecond=0)
-        .astimezone(UTC)
-    )
 
-    ip_credits_query = db.query(func.sum(UsageLog.credits_used)).filter(
-        UsageLog.user_id.is_(None),
-        UsageLog.ip_address == client_ip,
-        UsageLog.created_at >= today_start_utc,
-        UsageLog.created_at < today_end_utc,
-        UsageLog.credits_used.isnot(None),
+    # Read from the shared ledger; a balance not yet tracked today is seeded from UsageLog
+    _, ip_credits_remaining, _ = check_anonymous_credits(
+        f"ip:{client_ip}", Decimal(0), user_timezone, db
     )
-    ip_credits_used = ip_credits_query.scalar() or Decimal(0)
-    ip_credits_used_rounded = (
-        int(ip_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-        if ip_credits_used > 0
-        else 0
-    )
-    ip_credits_remaining = max(0, credits_allocated - ip_credits_used_rounded)
 
     fingerprint_credits_remaining = ip_credits_remaining
-    fp_credits_used = Decimal(0)
     if fingerprint:
-        fp_credits_query = db.query(func.sum(UsageLog.credits_used)).filter(
-            UsageLog.user_id.is_(None),
-            UsageLog.browser_fingerprint == fingerprint,
-            UsageLog.created_at >= today_start_utc,
-            UsageLog.created_at < today_end_utc,
-            UsageLog.credits_used.isnot(None),
-        )
-        fp_credits_used = fp_credits_query.scalar() or Decimal(0)
-        fp_credits_used_rounded = (
-            int(fp_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-            if fp_credits_used > 0
-            else 0
+        _, fingerprint_credits_remaining, _ = check_anonymous_credits(
+            f"fp:{fingerprint}", Decimal(0), user_timezone, db
         )
-        fingerprint_credits_remaining = max(0, credits_allocated - fp_credits_used_rounded)
-
-    ip_identifier = f"ip:{client_ip}"
-    today_str = _get_local_date(user_timezone)
-
-    ip_has_admin_reset = anonymous_rate_limit_storage[ip_identifier].get("_admin_reset", False)
-    if ip_has_admin_reset:
-        ip_credits_used_from_storage = anonymous_rate_limit_storage[ip_identifier].get("count", 0)
-        ip_credits_remaining = max(0, credits_allocated - ip_credits_used_from_storage)
-    else:
-        anonymous_rate_limit_storage[ip_identifier] = {
-            "count": (
-                int(ip_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-                if ip_credits_used > 0
-                else 0
-            ),
-            "date": today_str,
-            "timezone": user_timezone,
-            "first_seen": anonymous_rate_limit_storage[ip_identifier].get("first_seen")
-            or datetime.now(UTC),
-        }
-
-    if fingerprint:
-        fp_identifier = f"fp:{fingerprint}"
-        fp_has_admin_reset = anonymous_rate_limit_storage[fp_identifier].get("_admin_reset", False)
-        if fp_has_admin_reset:
-            fp_credits_used_from_storage = anonymous_rate_limit_storage[fp_identifier].get(
-                "count", 0
-            )
-            fingerprint_credits_remaining = max(0, credits_allocated - fp_credits_used_from_storage)
-        else:
-            anonymous_rate_limit_storage[fp_identifier] = {
-                "count": (
-                    int(fp_credits_used.quantize(Decimal("1"), rounding=ROUND_CEILING))
-                    if fp_credits_used > 0
-                    else 0
-                ),
-                "date": today_str,
-                "timezone": user_timezone,
-                "first_seen": anonymous_rate_limit_storage[fp_identifier].get("first_seen")
-                or datetime.now(UTC),
-            }
 
     credits_remaining = min(
         ip_credits_remaining,
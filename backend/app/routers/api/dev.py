@@ -11,10 +11,12 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from ...config.settings import settings
+from ...credit_ledger import anonymous_credit_ledger
 from ...database import get_db
 from ...dependencies import get_current_user
+from ...llm import get_client_pool_stats, get_token_count_stats
 from ...models import Conversation, User
-from ...rate_limiting import anonymous_rate_limit_storage
+from ...services.write_behind import write_behind_queue
 from ...utils.request import get_client_ip
 
 router = APIRouter(tags=["API - Dev"])
@@ -59,6 +61,24 @@ async def get_model_stats():
     return {"model_statistics": stats}
 
 
+@router.get("/dev/openrouter-pool-stats")
+async def get_openrouter_pool_stats():
+    """Get connection pool saturation metrics for the OpenRouter clients."""
+    return get_client_pool_stats()
+
+
+@router.get("/dev/token-count-stats")
+async def get_token_count_cache_stats():
+    """Get hit-rate metrics for the token-count memo."""
+    return get_token_count_stats()
+
+
+@router.get("/dev/write-behind-stats")
+async def get_write_behind_stats():
+    """Get queue depth and throughput of the post-stream write-behind queue."""
+    return write_behind_queue.stats()
+
+
 @router.post("/dev/reset-rate-limit")
 async def reset_rate_limit_dev(
     request: Request,
@@ -87,15 +107,11 @@ async def reset_rate_limit_dev(
         )
         db.commit()
 
-    ip_key = f"ip:{client_ip}"
-    if ip_key in anonymous_rate_limit_storage:
-        del anonymous_rate_limit_storage[ip_key]
+    anonymous_credit_ledger.delete(f"ip:{client_ip}")
 
     fingerprint = req_body.fingerprint
     if fingerprint:
-        fp_key = f"fp:{fingerprint}"
-        if fp_key in anonymous_rate_limit_storage:
-            del anonymous_rate_limit_storage[fp_key]
+        anonymous_credit_ledger.delete(f"fp:{fingerprint}")
 
     from ...routers.auth import failed_login_attempts
 
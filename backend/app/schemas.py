@@ -342,6 +342,9 @@ class ConversationMessage(BaseModel):
     images: list[str] | None = Field(
         None, description="Generated image URLs (for image-generation responses)"
     )
+    image_thumbnails: list[str | None] | None = Field(
+        None, description="Thumbnail URL of each generated image, in the order of images"
+    )
     input_tokens: int | None = Field(
         None, ge=0, description="Input tokens for user messages (from OpenRouter)"
     )
@@ -371,7 +374,10 @@ class ConversationSummary(BaseModel):
     """Schema for conversation list summary."""
 
     id: int
-    input_data: str
+    input_data: str = Field(..., description="The first prompt, cut to a preview when long")
+    input_truncated: bool = Field(
+        default=False, description="Whether input_data is a preview of a longer prompt"
+    )
     models_used: list[str]
     conversation_type: str = Field(
         default="comparison", description="Type of conversation: 'comparison' or 'breakout'"
@@ -400,7 +406,10 @@ class StoredFileContent(BaseModel):
     placeholder: str
     content: str | None = None
     mime_type: str | None = None
-    base64_data: str | None = None
+    base64_data: str | None = None  # Only on attachments saved before the blob store
+    blob_key: str | None = None  # SHA-256 key of the image in the attachment blob store
+    url: str | None = None  # Where the image is served from, for blob_key attachments
+    size: int | None = None  # Image size in bytes, for blob_key attachments
 
 
 class ConversationDetail(BaseModel):
@@ -429,6 +438,10 @@ class ConversationDetail(BaseModel):
     )
     created_at: datetime
     messages: list[ConversationMessage]
+    has_earlier_messages: bool = Field(
+        default=False,
+        description="Whether messages before the returned ones remain (when message_limit is set)",
+    )
     composer_temperature: float | None = None
     composer_top_p: float | None = None
     composer_max_tokens: int | None = None
@@ -4,7 +4,9 @@ Brave Search API provider implementation.
 This module implements the SearchProvider interface for Brave Search API.
 """
 
+import asyncio
 import logging
+import weakref
 
 import httpx
 
@@ -13,6 +15,36 @@ from .retry import RetryConfig, execute_with_retry
 
 logger = logging.getLogger(__name__)
 
+# One pooled client per event loop, shared by every provider instance: httpx async pools
+# are bound to the loop that created them, and a client is dropped with its loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_pooled_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_pooled_clients() -> None:
+    """Close the pooled client of the running event loop, if it made one.
+
+    A client can only be closed from the loop it belongs to, so each loop that searches
+    closes its own on the way down: the application loop at shutdown, the tool loop at its
+    teardown.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
 
 class BraveSearchProvider(SearchProvider):
     """Brave Search API provider."""
@@ -27,13 +59,10 @@ class BraveSearchProvider(SearchProvider):
             api_key: Brave Search API key
         """
         self.api_key = api_key
-        self._client = None
 
     def _get_client(self) -> httpx.AsyncClient:
-        """Get or create HTTP client."""
-        if self._client is None:
-            self._client = httpx.AsyncClient(timeout=30.0)
-        return self._client
+        """Get the pooled HTTP client for the running event loop."""
+        return _get_pooled_client()
 
     async def search(self, query: str, max_results: int = 5) -> list[SearchResult]:
         """
@@ -62,40 +91,34 @@ class BraveSearchProvider(SearchProvider):
         )
 
         async def _execute_search():
-            # Create a fresh client for each attempt to avoid event loop issues
-            # when called from asyncio.run() which creates a new event loop each time
-            client = httpx.AsyncClient(timeout=30.0)
-            try:
-                headers = {
-                    "X-Subscription-Token": self.api_key,
-                    "Accept": "application/json",
-                }
-                params = {
-                    "q": query,
-                    "count": max_results,
-                }
-
-                response = await client.get(self.BASE_URL, headers=headers, params=params)
-                response.raise_for_status()
-
-                data = response.json()
-
-                # Extract results from Brave API response
-                results = []
-                web_results = data.get("web", {}).get("results", [])
-
-                for item in web_results[:max_results]:
-                    result = SearchResult(
-                        title=item.get("title", ""),
-                        url=item.get("url", ""),
-                        snippet=item.get("description", ""),
-                        source="Brave Search",
-                    )
-                    results.append(result)
-
-                return results
-            finally:
-                await client.aclose()
+            headers = {
+                "X-Subscription-Token": self.api_key,
+                "Accept": "application/json",
+            }
+            params = {
+                "q": query,
+                "count": max_results,
+            }
+
+            response = await self._get_client().get(self.BASE_URL, headers=headers, params=params)
+            response.raise_for_status()
+
+            data = response.json()
+
+            # Extract results from Brave API response
+            results = []
+            web_results = data.get("web", {}).get("results", [])
+
+            for item in web_results[:max_results]:
+                result = SearchResult(
+                    title=item.get("title", ""),
+                    url=item.get("url", ""),
+                    snippet=item.get("description", ""),
+                    source="Brave Search",
+                )
+                results.append(result)
+
+            return results
 
         return await execute_with_retry(_execute_search, retry_config, query)
 
@@ -112,7 +135,4 @@ class BraveSearchProvider(SearchProvider):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Async context manager exit - close HTTP client."""
-        if self._client:
-            await self._client.aclose()
-            self._client = None
+        """Async context manager exit - the pooled HTTP client outlives the provider."""
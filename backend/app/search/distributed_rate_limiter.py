@@ -35,7 +35,7 @@ except ImportError:
 from ..config.settings import settings
 
 # Import cache from the original rate limiter
-from .rate_limiter import SearchResultCache
+from .rate_limiter import SearchResultCache, SearchSingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -401,6 +401,7 @@ class DistributedSearchRateLimiter:
         # Cache for request deduplication (shared with in-memory limiter)
         # Import here to avoid circular import with rate_limiter.py
         self.cache = SearchResultCache(ttl_seconds=settings.search_cache_ttl_seconds)
+        self.in_flight = SearchSingleFlight()
 
     def _init_redis(self, redis_url: str):
         """Initialize Redis connection (sync, connection tested on first async use)."""
@@ -821,6 +822,7 @@ class DistributedSearchRateLimiter:
             "redis_enabled": self.use_redis,
             "circuit_breaker_enabled": self.enable_circuit_breaker,
             "rate_limit_events": dict(self._rate_limit_events),
+            "coalesced_searches": self.in_flight.coalesced,
             "providers": {},
         }
 
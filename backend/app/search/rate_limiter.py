@@ -6,7 +6,7 @@ across multiple concurrent model requests, preventing API rate limit exhaustion.
 
 Features:
 - Provider-specific rate limits
-- Request deduplication/caching
+- Request deduplication/caching and coalescing of in-flight identical searches
 - Thread-safe for use from thread pools
 - Configurable via environment variables
 """
@@ -19,10 +19,12 @@ import os
 import threading
 import time
 from collections import deque
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from typing import Any
 
 from ..config.settings import settings
+from ..utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +38,12 @@ class ProviderRateLimitConfig:
     delay_between_requests: float
 
 
+def hash_search_query(provider_name: str, query: str) -> str:
+    """Key identifying a search for deduplication (case- and whitespace-insensitive)."""
+    combined = f"{provider_name}:{query.lower().strip()}"
+    return hashlib.sha256(combined.encode()).hexdigest()
+
+
 class SearchResultCache:
     """Thread-safe cache for search results to enable request deduplication."""
 
@@ -52,8 +60,7 @@ class SearchResultCache:
 
     def _hash_query(self, provider_name: str, query: str) -> str:
         """Generate hash for query deduplication."""
-        combined = f"{provider_name}:{query.lower().strip()}"
-        return hashlib.sha256(combined.encode()).hexdigest()
+        return hash_search_query(provider_name, query)
 
     def get(self, provider_name: str, query: str) -> Any | None:
         """
@@ -108,6 +115,21 @@ class SearchResultCache:
             self._cache.clear()
 
 
+class SearchSingleFlight(SingleFlight):
+    """Coalesces identical searches that are in flight at the same time.
+
+    Concurrent callers with the same ``hash_search_query`` key await the first caller's
+    search instead of issuing their own request, so several models asking the same
+    question in one comparison cost one API call. Completed results are the cache's job.
+    """
+
+    async def run_search(
+        self, provider_name: str, query: str, search: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run ``search`` unless an identical search is already running, then share its result."""
+        return await self.run(hash_search_query(provider_name, query), search)
+
+
 class SearchRateLimiter:
     """
     Provider-aware rate limiter for search API requests.
@@ -149,6 +171,7 @@ class SearchRateLimiter:
 
         # Cache for request deduplication
         self.cache = SearchResultCache(ttl_seconds=settings.search_cache_ttl_seconds)
+        self.in_flight = SearchSingleFlight()
 
         # Monitoring: Track rate limit events
         self._rate_limit_events: dict[str, int] = {}  # provider -> count of rate limit hits
@@ -259,6 +282,7 @@ class SearchRateLimiter:
             "rate_limit_events": dict(self._rate_limit_events),
             "cache_enabled": settings.search_cache_enabled,
             "cache_size": len(self.cache._cache) if hasattr(self.cache, "_cache") else 0,
+            "coalesced_searches": self.in_flight.coalesced,
             "providers": {},
         }
 
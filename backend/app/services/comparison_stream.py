@@ -7,43 +7,56 @@ import json
 import logging
 import math
 import os
-import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import UTC, datetime
 from decimal import Decimal
 from typing import TYPE_CHECKING, Any
 
-from openai import OpenAI
+from sqlalchemy import select
 
 from ..config import get_history_entry_limit
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
-from ..attachment_storage import serialize_attached_images
+from ..attachment_storage import (
+    offload_generated_image,
+    serialize_attached_images,
+    signed_blob_url,
+)
+from ..cache import get_cached_user
 from ..config.constants import OVERAGE_USD_PER_CREDIT
 from ..config.settings import settings
 from ..credit_manager import get_user_credits
 from ..database import SessionLocal
 from ..model_runner import (
-    MODELS_BY_PROVIDER,
-    call_openrouter_streaming,
+    call_openrouter_streaming_async,
     clean_model_response,
     estimate_token_count,
     get_min_max_input_tokens,
     get_min_max_output_tokens,
-    get_model_supports_image_generation,
+    get_model_capabilities,
+)
+from ..models import (
+    AppSettings,
+    Conversation,
+    User,
+    conversation_history_trim,
+    conversation_thread_fingerprint,
 )
-from ..models import AppSettings, Conversation, User
 from ..models import ConversationMessage as ConversationMessageModel
 from ..rate_limiting import (
+    anonymous_identifiers,
     check_anonymous_credits,
-    deduct_anonymous_credits,
     deduct_user_credits,
+    record_anonymous_usage,
+    settle_anonymous_credits,
 )
 from ..routers.api.dev import _default_model_stat
 from ..search.factory import SearchProviderFactory
+from .sse_encoder import SSEEncoder, TokenCoalescer
+from .stream_deadlines import StreamDeadlines
+from .write_behind import write_behind_queue
 
 logger = logging.getLogger(__name__)
 
@@ -65,17 +78,80 @@ class StreamContext:
     is_overage: bool = False
     overage_charge: float = 0.0
     credits_remaining_ref: list[int] = field(default_factory=lambda: [0])
+    # Credits reserved for an unregistered user at admission, settled when the stream ends
+    reserved_credits: int = 0
     model_stats: defaultdict[str, dict[str, Any]] = field(
         default_factory=lambda: defaultdict(_default_model_stat)
     )
 
 
+def find_follow_up_conversation(db: Session, user_id: int, req: Any) -> Conversation | None:
+    """
+    The saved conversation a follow-up comparison continues, if any.
+
+    Found by ``conversation_id`` when the client sends one, otherwise by the thread
+    fingerprint of the selected models and the history's first user message (an indexed
+    point query; the newest match wins).
+    """
+    if not req.conversation_history:
+        return None
+
+    if req.conversation_id:
+        conversation = (
+            db.query(Conversation)
+            .filter(Conversation.id == req.conversation_id, Conversation.user_id == user_id)
+            .first()
+        )
+        if conversation:
+            return conversation
+
+    first_user_message = next(
+        (msg.content for msg in req.conversation_history if msg.role == "user"), None
+    )
+    if not first_user_message:
+        return None
+    return (
+        db.query(Conversation)
+        .filter(
+            Conversation.user_id == user_id,
+            Conversation.thread_fingerprint
+            == conversation_thread_fingerprint(req.models, first_user_message),
+        )
+        .order_by(Conversation.updated_at.desc())
+        .first()
+    )
+
+
+def _anonymous_credits_remaining(identifiers: list[str], timezone_str: str) -> int:
+    """Lowest balance left across an unregistered user's identifiers."""
+    return min(
+        check_anonymous_credits(identifier, Decimal(0), timezone_str)[1]
+        for identifier in identifiers
+    )
+
+
+def _settle_unfinished_reservation(
+    ctx: StreamContext, identifiers: list[str], successful_models: int, credits_used: Decimal
+) -> int:
+    """
+    Settle an unregistered user's reservation for a stream that did not finish: the
+    credits used (at least one) when a model answered, else a full refund.
+    """
+    if successful_models > 0:
+        credits_used = max(credits_used, Decimal(1))
+    else:
+        credits_used = Decimal(0)
+    return settle_anonymous_credits(
+        identifiers, ctx.reserved_credits, credits_used, ctx.user_timezone
+    )
+
+
 async def generate_stream(ctx: StreamContext) -> Any:
     """
     Generate streaming response for all models.
     Async generator that yields SSE-formatted events.
     """
-    from ..model_runner import count_conversation_tokens
+    from ..model_runner import count_conversation_tokens, count_tokens_under
 
     req = ctx.req
     credits_remaining = ctx.credits_remaining_ref
@@ -86,6 +162,7 @@ async def generate_stream(ctx: StreamContext) -> Any:
     failed_models = 0
     results_dict = {}
     images_dict: dict[str, list[str]] = {}
+    thumbnail_urls: dict[str, str] = {}  # Image URL -> its thumbnail's URL
     done_sent: set[str] = set()
     total_input_tokens = 0
     total_output_tokens = 0
@@ -94,19 +171,32 @@ async def generate_stream(ctx: StreamContext) -> Any:
     total_credits_used = Decimal(0)
     billing_fractional_total = Decimal(0)
     total_usd_for_log = Decimal(0)
+    identifiers = (
+        [] if ctx.user_id else anonymous_identifiers(ctx.client_ip, req.browser_fingerprint)
+    )
+    reservation_settled = False
 
     allow_mock_responses = os.environ.get("ENVIRONMENT") in ("development", "test")
     use_mock = False
 
     if ctx.has_authenticated_user and ctx.user_id:
-        fresh_db = SessionLocal()
-        try:
-            fresh_user = fresh_db.query(User).filter(User.id == ctx.user_id).first()
-            if fresh_user and fresh_user.mock_mode_enabled:
-                if allow_mock_responses or fresh_user.role in ["admin", "super_admin"]:
-                    use_mock = True
-        finally:
-            fresh_db.close()
+
+        def load_user(user_id: int) -> User | None:
+            fresh_db = SessionLocal()
+            try:
+                user = fresh_db.get(User, user_id)
+                if user is not None:
+                    fresh_db.expunge(user)
+                return user
+            finally:
+                fresh_db.close()
+
+        # Usually the snapshot get_current_user cached for this request; an admin toggling
+        # mock mode invalidates it
+        fresh_user = get_cached_user(ctx.user_id, load_user)
+        if fresh_user and fresh_user.mock_mode_enabled:
+            if allow_mock_responses or fresh_user.role in ["admin", "super_admin"]:
+                use_mock = True
     elif not ctx.has_authenticated_user:
         if allow_mock_responses:
             from ..cache import get_cached_app_settings
@@ -120,27 +210,34 @@ async def generate_stream(ctx: StreamContext) -> Any:
 
     try:
         model_id = req.models[0] if req.models else None
-        input_tokens = estimate_token_count(req.input_data, model_id=model_id)
-        if req.conversation_history:
-            input_tokens += count_conversation_tokens(req.conversation_history, model_id=model_id)
+        history_tokens = (
+            count_conversation_tokens(req.conversation_history, model_id=model_id)
+            if req.conversation_history
+            else 0
+        )
+        credits_per_model = (
+            Decimal(credits_remaining[0]) / Decimal(ctx.num_models)
+            if ctx.num_models > 0
+            else Decimal(0)
+        )
+        low_credits = credits_remaining[0] > 0 and credits_per_model < 2
 
         effective_max_tokens = get_min_max_output_tokens(req.models)
         # Cap output by (context - input): some providers (e.g. StepFun) enforce input+output <= context_length
         min_max_input = get_min_max_input_tokens(req.models)
+        # An upper bound on the input is as good as its exact count while neither output cap
+        # depends on it; otherwise the input is tokenized
+        input_limit = -1 if low_credits else min_max_input - effective_max_tokens - history_tokens
+        input_tokens = history_tokens + count_tokens_under(req.input_data, model_id, input_limit)
         context_safe_output_cap = max(1, min_max_input - input_tokens)
         effective_max_tokens = min(effective_max_tokens, context_safe_output_cap)
         # User override: cap output length if requested
         if req.max_tokens is not None:
             effective_max_tokens = min(effective_max_tokens, max(256, req.max_tokens))
         credits_limited = False
-        credits_per_model = (
-            Decimal(credits_remaining[0]) / Decimal(ctx.num_models)
-            if ctx.num_models > 0
-            else Decimal(0)
-        )
         MIN_USABLE_OUTPUT_TOKENS = 300
 
-        if credits_remaining[0] > 0 and credits_per_model < 2:
+        if low_credits:
             effective_tokens_per_model = credits_per_model * Decimal(1000)
             max_output_tokens_calc = (effective_tokens_per_model - Decimal(input_tokens)) / Decimal(
                 2.5
@@ -163,14 +260,12 @@ async def generate_stream(ctx: StreamContext) -> Any:
             logger.info(f"Web search requested for comparison with models: {req.models}.")
 
         logger.info(f"[MultiModel] Starting comparison for {len(req.models)} models: {req.models}")
-        for mid in req.models:
-            yield f"data: {json.dumps({'model': mid, 'type': 'start'})}\n\n"
+        encoder = SSEEncoder(req.models)
+        coalescer = TokenCoalescer(encoder, settings.sse_coalesce_window_ms / 1000)
+        yield b"".join(encoder.start(mid) for mid in req.models)
 
         chunk_queue = asyncio.Queue()
-        loop = asyncio.get_event_loop()
-        executor = ThreadPoolExecutor(max_workers=max(len(req.models), 1))
         KEEPALIVE_INTERVAL = 10
-        last_keepalive_sent: dict[str, float] = {}
 
         async def stream_single_model(model_id: str):
             model_content = ""
@@ -179,169 +274,124 @@ async def generate_stream(ctx: StreamContext) -> Any:
             try:
                 enable_web_search_for_model = False
                 search_provider_instance = None
+                capabilities = get_model_capabilities(model_id)
 
                 if req.enable_web_search:
-                    model_supports_web_search = False
-                    for provider_models in MODELS_BY_PROVIDER.values():
-                        for model in provider_models:
-                            if model["id"] == model_id and model.get("supports_web_search"):
-                                model_supports_web_search = True
-                                break
-                        if model_supports_web_search:
-                            break
-
-                    if model_supports_web_search:
+                    if capabilities and capabilities.supports_web_search:
                         search_provider_instance = SearchProviderFactory.get_active_provider(ctx.db)
                         if search_provider_instance:
                             enable_web_search_for_model = True
 
-                is_image_gen = False
-                for models in MODELS_BY_PROVIDER.values():
-                    for m in models:
-                        if m.get("id") == model_id and m.get("supports_image_generation"):
-                            is_image_gen = True
-                            break
-                    if is_image_gen:
-                        break
-                if not is_image_gen:
-                    is_image_gen = get_model_supports_image_generation(model_id)
-
-                def process_stream_to_queue():
-                    content = ""
-                    count = 0
-                    usage_data = None
-                    last_chunk_was_keepalive = False
-
-                    try:
-                        logger.info(f"[MultiModel] {model_id}: thread started")
-                        filtered_history = []
-                        if req.conversation_history:
-                            for msg in req.conversation_history:
-                                if msg.role == "user":
-                                    filtered_history.append(msg)
-                                elif msg.role == "assistant":
-                                    if msg.model_id is None or msg.model_id == model_id:
-                                        filtered_history.append(msg)
-
-                        per_model_client = (
-                            None
-                            if use_mock
-                            else OpenAI(
-                                api_key=settings.openrouter_api_key,
-                                base_url="https://openrouter.ai/api/v1",
-                                default_headers={
-                                    "HTTP-Referer": "https://compareintel.com",
-                                    "X-Title": "CompareIntel",
-                                },
-                            )
-                        )
-                        attached_images_dicts = (
-                            [img.model_dump() for img in req.attached_images]
-                            if getattr(req, "attached_images", None)
-                            else None
-                        )
-                        image_config = getattr(req, "image_config", None) or None
-
-                        gen = call_openrouter_streaming(
-                            req.input_data,
-                            model_id,
-                            filtered_history,
-                            use_mock,
-                            max_tokens_override=effective_max_tokens,
-                            credits_limited=credits_limited,
-                            enable_web_search=enable_web_search_for_model,
-                            search_provider=search_provider_instance,
-                            user_timezone=ctx.user_timezone,
-                            user_location=ctx.user_location,
-                            location_source=ctx.location_source,
-                            temperature=req.temperature,
-                            top_p=req.top_p,
-                            attached_images=attached_images_dicts,
-                            is_image_generation=is_image_gen,
-                            image_config=image_config if is_image_gen else None,
-                            _client=per_model_client,
-                        )
+                is_image_gen = bool(capabilities and capabilities.supports_image_generation)
+
+                content = ""
+                count = 0
+                usage_data = None
+                last_chunk_was_keepalive = False
+                is_error = False
+
+                filtered_history = []
+                if req.conversation_history:
+                    for msg in req.conversation_history:
+                        if msg.role == "user":
+                            filtered_history.append(msg)
+                        elif msg.role == "assistant":
+                            if msg.model_id is None or msg.model_id == model_id:
+                                filtered_history.append(msg)
+
+                attached_images_dicts = (
+                    [img.model_dump() for img in req.attached_images]
+                    if getattr(req, "attached_images", None)
+                    else None
+                )
+                image_config = getattr(req, "image_config", None) or None
 
-                        logger.info(f"[MultiModel] {model_id}: calling API")
-                        try:
-                            while True:
-                                chunk = next(gen)
-                                if isinstance(chunk, dict) and chunk.get("type") == "image":
-                                    asyncio.run_coroutine_threadsafe(
-                                        chunk_queue.put(
-                                            {
-                                                "type": "image",
-                                                "model": model_id,
-                                                "url": chunk.get("url", ""),
-                                            }
-                                        ),
-                                        loop,
-                                    )
-                                    continue
-                                if isinstance(chunk, dict) and chunk.get("type") == "reasoning":
-                                    asyncio.run_coroutine_threadsafe(
-                                        chunk_queue.put(
-                                            {
-                                                "type": "reasoning",
-                                                "model": model_id,
-                                                "content": chunk.get("content") or "",
-                                            }
-                                        ),
-                                        loop,
-                                    )
-                                    continue
-                                is_keepalive = False
-                                if chunk == " ":
-                                    if len(content) == 0:
-                                        is_keepalive = True
-                                    elif content.rstrip() != content:
-                                        is_keepalive = True
-                                    elif last_chunk_was_keepalive:
-                                        is_keepalive = True
-
-                                if is_keepalive:
-                                    last_chunk_was_keepalive = True
-                                    asyncio.run_coroutine_threadsafe(
-                                        chunk_queue.put({"type": "keepalive", "model": model_id}),
-                                        loop,
-                                    )
-                                else:
-                                    last_chunk_was_keepalive = False
-                                    content += chunk
-                                    count += 1
-                                    asyncio.run_coroutine_threadsafe(
-                                        chunk_queue.put(
-                                            {
-                                                "type": "chunk",
-                                                "model": model_id,
-                                                "content": chunk,
-                                                "chunk_count": count,
-                                            }
-                                        ),
-                                        loop,
+                try:
+                    logger.info(f"[MultiModel] {model_id}: calling API")
+                    async for chunk in call_openrouter_streaming_async(
+                        req.input_data,
+                        model_id,
+                        filtered_history,
+                        use_mock,
+                        max_tokens_override=effective_max_tokens,
+                        credits_limited=credits_limited,
+                        enable_web_search=enable_web_search_for_model,
+                        search_provider=search_provider_instance,
+                        user_timezone=ctx.user_timezone,
+                        user_location=ctx.user_location,
+                        location_source=ctx.location_source,
+                        temperature=req.temperature,
+                        top_p=req.top_p,
+                        attached_images=attached_images_dicts,
+                        is_image_generation=is_image_gen,
+                        image_config=image_config if is_image_gen else None,
+                    ):
+                        if isinstance(chunk, dict):
+                            chunk_type = chunk.get("type")
+                            if chunk_type == "usage":
+                                usage_data = chunk.get("usage")
+                            elif chunk_type == "image":
+                                url = chunk.get("url", "")
+                                thumbnail_url = None
+                                # Saved history refers to blobs; anonymous history is kept
+                                # by the browser only, so its images stay inline
+                                if ctx.user_id and url:
+                                    url, thumbnail_url = await asyncio.to_thread(
+                                        offload_generated_image, url
                                     )
-                        except StopIteration as e:
-                            usage_data = e.value
-
-                        logger.info(
-                            f"[MultiModel] {model_id}: streaming complete, {count} chunks, content_len={len(content)}"
-                        )
-                        return content, False, usage_data
-
-                    except Exception as e:
-                        error_msg = f"Error: {str(e)[:100]}"
-                        logger.error(f"[MultiModel] {model_id}: EXCEPTION: {str(e)}", exc_info=True)
-                        asyncio.run_coroutine_threadsafe(
-                            chunk_queue.put(
-                                {"type": "chunk", "model": model_id, "content": error_msg}
-                            ),
-                            loop,
-                        )
-                        return error_msg, True, None
+                                chunk_queue.put_nowait(
+                                    {
+                                        "type": "image",
+                                        "model": model_id,
+                                        "url": url,
+                                        "thumbnail_url": thumbnail_url,
+                                    }
+                                )
+                            elif chunk_type == "reasoning":
+                                chunk_queue.put_nowait(
+                                    {
+                                        "type": "reasoning",
+                                        "model": model_id,
+                                        "content": chunk.get("content") or "",
+                                    }
+                                )
+                            continue
+                        is_keepalive = False
+                        if chunk == " ":
+                            if len(content) == 0:
+                                is_keepalive = True
+                            elif content.rstrip() != content:
+                                is_keepalive = True
+                            elif last_chunk_was_keepalive:
+                                is_keepalive = True
+
+                        if is_keepalive:
+                            last_chunk_was_keepalive = True
+                            chunk_queue.put_nowait({"type": "keepalive", "model": model_id})
+                        else:
+                            last_chunk_was_keepalive = False
+                            content += chunk
+                            count += 1
+                            chunk_queue.put_nowait(
+                                {
+                                    "type": "chunk",
+                                    "model": model_id,
+                                    "content": chunk,
+                                    "chunk_count": count,
+                                }
+                            )
 
-                full_content, is_error, usage_data = await loop.run_in_executor(
-                    executor, process_stream_to_queue
-                )
+                    logger.info(
+                        f"[MultiModel] {model_id}: streaming complete, {count} chunks, content_len={len(content)}"
+                    )
+                    full_content = content
+                except Exception as e:
+                    full_content = f"Error: {str(e)[:100]}"
+                    is_error = True
+                    logger.error(f"[MultiModel] {model_id}: EXCEPTION: {str(e)}", exc_info=True)
+                    chunk_queue.put_nowait(
+                        {"type": "chunk", "model": model_id, "content": full_content}
+                    )
 
                 if not is_error:
                     model_content = clean_model_response(full_content)
@@ -398,166 +448,89 @@ async def generate_stream(ctx: StreamContext) -> Any:
                 await chunk_queue.put({"type": "chunk", "model": model_id, "content": error_msg})
                 return {"model": model_id, "content": error_msg, "error": True, "usage": None}
 
+        def queued_event(chunk_data: dict[str, Any]) -> bytes:
+            """SSE frame(s) for an item a model task put on chunk_queue.
+
+            Text is buffered in the coalescer; other events flush the model's buffered text
+            first so per-model ordering is kept.
+            """
+            chunk_type = chunk_data["type"]
+            mid = chunk_data["model"]
+            if chunk_type in ("chunk", "reasoning"):
+                coalescer.add(mid, chunk_type, chunk_data["content"])
+                return b""
+            if chunk_type == "image":
+                url = chunk_data.get("url", "")
+                thumbnail_url = chunk_data.get("thumbnail_url")
+                if mid and url:
+                    lst = images_dict.setdefault(mid, [])
+                    if url not in lst:
+                        lst.append(url)
+                    if thumbnail_url:
+                        thumbnail_urls[url] = thumbnail_url
+                if ctx.user_id:
+                    # Saved messages keep plain blob URLs; until the conversation is saved the
+                    # user can only fetch the images through URLs signed for them
+                    url = signed_blob_url(url, ctx.user_id)
+                    if thumbnail_url:
+                        thumbnail_url = signed_blob_url(thumbnail_url, ctx.user_id)
+                return coalescer.flush(mid) + encoder.image(mid, url, thumbnail_url)
+            if chunk_type == "keepalive":
+                return coalescer.flush(mid) + encoder.keepalive(mid)
+            return b""
+
+        tasks: list[asyncio.Task] = []
+        queue_get: asyncio.Future | None = None
         try:
             tasks = [asyncio.create_task(stream_single_model(mid)) for mid in req.models]
             task_to_model = {task: mid for task, mid in zip(tasks, req.models)}
             pending_tasks = set(tasks)
-            model_last_activity = {mid: time.time() for mid in req.models}
+            # Keepalive and inactivity timers; the loop sleeps until the next one is due or a
+            # chunk / task completion arrives, so an idle comparison costs no CPU.
+            deadlines = StreamDeadlines(
+                req.models,
+                {"keepalive": KEEPALIVE_INTERVAL, "inactivity": model_inactivity_timeout},
+            )
 
             while pending_tasks or not chunk_queue.empty():
-                chunks_processed = False
-                current_time = time.time()
-
-                timed_out_tasks = set()
-                for task in list(pending_tasks):
-                    if task.done():
-                        continue
-                    mid = task_to_model.get(task)
-                    if mid and mid in model_last_activity:
-                        time_since_activity = current_time - model_last_activity[mid]
-                        if time_since_activity > model_inactivity_timeout:
-                            logger.warning(
-                                f"Model {mid} timed out after {model_inactivity_timeout}s of inactivity"
-                            )
-                            task.cancel()
-                            timed_out_tasks.add(task)
-                            timeout_msg = "Error: Model timed out after 1 minute of inactivity"
-                            results_dict[mid] = timeout_msg
-                            done_sent.add(mid)
-                            model_stats[mid]["failure"] += 1
-                            failed_models += 1
-                            yield f"data: {json.dumps({'model': mid, 'type': 'chunk', 'content': timeout_msg})}\n\n"
-                            yield f"data: {json.dumps({'model': mid, 'type': 'done', 'error': True})}\n\n"
-                            if mid in model_last_activity:
-                                del model_last_activity[mid]
-
-                pending_tasks -= timed_out_tasks
-
-                while not chunk_queue.empty():
-                    try:
-                        chunk_data = await asyncio.wait_for(chunk_queue.get(), timeout=0.001)
-                        chunk_model_id = chunk_data.get("model")
-                        if chunk_model_id:
-                            model_last_activity[chunk_model_id] = time.time()
-
-                        if chunk_data["type"] == "chunk":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'chunk', 'content': chunk_data['content']})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "reasoning":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'reasoning', 'content': chunk_data['content']})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "image":
-                            mid = chunk_data.get("model")
-                            url = chunk_data.get("url", "")
-                            if mid and url:
-                                lst = images_dict.setdefault(mid, [])
-                                if url not in lst:
-                                    lst.append(url)
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'image', 'url': chunk_data.get('url', '')})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "keepalive":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'keepalive'})}\n\n"
-                            chunks_processed = True
-                    except TimeoutError:
-                        break
-
-                for task in list(pending_tasks):
-                    mid = task_to_model.get(task)
-                    if not mid:
-                        continue
-                    last_activity = model_last_activity.get(mid, 0)
-                    if current_time - last_activity >= KEEPALIVE_INTERVAL:
-                        last_sent = last_keepalive_sent.get(mid, 0)
-                        if current_time - last_sent >= KEEPALIVE_INTERVAL:
-                            yield f"data: {json.dumps({'model': mid, 'type': 'keepalive'})}\n\n"
-                            last_keepalive_sent[mid] = current_time
-                            model_last_activity[mid] = current_time
-                            chunks_processed = True
-
-                await asyncio.sleep(0)
-
+                # Everything produced in one pass goes out as a single write.
+                frames: list[bytes] = []
+                ready: list[dict[str, Any]] = []
+                if queue_get is not None and queue_get.done():
+                    ready.append(queue_get.result())
+                    queue_get = None
                 while not chunk_queue.empty():
-                    try:
-                        chunk_data = await asyncio.wait_for(chunk_queue.get(), timeout=0.001)
-                        chunk_model_id = chunk_data.get("model")
-                        if chunk_model_id:
-                            model_last_activity[chunk_model_id] = time.time()
-                        if chunk_data["type"] == "chunk":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'chunk', 'content': chunk_data['content']})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "reasoning":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'reasoning', 'content': chunk_data['content']})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "image":
-                            mid = chunk_data.get("model")
-                            url = chunk_data.get("url", "")
-                            if mid and url:
-                                lst = images_dict.setdefault(mid, [])
-                                if url not in lst:
-                                    lst.append(url)
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'image', 'url': chunk_data.get('url', '')})}\n\n"
-                            chunks_processed = True
-                        elif chunk_data["type"] == "keepalive":
-                            yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'keepalive'})}\n\n"
-                            chunks_processed = True
-                    except TimeoutError:
-                        break
-
-                done_tasks = set()
-                for task in list(pending_tasks):
-                    if task.done():
-                        logger.info(f"[MultiModel] Task done for model {task_to_model.get(task)}")
-                        done_tasks.add(task)
-                        pending_tasks.remove(task)
-
-                if done_tasks:
-                    await asyncio.sleep(0)
-                    while not chunk_queue.empty():
-                        try:
-                            chunk_data = await asyncio.wait_for(chunk_queue.get(), timeout=0.001)
-                            chunk_model_id = chunk_data.get("model")
-                            if chunk_model_id:
-                                model_last_activity[chunk_model_id] = time.time()
-                            if chunk_data["type"] == "chunk":
-                                yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'chunk', 'content': chunk_data['content']})}\n\n"
-                                chunks_processed = True
-                            elif chunk_data["type"] == "reasoning":
-                                yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'reasoning', 'content': chunk_data['content']})}\n\n"
-                                chunks_processed = True
-                            elif chunk_data["type"] == "image":
-                                mid = chunk_data.get("model")
-                                url = chunk_data.get("url", "")
-                                if mid and url:
-                                    lst = images_dict.setdefault(mid, [])
-                                    if url not in lst:
-                                        lst.append(url)
-                                yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'image', 'url': chunk_data.get('url', '')})}\n\n"
-                                chunks_processed = True
-                            elif chunk_data["type"] == "keepalive":
-                                yield f"data: {json.dumps({'model': chunk_data['model'], 'type': 'keepalive'})}\n\n"
-                                chunks_processed = True
-                        except TimeoutError:
-                            break
-
+                    ready.append(chunk_queue.get_nowait())
+                for chunk_data in ready:
+                    chunk_model_id = chunk_data.get("model")
+                    if chunk_model_id:
+                        deadlines.touch(chunk_model_id)
+                    frames.append(queued_event(chunk_data))
+                if coalescer.window == 0 or coalescer.due():
+                    frames.append(coalescer.flush())
+
+                done_tasks = {task for task in pending_tasks if task.done()}
+                pending_tasks -= done_tasks
                 for task in done_tasks:
                     mid = task_to_model.get(task)
                     if not mid:
                         continue
+                    logger.info(f"[MultiModel] Task done for model {mid}")
+                    deadlines.discard(mid)
+                    frames.append(coalescer.flush(mid))
 
                     if task.cancelled():
                         continue
 
                     try:
-                        result = await task
-                    except asyncio.CancelledError:
-                        continue
+                        result = task.result()
                     except Exception as e:
                         logger.error(f"Task for model {mid} failed: {e}", exc_info=True)
                         results_dict[mid] = f"Error: {str(e)[:100]}"
                         done_sent.add(mid)
                         failed_models += 1
                         model_stats[mid]["failure"] += 1
-                        yield f"data: {json.dumps({'model': mid, 'type': 'done', 'error': True})}\n\n"
+                        frames.append(encoder.done(mid, True))
                         continue
 
                     result_model_id = result.get("model")
@@ -603,16 +576,64 @@ async def generate_stream(ctx: StreamContext) -> Any:
                     logger.info(
                         f"[MultiModel] {mid}: sending done event, error={result['error']}, content_len={len(result.get('content', ''))}"
                     )
-                    yield f"data: {json.dumps({'model': mid, 'type': 'done', 'error': result['error']})}\n\n"
+                    frames.append(encoder.done(mid, result["error"]))
 
-                if pending_tasks and not chunks_processed:
-                    await asyncio.sleep(0.01)
-                elif chunks_processed:
-                    await asyncio.sleep(0)
+                for mid, kind in deadlines.pop_due():
+                    task = next(
+                        (t for t in pending_tasks if task_to_model.get(t) == mid and not t.done()),
+                        None,
+                    )
+                    if task is None:
+                        continue
+                    if kind == "keepalive":
+                        frames.append(coalescer.flush(mid) + encoder.keepalive(mid))
+                        deadlines.touch(mid)
+                        continue
+                    logger.warning(
+                        f"Model {mid} timed out after {model_inactivity_timeout}s of inactivity"
+                    )
+                    task.cancel()
+                    pending_tasks.discard(task)
+                    deadlines.discard(mid)
+                    timeout_msg = "Error: Model timed out after 1 minute of inactivity"
+                    results_dict[mid] = timeout_msg
+                    done_sent.add(mid)
+                    model_stats[mid]["failure"] += 1
+                    failed_models += 1
+                    frames.append(coalescer.flush(mid))
+                    frames.append(encoder.text(mid, "chunk", timeout_msg))
+                    frames.append(encoder.done(mid, True))
+
+                batch = b"".join(frames)
+                if batch:
+                    yield batch
+
+                if not pending_tasks or not chunk_queue.empty():
+                    continue
+                if queue_get is None:
+                    queue_get = asyncio.ensure_future(chunk_queue.get())
+                timeouts = [
+                    t
+                    for t in (deadlines.next_timeout(), coalescer.time_until_flush())
+                    if t is not None
+                ]
+                await asyncio.wait(
+                    {queue_get, *pending_tasks},
+                    timeout=min(timeouts) if timeouts else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
 
         finally:
-            executor.shutdown(wait=False)
-
+            if queue_get is not None and not queue_get.done():
+                queue_get.cancel()
+            # Client disconnects close this generator mid-loop; stop the upstream streams too.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        tail = coalescer.flush()
+        if tail:
+            yield tail
         logger.info(
             f"[MultiModel] While loop exited. done_sent={done_sent}, pending_tasks remaining={len(pending_tasks)}"
         )
@@ -624,7 +645,7 @@ async def generate_stream(ctx: StreamContext) -> Any:
                     and str(results_dict.get(mid, "")).startswith("Error:")
                 )
                 logger.info(f"[MultiModel] Safety check: sending done for {mid}, error={is_err}")
-                yield f"data: {json.dumps({'model': mid, 'type': 'done', 'error': is_err})}\n\n"
+                yield encoder.done(mid, is_err)
             else:
                 logger.info(f"[MultiModel] Safety check: {mid} already in done_sent")
 
@@ -658,83 +679,33 @@ async def generate_stream(ctx: StreamContext) -> Any:
                         credit_db.refresh(credit_user)
                         credits_remaining[0] = get_user_credits(ctx.user_id, credit_db)
                 else:
-                    ip_identifier = f"ip:{ctx.client_ip}"
-                    deduct_anonymous_credits(ip_identifier, total_credits_used, ctx.user_timezone)
-                    _, ip_credits_remaining, _ = check_anonymous_credits(
-                        ip_identifier, Decimal(0), ctx.user_timezone
+                    # Redis calls: kept off the event loop
+                    credits_remaining[0] = await asyncio.to_thread(
+                        settle_anonymous_credits,
+                        identifiers,
+                        ctx.reserved_credits,
+                        total_credits_used,
+                        ctx.user_timezone,
                     )
-                    fingerprint_credits_remaining = ip_credits_remaining
-                    if req.browser_fingerprint:
-                        fp_identifier = f"fp:{req.browser_fingerprint}"
-                        deduct_anonymous_credits(
-                            fp_identifier, total_credits_used, ctx.user_timezone
-                        )
-                        _, fingerprint_credits_remaining, _ = check_anonymous_credits(
-                            fp_identifier, Decimal(0), ctx.user_timezone
-                        )
-                        credits_remaining[0] = min(
-                            ip_credits_remaining,
-                            fingerprint_credits_remaining,
-                        )
-                    else:
-                        credits_remaining[0] = ip_credits_remaining
+                    reservation_settled = True
             except Exception as e:
                 logger.error(f"Credit deduction failed: {e}", exc_info=True)
                 if not ctx.user_id:
-                    ip_identifier = f"ip:{ctx.client_ip}"
-                    _, ip_credits_remaining, _ = check_anonymous_credits(
-                        ip_identifier, Decimal(0), ctx.user_timezone
+                    credits_remaining[0] = await asyncio.to_thread(
+                        _anonymous_credits_remaining, identifiers, ctx.user_timezone
                     )
-                    fingerprint_credits_remaining = ip_credits_remaining
-                    if req.browser_fingerprint:
-                        fp_identifier = f"fp:{req.browser_fingerprint}"
-                        _, fingerprint_credits_remaining, _ = check_anonymous_credits(
-                            fp_identifier, Decimal(0), ctx.user_timezone
-                        )
-                        credits_remaining[0] = min(
-                            ip_credits_remaining,
-                            fingerprint_credits_remaining,
-                        )
-                    else:
-                        credits_remaining[0] = ip_credits_remaining
             finally:
                 credit_db.close()
-        else:
-            if not ctx.user_id:
-                ip_identifier = f"ip:{ctx.client_ip}"
-                _, ip_credits_remaining, _ = check_anonymous_credits(
-                    ip_identifier, Decimal(0), ctx.user_timezone
-                )
-                fingerprint_credits_remaining = ip_credits_remaining
-                if req.browser_fingerprint:
-                    fp_identifier = f"fp:{req.browser_fingerprint}"
-                    _, fingerprint_credits_remaining, _ = check_anonymous_credits(
-                        fp_identifier, Decimal(0), ctx.user_timezone
-                    )
-                    credits_remaining[0] = min(
-                        ip_credits_remaining,
-                        fingerprint_credits_remaining,
-                    )
-                else:
-                    credits_remaining[0] = ip_credits_remaining
-
-        if not ctx.user_id and successful_models > 0:
-            ip_identifier = f"ip:{ctx.client_ip}"
-            _, ip_credits_remaining, _ = check_anonymous_credits(
-                ip_identifier, Decimal(0), ctx.user_timezone
+        elif not ctx.user_id:
+            # Nothing to bill: the reservation is refunded
+            credits_remaining[0] = await asyncio.to_thread(
+                settle_anonymous_credits,
+                identifiers,
+                ctx.reserved_credits,
+                Decimal(0),
+                ctx.user_timezone,
             )
-            fingerprint_credits_remaining = ip_credits_remaining
-            if req.browser_fingerprint:
-                fp_identifier = f"fp:{req.browser_fingerprint}"
-                _, fingerprint_credits_remaining, _ = check_anonymous_credits(
-                    fp_identifier, Decimal(0), ctx.user_timezone
-                )
-                credits_remaining[0] = min(
-                    ip_credits_remaining,
-                    fingerprint_credits_remaining,
-                )
-            else:
-                credits_remaining[0] = ip_credits_remaining
+            reservation_settled = True
 
         processing_time_ms = int((datetime.now() - ctx.start_time).total_seconds() * 1000)
 
@@ -774,187 +745,114 @@ async def generate_stream(ctx: StreamContext) -> Any:
 
         from ..models import UsageLog
 
-        usage_log = UsageLog(
-            user_id=ctx.user_id,
-            ip_address=ctx.client_ip,
-            browser_fingerprint=req.browser_fingerprint,
-            models_used=json.dumps(req.models),
-            input_length=len(req.input_data),
-            models_requested=len(req.models),
-            models_successful=successful_models,
-            models_failed=failed_models,
-            processing_time_ms=processing_time_ms,
-            estimated_cost=len(req.models) * 0.0166,
-            is_overage=ctx.is_overage,
-            overage_charge=ctx.overage_charge,
-            input_tokens=total_input_tokens if total_input_tokens > 0 else None,
-            output_tokens=total_output_tokens if total_output_tokens > 0 else None,
-            total_tokens=(
+        usage_log_fields = {
+            "user_id": ctx.user_id,
+            "ip_address": ctx.client_ip,
+            "browser_fingerprint": req.browser_fingerprint,
+            "models_used": json.dumps(req.models),
+            "input_length": len(req.input_data),
+            "models_requested": len(req.models),
+            "models_successful": successful_models,
+            "models_failed": failed_models,
+            "processing_time_ms": processing_time_ms,
+            "estimated_cost": len(req.models) * 0.0166,
+            "is_overage": ctx.is_overage,
+            "overage_charge": ctx.overage_charge,
+            "input_tokens": total_input_tokens if total_input_tokens > 0 else None,
+            "output_tokens": total_output_tokens if total_output_tokens > 0 else None,
+            "total_tokens": (
                 total_input_tokens + total_output_tokens
                 if (total_input_tokens > 0 or total_output_tokens > 0)
                 else None
             ),
-            effective_tokens=total_effective_tokens if total_effective_tokens > 0 else None,
-            credits_used=total_credits_used,
-            actual_cost=total_usd_for_log if total_usd_for_log > 0 else None,
-        )
-        log_db = SessionLocal()
-        try:
-            log_db.add(usage_log)
-            log_db.commit()
-        except Exception as e:
-            logger.error(f"Failed to commit UsageLog: {e}")
-            log_db.rollback()
-        finally:
-            log_db.close()
+            "effective_tokens": total_effective_tokens if total_effective_tokens > 0 else None,
+            "credits_used": total_credits_used,
+            "actual_cost": total_usd_for_log if total_usd_for_log > 0 else None,
+        }
+        completed_at = datetime.now(UTC)
+
+        def write_usage_log(log_db: Session) -> None:
+            log_db.add(UsageLog(**usage_log_fields))
+            if not ctx.user_id:
+                record_anonymous_usage(
+                    log_db,
+                    ctx.client_ip,
+                    req.browser_fingerprint,
+                    total_credits_used,
+                    at=completed_at,
+                )
+
+        write_behind_queue.submit(f"usage log of {ctx.client_ip}", write_usage_log)
 
         if ctx.user_id and successful_models > 0:
 
-            def save_conversation_to_db():
-                conv_db = SessionLocal()
-                try:
-                    is_follow_up = bool(
-                        req.conversation_history and len(req.conversation_history) > 0
-                    )
-                    existing_conversation: Conversation | None = None
-
-                    if is_follow_up:
-                        if req.conversation_id:
-                            conversation_by_id = (
-                                conv_db.query(Conversation)
-                                .filter(
-                                    Conversation.id == req.conversation_id,
-                                    Conversation.user_id == ctx.user_id,
-                                )
-                                .first()
-                            )
-                            if conversation_by_id:
-                                existing_conversation = conversation_by_id
-
-                        if not existing_conversation:
-                            original_input_data = None
-                            for msg in req.conversation_history:
-                                if msg.role == "user":
-                                    original_input_data = msg.content
-                                    break
-
-                            req_models_sorted = sorted(req.models)
-                            all_user_conversations = (
-                                conv_db.query(Conversation)
-                                .filter(Conversation.user_id == ctx.user_id)
-                                .order_by(Conversation.updated_at.desc())
-                                .all()
-                            )
+            def save_conversation_to_db(conv_db: Session) -> None:
+                existing_conversation = find_follow_up_conversation(conv_db, ctx.user_id, req)
 
-                            for conv in all_user_conversations:
-                                try:
-                                    conv_models = (
-                                        json.loads(conv.models_used) if conv.models_used else []
-                                    )
-                                    models_match = sorted(conv_models) == req_models_sorted
-                                    input_matches = (
-                                        original_input_data
-                                        and conv.input_data == original_input_data
-                                    )
-                                    if models_match and input_matches:
-                                        existing_conversation = conv
-                                        break
-                                except (json.JSONDecodeError, TypeError):
-                                    continue
-
-                    if existing_conversation:
-                        conversation = existing_conversation
-                        conversation.updated_at = datetime.now()
-                    else:
-                        file_contents_json = serialize_attached_images(
-                            getattr(req, "attached_images", None)
-                        )
-                        conversation = Conversation(
-                            user_id=ctx.user_id,
-                            input_data=req.input_data,
-                            models_used=json.dumps(req.models),
-                            file_contents=file_contents_json,
-                        )
-                        conv_db.add(conversation)
-                        conv_db.flush()
+                if existing_conversation:
+                    conversation = existing_conversation
+                    conversation.updated_at = datetime.now()
+                else:
+                    file_contents_json = serialize_attached_images(
+                        getattr(req, "attached_images", None)
+                    )
+                    conversation = Conversation(
+                        user_id=ctx.user_id,
+                        input_data=req.input_data,
+                        models_used=json.dumps(req.models),
+                        file_contents=file_contents_json,
+                    )
+                    conv_db.add(conversation)
+                    conv_db.flush()
 
-                    if req.image_config is None:
-                        conversation.composer_temperature = req.temperature
-                        conversation.composer_top_p = req.top_p
-                        conversation.composer_max_tokens = req.max_tokens
-                    else:
-                        ic = req.image_config if isinstance(req.image_config, dict) else {}
-                        ar = ic.get("aspect_ratio")
-                        sz = ic.get("image_size")
-                        conversation.composer_aspect_ratio = str(ar) if ar is not None else None
-                        conversation.composer_image_size = str(sz) if sz is not None else None
-
-                    user_input_tokens = None
-                    actual_prompt_tokens = None
-                    if usage_data_dict:
-                        first_model_usage = next(iter(usage_data_dict.values()))
-                        if first_model_usage:
-                            actual_prompt_tokens = first_model_usage.prompt_tokens
-
-                    if actual_prompt_tokens is not None and existing_conversation:
-                        previous_user_messages = (
-                            conv_db.query(ConversationMessageModel)
-                            .filter(
-                                ConversationMessageModel.conversation_id == conversation.id,
-                                ConversationMessageModel.role == "user",
-                            )
-                            .all()
-                        )
-                        previous_assistant_messages = (
-                            conv_db.query(ConversationMessageModel)
-                            .filter(
-                                ConversationMessageModel.conversation_id == conversation.id,
-                                ConversationMessageModel.role == "assistant",
-                            )
-                            .all()
-                        )
-                        sum_previous_user_tokens = sum(
-                            msg.input_tokens
-                            for msg in previous_user_messages
-                            if msg.input_tokens is not None
-                        )
-                        sum_previous_assistant_tokens = sum(
-                            msg.output_tokens
-                            for msg in previous_assistant_messages
-                            if msg.output_tokens is not None
-                        )
-                        sum_previous_tokens = (
-                            sum_previous_user_tokens + sum_previous_assistant_tokens
+                if req.image_config is None:
+                    conversation.composer_temperature = req.temperature
+                    conversation.composer_top_p = req.top_p
+                    conversation.composer_max_tokens = req.max_tokens
+                else:
+                    ic = req.image_config if isinstance(req.image_config, dict) else {}
+                    ar = ic.get("aspect_ratio")
+                    sz = ic.get("image_size")
+                    conversation.composer_aspect_ratio = str(ar) if ar is not None else None
+                    conversation.composer_image_size = str(sz) if sz is not None else None
+
+                user_input_tokens = None
+                actual_prompt_tokens = None
+                if usage_data_dict:
+                    first_model_usage = next(iter(usage_data_dict.values()))
+                    if first_model_usage:
+                        actual_prompt_tokens = first_model_usage.prompt_tokens
+
+                if actual_prompt_tokens is not None and existing_conversation:
+                    previous_user_messages = (
+                        conv_db.query(ConversationMessageModel)
+                        .filter(
+                            ConversationMessageModel.conversation_id == conversation.id,
+                            ConversationMessageModel.role == "user",
                         )
-                        has_previous_messages = (
-                            previous_user_messages or previous_assistant_messages
+                        .all()
+                    )
+                    previous_assistant_messages = (
+                        conv_db.query(ConversationMessageModel)
+                        .filter(
+                            ConversationMessageModel.conversation_id == conversation.id,
+                            ConversationMessageModel.role == "assistant",
                         )
-                        if not has_previous_messages or sum_previous_tokens == 0:
-                            if req.models:
-                                try:
-                                    user_input_tokens = estimate_token_count(
-                                        req.input_data, model_id=req.models[0]
-                                    )
-                                except Exception:
-                                    user_input_tokens = estimate_token_count(
-                                        req.input_data, model_id=None
-                                    )
-                            else:
-                                user_input_tokens = actual_prompt_tokens - sum_previous_tokens
-                                if (
-                                    user_input_tokens < 0
-                                    or user_input_tokens < len(req.input_data) // 10
-                                ):
-                                    if req.models:
-                                        try:
-                                            user_input_tokens = estimate_token_count(
-                                                req.input_data, model_id=req.models[0]
-                                            )
-                                        except Exception:
-                                            user_input_tokens = estimate_token_count(
-                                                req.input_data, model_id=None
-                                            )
-                    else:
+                        .all()
+                    )
+                    sum_previous_user_tokens = sum(
+                        msg.input_tokens
+                        for msg in previous_user_messages
+                        if msg.input_tokens is not None
+                    )
+                    sum_previous_assistant_tokens = sum(
+                        msg.output_tokens
+                        for msg in previous_assistant_messages
+                        if msg.output_tokens is not None
+                    )
+                    sum_previous_tokens = sum_previous_user_tokens + sum_previous_assistant_tokens
+                    has_previous_messages = previous_user_messages or previous_assistant_messages
+                    if not has_previous_messages or sum_previous_tokens == 0:
                         if req.models:
                             try:
                                 user_input_tokens = estimate_token_count(
@@ -965,91 +863,100 @@ async def generate_stream(ctx: StreamContext) -> Any:
                                     req.input_data, model_id=None
                                 )
                         else:
+                            user_input_tokens = actual_prompt_tokens - sum_previous_tokens
+                            if (
+                                user_input_tokens < 0
+                                or user_input_tokens < len(req.input_data) // 10
+                            ):
+                                if req.models:
+                                    try:
+                                        user_input_tokens = estimate_token_count(
+                                            req.input_data, model_id=req.models[0]
+                                        )
+                                    except Exception:
+                                        user_input_tokens = estimate_token_count(
+                                            req.input_data, model_id=None
+                                        )
+                else:
+                    if req.models:
+                        try:
+                            user_input_tokens = estimate_token_count(
+                                req.input_data, model_id=req.models[0]
+                            )
+                        except Exception:
                             user_input_tokens = estimate_token_count(req.input_data, model_id=None)
-
-                    user_msg = ConversationMessageModel(
-                        conversation_id=conversation.id,
-                        role="user",
-                        content=req.input_data,
-                        model_id=None,
-                        input_tokens=user_input_tokens,
-                    )
-                    conv_db.add(user_msg)
-
-                    for mid, content in results_dict.items():
-                        has_content = (
-                            not content.startswith("Error:") and content and content.strip()
+                    else:
+                        user_input_tokens = estimate_token_count(req.input_data, model_id=None)
+
+                user_msg = ConversationMessageModel(
+                    conversation_id=conversation.id,
+                    role="user",
+                    content=req.input_data,
+                    model_id=None,
+                    input_tokens=user_input_tokens,
+                )
+                conv_db.add(user_msg)
+
+                for mid, content in results_dict.items():
+                    has_content = not content.startswith("Error:") and content and content.strip()
+                    has_images = mid in images_dict and images_dict[mid]
+                    if has_content or has_images:
+                        output_tokens = None
+                        if mid in usage_data_dict:
+                            output_tokens = usage_data_dict[mid].completion_tokens
+                        images_json = None
+                        thumbnails_json = None
+                        if has_images:
+                            images_json = json.dumps(images_dict[mid])
+                            thumbnails = [thumbnail_urls.get(url) for url in images_dict[mid]]
+                            if any(thumbnails):
+                                thumbnails_json = json.dumps(thumbnails)
+                        assistant_msg = ConversationMessageModel(
+                            conversation_id=conversation.id,
+                            role="assistant",
+                            content=content if has_content else "",
+                            model_id=mid,
+                            success=True,
+                            processing_time_ms=processing_time_ms,
+                            output_tokens=output_tokens,
+                            images=images_json,
+                            image_thumbnails=thumbnails_json,
                         )
-                        has_images = mid in images_dict and images_dict[mid]
-                        if has_content or has_images:
-                            output_tokens = None
-                            if mid in usage_data_dict:
-                                output_tokens = usage_data_dict[mid].completion_tokens
-                            images_json = None
-                            if has_images:
-                                images_json = json.dumps(images_dict[mid])
-                            assistant_msg = ConversationMessageModel(
-                                conversation_id=conversation.id,
-                                role="assistant",
-                                content=content if has_content else "",
-                                model_id=mid,
-                                success=True,
-                                processing_time_ms=processing_time_ms,
-                                output_tokens=output_tokens,
-                                images=images_json,
-                            )
-                            conv_db.add(assistant_msg)
-
-                    conv_db.commit()
-
-                    user_obj = conv_db.query(User).filter(User.id == ctx.user_id).first()
-                    tier = user_obj.subscription_tier if user_obj else "free"
-                    storage_limit = get_history_entry_limit(tier)
-
-                    all_conversations = (
-                        conv_db.query(Conversation)
-                        .filter(Conversation.user_id == ctx.user_id)
-                        .order_by(Conversation.created_at.desc())
-                        .all()
-                    )
+                        conv_db.add(assistant_msg)
 
-                    if len(all_conversations) > storage_limit:
-                        conversations_to_delete = all_conversations[storage_limit:]
-                        for conv_to_delete in conversations_to_delete:
-                            conv_db.delete(conv_to_delete)
-                        conv_db.commit()
+                conv_db.flush()
 
-                except Exception as e:
-                    logger.error(f"Failed to save conversation to database: {e}", exc_info=True)
-                    conv_db.rollback()
-                finally:
-                    conv_db.close()
-
-            try:
-                loop = asyncio.get_running_loop()
-                future = loop.run_in_executor(None, save_conversation_to_db)
-
-                def log_executor_error(fut):
-                    try:
-                        fut.result()
-                    except Exception as e:
-                        logger.error(f"Exception in save_conversation_to_db executor: {e}")
+                tier = conv_db.scalar(select(User.subscription_tier).where(User.id == ctx.user_id))
+                conv_db.execute(
+                    conversation_history_trim(ctx.user_id, get_history_entry_limit(tier or "free"))
+                )
 
-                future.add_done_callback(log_executor_error)
-            except Exception as e:
-                logger.error(f"Failed to start save_conversation_to_db executor: {e}")
-                try:
-                    save_conversation_to_db()
-                except Exception as e2:
-                    logger.error(f"Fallback synchronous save also failed: {e2}")
+            # Awaited, unlike the usage log: history reloaded on "complete" must include it
+            if not await write_behind_queue.write(
+                f"conversation of user {ctx.user_id}", save_conversation_to_db
+            ):
+                logger.error(f"[MultiModel] Conversation of user {ctx.user_id} was not saved")
 
-        yield f"data: {json.dumps({'type': 'complete', 'metadata': metadata})}\n\n"
+        yield encoder.event({"type": "complete", "metadata": metadata})
 
     except Exception as e:
         logger.error(f"[MultiModel] Outer exception: {type(e).__name__}: {str(e)}", exc_info=True)
         error_msg = f"Error: {str(e)[:200]}"
         has_partial_results = successful_models > 0 or len(results_dict) > 0
 
+        if not ctx.user_id and not reservation_settled:
+            try:
+                credits_remaining[0] = await asyncio.to_thread(
+                    _settle_unfinished_reservation,
+                    ctx,
+                    identifiers,
+                    successful_models,
+                    total_credits_used,
+                )
+                reservation_settled = True
+            except Exception as settle_error:
+                logger.error(f"Credit reservation settlement failed: {settle_error}")
+
         if has_partial_results:
             processing_time_ms = int((datetime.now() - ctx.start_time).total_seconds() * 1000)
             partial_metadata = {
@@ -1064,6 +971,17 @@ async def generate_stream(ctx: StreamContext) -> Any:
                 "credits_remaining": int(credits_remaining[0]),
                 "error": error_msg,
             }
-            yield f"data: {json.dumps({'type': 'complete', 'metadata': partial_metadata})}\n\n"
+            yield SSEEncoder.event({"type": "complete", "metadata": partial_metadata})
         else:
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
+            yield SSEEncoder.event({"type": "error", "message": error_msg})
+
+    finally:
+        # Client gone (cancelled or closed mid-stream) before the reservation was settled.
+        # Settled inline: under cancellation an await here would be cancelled too.
+        if not ctx.user_id and not reservation_settled:
+            try:
+                _settle_unfinished_reservation(
+                    ctx, identifiers, successful_models, total_credits_used
+                )
+            except Exception as settle_error:
+                logger.error(f"Credit reservation settlement failed: {settle_error}")
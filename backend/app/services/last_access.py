@@ -0,0 +1,109 @@
+"""Coalesced last_access updates for authenticated requests.
+
+``get_current_user`` records an access here instead of committing one: a user's accesses
+within ``min_interval`` seconds count once, and the recorded timestamps are written every
+``flush_interval`` seconds as one executemany UPDATE through the write-behind queue. The
+UPDATE goes through the users table, not the mapper, so it does not invalidate the cached
+user snapshots.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import UTC, datetime
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from ..config.settings import settings
+from ..models import User
+from .write_behind import write_behind_queue
+
+logger = logging.getLogger(__name__)
+
+_users = User.__table__
+
+
+class LastAccessRecorder:
+    """Collects users' latest access times until the next flush."""
+
+    def __init__(self, min_interval: float = 60.0, flush_interval: float = 30.0):
+        self.min_interval = min_interval
+        self.flush_interval = flush_interval
+        self._pending: dict[int, datetime] = {}
+        self._recorded: dict[int, float] = {}  # user id -> monotonic time of its last record
+        self._lock = threading.Lock()
+
+    def touch(self, user_id: int, last_access: datetime | None = None) -> None:
+        """
+        Record an access by ``user_id`` now, unless one was recorded (or, per the stored
+        ``last_access``, written) within ``min_interval`` seconds.
+        """
+        now = datetime.now(UTC)
+        if last_access is not None:
+            # Normalize last_access to UTC-aware if it's naive (for SQLite compatibility)
+            if last_access.tzinfo is None:
+                last_access = last_access.replace(tzinfo=UTC)
+            if (now - last_access).total_seconds() <= self.min_interval:
+                return
+
+        tick = time.monotonic()
+        with self._lock:
+            recorded = self._recorded.get(user_id)
+            if recorded is not None and tick - recorded <= self.min_interval:
+                return
+            self._recorded[user_id] = tick
+            self._pending[user_id] = now
+
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def take(self) -> dict[int, datetime]:
+        """Hand over the recorded accesses, forgetting those older than ``min_interval``."""
+        tick = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._recorded = {
+                user_id: recorded
+                for user_id, recorded in self._recorded.items()
+                if tick - recorded <= self.min_interval
+            }
+        return pending
+
+    def flush(self) -> int:
+        """Queue one UPDATE of every recorded access; returns the number of users."""
+        pending = self.take()
+        if not pending:
+            return 0
+
+        def write_last_access(db: Session) -> None:
+            write_accesses(db, pending)
+
+        write_behind_queue.submit(f"last access of {len(pending)} users", write_last_access)
+        return len(pending)
+
+
+def write_accesses(db: Session, accesses: dict[int, datetime]) -> None:
+    """Set last_access for many users in one executemany UPDATE."""
+    db.execute(
+        update(_users)
+        .where(_users.c.id == bindparam("user_id"))
+        .values(last_access=bindparam("at")),
+        [{"user_id": user_id, "at": at} for user_id, at in accesses.items()],
+    )
+
+
+last_access_recorder = LastAccessRecorder(
+    flush_interval=settings.last_access_flush_interval_seconds
+)
+
+
+async def run_last_access_flusher(interval_seconds: float) -> None:
+    """Flush recorded accesses every ``interval_seconds`` for the lifetime of a worker."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            last_access_recorder.flush()
+        except Exception as e:
+            logger.warning(f"Last access flush failed: {e}")
@@ -10,7 +10,7 @@ from typing import Any
 
 import httpx
 
-from ..model_runner import MODELS_BY_PROVIDER
+from ..model_runner import get_capability_index
 
 logger = logging.getLogger(__name__)
 
@@ -123,19 +123,12 @@ class ModelCapabilityService:
 
     async def get_models_with_web_search(self) -> list[str]:
         """
-        Get list of model IDs that support web search (from MODELS_BY_PROVIDER).
+        Get list of model IDs that support web search (from the registry).
 
         Returns:
             List of model IDs that have supports_web_search=True
         """
-        models_with_web_search = []
-
-        for provider, models in MODELS_BY_PROVIDER.items():
-            for model in models:
-                if model.get("supports_web_search") is True:
-                    models_with_web_search.append(model["id"])
-
-        return models_with_web_search
+        return list(get_capability_index().web_search_model_ids)
 
     async def __aenter__(self):
         """Async context manager entry."""
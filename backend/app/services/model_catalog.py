@@ -0,0 +1,239 @@
+"""
+Precomputed ``GET /api/models`` responses.
+
+The response only varies by the caller's tier and trial state, so the catalog renders
+the annotated model lists once per registry / snapshot / token-limit change, serializes
+them, and keeps one ready-made body with a strong ETag per ``(tier, is_trial_active)``.
+Serving a request is then a dict lookup plus a byte write.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from ..config.constants import SUBSCRIPTION_CONFIG
+from ..llm import registry
+from ..llm.tokens import get_model_token_limits_from_openrouter, get_model_token_limits_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_ASPECT_RATIOS = [
+    "9:16",
+    "2:3",
+    "3:4",
+    "4:5",
+    "1:1",
+    "5:4",
+    "4:3",
+    "3:2",
+    "16:9",
+    "21:9",
+]
+DEFAULT_IMAGE_SIZES = ["1K", "2K"]
+
+# Browsers keep the body but must revalidate it with If-None-Match on every use
+MODELS_CACHE_CONTROL = "private, no-cache"
+
+# How often the registry and snapshot files are stat()ed for edits made by other processes
+_SOURCE_CHECK_INTERVAL_SECONDS = 1.0
+
+_PRECOMPUTED_TIERS = ("unregistered", *SUBSCRIPTION_CONFIG)
+
+
+def _dumps(value: Any) -> bytes:
+    # Same encoding as FastAPI's JSONResponse
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+@dataclass(frozen=True)
+class CatalogResponse:
+    """One serialized ``/models`` body and its validator."""
+
+    body: bytes
+    etag: str
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"ETag": self.etag, "Cache-Control": MODELS_CACHE_CONTROL}
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """True when an ``If-None-Match`` header lists this body's ETag (weak comparison)."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == self.etag:
+                return True
+        return False
+
+
+def _annotate(model: dict[str, Any], index: registry.CapabilityIndex) -> dict[str, Any]:
+    """Add the capability fields the frontend reads to a tier-annotated model copy."""
+    mid = model["id"]
+    rec = index.get(mid)
+    model["supports_temperature"] = rec.supports_temperature if rec else True
+    model["supports_vision"] = rec.supports_vision if rec else False
+    model["supports_image_generation"] = model.get("supports_image_generation") or bool(
+        rec and rec.outputs_images
+    )
+    if model.get("supports_image_generation"):
+        model["image_aspect_ratios"] = model.get("image_aspect_ratios") or list(
+            DEFAULT_IMAGE_ASPECT_RATIOS
+        )
+        model["image_sizes"] = model.get("image_sizes") or list(DEFAULT_IMAGE_SIZES)
+    limits = get_model_token_limits_from_openrouter(mid)
+    if limits:
+        model["max_input_tokens"] = limits["max_input"]
+        model["max_output_tokens"] = limits["max_output"]
+    else:
+        model["max_input_tokens"] = 8192
+        model["max_output_tokens"] = 8192
+    if rec is not None:
+        model["is_thinking_model"] = rec.is_thinking_model
+    else:
+        model["is_thinking_model"] = registry.resolve_is_thinking_model_for_ui(mid, model)
+    return model
+
+
+def build_models_payload(tier: str, is_trial_active: bool) -> dict[str, Any]:
+    """The ``/models`` response for one tier, built from the loaded registry."""
+    index = registry.get_capability_index()
+    all_models = [
+        _annotate(m, index)
+        for m in registry.filter_models_by_tier(registry.OPENROUTER_MODELS, tier, is_trial_active)
+    ]
+
+    models_by_provider_out = {}
+    for provider, models in registry.MODELS_BY_PROVIDER.items():
+        sorted_models = registry.sort_models_by_tier_and_version(models)
+        provider_models = registry.filter_models_by_tier(sorted_models, tier, is_trial_active)
+        seen_ids: set[str] = set()
+        deduped_models = []
+        for model in provider_models:
+            mid = model.get("id")
+            if mid and mid in seen_ids:
+                continue
+            if mid:
+                seen_ids.add(mid)
+            deduped_models.append(_annotate(model, index))
+        if deduped_models:
+            models_by_provider_out[provider] = deduped_models
+
+    return {
+        "models": all_models,
+        "models_by_provider": models_by_provider_out,
+        "user_tier": tier,
+        "is_trial_active": is_trial_active,
+    }
+
+
+class _Rendering:
+    """Serialized model lists for one state of the registry, snapshot and token limits."""
+
+    def __init__(self, stamp: tuple[Any, ...]):
+        self.stamp = stamp
+        # Only the free tier's trial flag changes the lists (``trial_unlocked``)
+        self._fragments: dict[bool, bytes] = {}
+        self.responses: dict[tuple[str, bool], CatalogResponse] = {}
+
+    def response(self, tier: str, is_trial_active: bool) -> CatalogResponse:
+        key = (tier, is_trial_active)
+        entry = self.responses.get(key)
+        if entry is not None:
+            return entry
+        trial_unlocks = tier == "free" and is_trial_active
+        fragment = self._fragments.get(trial_unlocks)
+        if fragment is None:
+            payload = build_models_payload("free" if trial_unlocks else tier, trial_unlocks)
+            body = _dumps(payload)
+            # Splice point: everything before the per-caller tier fields
+            fragment = body[: body.rindex(b',"user_tier":')]
+            self._fragments[trial_unlocks] = fragment
+        body = (
+            fragment
+            + b',"user_tier":'
+            + _dumps(tier)
+            + b',"is_trial_active":'
+            + _dumps(is_trial_active)
+            + b"}"
+        )
+        entry = CatalogResponse(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        self.responses[key] = entry
+        return entry
+
+
+class ModelCatalog:
+    """Process-wide holder of precomputed ``/models`` responses."""
+
+    def __init__(self) -> None:
+        self._rendering: _Rendering | None = None
+        self._lock = threading.Lock()
+        self._file_mtimes: tuple[int | None, int | None] | None = None
+        self._next_source_check = 0.0
+
+    @staticmethod
+    def _mtime_ns(path) -> int | None:
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_source_files(self) -> None:
+        """Reload the registry or snapshot when another process rewrote them on disk."""
+        now = time.monotonic()
+        if now < self._next_source_check:
+            return
+        self._next_source_check = now + _SOURCE_CHECK_INTERVAL_SECONDS
+        mtimes = (
+            self._mtime_ns(registry.get_registry_path()),
+            self._mtime_ns(registry.get_openrouter_models_json_path()),
+        )
+        previous, self._file_mtimes = self._file_mtimes, mtimes
+        if previous is None or previous == mtimes:
+            return
+        if previous[0] != mtimes[0]:
+            logger.info("models_registry.json changed on disk; reloading registry")
+            registry.reload_registry()
+        if previous[1] != mtimes[1]:
+            logger.info("openrouter_models.json changed on disk; rebuilding capabilities")
+            registry.invalidate_openrouter_models_json_caches()
+
+    def get(self, tier: str, is_trial_active: bool) -> CatalogResponse:
+        """The response for a caller, rendering it if the sources changed since last time."""
+        self._check_source_files()
+        # The capability index is replaced (never mutated) on every registry / snapshot reload,
+        # so holding it in the stamp and comparing by identity detects both kinds of reload
+        stamp = (registry.get_capability_index(), get_model_token_limits_version())
+        rendering = self._rendering
+        if rendering is None or rendering.stamp != stamp:
+            with self._lock:
+                rendering = self._rendering
+                if rendering is None or rendering.stamp != stamp:
+                    rendering = self._render(stamp)
+        entry = rendering.responses.get((tier, is_trial_active))
+        if entry is None:
+            entry = rendering.response(tier, is_trial_active)
+        return entry
+
+    def _render(self, stamp: tuple[Any, ...]) -> _Rendering:
+        rendering = _Rendering(stamp)
+        for tier in _PRECOMPUTED_TIERS:
+            for is_trial_active in (False, True):
+                rendering.response(tier, is_trial_active)
+        # Rendering can load token limits and bump their version; stamp what was rendered
+        rendering.stamp = (stamp[0], get_model_token_limits_version())
+        self._rendering = rendering
+        return rendering
+
+    def invalidate(self) -> None:
+        """Drop all rendered responses; the next request renders fresh ones."""
+        self._rendering = None
+
+
+model_catalog = ModelCatalog()
@@ -0,0 +1,148 @@
+"""SSE frame encoding and token coalescing for the comparison stream."""
+
+import json
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON as UTF-8 bytes: orjson, or stdlib json for what orjson rejects."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # orjson rejects lone surrogates and int subclasses json accepts; stay lenient.
+            pass
+    # ensure_ascii keeps lone surrogates encodable, as the stream always did with json.dumps.
+    return json.dumps(value, separators=(",", ":")).encode("ascii")
+
+
+class SSEEncoder:
+    """Builds ``data: {...}\\n\\n`` frames for a fixed set of models.
+
+    The ``{"model": ..., "type": ...`` prefix of every per-model frame is encoded once, and
+    constant frames (start, keepalive, done) are cached whole, so a token frame only has
+    to escape its content string.
+    """
+
+    def __init__(self, models: Iterable[str]):
+        self._prefixes: dict[tuple[str, str], bytes] = {}
+        self._frames: dict[tuple[str, str, Any], bytes] = {}
+        for model_id in models:
+            self._register(model_id)
+
+    def _register(self, model_id: str) -> None:
+        model_json = dumps(model_id)
+        for event_type in ("start", "keepalive", "done", "chunk", "reasoning", "image"):
+            self._prefixes[(model_id, event_type)] = (
+                b'data: {"model":' + model_json + b',"type":"' + event_type.encode() + b'"'
+            )
+
+    def _prefix(self, model_id: str, event_type: str) -> bytes:
+        prefix = self._prefixes.get((model_id, event_type))
+        if prefix is None:
+            self._register(model_id)
+            prefix = self._prefixes[(model_id, event_type)]
+        return prefix
+
+    def _constant(self, model_id: str, event_type: str, suffix: bytes, key: Any = None) -> bytes:
+        cache_key = (model_id, event_type, key)
+        frame = self._frames.get(cache_key)
+        if frame is None:
+            frame = self._prefix(model_id, event_type) + suffix + b"}\n\n"
+            self._frames[cache_key] = frame
+        return frame
+
+    def start(self, model_id: str) -> bytes:
+        return self._constant(model_id, "start", b"")
+
+    def keepalive(self, model_id: str) -> bytes:
+        return self._constant(model_id, "keepalive", b"")
+
+    def done(self, model_id: str, error: Any) -> bytes:
+        if isinstance(error, bool):
+            return self._constant(model_id, "done", b',"error":' + dumps(error), error)
+        return self._prefix(model_id, "done") + b',"error":' + dumps(error) + b"}\n\n"
+
+    def text(self, model_id: str, event_type: str, content: str) -> bytes:
+        """Frame for a ``chunk`` or ``reasoning`` event."""
+        return self._prefix(model_id, event_type) + b',"content":' + dumps(content) + b"}\n\n"
+
+    def image(self, model_id: str, url: str, thumbnail_url: str | None = None) -> bytes:
+        frame = self._prefix(model_id, "image") + b',"url":' + dumps(url)
+        if thumbnail_url:
+            frame += b',"thumbnail_url":' + dumps(thumbnail_url)
+        return frame + b"}\n\n"
+
+    @staticmethod
+    def event(payload: dict[str, Any]) -> bytes:
+        """Frame for an arbitrary event (complete / error)."""
+        return b"data: " + dumps(payload) + b"\n\n"
+
+
+class TokenCoalescer:
+    """Merges text events that arrive within ``window`` seconds into one frame per run.
+
+    Consecutive ``chunk`` (or ``reasoning``) pieces from the same model are concatenated,
+    so the client sees identical text in fewer frames. Per-model ordering is preserved:
+    anything else for a model (image, keepalive, done) must be preceded by
+    ``flush(model_id)``. With ``window == 0`` nothing is held back across loop iterations;
+    pieces drained together are still merged.
+    """
+
+    def __init__(
+        self,
+        encoder: SSEEncoder,
+        window: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._encoder = encoder
+        self.window = max(0.0, window)
+        self._clock = clock
+        # model_id -> list of [event_type, [pieces]] runs, in arrival order
+        self._pending: dict[str, list[list[Any]]] = {}
+        self._first_at: float | None = None
+
+    def add(self, model_id: str, event_type: str, content: str) -> None:
+        runs = self._pending.setdefault(model_id, [])
+        if runs and runs[-1][0] == event_type:
+            runs[-1][1].append(content)
+        else:
+            runs.append([event_type, [content]])
+        if self._first_at is None:
+            self._first_at = self._clock()
+
+    def time_until_flush(self) -> float | None:
+        """Seconds until buffered text is due, or None when nothing is buffered."""
+        if self._first_at is None:
+            return None
+        return max(0.0, self._first_at + self.window - self._clock())
+
+    def due(self) -> bool:
+        remaining = self.time_until_flush()
+        return remaining is not None and remaining <= 0
+
+    def flush(self, model_id: str | None = None) -> bytes:
+        """Encode and clear buffered text for one model, or for all models."""
+        if model_id is None:
+            model_ids = list(self._pending)
+        elif model_id in self._pending:
+            model_ids = [model_id]
+        else:
+            return b""
+        frames = []
+        for mid in model_ids:
+            for event_type, pieces in self._pending.pop(mid):
+                frames.append(self._encoder.text(mid, event_type, "".join(pieces)))
+        if not self._pending:
+            self._first_at = None
+        return b"".join(frames)
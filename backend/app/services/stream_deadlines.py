@@ -0,0 +1,71 @@
+"""Deadline timers for the comparison SSE multiplexer."""
+
+import heapq
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+
+class StreamDeadlines:
+    """Per-model activity deadlines (keepalive, inactivity) on a lazy min-heap.
+
+    ``touch`` only records the activity time, so it stays O(1) per streamed chunk. Heap
+    entries are re-validated when they come due: an entry whose model has been active
+    since it was pushed is moved to its real deadline instead of firing. The heap holds
+    one entry per (model, kind), and the multiplexer sleeps until ``next_timeout``.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[str],
+        intervals: dict[str, float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._intervals = dict(intervals)
+        now = clock()
+        self._last_activity: dict[str, float] = {}
+        self._heap: list[tuple[float, str, str]] = []
+        for model_id in models:
+            self._last_activity[model_id] = now
+            for kind, interval in self._intervals.items():
+                self._heap.append((now + interval, kind, model_id))
+        heapq.heapify(self._heap)
+
+    def touch(self, model_id: str) -> None:
+        """Record activity for a tracked model (ignored once the model is discarded)."""
+        if model_id in self._last_activity:
+            self._last_activity[model_id] = self._clock()
+
+    def discard(self, model_id: str) -> None:
+        """Stop tracking a model; its heap entries are dropped lazily."""
+        self._last_activity.pop(model_id, None)
+
+    def next_timeout(self) -> float | None:
+        """Seconds until the earliest pending deadline, or None when nothing is tracked."""
+        while self._heap and self._heap[0][2] not in self._last_activity:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self._clock())
+
+    def pop_due(self) -> Iterator[tuple[str, str]]:
+        """Yield ``(model_id, kind)`` for deadlines that have passed.
+
+        Lazy so that a ``touch`` or ``discard`` made while handling one deadline is seen
+        when the next one is validated.
+        """
+        while self._heap:
+            when, kind, model_id = self._heap[0]
+            now = self._clock()
+            if when > now:
+                return
+            heapq.heappop(self._heap)
+            last_activity = self._last_activity.get(model_id)
+            if last_activity is None:
+                continue
+            deadline = last_activity + self._intervals[kind]
+            if deadline > now:
+                heapq.heappush(self._heap, (deadline, kind, model_id))
+                continue
+            heapq.heappush(self._heap, (now + self._intervals[kind], kind, model_id))
+            yield model_id, kind
@@ -0,0 +1,258 @@
+"""Write-behind queue for the bookkeeping that follows a finished comparison stream.
+
+The usage log and the anonymous usage rollup are not needed to answer the request, so
+``generate_stream`` queues them here (``submit``) instead of opening a session and
+committing for each. The saved conversation is queued the same way but awaited
+(``write``) before the stream completes, so history reloaded right after a comparison
+includes it. A worker task on the event loop collects the queued writes and runs them in
+the threadpool, many comparisons per transaction:
+
+- Latency is bounded: a batch is written at most ``max_delay`` seconds after its first
+  write was queued, or as soon as ``max_batch`` writes are waiting.
+- Each write is flushed on its own, so one that fails (bad data, constraint violation) is
+  dropped and the rest of the batch is written without it.
+- Transient database errors (locked database, lost connection) retry the whole batch with
+  backoff, up to ``max_attempts`` tries.
+- ``stop`` drains everything still queued, so a graceful shutdown loses nothing.
+- Without a running worker (scripts, tests, a lifespan that did not start it) writes go
+  straight to the threadpool; the event loop never runs a commit itself.
+
+Credit deduction is not queued: it stays synchronous in the stream, which reports the
+remaining balance.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session
+
+from ..config.settings import settings
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Adds rows to the session; called again with a new session when its batch is retried
+WriteJob = Callable[[Session], None]
+
+# A queued write, and the future of a caller awaiting its commit (None when submitted)
+_Write = tuple[str, WriteJob, "asyncio.Future[bool] | None"]
+
+_RETRY_BACKOFF_SECONDS = 0.5
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a database error is worth retrying (the data itself was not rejected)."""
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class WriteBehindQueue:
+    """Batches queued writes into shared transactions, off the event loop."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_batch: int = 100,
+        max_delay: float = 0.2,
+        max_attempts: int = 3,
+    ):
+        self._session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay)
+        self.max_attempts = max(1, max_attempts)
+        self._pending: deque[_Write] = deque()
+        self._detached: set[asyncio.Future] = set()  # Written in the threadpool, no worker
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._stopping = False
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "peak_depth": 0,
+            "last_batch_size": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    @property
+    def depth(self) -> int:
+        """Writes queued and not yet committed."""
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def submit(self, description: str, job: WriteJob) -> None:
+        """
+        Queue a write. Without a running worker it is written at once: in the threadpool
+        when called on an event loop, else synchronously.
+        """
+        if self.running:
+            self._enqueue((description, job, None))
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_batch([(description, job, None)])
+            return
+        future = loop.run_in_executor(None, self._write_batch, [(description, job, None)])
+        self._detached.add(future)
+        future.add_done_callback(self._detached.discard)
+
+    async def write(self, description: str, job: WriteJob) -> bool:
+        """Queue a write and wait for its batch; returns whether it was committed."""
+        if not self.running:
+            (written,) = await asyncio.to_thread(self._write_batch, [(description, job, None)])
+            return written
+        done: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        self._enqueue((description, job, done))
+        return await done
+
+    def _enqueue(self, item: _Write) -> None:
+        with self._lock:
+            self._pending.append(item)
+            self._stats["submitted"] += 1
+            self._stats["peak_depth"] = max(self._stats["peak_depth"], len(self._pending))
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        """Start the worker on the running event loop."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the worker."""
+        if self._detached:
+            await asyncio.gather(*self._detached, return_exceptions=True)
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                if self._stopping:
+                    return
+                continue
+            # Let more writes join the batch, up to the latency bound
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_batch and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except TimeoutError:
+                    break
+                self._wakeup.clear()
+            while self._pending:
+                with self._lock:
+                    batch = [
+                        self._pending.popleft()
+                        for _ in range(min(self.max_batch, len(self._pending)))
+                    ]
+                try:
+                    written = await asyncio.to_thread(self._write_batch, batch)
+                except Exception as e:
+                    logger.error(f"Write-behind: batch of {len(batch)} lost: {e}", exc_info=True)
+                    self._stats["failed"] += len(batch)
+                    written = [False] * len(batch)
+                for (_, _, done), committed in zip(batch, written, strict=True):
+                    if done is not None and not done.done():
+                        done.set_result(committed)
+            if self._stopping:
+                return
+
+    def _write_batch(self, batch: list[_Write]) -> list[bool]:
+        """
+        Write a batch in one transaction; drops rejected writes, retries transient errors.
+
+        Returns whether each write of the batch was committed.
+        """
+        started = time.perf_counter()
+        jobs = list(enumerate(batch))
+        written = [False] * len(batch)
+        attempt = 1
+        while jobs:
+            db = self._session_factory()
+            rejected = None
+            try:
+                for index, (_, (description, job, _)) in enumerate(jobs):
+                    try:
+                        job(db)
+                        db.flush()
+                    except Exception as e:
+                        if _is_transient(e):
+                            raise
+                        rejected = index
+                        logger.error(f"Write-behind: dropped {description}: {e}", exc_info=True)
+                        break
+                if rejected is None:
+                    db.commit()
+                    self._stats["written"] += len(jobs)
+                    for position, _ in jobs:
+                        written[position] = True
+                    break
+            except Exception as e:
+                db.rollback()
+                if attempt >= self.max_attempts:
+                    logger.error(
+                        f"Write-behind: gave up on {len(jobs)} write(s) after {attempt} "
+                        f"attempts: {e}"
+                    )
+                    self._stats["failed"] += len(jobs)
+                    break
+                logger.warning(f"Write-behind: batch failed ({e}); retry {attempt}")
+                self._stats["retries"] += 1
+                time.sleep(_RETRY_BACKOFF_SECONDS * attempt)
+                attempt += 1
+                continue
+            finally:
+                db.close()
+            # A write was rejected: closing rolled the transaction back; rerun the others
+            self._stats["failed"] += 1
+            jobs.pop(rejected)
+
+        self._stats["batches"] += 1
+        self._stats["last_batch_size"] = len(batch)
+        self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return written
+
+    def stats(self) -> dict[str, Any]:
+        """Queue depth and throughput counters."""
+        return {
+            **self._stats,
+            "depth": self.depth,
+            "running": self.running,
+            "max_batch": self.max_batch,
+            "max_delay_ms": round(self.max_delay * 1000),
+        }
+
+
+write_behind_queue = WriteBehindQueue(
+    SessionLocal,
+    max_batch=settings.write_behind_max_batch,
+    max_delay=settings.write_behind_max_delay_ms / 1000,
+    max_attempts=settings.write_behind_max_attempts,
+)
@@ -0,0 +1,56 @@
+"""
+Coalescing of identical concurrent async calls.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome.
+
+    The first caller for a key runs the call, and callers arriving while it is running
+    await the same result (or exception). Nothing is remembered once the call finishes.
+    If the leading caller is cancelled, a waiting caller runs the call itself. Keys are
+    scoped to the running event loop, since futures cannot be awaited across loops.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[tuple[int, Hashable], asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        while (shared := self._in_flight.get(flight_key)) is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if not shared.cancelled() or (current is not None and current.cancelling()):
+                    raise
+                logger.debug(f"Leading call for {key!r} was cancelled; taking over")
+
+        future = loop.create_future()
+        # Mark exceptions as retrieved so a call nobody joined does not warn on GC.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[flight_key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(flight_key) is future:
+                del self._in_flight[flight_key]
@@ -0,0 +1,59 @@
+"""
+Materialized daily visitor activity for the admin analytics dashboard.
+
+UsageLog has one row per comparison and grows without bound; the dashboard only needs one
+row per visitor per day. ``VisitorDailyActivity`` holds those rows, and each refresh
+recomputes only the days that can still change (from the newest materialized day onward),
+so a dashboard load costs a scan of today's logs rather than of the whole table.
+"""
+
+import logging
+from datetime import datetime, time
+
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import UsageLog, VisitorDailyActivity
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_visitor_daily_activity(db: Session) -> None:
+    """
+    Bring VisitorDailyActivity up to date with UsageLog.
+
+    Days before the newest materialized day are closed and never recomputed; that day and
+    any later ones are rebuilt with one grouped INSERT ... SELECT per visitor kind.
+    """
+    last_day = db.query(func.max(VisitorDailyActivity.day)).scalar()
+    if isinstance(last_day, str):  # SQLite returns aggregates of Date columns untyped
+        last_day = datetime.strptime(last_day, "%Y-%m-%d").date()
+
+    day = func.date(UsageLog.created_at)
+    columns = ["day", "kind", "value", "comparisons", "authenticated_comparisons"]
+    try:
+        if last_day is not None:
+            db.query(VisitorDailyActivity).filter(VisitorDailyActivity.day >= last_day).delete()
+        for kind, column in (("ip", UsageLog.ip_address), ("fp", UsageLog.browser_fingerprint)):
+            rows = (
+                select(
+                    day,
+                    literal(kind),
+                    column,
+                    func.count(UsageLog.id),
+                    func.count(UsageLog.user_id),
+                )
+                .where(UsageLog.created_at.isnot(None))
+                .group_by(day, column)
+            )
+            if last_day is not None:
+                rows = rows.where(UsageLog.created_at >= datetime.combine(last_day, time.min))
+            if kind == "fp":
+                rows = rows.where(UsageLog.browser_fingerprint.isnot(None))
+            db.execute(insert(VisitorDailyActivity).from_select(columns, rows))
+        db.commit()
+    except IntegrityError:
+        # A concurrent refresh rebuilt the same days first; its rows are just as current
+        db.rollback()
+        logger.debug("Visitor activity refresh raced with another refresh; keeping its rows")
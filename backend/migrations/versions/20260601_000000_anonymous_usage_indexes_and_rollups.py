@@ -0,0 +1,127 @@
+"""Covering indexes for unregistered usage lookups and the anonymous usage rollup table
+
+Revision ID: 0012_anon_usage_rollups
+Revises: 0011_file_contents
+Create Date: 2026-06-01 00:00:00.000000
+
+"""
+
+from collections import defaultdict
+from collections.abc import Sequence
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0012_anon_usage_rollups"
+down_revision: str | None = "0011_file_contents"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# Balances only ever look at the current local day; two days covers every timezone
+BACKFILL_DAYS = 2
+
+
+def _backfill(bind: sa.engine.Connection) -> None:
+    logs = sa.table(
+        "usage_logs",
+        sa.column("user_id", sa.Integer),
+        sa.column("ip_address", sa.String),
+        sa.column("browser_fingerprint", sa.String),
+        sa.column("credits_used", sa.DECIMAL),
+        sa.column("created_at", sa.DateTime),
+    )
+    since = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=BACKFILL_DAYS)
+    rows = bind.execute(
+        sa.select(
+            logs.c.ip_address, logs.c.browser_fingerprint, logs.c.credits_used, logs.c.created_at
+        ).where(logs.c.user_id.is_(None), logs.c.created_at >= since)
+    )
+    totals: dict[tuple[str, datetime], list] = defaultdict(lambda: [Decimal(0), 0])
+    for ip_address, fingerprint, credits_used, created_at in rows:
+        bucket = created_at.replace(
+            minute=created_at.minute - created_at.minute % 15, second=0, microsecond=0
+        )
+        for identifier in (
+            f"ip:{ip_address}" if ip_address else None,
+            f"fp:{fingerprint}" if fingerprint else None,
+        ):
+            if identifier:
+                totals[(identifier, bucket)][0] += Decimal(credits_used or 0)
+                totals[(identifier, bucket)][1] += 1
+    if totals:
+        op.bulk_insert(
+            sa.table(
+                "anonymous_usage_rollups",
+                sa.column("identifier", sa.String),
+                sa.column("bucket_start", sa.DateTime),
+                sa.column("credits_used", sa.DECIMAL),
+                sa.column("comparisons", sa.Integer),
+            ),
+            [
+                {
+                    "identifier": identifier,
+                    "bucket_start": bucket,
+                    "credits_used": credits,
+                    "comparisons": comparisons,
+                }
+                for (identifier, bucket), (credits, comparisons) in totals.items()
+            ],
+        )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing_indexes = {i["name"] for i in inspector.get_indexes("usage_logs")}
+
+    if "ix_usage_logs_anon_ip_created" not in existing_indexes:
+        op.create_index(
+            "ix_usage_logs_anon_ip_created",
+            "usage_logs",
+            ["ip_address", "created_at", "credits_used", "user_id"],
+            postgresql_where=sa.text("user_id IS NULL"),
+            sqlite_where=sa.text("user_id IS NULL"),
+        )
+    if "ix_usage_logs_anon_fp_created" not in existing_indexes:
+        op.create_index(
+            "ix_usage_logs_anon_fp_created",
+            "usage_logs",
+            ["browser_fingerprint", "created_at", "credits_used", "user_id"],
+            postgresql_where=sa.text("user_id IS NULL AND browser_fingerprint IS NOT NULL"),
+            sqlite_where=sa.text("user_id IS NULL AND browser_fingerprint IS NOT NULL"),
+        )
+
+    if "anonymous_usage_rollups" in inspector.get_table_names():
+        return
+    op.create_table(
+        "anonymous_usage_rollups",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("identifier", sa.String(length=80), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("credits_used", sa.DECIMAL(12, 4), nullable=False, server_default="0"),
+        sa.Column("comparisons", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "identifier", "bucket_start", name="uq_anonymous_usage_rollups_identifier_bucket"
+        ),
+    )
+    op.create_index(
+        op.f("ix_anonymous_usage_rollups_id"), "anonymous_usage_rollups", ["id"], unique=False
+    )
+    _backfill(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "anonymous_usage_rollups" in inspector.get_table_names():
+        op.drop_index(op.f("ix_anonymous_usage_rollups_id"), table_name="anonymous_usage_rollups")
+        op.drop_table("anonymous_usage_rollups")
+
+    existing_indexes = {i["name"] for i in inspector.get_indexes("usage_logs")}
+    for name in ("ix_usage_logs_anon_fp_created", "ix_usage_logs_anon_ip_created"):
+        if name in existing_indexes:
+            op.drop_index(name, table_name="usage_logs")
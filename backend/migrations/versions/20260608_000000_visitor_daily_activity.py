@@ -0,0 +1,49 @@
+"""Materialized daily visitor activity for admin analytics
+
+Revision ID: 0013_visitor_daily_activity
+Revises: 0012_anon_usage_rollups
+Create Date: 2026-06-08 00:00:00.000000
+
+The table starts empty; the first visitor analytics request materializes UsageLog in one pass.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0013_visitor_daily_activity"
+down_revision: str | None = "0012_anon_usage_rollups"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "visitor_daily_activity" in inspector.get_table_names():
+        return
+    op.create_table(
+        "visitor_daily_activity",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("kind", sa.String(length=2), nullable=False),
+        sa.Column("value", sa.String(length=64), nullable=True),
+        sa.Column("comparisons", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("authenticated_comparisons", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "kind", "day", "value", name="uq_visitor_daily_activity_kind_day_value"
+        ),
+    )
+    op.create_index(
+        op.f("ix_visitor_daily_activity_id"), "visitor_daily_activity", ["id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "visitor_daily_activity" in inspector.get_table_names():
+        op.drop_index(op.f("ix_visitor_daily_activity_id"), table_name="visitor_daily_activity")
+        op.drop_table("visitor_daily_activity")
@@ -0,0 +1,96 @@
+"""Thread fingerprint on conversations for indexed follow-up lookup
+
+Revision ID: 0014_conv_thread_fingerprint
+Revises: 0013_visitor_daily_activity
+Create Date: 2026-06-15 00:00:00.000000
+
+"""
+
+import hashlib
+import json
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0014_conv_thread_fingerprint"
+down_revision: str | None = "0013_visitor_daily_activity"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _fingerprint(models_used: str | None, input_data: str | None) -> str:
+    """Frozen copy of app.models.conversation_thread_fingerprint."""
+    try:
+        models = json.loads(models_used) if models_used else []
+    except (json.JSONDecodeError, TypeError):
+        models = []
+    payload = json.dumps([sorted(models), input_data or ""], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _backfill(bind: sa.engine.Connection) -> None:
+    conversations = sa.table(
+        "conversations",
+        sa.column("id", sa.Integer),
+        sa.column("models_used", sa.Text),
+        sa.column("input_data", sa.Text),
+        sa.column("thread_fingerprint", sa.String),
+    )
+    update = (
+        conversations.update()
+        .where(conversations.c.id == sa.bindparam("conversation_id"))
+        .values(thread_fingerprint=sa.bindparam("fingerprint"))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(conversations.c.id, conversations.c.models_used, conversations.c.input_data)
+            .where(conversations.c.id > last_id, conversations.c.thread_fingerprint.is_(None))
+            .order_by(conversations.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        bind.execute(
+            update,
+            [
+                {"conversation_id": id_, "fingerprint": _fingerprint(models_used, input_data)}
+                for id_, models_used, input_data in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    columns = {c["name"] for c in inspector.get_columns("conversations")}
+    if "thread_fingerprint" not in columns:
+        op.add_column(
+            "conversations", sa.Column("thread_fingerprint", sa.String(length=64), nullable=True)
+        )
+    _backfill(bind)
+
+    existing_indexes = {i["name"] for i in inspector.get_indexes("conversations")}
+    if "ix_conversations_user_thread_fingerprint" not in existing_indexes:
+        op.create_index(
+            "ix_conversations_user_thread_fingerprint",
+            "conversations",
+            ["user_id", "thread_fingerprint"],
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    existing_indexes = {i["name"] for i in inspector.get_indexes("conversations")}
+    if "ix_conversations_user_thread_fingerprint" in existing_indexes:
+        op.drop_index("ix_conversations_user_thread_fingerprint", table_name="conversations")
+    columns = {c["name"] for c in inspector.get_columns("conversations")}
+    if "thread_fingerprint" in columns:
+        op.drop_column("conversations", "thread_fingerprint")
@@ -0,0 +1,59 @@
+"""Conversation references to attachment blob store blobs
+
+Revision ID: 0015_attachment_blob_refs
+Revises: 0014_conv_thread_fingerprint
+Create Date: 2026-06-22 00:00:00.000000
+
+Conversations saved before this keep their inline base64 attachments; only new ones
+reference blobs.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0015_attachment_blob_refs"
+down_revision: str | None = "0014_conv_thread_fingerprint"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "attachment_blob_refs" in inspector.get_table_names():
+        return
+
+    op.create_table(
+        "attachment_blob_refs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("blob_key", sa.String(length=64), nullable=False),
+        sa.Column("conversation_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_attachment_blob_refs_id"), "attachment_blob_refs", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_attachment_blob_refs_blob_key"), "attachment_blob_refs", ["blob_key"], unique=False
+    )
+    op.create_index(
+        op.f("ix_attachment_blob_refs_conversation_id"),
+        "attachment_blob_refs",
+        ["conversation_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "attachment_blob_refs" in inspector.get_table_names():
+        for column in ("conversation_id", "blob_key", "id"):
+            op.drop_index(
+                op.f(f"ix_attachment_blob_refs_{column}"), table_name="attachment_blob_refs"
+            )
+        op.drop_table("attachment_blob_refs")
@@ -0,0 +1,36 @@
+"""Thumbnail URLs of generated images on conversation messages
+
+Revision ID: 0016_message_image_thumbnails
+Revises: 0015_attachment_blob_refs
+Create Date: 2026-06-29 00:00:00.000000
+
+Messages saved before this keep their images as they are (often inline data URLs).
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0016_message_image_thumbnails"
+down_revision: str | None = "0015_attachment_blob_refs"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c["name"] for c in inspector.get_columns("conversation_messages")}
+    if "image_thumbnails" not in columns:
+        op.add_column(
+            "conversation_messages", sa.Column("image_thumbnails", sa.Text(), nullable=True)
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c["name"] for c in inspector.get_columns("conversation_messages")}
+    if "image_thumbnails" in columns:
+        op.drop_column("conversation_messages", "image_thumbnails")
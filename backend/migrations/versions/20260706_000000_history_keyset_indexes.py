@@ -0,0 +1,43 @@
+"""Composite indexes for keyset-paged conversation history and messages
+
+Revision ID: 0017_history_keyset_indexes
+Revises: 0016_message_image_thumbnails
+Create Date: 2026-07-06 00:00:00.000000
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0017_history_keyset_indexes"
+down_revision: str | None = "0016_message_image_thumbnails"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEXES = (
+    ("conversations", "ix_conversations_user_created_id", ["user_id", "created_at", "id"]),
+    (
+        "conversation_messages",
+        "ix_conversation_messages_conversation_created_id",
+        ["conversation_id", "created_at", "id"],
+    ),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, name, columns in INDEXES:
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table)}
+        if name not in existing_indexes:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, name, _ in INDEXES:
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table)}
+        if name in existing_indexes:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark exact tokenization against the approximate token-count bounds.
+
+Builds a ~100K-token input (the backend's own source by default, or the given files),
+then times tiktoken's exact count and ``approximate_token_bounds`` for each calibrated
+tokenizer family and checks that the bounds contain the exact count.
+
+Usage:
+    python scripts/benchmark_token_estimate.py [OPTIONS]
+
+Options:
+    --file: Text file(s) to use as input instead of the backend source (repeatable)
+    --chars: Input length in characters (default: 420000, about 100K tokens of code)
+    --repeat: Timed runs per method (default: 10)
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import tiktoken  # type: ignore[import-untyped]
+
+from app.llm.token_estimate import approximate_token_bounds
+
+
+def build_input(files: list[str], chars: int) -> str:
+    if files:
+        paths = [Path(f) for f in files]
+    else:
+        paths = sorted((Path(__file__).parent.parent / "app").rglob("*.py"))
+    text = ""
+    while len(text) < chars:
+        text += "\n".join(p.read_text(encoding="utf-8", errors="replace") for p in paths)
+    return text[:chars]
+
+
+def time_ms(fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--file", action="append", default=[])
+    parser.add_argument("--chars", type=int, default=420_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    text = build_input(args.file, args.chars)
+    print(f"Input: {len(text):,} characters, {len(text.encode('utf-8')):,} bytes\n")
+    print(
+        f"{'family':<12} {'exact':>9} {'estimate':>9} {'lower':>9} {'upper':>9} "
+        f"{'exact ms':>9} {'approx ms':>10} {'speedup':>8}"
+    )
+
+    all_contained = True
+    for family in ("cl100k_base", "o200k_base"):
+        encoding = tiktoken.get_encoding(family)
+        exact = len(encoding.encode(text, disallowed_special=()))
+        bounds = approximate_token_bounds(text, family)
+        exact_ms = time_ms(
+            lambda enc=encoding: enc.encode(text, disallowed_special=()), args.repeat
+        )
+        approx_ms = time_ms(lambda f=family: approximate_token_bounds(text, f), args.repeat)
+        contained = bounds.lower <= exact <= bounds.upper
+        all_contained &= contained
+        print(
+            f"{family:<12} {exact:>9,} {bounds.estimate:>9,} {bounds.lower:>9,} "
+            f"{bounds.upper:>9,} {exact_ms:>9.1f} {approx_ms:>10.1f} {exact_ms / approx_ms:>7.1f}x"
+            f"{'' if contained else '  OUT OF BOUNDS'}"
+        )
+    return 0 if all_contained else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
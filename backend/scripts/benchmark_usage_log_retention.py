@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark the UsageLog retention job on a synthetic SQLite database.
+
+Fills a temporary SQLite file with a multi-million-row usage log spread over the past
+year, runs the batched cleanup (aggregate into monthly summaries, delete old entries)
+and reports throughput, the largest batch time and peak memory.
+
+Usage:
+    python scripts/benchmark_usage_log_retention.py [OPTIONS]
+
+Options:
+    --rows: Synthetic UsageLog entries (default: 2000000)
+    --keep-days: Retention period passed to the cleanup (default: 90)
+    --batch-size: Entries per cleanup batch (default: the job's default)
+    --interrupt-after: Stop after this many batches, then resume (default: 0, no interruption)
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.data_retention import DEFAULT_BATCH_SIZE, iter_usage_log_cleanup
+from app.database import Base
+from app.models import UsageLog, UsageLogMonthlyAggregate
+
+MODEL_SETS = [
+    ["openai/gpt-4o-mini"],
+    ["openai/gpt-4o-mini", "anthropic/claude-3.5-haiku"],
+    ["google/gemini-2.0-flash-001", "openai/gpt-4o", "anthropic/claude-sonnet-4"],
+    ["deepseek/deepseek-chat", "meta-llama/llama-3.3-70b-instruct"],
+]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def fill(path: str, rows: int) -> None:
+    """Insert ``rows`` usage entries in created_at order, spread evenly over 365 days."""
+    conn = sqlite3.connect(path)
+    now = datetime.now(UTC).replace(tzinfo=None)
+    step = timedelta(days=365) / rows
+    start = now - timedelta(days=365)
+    rng = random.Random(7)
+    model_sets = [json.dumps(m) for m in MODEL_SETS]
+
+    def entries():
+        for i in range(rows):
+            input_tokens = rng.randint(50, 4000)
+            yield (
+                rng.choice((None, i % 5000)),
+                f"10.{i % 250}.{i % 199}.{i % 97}",
+                rng.choice(model_sets),
+                input_tokens,
+                input_tokens * 3,
+                round(rng.uniform(0.1, 20), 4),
+                (start + step * i).isoformat(sep=" "),
+            )
+
+    conn.executemany(
+        "INSERT INTO usage_logs (user_id, ip_address, models_used, input_tokens, "
+        "output_tokens, credits_used, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        entries(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(session_factory, keep_days: int, batch_size: int, max_batches: int | None):
+    db = session_factory()
+    slowest = 0.0
+    last = None
+    batch_started = time.perf_counter()
+    try:
+        for last in iter_usage_log_cleanup(db, keep_days=keep_days, batch_size=batch_size):
+            slowest = max(slowest, time.perf_counter() - batch_started)
+            batch_started = time.perf_counter()
+            if last["status"] == "running" and last["batches"] % 50 == 0:
+                print(
+                    f"  batch {last['batches']:>5}: {last['entries_deleted']:,} deleted "
+                    f"(id {last['last_id_processed']:,} of {last['max_id']:,})"
+                )
+            if max_batches and last["batches"] >= max_batches:
+                break
+    finally:
+        db.close()
+    return last, slowest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--keep-days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--interrupt-after", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "retention.db")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+
+        started = time.perf_counter()
+        fill(path, args.rows)
+        print(f"Filled {args.rows:,} entries in {time.perf_counter() - started:.1f}s")
+        rss_before = peak_rss_mb()
+
+        started = time.perf_counter()
+        if args.interrupt_after:
+            partial, _ = run(session_factory, args.keep_days, args.batch_size, args.interrupt_after)
+            print(f"Interrupted after {partial['entries_deleted']:,} entries; resuming")
+        result, slowest = run(session_factory, args.keep_days, args.batch_size, None)
+        elapsed = time.perf_counter() - started
+
+        db = session_factory()
+        remaining = db.query(UsageLog).count()
+        aggregated = sum(a.total_comparisons for a in db.query(UsageLogMonthlyAggregate))
+        db.close()
+
+    deleted = args.rows - remaining
+    print(f"\nCleanup: {deleted:,} entries in {elapsed:.1f}s ({deleted / elapsed:,.0f}/s)")
+    print(
+        f"Batches: {result.get('batches', 0)} of {args.batch_size:,}; slowest {slowest * 1000:.0f}ms"
+    )
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB (before cleanup: {rss_before:.0f} MB)")
+    print(f"Remaining entries: {remaining:,}; comparisons in monthly aggregates: {aggregated:,}")
+    return 0 if aggregated == deleted else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
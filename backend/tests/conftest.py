@@ -13,13 +13,16 @@ Phase 4, Week 9, Task 2: Enhanced test fixtures with:
 
 import os
 import sys
+import tempfile
 from unittest.mock import AsyncMock, MagicMock
 
+import aiosqlite
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
 # Set environment variables to avoid email configuration issues
 os.environ.setdefault("MAIL_USERNAME", "")
@@ -33,6 +36,8 @@ os.environ.setdefault(
 )
 os.environ.setdefault("OPENROUTER_API_KEY", "test-api-key-for-testing-only")
 os.environ.setdefault("ENVIRONMENT", "development")  # Use development mode for tests
+# Attachment blobs written by tests stay out of backend/data
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="compareintel-test-blobs-"))
 
 # Mock email service functions before importing app to avoid fastapi_mail import issues
 # This is a known bug in fastapi-mail 1.5.2 where SecretStr is not imported
@@ -47,7 +52,7 @@ email_service_mock.EMAIL_CONFIGURED = False
 sys.modules["app.email_service"] = email_service_mock
 
 # Now import app - email_service will use the mock
-from app.database import Base, get_db
+from app.database import Base, get_async_db, get_db
 from app.main import app as fastapi_app  # Rename to avoid conflict with app module
 from app.models import User
 
@@ -79,11 +84,48 @@ test_engine = create_engine(
 # Create test session factory
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
 
+
+class _SharedSQLiteConnection:
+    """
+    The test engine's sqlite3 connection, handed to aiosqlite.
+
+    An in-memory database exists only inside its connection, so the async engine has to
+    run on the same one; closing is left to the test engine.
+    """
+
+    def __init__(self, connection):
+        object.__setattr__(self, "_connection", connection)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def close(self):
+        pass
+
+
+async def _connect_to_test_database():
+    with test_engine.connect() as connection:
+        shared = _SharedSQLiteConnection(connection.connection.driver_connection)
+    return await aiosqlite.Connection(lambda: shared, iter_chunk_size=64)
+
+
+# Async engine over the same in-memory database, for handlers using get_async_db
+test_async_engine = create_async_engine(
+    "sqlite+aiosqlite://", async_creator=_connect_to_test_database, poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    test_async_engine, autoflush=False, expire_on_commit=False
+)
+
 # Patch SessionLocal in app.database to use test engine for any direct SessionLocal() calls in app code
 # This ensures that when app code creates fresh sessions (like in api.py), they use the test database
 import app.database
 
 app.database.SessionLocal = TestingSessionLocal
+app.database.AsyncSessionLocal = TestingAsyncSessionLocal
 
 
 @pytest.fixture(scope="function")
@@ -111,6 +153,11 @@ def db_session():
     # Create all tables with all columns
     Base.metadata.create_all(bind=test_engine)
 
+    # User ids are reused by the fresh database; snapshots of earlier tests' users must go
+    from app.cache import user_cache
+
+    user_cache.clear()
+
     # Create a new session
     session = TestingSessionLocal()
 
@@ -140,7 +187,12 @@ def client(db_session):
         finally:
             pass
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     fastapi_app.dependency_overrides[get_db] = override_get_db
+    fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
 
     # Clear login rate limiting before each test
     from app.routers.auth import failed_login_attempts
@@ -152,6 +152,32 @@ class TestSystemConfiguration:
             data = response.json()
             assert isinstance(data, (list, dict))
 
+    def test_cleanup_usage_logs_streams_progress(self, authenticated_client_admin, db_session):
+        """Streaming cleanup reports one progress event per batch, then the result."""
+        import json
+        from datetime import UTC, datetime, timedelta
+
+        from app.models import UsageLog
+
+        old = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=200)
+        for _ in range(250):
+            db_session.add(UsageLog(models_used='["a/model"]', created_at=old))
+        db_session.commit()
+        client = authenticated_client_admin[0]
+
+        response = client.post(
+            "/api/admin/maintenance/cleanup-usage-logs?stream=true&batch_size=100"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        events = [
+            json.loads(line[len("data: ") :])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        assert [e["type"] for e in events] == ["progress", "progress", "progress", "complete"]
+        assert events[-1]["entries_deleted"] == 250
+        assert db_session.query(UsageLog).count() == 0
+
 
 class TestAdminUserCRUD:
     """Tests for admin user CRUD operations."""
@@ -315,6 +341,65 @@ class TestAdminStats:
 
         data = response.json()
         assert data["total_users"] >= 4  # Admin + 3 created users
+        from app.models import User
+
+        for tier, count in data["users_by_tier"].items():
+            assert count == db_session.query(User).filter(User.subscription_tier == tier).count()
+        for role, count in data["users_by_role"].items():
+            assert count == db_session.query(User).filter(User.role == role).count()
+
+
+class TestVisitorAnalytics:
+    """Tests for the visitor analytics endpoint and its daily activity table."""
+
+    @staticmethod
+    def add_log(db_session, days_ago: int, ip: str, fingerprint=None, user_id=None):
+        from datetime import UTC, datetime, timedelta
+
+        from app.models import UsageLog
+
+        created_at = datetime.now(UTC).replace(tzinfo=None, hour=12) - timedelta(days=days_ago)
+        db_session.add(
+            UsageLog(
+                user_id=user_id,
+                ip_address=ip,
+                browser_fingerprint=fingerprint,
+                models_used='["openai/gpt-4o-mini"]',
+                created_at=created_at,
+            )
+        )
+        db_session.commit()
+
+    def test_visitor_analytics_counts(self, authenticated_client_admin, db_session):
+        client, admin_user, _, _ = authenticated_client_admin
+        self.add_log(db_session, 0, "1.1.1.1", "fp-a")
+        self.add_log(db_session, 0, "1.1.1.1", "fp-a")
+        self.add_log(db_session, 0, "2.2.2.2", None, admin_user.id)
+        self.add_log(db_session, 3, "3.3.3.3", "fp-b")
+        self.add_log(db_session, 10, "1.1.1.1", "fp-c")
+        self.add_log(db_session, 45, "4.4.4.4")
+
+        data = client.get("/api/admin/analytics/visitors").json()
+        assert data["total_unique_visitors"] == 4
+        assert data["total_unique_devices"] == 3
+        assert data["total_comparisons"] == 6
+        assert data["unique_visitors_today"] == 2
+        assert data["unique_visitors_this_week"] == 3
+        assert data["unique_visitors_this_month"] == 3
+        assert data["authenticated_visitors"] == 1
+        assert data["anonymous_visitors"] == 3
+        assert (data["comparisons_today"], data["comparisons_this_week"]) == (3, 4)
+        assert data["comparisons_this_month"] == 5
+        assert len(data["daily_breakdown"]) == 30
+        assert data["daily_breakdown"][-1]["unique_visitors"] == 2
+        assert data["daily_breakdown"][-4]["total_comparisons"] == 1
+
+        # Later usage today is picked up by the incremental refresh
+        self.add_log(db_session, 0, "5.5.5.5")
+        data = client.get("/api/admin/analytics/visitors").json()
+        assert data["unique_visitors_today"] == 3
+        assert data["total_comparisons"] == 7
+        assert data["total_unique_visitors"] == 5
 
 
 class TestAdminPagination:
@@ -71,3 +71,25 @@ class TestErrorHandling:
             status.HTTP_422_UNPROCESSABLE_CONTENT,
             status.HTTP_400_BAD_REQUEST,
         ]
+
+
+class TestModelsConditionalGet:
+    """Tests for ETag revalidation of /api/models."""
+
+    def test_models_has_etag(self, client):
+        response = client.get("/api/models")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"]
+        assert "no-store" not in response.headers["Cache-Control"]
+
+    def test_matching_etag_returns_304(self, client):
+        etag = client.get("/api/models").headers["ETag"]
+        response = client.get("/api/models", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    def test_stale_etag_returns_body(self, client):
+        response = client.get("/api/models", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == status.HTTP_200_OK
+        assert "models" in response.json()
@@ -307,3 +307,43 @@ class TestCircuitBreaker:
         cb.record_success()
         cb.record_success()  # Need 2 successes (default success_threshold)
         assert cb.state == CircuitState.CLOSED
+
+
+class TestRedisCreditLedger:
+    """Tests for the anonymous credit ledger's Lua scripts."""
+
+    @pytest.fixture
+    def ledger(self):
+        import redis as sync_redis
+
+        from app.credit_ledger import LocalCreditLedger, RedisCreditLedger
+
+        sync_redis.from_url(REDIS_URL).flushdb()
+        yield RedisCreditLedger(REDIS_URL, fallback=LocalCreditLedger())
+        sync_redis.from_url(REDIS_URL).flushdb()
+
+    def test_charge_starts_and_caps_balance(self, ledger):
+        from app.credit_ledger import LedgerEntry
+
+        assert ledger.charge("ip:1", "UTC", "2026-03-10", 0, 50) == LedgerEntry(
+            0, "2026-03-10", "UTC", True
+        )
+        assert ledger.charge("ip:1", "UTC", "2026-03-10", 60, 50).count == 50
+        assert ledger.balances() == {"ip:1": 50}
+
+    def test_reservation_refused_past_cap(self, ledger):
+        assert ledger.reserve("ip:1", "UTC", "2026-03-10", 45, 50).allowed
+        entry = ledger.reserve("ip:1", "UTC", "2026-03-10", 10, 50)
+        assert (entry.count, entry.allowed) == (45, False)
+        assert ledger.charge("ip:1", "UTC", "2026-03-10", -60, 50).count == 0
+
+    def test_no_second_allowance_within_20_hours(self, ledger):
+        ledger.charge("ip:1", "America/Chicago", "2026-03-10", 50, 50)
+        entry = ledger.charge("ip:1", "Asia/Tokyo", "2026-03-11", 0, 50)
+        assert (entry.count, entry.date, entry.started) == (50, "2026-03-10", False)
+
+    def test_seed_and_zero_all(self, ledger):
+        ledger.charge("fp:abc", "UTC", "2026-03-10", 5, 50)
+        assert ledger.seed("fp:abc", "2026-03-10", 12, 50) == 12
+        assert ledger.zero_all("2026-03-10") == ["fp:abc"]
+        assert ledger.balances() == {"fp:abc": 0}
@@ -0,0 +1,156 @@
+"""
+Unit tests for unregistered usage indexes and the anonymous usage rollup.
+
+Tests cover:
+- Rollup upserts per identifier and 15-minute bucket
+- Local-day totals for timezones with non-hour offsets
+- Query plans (EXPLAIN) using the covering indexes on SQLite and PostgreSQL
+"""
+
+import os
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event, func, text
+from sqlalchemy.orm import sessionmaker
+
+pytestmark = pytest.mark.unit
+
+
+from app.database import Base
+from app.models import AnonymousUsageRollup, UsageLog
+from app.rate_limiting import _anonymous_credits_used_today, record_anonymous_usage
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def anonymous_log_query(db, ip_address: str):
+    """The per-IP, per-day UsageLog sum the anonymous covering index exists for."""
+    start = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=1)
+    return db.query(func.sum(UsageLog.credits_used)).filter(
+        UsageLog.user_id.is_(None),
+        UsageLog.ip_address == ip_address,
+        UsageLog.created_at >= start,
+        UsageLog.created_at < start + timedelta(days=1),
+    )
+
+
+def captured_statements(db, fn) -> list[tuple[str, object]]:
+    """SQL statements (with parameters) executed by ``fn``."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+
+def sqlite_plan(db, statement: str, parameters) -> str:
+    rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return " | ".join(str(row[-1]) for row in rows)
+
+
+class TestRecordAnonymousUsage:
+    def test_upserts_ip_and_fingerprint_buckets(self, db_session):
+        at = datetime(2026, 3, 10, 12, 7, tzinfo=UTC)
+        record_anonymous_usage(db_session, "10.0.0.1", "fp1", Decimal("2.5"), at)
+        record_anonymous_usage(
+            db_session, "10.0.0.1", None, Decimal("1.25"), at + timedelta(minutes=5)
+        )
+        record_anonymous_usage(
+            db_session, "10.0.0.1", None, Decimal("1"), at + timedelta(minutes=10)
+        )
+        db_session.commit()
+
+        rows = {
+            (r.identifier, r.bucket_start): (r.credits_used, r.comparisons)
+            for r in db_session.query(AnonymousUsageRollup).all()
+        }
+        assert rows == {
+            ("ip:10.0.0.1", datetime(2026, 3, 10, 12, 0)): (Decimal("3.75"), 2),
+            ("fp:fp1", datetime(2026, 3, 10, 12, 0)): (Decimal("2.5"), 1),
+            ("ip:10.0.0.1", datetime(2026, 3, 10, 12, 15)): (Decimal("1"), 1),
+        }
+
+    def test_no_identifiers_is_a_no_op(self, db_session):
+        record_anonymous_usage(db_session, None, None, Decimal("1"))
+        assert db_session.query(AnonymousUsageRollup).count() == 0
+
+    def test_local_day_with_quarter_hour_offset(self, db_session):
+        tz = "Asia/Kathmandu"  # UTC+05:45
+        import pytz
+
+        midnight = (
+            datetime.now(pytz.timezone(tz))
+            .replace(hour=0, minute=0, second=0, microsecond=0)
+            .astimezone(UTC)
+        )
+        record_anonymous_usage(db_session, "10.0.0.3", None, Decimal("4"), midnight)
+        record_anonymous_usage(
+            db_session, "10.0.0.3", None, Decimal("9"), midnight - timedelta(minutes=1)
+        )
+        db_session.commit()
+        assert _anonymous_credits_used_today(db_session, "ip:10.0.0.3", tz) == 4
+
+
+class TestSQLiteQueryPlans:
+    def test_rollup_lookup_uses_unique_index(self, db_session):
+        statements = captured_statements(
+            db_session, lambda: _anonymous_credits_used_today(db_session, "ip:10.0.0.1", "UTC")
+        )
+        plan = sqlite_plan(db_session, *statements[-1])
+        assert "sqlite_autoindex_anonymous_usage_rollups" in plan, plan
+        assert "SCAN" not in plan.replace("SCAN CONSTANT", ""), plan
+
+    def test_anonymous_log_sum_uses_covering_index(self, db_session):
+        query = anonymous_log_query(db_session, "10.0.0.1")
+        statements = captured_statements(db_session, query.scalar)
+        plan = sqlite_plan(db_session, *statements[-1])
+        assert "USING COVERING INDEX ix_usage_logs_anon_ip_created" in plan, plan
+
+
+@pytest.fixture
+def pg_session():
+    if not POSTGRES_URL:
+        pytest.skip("PostgreSQL not available for testing (set TEST_POSTGRES_URL)")
+    engine = create_engine(POSTGRES_URL)
+    from app import models  # noqa: F401
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    # Tiny tables are cheaper to scan; planner must still be able to use the index
+    session.execute(text("SET enable_seqscan = off"))
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+class TestPostgresQueryPlans:
+    def pg_plan(self, db, statement: str, parameters) -> str:
+        rows = db.connection().exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return "\n".join(row[0] for row in rows)
+
+    def test_rollup_lookup_uses_unique_index(self, pg_session):
+        record_anonymous_usage(pg_session, "10.0.0.1", "fp1", Decimal("2"))
+        statements = captured_statements(
+            pg_session, lambda: _anonymous_credits_used_today(pg_session, "ip:10.0.0.1", "UTC")
+        )
+        plan = self.pg_plan(pg_session, *statements[-1])
+        assert "uq_anonymous_usage_rollups_identifier_bucket" in plan, plan
+
+    def test_anonymous_log_sum_uses_covering_index(self, pg_session):
+        query = anonymous_log_query(pg_session, "10.0.0.1")
+        statements = captured_statements(pg_session, query.scalar)
+        plan = self.pg_plan(pg_session, *statements[-1])
+        assert "Index Only Scan using ix_usage_logs_anon_ip_created" in plan, plan
@@ -0,0 +1,140 @@
+"""
+Unit tests for the async database layer.
+
+Tests cover:
+- Async driver URLs derived from DATABASE_URL
+- get_current_user loading through the async session and handing the user to the sync one
+- Conversation endpoints running on AsyncSession (list, history cap, detail, delete, breakout)
+"""
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app import dependencies
+from app.config import get_history_entry_limit
+from app.database import to_async_url
+from app.models import Conversation, ConversationMessage
+from app.services.last_access import LastAccessRecorder, write_accesses
+from tests.factories import create_conversation, create_conversation_message
+
+
+class TestAsyncUrl:
+    def test_postgresql_uses_asyncpg(self):
+        url = to_async_url("postgresql://app:s3cret@db:5432/compareintel")
+        assert url == "postgresql+asyncpg://app:s3cret@db:5432/compareintel"
+
+    def test_explicit_sync_driver_is_replaced(self):
+        url = to_async_url("postgresql+psycopg2://app@db/compareintel")
+        assert url == "postgresql+asyncpg://app@db/compareintel"
+
+    def test_sqlite_uses_aiosqlite(self):
+        assert to_async_url("sqlite:////srv/data/app.db") == "sqlite+aiosqlite:////srv/data/app.db"
+
+
+class TestCurrentUser:
+    def test_handlers_can_refresh_current_user(self, authenticated_client):
+        """/rate-limit-status refreshes current_user on the sync session."""
+        client, user, _, _ = authenticated_client
+        response = client.get("/api/rate-limit-status")
+        assert response.status_code == 200
+        assert response.json()["email"] == user.email
+
+    def test_last_access_recorded(self, authenticated_client, db_session, monkeypatch):
+        client, user, _, _ = authenticated_client
+        recorder = LastAccessRecorder()
+        monkeypatch.setattr(dependencies, "last_access_recorder", recorder)
+        user.last_access = datetime.now(UTC) - timedelta(hours=1)
+        db_session.commit()
+
+        assert client.get("/api/conversations").status_code == 200
+
+        write_accesses(db_session, recorder.take())
+        db_session.commit()
+        db_session.refresh(user)
+        last_access = user.last_access.replace(tzinfo=UTC)
+        assert datetime.now(UTC) - last_access < timedelta(minutes=1)
+
+
+class TestConversationsOnAsyncSession:
+    def test_list_with_message_counts(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        conversation = create_conversation(db_session, user)
+        create_conversation_message(db_session, conversation, role="user")
+        create_conversation_message(db_session, conversation, model_id="openai/gpt-4")
+
+        response = client.get("/api/conversations")
+        assert response.status_code == 200
+        (summary,) = response.json()
+        assert summary["id"] == conversation.id
+        assert summary["message_count"] == 2
+        assert summary["models_used"] == ["openai/gpt-4"]
+
+    def test_list_capped_at_tier_limit(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        limit = get_history_entry_limit(user.subscription_tier)
+        base = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=1)
+        oldest_id = [
+            create_conversation(db_session, user, created_at=base + timedelta(minutes=i)).id
+            for i in range(limit + 1)
+        ][0]
+
+        response = client.get("/api/conversations")
+        assert response.status_code == 200
+        assert len(response.json()) == limit
+        assert oldest_id not in {c["id"] for c in response.json()}
+        assert "x-next-before" not in response.headers
+
+    def test_detail_lists_broken_out_models(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        parent = create_conversation(db_session, user, models_used=["a/one", "b/two"])
+        create_conversation(
+            db_session,
+            user,
+            models_used=["b/two"],
+            conversation_type="breakout",
+            parent_conversation_id=parent.id,
+            breakout_model_id="b/two",
+        )
+
+        response = client.get(f"/api/conversations/{parent.id}")
+        assert response.status_code == 200
+        assert response.json()["already_broken_out_models"] == ["b/two"]
+
+    def test_delete_removes_messages(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        conversation = create_conversation(db_session, user)
+        create_conversation_message(db_session, conversation, role="user")
+
+        response = client.delete(f"/api/conversations/{conversation.id}")
+        assert response.status_code == 200
+        db_session.expire_all()
+        assert db_session.query(Conversation).count() == 0
+        assert db_session.query(ConversationMessage).count() == 0
+
+    def test_breakout_copies_selected_model_messages(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        parent = create_conversation(db_session, user, models_used=["a/one", "b/two"])
+        create_conversation_message(db_session, parent, role="user", content="question")
+        create_conversation_message(db_session, parent, model_id="a/one", content="from one")
+        create_conversation_message(db_session, parent, model_id="b/two", content="from two")
+
+        response = client.post(
+            "/api/conversations/breakout",
+            json={"parent_conversation_id": parent.id, "model_id": "b/two"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["conversation_type"] == "breakout"
+        assert [m["content"] for m in data["messages"]] == ["question", "from two"]
+
+    def test_other_users_conversation_not_found(self, authenticated_client, db_session):
+        from tests.factories import create_free_user
+
+        client, _, _, _ = authenticated_client
+        other = create_conversation(db_session, create_free_user(db_session))
+        assert client.get(f"/api/conversations/{other.id}").status_code == 404
+        assert client.delete(f"/api/conversations/{other.id}").status_code == 404
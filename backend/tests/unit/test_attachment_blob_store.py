@@ -0,0 +1,264 @@
+"""
+Unit tests for the content-addressed attachment blob store.
+
+Tests cover:
+- Local store: dedup on put, head, ranged get, delete, listing, key validation
+- Blob references added for new and breakout conversations
+- Sweeping unreferenced blobs, sparing referenced and recent ones
+- The attachment endpoint: caching headers, revalidation, byte ranges, content types
+- Attachments served only to the owner of a conversation referencing them, or by a
+  URL signed for the user
+- Conversation detail returning blob references instead of inline base64
+"""
+
+import base64
+import os
+import time
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.attachment_storage import (
+    blob_url,
+    collect_unreferenced_blobs,
+    serialize_attached_images,
+    signed_blob_url,
+)
+from app.blob_store import LocalBlobStore, blob_key, blob_store
+from app.models import AttachmentBlobRef
+from tests.factories import create_conversation, create_free_user
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(tmp_path / "blobs")
+
+
+def stored_image(name: str = "photo.png", data: bytes = DATA) -> str:
+    """file_contents JSON for one image, stored in the shared blob store."""
+    return serialize_attached_images(
+        [
+            {
+                "mime_type": "image/png",
+                "base64_data": base64.b64encode(data).decode("ascii"),
+                "filename": name,
+            }
+        ]
+    )
+
+
+def refs_to(db_session, key: str) -> int:
+    return db_session.query(AttachmentBlobRef).filter(AttachmentBlobRef.blob_key == key).count()
+
+
+def age(store: LocalBlobStore, key: str, seconds: float) -> None:
+    past = time.time() - seconds
+    os.utime(store._path(key), (past, past))
+
+
+class TestLocalBlobStore:
+    def test_put_is_content_addressed_and_deduplicated(self, store):
+        key = store.put(DATA, "image/png")
+        assert key == blob_key(DATA)
+        assert store.put_object(key, DATA, "image/png") is False
+
+        info = store.head_object(key)
+        assert info.size == len(DATA)
+        assert info.content_type == "image/png"
+        assert [i.key for i in store.list_objects()] == [key]
+
+    def test_ranged_get(self, store):
+        key = store.put(DATA, "image/png")
+        assert store.get_object(key) == DATA
+        assert store.get_object(key, 10, 19) == DATA[10:20]
+        assert store.get_object(key, 1000) == DATA[1000:]
+
+    def test_delete_and_missing(self, store):
+        key = store.put(DATA, "image/png")
+        store.delete_object(key)
+        assert store.head_object(key) is None
+        assert store.get_object(key) is None
+        assert list(store.list_objects()) == []
+
+    def test_rejects_keys_outside_the_store(self, store):
+        with pytest.raises(ValueError):
+            store.get_object("../" + "a" * 61)
+
+
+class TestReferences:
+    def test_conversation_references_its_blobs(self, db_session, test_user):
+        conversation = create_conversation(db_session, test_user, file_contents=stored_image())
+        (ref,) = db_session.query(AttachmentBlobRef).all()
+        assert ref.conversation_id == conversation.id
+        assert ref.blob_key == blob_key(DATA)
+
+    def test_conversation_without_images_has_no_references(self, db_session, test_user):
+        create_conversation(db_session, test_user)
+        assert db_session.query(AttachmentBlobRef).count() == 0
+
+    def test_breakout_adds_a_reference(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        parent = create_conversation(
+            db_session, user, models_used=["a/one", "b/two"], file_contents=stored_image()
+        )
+
+        response = client.post(
+            "/api/conversations/breakout",
+            json={"parent_conversation_id": parent.id, "model_id": "b/two"},
+        )
+        assert response.status_code == 200
+        assert refs_to(db_session, blob_key(DATA)) == 2
+        assert response.json()["file_contents"][0]["blob_key"] == blob_key(DATA)
+
+
+class TestSweep:
+    def test_deletes_only_old_unreferenced_blobs(self, db_session, test_user, store):
+        referenced = store.put(b"referenced", "image/png")
+        orphan = store.put(b"orphan", "image/png")
+        recent = store.put(b"recent", "image/png")
+        age(store, referenced, 7200)
+        age(store, orphan, 7200)
+        conversation = create_conversation(db_session, test_user)
+        db_session.add(AttachmentBlobRef(blob_key=referenced, conversation_id=conversation.id))
+        db_session.commit()
+
+        assert collect_unreferenced_blobs(db_session, grace_seconds=3600, store=store) == 1
+        assert store.head_object(orphan) is None
+        assert store.head_object(referenced) is not None
+        assert store.head_object(recent) is not None
+
+    def test_storing_again_restarts_grace_period(self, store):
+        key = store.put(DATA, "image/png")
+        age(store, key, 7200)
+        store.put(DATA, "image/png")
+        assert time.time() - store.head_object(key).modified_at < 60
+
+
+class TestAttachmentEndpoint:
+    @pytest.fixture
+    def owner(self, authenticated_client):
+        return authenticated_client[0]
+
+    @pytest.fixture
+    def referenced(self, authenticated_client, db_session):
+        """Store bytes as a blob referenced by one of the signed-in user's conversations."""
+        conversation = create_conversation(db_session, authenticated_client[1])
+
+        def reference(data: bytes, content_type: str = "image/png") -> str:
+            key = blob_store.put(data, content_type)
+            db_session.add(AttachmentBlobRef(blob_key=key, conversation_id=conversation.id))
+            db_session.commit()
+            return key
+
+        return reference
+
+    @pytest.fixture
+    def key(self, referenced):
+        return referenced(DATA)
+
+    def test_serves_blob_with_cache_headers(self, owner, key):
+        response = owner.get(f"/api/attachments/{key}")
+        assert response.status_code == 200
+        assert response.content == DATA
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["etag"] == f'"{key}"'
+        assert response.headers["cache-control"] == "private, max-age=31536000, immutable"
+        assert response.headers["accept-ranges"] == "bytes"
+
+    def test_revalidation(self, owner, key):
+        response = owner.get(f"/api/attachments/{key}", headers={"If-None-Match": f'"{key}"'})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_byte_range(self, owner, key):
+        response = owner.get(f"/api/attachments/{key}", headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.content == DATA[100:200]
+        assert response.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+
+    def test_open_and_suffix_ranges(self, owner, key):
+        response = owner.get(f"/api/attachments/{key}", headers={"Range": "bytes=1000-"})
+        assert response.content == DATA[1000:]
+        response = owner.get(f"/api/attachments/{key}", headers={"Range": "bytes=-24"})
+        assert response.content == DATA[-24:]
+        assert response.headers["content-range"] == f"bytes 1000-1023/{len(DATA)}"
+
+    def test_unsatisfiable_range(self, owner, key):
+        response = owner.get(f"/api/attachments/{key}", headers={"Range": "bytes=5000-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+    def test_stale_if_range_gets_whole_blob(self, owner, key):
+        response = owner.get(
+            f"/api/attachments/{key}", headers={"Range": "bytes=0-9", "If-Range": '"other"'}
+        )
+        assert response.status_code == 200
+        assert response.content == DATA
+
+    def test_active_content_not_served_inline(self, owner, referenced):
+        key = referenced(b"<svg onload='alert(1)'/>", "image/svg+xml")
+        response = owner.get(f"/api/attachments/{key}")
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.headers["x-content-type-options"] == "nosniff"
+
+    def test_unknown_and_malformed_keys(self, owner):
+        assert owner.get(f"/api/attachments/{'0' * 64}").status_code == 404
+        assert owner.get("/api/attachments/not-a-key").status_code == 404
+
+    def test_requires_authentication(self, owner, key):
+        owner.headers = {}
+        owner.cookies.clear()
+        assert owner.get(f"/api/attachments/{key}").status_code == 401
+
+    def test_unreferenced_blob_not_served(self, owner):
+        key = blob_store.put(b"stored, but in no conversation", "image/png")
+        assert owner.get(f"/api/attachments/{key}").status_code == 404
+
+    def test_signed_url_served_without_reference(self, owner, authenticated_client, db_session):
+        key = blob_store.put(b"generated, conversation not saved yet", "image/png")
+        user = authenticated_client[1]
+        assert owner.get(signed_blob_url(blob_url(key), user.id)).status_code == 200
+
+        other = create_free_user(db_session)
+        assert owner.get(signed_blob_url(blob_url(key), other.id)).status_code == 404
+        assert owner.get(f"{blob_url(key)}?sig=forged").status_code == 404
+
+    def test_other_users_blob_not_served(self, owner, db_session):
+        other = create_conversation(db_session, create_free_user(db_session))
+        key = blob_store.put(b"someone else's photo", "image/png")
+        db_session.add(AttachmentBlobRef(blob_key=key, conversation_id=other.id))
+        db_session.commit()
+        assert owner.get(f"/api/attachments/{key}").status_code == 404
+
+
+class TestConversationDetail:
+    def test_images_returned_as_references(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        conversation = create_conversation(db_session, user, file_contents=stored_image())
+
+        response = client.get(f"/api/conversations/{conversation.id}")
+        (item,) = response.json()["file_contents"]
+        key = blob_key(DATA)
+        assert item["blob_key"] == key
+        assert item["url"] == f"/api/attachments/{key}"
+        assert item["size"] == len(DATA)
+        assert item["base64_data"] is None
+        assert client.get(item["url"]).content == DATA
+
+    def test_legacy_inline_images_still_returned(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        conversation = create_conversation(
+            db_session,
+            user,
+            file_contents='[{"name": "old.png", "placeholder": "[image: old.png]", '
+            '"mime_type": "image/png", "base64_data": "iVBORw0KGgo="}]',
+        )
+
+        response = client.get(f"/api/conversations/{conversation.id}")
+        (item,) = response.json()["file_contents"]
+        assert item["base64_data"] == "iVBORw0KGgo="
+        assert item["blob_key"] is None
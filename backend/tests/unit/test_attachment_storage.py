@@ -1,11 +1,22 @@
 """Tests for conversation attachment serialization."""
 
+import base64
+import hashlib
+
 import pytest
 
 pytestmark = pytest.mark.unit
 
 
-from app.attachment_storage import parse_file_contents, serialize_attached_images
+from app.attachment_storage import (
+    attachment_blob_keys,
+    parse_file_contents,
+    serialize_attached_images,
+)
+from app.blob_store import blob_store
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nnot really a png"
+PNG_B64 = base64.b64encode(PNG_BYTES).decode("ascii")
 
 
 def test_serialize_attached_images_builds_json() -> None:
@@ -13,7 +24,7 @@ def test_serialize_attached_images_builds_json() -> None:
         [
             {
                 "mime_type": "image/png",
-                "base64_data": "abc123",
+                "base64_data": PNG_B64,
                 "filename": "photo.png",
                 "placeholder": "[image: photo.png]",
             }
@@ -23,8 +34,24 @@ def test_serialize_attached_images_builds_json() -> None:
     items = parse_file_contents(payload)
     assert len(items) == 1
     assert items[0]["name"] == "photo.png"
-    assert items[0]["base64_data"] == "abc123"
     assert items[0]["mime_type"] == "image/png"
+    assert "base64_data" not in items[0]
+    assert items[0]["blob_key"] == hashlib.sha256(PNG_BYTES).hexdigest()
+    assert items[0]["size"] == len(PNG_BYTES)
+    assert blob_store.get_object(items[0]["blob_key"]) == PNG_BYTES
+
+
+def test_serialize_attached_images_stores_repeated_image_once() -> None:
+    image = {"mime_type": "image/png", "base64_data": PNG_B64, "filename": "a.png"}
+    payload = serialize_attached_images([image, {**image, "filename": "b.png"}])
+
+    first, second = parse_file_contents(payload)
+    assert first["blob_key"] == second["blob_key"]
+    assert attachment_blob_keys(payload) == [first["blob_key"]]
+
+
+def test_serialize_attached_images_skips_invalid_base64() -> None:
+    assert serialize_attached_images([{"mime_type": "image/png", "base64_data": "%%%"}]) is None
 
 
 def test_serialize_attached_images_empty_when_no_data() -> None:
@@ -37,7 +64,7 @@ def test_serialize_attached_images_accepts_pydantic_like_objects() -> None:
         def model_dump(self) -> dict[str, str]:
             return {
                 "mime_type": "image/jpeg",
-                "base64_data": "xyz",
+                "base64_data": base64.b64encode(b"jpeg bytes").decode("ascii"),
                 "filename": "snap.jpg",
             }
 
@@ -63,3 +90,12 @@ def test_parse_file_contents_rejects_non_list_payload() -> None:
 def test_parse_file_contents_filters_non_dict_entries() -> None:
     parsed = parse_file_contents('[{"name": "ok"}, "skip", 42]')
     assert parsed == [{"name": "ok"}]
+
+
+def test_attachment_blob_keys_ignores_legacy_and_invalid_entries() -> None:
+    key = "a" * 64
+    raw = (
+        f'[{{"blob_key": "{key}"}}, {{"base64_data": "abc"}}, '
+        '{"blob_key": "../../etc/passwd"}, {"name": "notes.txt", "content": "hi"}]'
+    )
+    assert attachment_blob_keys(raw) == [key]
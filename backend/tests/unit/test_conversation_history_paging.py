@@ -0,0 +1,199 @@
+"""
+Unit tests for keyset-paged conversation history.
+
+Tests cover:
+- Conversation list pages linked by X-Next-Before, ties on created_at broken by id
+- Summaries carrying a preview of long prompts, the detail the full text
+- Latest-messages detail and paging back through earlier messages
+- History trimmed on write, in one DELETE, on saves and breakouts
+- Query plans (EXPLAIN) walking the (user_id, created_at, id) index
+"""
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from sqlalchemy import select
+
+from app.config import get_history_entry_limit
+from app.models import Conversation, conversation_history_trim
+from app.routers.api.conversations import SUMMARY_INPUT_PREVIEW_CHARS
+from tests.factories import (
+    create_conversation,
+    create_conversation_message,
+    create_free_user,
+)
+
+BASE = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=1)
+
+
+def make_history(db_session, user, count: int) -> list[int]:
+    """Conversation ids, newest first; every other pair shares its created_at."""
+    ids = [
+        create_conversation(db_session, user, created_at=BASE + timedelta(minutes=i // 2)).id
+        for i in range(count)
+    ]
+    return ids[::-1]
+
+
+class TestConversationPages:
+    def test_pages_cover_history_once(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        user.subscription_tier = "pro"
+        db_session.commit()
+        expected = make_history(db_session, user, 7)
+
+        seen, before = [], None
+        while True:
+            params = {"limit": 3} | ({"before": before} if before else {})
+            response = client.get("/api/conversations", params=params)
+            assert response.status_code == 200
+            seen += [c["id"] for c in response.json()]
+            before = response.headers.get("x-next-before")
+            if before is None:
+                break
+
+        assert seen == expected
+
+    def test_page_size_capped_at_history_limit(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        limit = get_history_entry_limit(user.subscription_tier)
+        make_history(db_session, user, limit)
+
+        response = client.get("/api/conversations", params={"limit": 100})
+        assert len(response.json()) == limit
+        assert "x-next-before" not in response.headers
+
+    def test_unknown_cursor_gives_empty_page(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        make_history(db_session, user, 2)
+        other = create_conversation(db_session, create_free_user(db_session))
+
+        response = client.get("/api/conversations", params={"before": other.id})
+        assert response.json() == []
+
+    def test_summary_previews_long_prompts(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        prompt = "é" + "x" * SUMMARY_INPUT_PREVIEW_CHARS
+        long = create_conversation(db_session, user, input_data=prompt, created_at=BASE)
+        short = create_conversation(
+            db_session, user, input_data="short", created_at=BASE + timedelta(minutes=1)
+        )
+
+        summaries = client.get("/api/conversations").json()
+        assert [(c["id"], c["input_truncated"]) for c in summaries] == [
+            (short.id, False),
+            (long.id, True),
+        ]
+        assert summaries[0]["input_data"] == "short"
+        assert summaries[1]["input_data"] == prompt[:SUMMARY_INPUT_PREVIEW_CHARS]
+        detail = client.get(f"/api/conversations/{long.id}").json()
+        assert detail["input_data"] == prompt
+
+
+class TestMessagePages:
+    @pytest.fixture
+    def thread(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        conversation = create_conversation(db_session, user)
+        ids = [
+            create_conversation_message(db_session, conversation, role="user").id for _ in range(7)
+        ]
+        return client, conversation, ids
+
+    def test_detail_returns_latest_messages(self, thread):
+        client, conversation, ids = thread
+        detail = client.get(
+            f"/api/conversations/{conversation.id}", params={"message_limit": 3}
+        ).json()
+        assert [m["id"] for m in detail["messages"]] == ids[-3:]
+        assert detail["has_earlier_messages"] is True
+
+    def test_detail_without_limit_returns_all(self, thread):
+        client, conversation, ids = thread
+        detail = client.get(f"/api/conversations/{conversation.id}").json()
+        assert [m["id"] for m in detail["messages"]] == ids
+        assert detail["has_earlier_messages"] is False
+
+    def test_paging_back_through_earlier_messages(self, thread):
+        client, conversation, ids = thread
+        seen, before = [], ids[-3]
+        while before is not None:
+            response = client.get(
+                f"/api/conversations/{conversation.id}/messages",
+                params={"before": before, "limit": 2},
+            )
+            assert response.status_code == 200
+            seen = [m["id"] for m in response.json()] + seen
+            before = response.headers.get("x-next-before")
+        assert seen == ids[:-3]
+
+    def test_messages_of_other_users_conversation(self, thread, db_session):
+        client, _, ids = thread
+        other = create_conversation(db_session, create_free_user(db_session))
+        response = client.get(f"/api/conversations/{other.id}/messages", params={"before": ids[-1]})
+        assert response.status_code == 404
+
+
+class TestTrimOnWrite:
+    def test_trim_keeps_newest(self, db_session, test_user):
+        newest_first = make_history(db_session, test_user, 5)
+        db_session.execute(conversation_history_trim(test_user.id, 2))
+        db_session.commit()
+
+        remaining = db_session.scalars(
+            select(Conversation.id).where(Conversation.user_id == test_user.id)
+        ).all()
+        assert sorted(remaining) == sorted(newest_first[:2])
+
+    def test_trim_spares_other_users(self, db_session, test_user):
+        other = create_free_user(db_session)
+        mine = create_conversation(db_session, other)
+        make_history(db_session, test_user, 3)
+        db_session.execute(conversation_history_trim(test_user.id, 1))
+        db_session.commit()
+        assert db_session.get(Conversation, mine.id) is not None
+
+    def test_reading_history_does_not_trim(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        limit = get_history_entry_limit(user.subscription_tier)
+        oldest = make_history(db_session, user, limit + 1)[-1]
+
+        client.get("/api/conversations")
+        db_session.expire_all()
+        assert db_session.get(Conversation, oldest) is not None
+
+    def test_breakout_trims_history(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        limit = get_history_entry_limit(user.subscription_tier)
+        ids = make_history(db_session, user, limit)
+        parent = create_conversation(
+            db_session, user, models_used=["a/one", "b/two"], created_at=datetime.now()
+        )
+
+        response = client.post(
+            "/api/conversations/breakout",
+            json={"parent_conversation_id": parent.id, "model_id": "b/two"},
+        )
+        assert response.status_code == 200
+        db_session.expire_all()
+        remaining = set(
+            db_session.scalars(select(Conversation.id).where(Conversation.user_id == user.id))
+        )
+        assert remaining == {response.json()["id"], parent.id, *ids[: limit - 2]}
+
+
+class TestQueryPlan:
+    def test_history_page_walks_composite_index(self, db_session, test_user):
+        make_history(db_session, test_user, 4)
+        rows = db_session.connection().exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM conversations WHERE user_id = ? "
+            "ORDER BY created_at DESC, id DESC LIMIT 3",
+            (test_user.id,),
+        )
+        plan = " | ".join(str(row[-1]) for row in rows)
+        assert "ix_conversations_user_created_id" in plan
+        assert "TEMP B-TREE" not in plan
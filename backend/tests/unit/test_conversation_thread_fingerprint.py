@@ -0,0 +1,123 @@
+"""
+Unit tests for the conversation thread fingerprint.
+
+Tests cover:
+- Fingerprint set on insert, independent of model order
+- Follow-up lookup by conversation_id and by fingerprint
+- The lookup using the (user_id, thread_fingerprint) index on SQLite
+- The migration backfill hashing like the model
+"""
+
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.models import Conversation, conversation_thread_fingerprint
+from app.routers.api.core import CompareRequest, ConversationMessage
+from app.services.comparison_stream import find_follow_up_conversation
+from tests.factories import create_conversation, create_free_user
+
+MIGRATION = (
+    Path(__file__).parents[2]
+    / "migrations"
+    / "versions"
+    / "20260615_000000_conversation_thread_fingerprint.py"
+)
+
+
+def follow_up(models: list[str], first_message: str, conversation_id: int | None = None):
+    return CompareRequest(
+        input_data="and then?",
+        models=models,
+        conversation_id=conversation_id,
+        conversation_history=[
+            ConversationMessage(role="user", content=first_message),
+            ConversationMessage(role="assistant", content="answer", model_id=models[0]),
+        ],
+    )
+
+
+class TestFingerprint:
+    def test_set_on_insert(self, db_session, test_user):
+        conversation = create_conversation(
+            db_session, test_user, input_data="hello", models_used=["b/two", "a/one"]
+        )
+        assert conversation.thread_fingerprint == conversation_thread_fingerprint(
+            ["a/one", "b/two"], "hello"
+        )
+
+    def test_distinguishes_models_and_message(self):
+        base = conversation_thread_fingerprint(["a/one", "b/two"], "hello")
+        assert base == conversation_thread_fingerprint(["b/two", "a/one"], "hello")
+        assert base != conversation_thread_fingerprint(["a/one"], "hello")
+        assert base != conversation_thread_fingerprint(["a/one", "b/two"], "hello!")
+
+    def test_migration_backfill_matches(self):
+        spec = importlib.util.spec_from_file_location("thread_fingerprint_migration", MIGRATION)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        assert migration._fingerprint('["b/two", "a/one"]', "hello") == (
+            conversation_thread_fingerprint(["a/one", "b/two"], "hello")
+        )
+
+
+class TestFindFollowUpConversation:
+    def test_by_fingerprint(self, db_session, test_user):
+        other_user = create_free_user(db_session)
+        create_conversation(db_session, other_user, input_data="hello", models_used=["a/one"])
+        create_conversation(db_session, test_user, input_data="hello", models_used=["b/two"])
+        create_conversation(db_session, test_user, input_data="bye", models_used=["a/one"])
+        match = create_conversation(
+            db_session, test_user, input_data="hello", models_used=["a/one"]
+        )
+
+        found = find_follow_up_conversation(db_session, test_user.id, follow_up(["a/one"], "hello"))
+        assert found.id == match.id
+
+    def test_newest_thread_wins(self, db_session, test_user):
+        now = datetime.now()
+        create_conversation(
+            db_session, test_user, input_data="hello", updated_at=now - timedelta(days=1)
+        )
+        newest = create_conversation(db_session, test_user, input_data="hello", updated_at=now)
+
+        found = find_follow_up_conversation(
+            db_session, test_user.id, follow_up(["openai/gpt-4"], "hello")
+        )
+        assert found.id == newest.id
+
+    def test_by_conversation_id(self, db_session, test_user):
+        conversation = create_conversation(db_session, test_user, input_data="renamed thread")
+
+        req = follow_up(["openai/gpt-4"], "hello", conversation_id=conversation.id)
+        assert find_follow_up_conversation(db_session, test_user.id, req).id == conversation.id
+
+    def test_other_users_conversation_id_ignored(self, db_session, test_user):
+        other = create_conversation(db_session, create_free_user(db_session), input_data="hello")
+
+        req = follow_up(["openai/gpt-4"], "hello", conversation_id=other.id)
+        assert find_follow_up_conversation(db_session, test_user.id, req) is None
+
+    def test_first_comparison_has_no_thread(self, db_session, test_user):
+        create_conversation(db_session, test_user, input_data="hello")
+        req = CompareRequest(input_data="hello", models=["openai/gpt-4"])
+
+        assert find_follow_up_conversation(db_session, test_user.id, req) is None
+
+    def test_lookup_uses_index(self, db_session, test_user):
+        query = db_session.query(Conversation.id).filter(
+            Conversation.user_id == test_user.id,
+            Conversation.thread_fingerprint == "0" * 64,
+        )
+        statement = query.statement.compile(db_session.get_bind())
+        rows = db_session.connection().exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", tuple(statement.params.values())
+        )
+        plan = " | ".join(str(row[-1]) for row in rows)
+        assert "ix_conversations_user_thread_fingerprint" in plan
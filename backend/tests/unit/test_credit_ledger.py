@@ -0,0 +1,285 @@
+"""
+Unit tests for the anonymous credit ledger.
+
+Tests cover:
+- Day rollover, the 20-hour reset guard, and timezone changes
+- Charges capped at the allocation, refunds floored at zero
+- Reservations refused past the cap, atomically under concurrent requests
+- Reserving on every identifier or none, and settling to the actual cost
+- Seeding a newly started balance from the usage rollup (once per day)
+- Falling back to the local ledger when Redis fails
+- The comparison stream reserving at admission and settling or refunding at its end,
+  including when the client goes away mid-stream
+"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from sqlalchemy.orm import sessionmaker
+
+from app.credit_ledger import (
+    LedgerEntry,
+    LocalCreditLedger,
+    RedisCreditLedger,
+    anonymous_credit_ledger,
+)
+from app.llm import tokens
+from app.rate_limiting import (
+    check_anonymous_credits,
+    deduct_anonymous_credits,
+    record_anonymous_usage,
+    reserve_anonymous_credits,
+    settle_anonymous_credits,
+)
+from app.routers.api import core
+from app.services import comparison_stream
+from app.services.write_behind import write_behind_queue
+
+TODAY = "2026-03-10"
+TOMORROW = "2026-03-11"
+
+
+@pytest.fixture
+def ledger():
+    return LocalCreditLedger()
+
+
+class TestLocalCreditLedger:
+    def test_new_identifier_starts_balance(self, ledger):
+        assert ledger.charge("ip:1", "UTC", TODAY, 0, 50) == LedgerEntry(0, TODAY, "UTC", True)
+        assert ledger.charge("ip:1", "UTC", TODAY, 5, 50) == LedgerEntry(5, TODAY, "UTC", False)
+
+    def test_charge_capped_at_allocation(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 45, 50)
+        assert ledger.charge("ip:1", "UTC", TODAY, 10, 50).count == 50
+
+    def test_refund_floored_at_zero(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 5, 50)
+        assert ledger.charge("ip:1", "UTC", TODAY, -8, 50).count == 0
+
+    def test_reservation_refused_past_cap(self, ledger):
+        assert ledger.reserve("ip:1", "UTC", TODAY, 45, 50).allowed
+        entry = ledger.reserve("ip:1", "UTC", TODAY, 10, 50)
+        assert (entry.count, entry.allowed) == (45, False)
+        assert ledger.reserve("ip:1", "UTC", TODAY, 5, 50) == LedgerEntry(
+            50, TODAY, "UTC", False, True
+        )
+
+    def test_concurrent_reservations_never_exceed_cap(self, ledger):
+        barrier = threading.Barrier(20)
+
+        def reserve(_):
+            barrier.wait()
+            return ledger.reserve("ip:1", "UTC", TODAY, 10, 50).allowed
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            allowed = list(pool.map(reserve, range(20)))
+        assert allowed.count(True) == 5
+        assert ledger.balances() == {"ip:1": 50}
+
+    def test_new_day_restarts_balance(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 30, 50)
+        ledger.records["ip:1"]["last_reset_at"] = datetime.now(UTC) - timedelta(hours=21)
+        entry = ledger.charge("ip:1", "UTC", TOMORROW, 0, 50)
+        assert entry == LedgerEntry(0, TOMORROW, "UTC", True)
+
+    def test_no_restart_within_20_hours(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 30, 50)
+        entry = ledger.charge("ip:1", "UTC", TOMORROW, 0, 50)
+        assert entry == LedgerEntry(30, TODAY, "UTC", False)
+
+    def test_timezone_change_does_not_buy_second_allowance(self, ledger):
+        ledger.charge("ip:1", "America/Chicago", TODAY, 50, 50)
+        entry = ledger.charge("ip:1", "Asia/Tokyo", TOMORROW, 0, 50)
+        assert entry == LedgerEntry(50, TODAY, "America/Chicago", False)
+
+    def test_timezone_change_accepted_when_reset_allowed(self, ledger):
+        ledger.charge("ip:1", "America/Chicago", TODAY, 50, 50)
+        ledger.records["ip:1"]["last_reset_at"] = datetime.now(UTC) - timedelta(hours=21)
+        entry = ledger.charge("ip:1", "Asia/Tokyo", TOMORROW, 0, 50)
+        assert entry == LedgerEntry(0, TOMORROW, "Asia/Tokyo", True)
+
+    def test_seed_only_raises_current_day(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 10, 50)
+        assert ledger.seed("ip:1", TODAY, 4, 50) == 10
+        assert ledger.seed("ip:1", TODAY, 80, 50) == 50
+        assert ledger.seed("ip:1", TOMORROW, 0, 50) == 50
+
+    def test_zero_all_and_delete(self, ledger):
+        ledger.charge("ip:1", "UTC", TODAY, 10, 50)
+        ledger.charge("fp:abc", "UTC", TODAY, 20, 50)
+        assert sorted(ledger.zero_all(TODAY)) == ["fp:abc", "ip:1"]
+        assert ledger.balances() == {"ip:1": 0, "fp:abc": 0}
+        ledger.delete("ip:1")
+        assert ledger.balances() == {"fp:abc": 0}
+
+
+class TestRedisFallback:
+    def test_redis_errors_use_local_ledger(self):
+        import redis
+
+        fallback = LocalCreditLedger()
+        ledger = RedisCreditLedger("redis://localhost:1/0", fallback=fallback)
+        ledger._charge = MagicMock(side_effect=redis.ConnectionError("down"))
+        ledger._seed = MagicMock(side_effect=redis.ConnectionError("down"))
+
+        assert ledger.charge("ip:1", "UTC", TODAY, 7, 50).count == 7
+        assert ledger.seed("ip:1", TODAY, 9, 50) == 9
+        assert fallback.records["ip:1"]["count"] == 9
+        assert not ledger.reserve("ip:1", "UTC", TODAY, 42, 50).allowed
+
+
+class TestReservations:
+    @pytest.fixture(autouse=True)
+    def clear_ledger(self):
+        anonymous_credit_ledger.clear()
+        yield
+        anonymous_credit_ledger.clear()
+
+    def test_reserved_on_every_identifier(self):
+        allowed, remaining, allocated = reserve_anonymous_credits(
+            ["ip:10.0.0.3", "fp:abc"], Decimal("4.2")
+        )
+        assert (allowed, remaining) == (True, allocated - 5)
+        assert anonymous_credit_ledger.balances() == {"ip:10.0.0.3": 5, "fp:abc": 5}
+
+    def test_refused_identifier_releases_the_others(self):
+        deduct_anonymous_credits("fp:abc", Decimal(48))
+        allowed, remaining, _ = reserve_anonymous_credits(["ip:10.0.0.4", "fp:abc"], Decimal(5))
+        assert (allowed, remaining) == (False, 2)
+        assert anonymous_credit_ledger.balances() == {"ip:10.0.0.4": 0, "fp:abc": 48}
+
+    def test_settled_to_actual_cost(self):
+        identifiers = ["ip:10.0.0.5", "fp:abc"]
+        _, _, allocated = reserve_anonymous_credits(identifiers, Decimal(20))
+        assert settle_anonymous_credits(identifiers, 20, Decimal("6.5")) == allocated - 7
+        assert anonymous_credit_ledger.balances() == {"ip:10.0.0.5": 7, "fp:abc": 7}
+
+        reserve_anonymous_credits(identifiers, Decimal(3))
+        assert settle_anonymous_credits(identifiers, 3, Decimal(0)) == allocated - 7
+
+
+class TestSeedFromUsageRollup:
+    def test_new_balance_seeded_from_todays_usage(self, db_session):
+        record_anonymous_usage(db_session, "10.0.0.1", None, Decimal("12.2"))
+        db_session.commit()
+        _, remaining, allocated = check_anonymous_credits(
+            "ip:10.0.0.1", Decimal(0), "UTC", db_session
+        )
+        assert remaining == allocated - 13
+
+    def test_usage_only_read_when_balance_starts(self, db_session):
+        check_anonymous_credits("ip:10.0.0.2", Decimal(0), "UTC", db_session)
+        deduct_anonymous_credits("ip:10.0.0.2", Decimal("3"))
+        # Recorded after the balance started: already counted by the deduction above
+        record_anonymous_usage(db_session, "10.0.0.2", None, Decimal("3"))
+        db_session.commit()
+        _, remaining, allocated = check_anonymous_credits(
+            "ip:10.0.0.2", Decimal(0), "UTC", db_session
+        )
+        assert remaining == allocated - 3
+
+
+class TestComparisonStream:
+    @pytest.fixture
+    def stream_client(self, monkeypatch, client, db_session):
+        # Queued writes land before the response ends, on the test's single connection
+        client.portal.call(write_behind_queue.stop)
+        monkeypatch.setattr(
+            write_behind_queue,
+            "submit",
+            lambda description, job: write_behind_queue._write_batch([(description, job, None)]),
+        )
+        monkeypatch.setattr(
+            write_behind_queue, "_session_factory", sessionmaker(bind=db_session.get_bind())
+        )
+        monkeypatch.setattr(
+            tokens, "estimate_reserved_credits_for_compare", lambda *a, **k: Decimal(10)
+        )
+        return client
+
+    @pytest.fixture
+    def balances_at_admission(self, monkeypatch):
+        balances: list[int] = []
+
+        def reserve(*args, **kwargs):
+            result = reserve_anonymous_credits(*args, **kwargs)
+            balances.append(anonymous_credit_ledger.balances()["ip:testclient"])
+            return result
+
+        monkeypatch.setattr(core, "reserve_anonymous_credits", reserve)
+        return balances
+
+    def compare(self, client):
+        return client.post(
+            "/api/compare-stream",
+            json={"input_data": "Hello", "models": ["deepseek/deepseek-chat-v3.1"]},
+        )
+
+    def test_reserved_at_admission_and_settled(
+        self, stream_client, balances_at_admission, monkeypatch
+    ):
+        async def fake_stream(*args, **kwargs):
+            yield "Hi there."
+            yield {"type": "usage", "usage": None}
+
+        monkeypatch.setattr(comparison_stream, "call_openrouter_streaming_async", fake_stream)
+        response = self.compare(stream_client)
+
+        assert response.status_code == 200
+        assert balances_at_admission == [10]
+        # Billed the one-credit minimum; the rest of the reservation is released
+        assert anonymous_credit_ledger.balances()["ip:testclient"] == 1
+        complete = json.loads(response.text.rsplit("data: ", 1)[1])
+        assert complete["metadata"]["credits_remaining"] == 49
+
+    def test_reservation_refunded_when_every_model_fails(
+        self, stream_client, balances_at_admission, monkeypatch
+    ):
+        async def fake_stream(*args, **kwargs):
+            raise RuntimeError("provider down")
+            yield  # pragma: no cover
+
+        monkeypatch.setattr(comparison_stream, "call_openrouter_streaming_async", fake_stream)
+        assert self.compare(stream_client).status_code == 200
+        assert balances_at_admission == [10]
+        assert anonymous_credit_ledger.balances()["ip:testclient"] == 0
+
+    def test_reservation_refunded_when_stream_closed_mid_way(
+        self, stream_client, balances_at_admission, monkeypatch
+    ):
+        async def fake_stream(*args, **kwargs):
+            yield "Hi there."
+            await asyncio.Event().wait()
+
+        generate_stream = comparison_stream.generate_stream
+
+        async def closed_mid_stream(ctx):
+            # What a client disconnect does to the response body
+            stream = generate_stream(ctx)
+            async for frame in stream:
+                if b"Hi there." in frame:
+                    break
+            await stream.aclose()
+            yield b""
+
+        monkeypatch.setattr(comparison_stream, "call_openrouter_streaming_async", fake_stream)
+        monkeypatch.setattr(comparison_stream, "generate_stream", closed_mid_stream)
+        assert self.compare(stream_client).status_code == 200
+        assert balances_at_admission == [10]
+        assert anonymous_credit_ledger.balances()["ip:testclient"] == 0
+
+    def test_over_cap_request_refused_without_charge(self, stream_client):
+        deduct_anonymous_credits("ip:testclient", Decimal(45))
+        assert self.compare(stream_client).status_code == 402
+        assert anonymous_credit_ledger.balances()["ip:testclient"] == 45
@@ -0,0 +1,141 @@
+"""
+Unit tests for the UsageLog retention job.
+
+Tests cover:
+- Monthly aggregates built from batched GROUP BY queries
+- Recent entries left untouched
+- Resuming an interrupted cleanup without double counting
+- Keyset batches of batch_size old entries, however sparse the ids
+- Dry-run reporting
+"""
+
+import json
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.data_retention import cleanup_old_usage_logs, iter_usage_log_cleanup
+from app.models import UsageLog, UsageLogMonthlyAggregate
+
+NOW = datetime.now(UTC).replace(tzinfo=None)
+
+
+def add_logs(db_session, days_ago: int, count: int, models: list[str], tokens: int = 100):
+    for _ in range(count):
+        db_session.add(
+            UsageLog(
+                models_used=json.dumps(models),
+                models_requested=len(models),
+                models_successful=len(models),
+                models_failed=0,
+                input_tokens=tokens,
+                output_tokens=2 * tokens,
+                credits_used=Decimal("1.5"),
+                estimated_cost=Decimal("0.0166"),
+                created_at=NOW - timedelta(days=days_ago),
+            )
+        )
+    db_session.commit()
+
+
+@pytest.fixture
+def old_and_recent_logs(db_session):
+    add_logs(db_session, 200, 7, ["a/model", "b/model"])
+    add_logs(db_session, 150, 5, ["a/model"], tokens=50)
+    add_logs(db_session, 120, 4, ["c/model"])
+    add_logs(db_session, 10, 3, ["a/model"])
+    return db_session
+
+
+def aggregates(db_session) -> dict[tuple[int, int], UsageLogMonthlyAggregate]:
+    return {(a.year, a.month): a for a in db_session.query(UsageLogMonthlyAggregate).all()}
+
+
+def comparable(db_session) -> dict:
+    return {
+        key: (
+            a.total_comparisons,
+            a.total_input_tokens,
+            a.total_credits_used,
+            {
+                m: (s["count"], round(s["avg_input_tokens"], 6))
+                for m, s in json.loads(a.model_breakdown).items()
+            },
+        )
+        for key, a in aggregates(db_session).items()
+    }
+
+
+class TestCleanupOldUsageLogs:
+    def test_aggregates_and_deletes_old_entries(self, old_and_recent_logs):
+        db = old_and_recent_logs
+        result = cleanup_old_usage_logs(db, keep_days=90, batch_size=3)
+
+        assert result["status"] == "success"
+        assert result["entries_deleted"] == 16
+        assert result["batches"] == 6
+        assert db.query(UsageLog).count() == 3
+        totals = aggregates(db).values()
+        assert sum(a.total_comparisons for a in totals) == 16
+        assert sum(a.total_input_tokens for a in totals) == 7 * 100 + 5 * 50 + 4 * 100
+        assert sum(a.total_credits_used for a in totals) == Decimal("24")
+        breakdowns = [json.loads(a.model_breakdown) for a in totals]
+        assert sum(b.get("a/model", {}).get("count", 0) for b in breakdowns) == 12
+        assert sum(b.get("c/model", {}).get("count", 0) for b in breakdowns) == 4
+
+    def test_batch_size_does_not_change_result(self, old_and_recent_logs):
+        db = old_and_recent_logs
+        cleanup_old_usage_logs(db, keep_days=90, batch_size=100)
+        in_one_batch = comparable(db)
+        db.query(UsageLogMonthlyAggregate).delete()
+        db.commit()
+
+        add_logs(db, 200, 7, ["a/model", "b/model"])
+        add_logs(db, 150, 5, ["a/model"], tokens=50)
+        add_logs(db, 120, 4, ["c/model"])
+        cleanup_old_usage_logs(db, keep_days=90, batch_size=1)
+        assert comparable(db) == in_one_batch
+
+    def test_interrupted_cleanup_resumes_without_double_counting(self, old_and_recent_logs):
+        db = old_and_recent_logs
+        progress = iter_usage_log_cleanup(db, keep_days=90, batch_size=4)
+        first = next(progress)
+        progress.close()  # interrupted after one committed batch
+        assert first["status"] == "running" and first["entries_deleted"] == 4
+
+        result = cleanup_old_usage_logs(db, keep_days=90, batch_size=4)
+        assert result["entries_deleted"] == 12
+        assert sum(a.total_comparisons for a in aggregates(db).values()) == 16
+
+    def test_batches_count_entries_not_ids(self, db_session):
+        add_logs(db_session, 200, 9, ["a/model"])
+        # Sparse ids: every other entry is gone, and a recent entry sits in the middle
+        ids = [log.id for log in db_session.query(UsageLog).order_by(UsageLog.id)]
+        db_session.query(UsageLog).filter(UsageLog.id.in_(ids[1::2])).delete()
+        db_session.query(UsageLog).filter(UsageLog.id == ids[4]).update(
+            {"created_at": NOW - timedelta(days=1)}
+        )
+        db_session.commit()
+
+        progress = list(iter_usage_log_cleanup(db_session, keep_days=90, batch_size=2))
+        assert [p["entries_deleted"] for p in progress[:-1]] == [2, 4]
+        assert progress[-1]["batches"] == 2
+        assert [log.id for log in db_session.query(UsageLog)] == [ids[4]]
+
+    def test_no_data(self, db_session):
+        add_logs(db_session, 1, 2, ["a/model"])
+        assert cleanup_old_usage_logs(db_session, keep_days=90)["status"] == "no_data"
+        assert db_session.query(UsageLog).count() == 2
+
+    def test_dry_run_reports_without_deleting(self, old_and_recent_logs):
+        db = old_and_recent_logs
+        result = cleanup_old_usage_logs(db, keep_days=90, dry_run=True)
+        assert result["status"] == "dry_run"
+        assert result["would_delete_entries"] == 16
+        assert sum(m["entries"] for m in result["monthly_breakdown"].values()) == 16
+        assert db.query(UsageLog).count() == 19
+        assert not aggregates(db)
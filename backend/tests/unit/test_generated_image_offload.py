@@ -0,0 +1,189 @@
+"""
+Unit tests for offloading generated images to the blob store.
+
+Tests cover:
+- data: URLs stored as blobs, with a WebP thumbnail bounded in size
+- Remote and undecodable URLs passed through, thumbnails switched off
+- Blob references added for a message's images and thumbnails
+- The comparison stream carrying signed blob URLs in SSE frames, plain ones in saved messages
+- Streamed image URLs served before the conversation is saved, only to their user
+"""
+
+import base64
+import io
+import json
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from PIL import Image
+from sqlalchemy.orm import sessionmaker
+
+from app.attachment_storage import blob_url_keys, offload_generated_image, signed_blob_url
+from app.blob_store import blob_key, blob_store
+from app.config import settings
+from app.models import AttachmentBlobRef, ConversationMessage
+from app.services import comparison_stream
+from app.services.write_behind import write_behind_queue
+from tests.factories import create_conversation, create_free_user
+
+MODEL = "deepseek/deepseek-chat-v3.1"
+
+
+def png_bytes(width: int = 600, height: int = 300) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def data_url(data: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+
+
+def key_of(url: str) -> str:
+    (key,) = blob_url_keys([url])
+    return key
+
+
+def compare(client) -> str:
+    response = client.post(
+        "/api/compare-stream", json={"input_data": "Draw a square", "models": [MODEL]}
+    )
+    assert response.status_code == 200
+    return response.text
+
+
+def image_event_of(stream: str) -> dict:
+    assert "base64," not in stream
+    events = [
+        json.loads(line[len("data: ") :])
+        for line in stream.splitlines()
+        if line.startswith("data: ")
+    ]
+    (image_event,) = [e for e in events if e["type"] == "image"]
+    return image_event
+
+
+class TestOffload:
+    def test_data_url_stored_as_blob(self):
+        data = png_bytes()
+        url, thumbnail_url = offload_generated_image(data_url(data))
+
+        assert url == f"/api/attachments/{blob_key(data)}"
+        assert blob_store.get_object(blob_key(data)) == data
+        assert blob_store.head_object(blob_key(data)).content_type == "image/png"
+
+        thumbnail = blob_store.get_object(key_of(thumbnail_url))
+        with Image.open(io.BytesIO(thumbnail)) as image:
+            assert image.format == "WEBP"
+            assert max(image.size) == settings.generated_image_thumbnail_px
+
+    def test_remote_url_passed_through(self):
+        url = "https://images.example.com/generated/1.png"
+        assert offload_generated_image(url) == (url, None)
+
+    def test_undecodable_data_url_passed_through(self):
+        url = "data:image/png;base64,%%%not-base64"
+        assert offload_generated_image(url) == (url, None)
+
+    def test_thumbnail_skipped_for_non_image_bytes(self):
+        url, thumbnail_url = offload_generated_image(data_url(b"not an image"))
+        assert url == f"/api/attachments/{blob_key(b'not an image')}"
+        assert thumbnail_url is None
+
+    def test_thumbnails_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "generated_image_thumbnail_px", 0)
+        url, thumbnail_url = offload_generated_image(data_url(png_bytes(40, 40)))
+        assert url.startswith("/api/attachments/")
+        assert thumbnail_url is None
+
+
+class TestMessageReferences:
+    def test_images_and_thumbnails_referenced(self, db_session, test_user):
+        conversation = create_conversation(db_session, test_user)
+        image_url, thumbnail_url = offload_generated_image(data_url(png_bytes()))
+        db_session.add(
+            ConversationMessage(
+                conversation_id=conversation.id,
+                role="assistant",
+                content="",
+                images=json.dumps([image_url, "https://images.example.com/2.png"]),
+                image_thumbnails=json.dumps([thumbnail_url, None]),
+            )
+        )
+        db_session.commit()
+
+        refs = db_session.query(AttachmentBlobRef).filter_by(conversation_id=conversation.id)
+        assert sorted(ref.blob_key for ref in refs) == sorted(
+            [key_of(image_url), key_of(thumbnail_url)]
+        )
+
+
+class TestComparisonStream:
+    @pytest.fixture
+    def image_model(self, monkeypatch, client, db_session):
+        image = png_bytes()
+        # Queued writes land before the response ends, on the test's single connection
+        client.portal.call(write_behind_queue.stop)
+        monkeypatch.setattr(
+            write_behind_queue,
+            "submit",
+            lambda description, job: write_behind_queue._write_batch([(description, job, None)]),
+        )
+
+        async def fake_stream(*args, **kwargs):
+            yield {"type": "image", "url": data_url(image)}
+            yield "Here is your image."
+            yield {"type": "usage", "usage": None}
+
+        monkeypatch.setattr(comparison_stream, "call_openrouter_streaming_async", fake_stream)
+        monkeypatch.setattr(
+            write_behind_queue, "_session_factory", sessionmaker(bind=db_session.get_bind())
+        )
+        return image
+
+    def test_stream_and_history_carry_blob_urls(
+        self, authenticated_client, db_session, image_model
+    ):
+        client, user, _, _ = authenticated_client
+        image_event = image_event_of(compare(client))
+        image_url = f"/api/attachments/{blob_key(image_model)}"
+        assert image_event["url"] == signed_blob_url(image_url, user.id)
+        assert image_event["thumbnail_url"].startswith("/api/attachments/")
+
+        db_session.expire_all()
+        message = db_session.query(ConversationMessage).filter_by(role="assistant").one()
+        assert json.loads(message.images) == [image_url]
+        (thumbnail_url,) = json.loads(message.image_thumbnails)
+        assert image_event["thumbnail_url"] == signed_blob_url(thumbnail_url, user.id)
+
+        detail = client.get(f"/api/conversations/{message.conversation_id}").json()
+        assistant = next(m for m in detail["messages"] if m["role"] == "assistant")
+        assert assistant["images"] == [image_url]
+        assert assistant["image_thumbnails"] == [thumbnail_url]
+        assert client.get(image_url).content == image_model
+
+    def test_streamed_urls_served_before_conversation_saved(
+        self, authenticated_client, db_session, image_model, monkeypatch
+    ):
+        client, user, _, _ = authenticated_client
+
+        async def not_saved_yet(description, job):
+            return True
+
+        monkeypatch.setattr(write_behind_queue, "write", not_saved_yet)
+        image_event = image_event_of(compare(client))
+        assert db_session.query(ConversationMessage).count() == 0
+
+        assert client.get(image_event["url"]).content == image_model
+        assert client.get(image_event["thumbnail_url"]).status_code == 200
+        # Unsigned, or signed for someone else, it needs a saved conversation
+        assert client.get(image_event["url"].split("?")[0]).status_code == 404
+        other = create_free_user(db_session)
+        foreign = signed_blob_url(image_event["url"].split("?")[0], other.id)
+        assert client.get(foreign).status_code == 404
+
+    def test_anonymous_stream_keeps_inline_images(self, client, image_model):
+        assert data_url(image_model) in compare(client)
@@ -6,8 +6,8 @@ pytestmark = pytest.mark.unit
 
 
 from app.llm.registry import (
+    build_capability_index,
     get_model_supports_vision,
-    invalidate_vision_probed_cache,
     openrouter_entry_supports_vision_input,
 )
 
@@ -31,33 +31,32 @@ def test_openrouter_entry_supports_vision_input() -> None:
     )
 
 
-def test_get_model_supports_vision_uses_probed_true(monkeypatch) -> None:
+def _install_index(monkeypatch, models: list[dict], snapshot: list[dict]) -> None:
     monkeypatch.setattr(
-        "app.llm.registry.MODELS_BY_PROVIDER",
-        {"Test": [{"id": "vendor/x", "supports_vision_probed": True}]},
+        "app.llm.registry._capability_index",
+        build_capability_index({"Test": models}, snapshot),
     )
-    invalidate_vision_probed_cache()
+
+
+def test_get_model_supports_vision_uses_probed_true(monkeypatch) -> None:
+    _install_index(monkeypatch, [{"id": "vendor/x", "supports_vision_probed": True}], [])
     assert get_model_supports_vision("vendor/x") is True
 
 
 def test_get_model_supports_vision_uses_probed_false_over_metadata(monkeypatch) -> None:
-    monkeypatch.setattr(
-        "app.llm.registry.MODELS_BY_PROVIDER",
-        {"Test": [{"id": "vendor/x", "supports_vision_probed": False}]},
-    )
-    monkeypatch.setattr(
-        "app.llm.registry._load_vision_support_map",
-        lambda: {"vendor/x": True},
+    _install_index(
+        monkeypatch,
+        [{"id": "vendor/x", "supports_vision_probed": False}],
+        [{"id": "vendor/x", "architecture": {"input_modalities": ["text", "image"]}}],
     )
-    invalidate_vision_probed_cache()
     assert get_model_supports_vision("vendor/x") is False
 
 
 def test_get_model_supports_vision_falls_back_to_metadata(monkeypatch) -> None:
-    monkeypatch.setattr("app.llm.registry.MODELS_BY_PROVIDER", {"Test": []})
-    monkeypatch.setattr(
-        "app.llm.registry._load_vision_support_map",
-        lambda: {"vendor/y": True},
+    _install_index(
+        monkeypatch,
+        [],
+        [{"id": "vendor/y", "architecture": {"input_modalities": ["text", "image"]}}],
     )
-    invalidate_vision_probed_cache()
     assert get_model_supports_vision("vendor/y") is True
+    assert get_model_supports_vision("vendor/unknown") is False
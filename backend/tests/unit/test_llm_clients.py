@@ -0,0 +1,236 @@
+"""
+Unit tests for the pooled OpenRouter clients.
+
+Tests cover:
+- In-flight accounting for streamed responses (released when the body is closed)
+- Saturation counted for requests that waited for a pooled connection
+- HTTP/2 negotiated by the OpenRouter transport when enabled
+- One async client per event loop, shared sync pool
+"""
+
+import asyncio
+import datetime
+import ipaddress
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import h2.config
+import h2.connection
+import h2.events
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+pytestmark = pytest.mark.unit
+
+
+from app.llm import clients
+from app.llm.clients import AsyncMeteredTransport, MeteredTransport, PoolStats
+
+
+class _Body(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Unread response body, as a real transport returns it."""
+
+    def __iter__(self):
+        yield b"data: {}\n\n"
+
+    async def __aiter__(self):
+        yield b"data: {}\n\n"
+
+
+def _ok(request):
+    return httpx.Response(200, stream=_Body())
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _self_signed_certificate(tmp_path) -> tuple[str, str, bytes]:
+    """Certificate and key files for localhost, and the certificate as PEM."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+            ),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    pem = certificate.public_bytes(serialization.Encoding.PEM)
+    cert_file, key_file = tmp_path / "cert.pem", tmp_path / "key.pem"
+    cert_file.write_bytes(pem)
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(cert_file), str(key_file), pem
+
+
+async def _serve_h2(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer every HTTP/2 request on the connection with 200 "ok"."""
+    connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+    connection.initiate_connection()
+    writer.write(connection.data_to_send())
+    while data := await reader.read(65535):
+        for event in connection.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                connection.send_headers(
+                    event.stream_id, [(":status", "200"), ("content-length", "2")]
+                )
+                connection.send_data(event.stream_id, b"ok", end_stream=True)
+        writer.write(connection.data_to_send())
+        await writer.drain()
+    writer.close()
+
+
+@pytest.fixture
+async def h2_server(tmp_path):
+    """TLS server offering h2 by ALPN; yields its URL and a client context trusting it."""
+    cert_file, key_file, pem = _self_signed_certificate(tmp_path)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_file, key_file)
+    server_context.set_alpn_protocols(["h2"])
+    server = await asyncio.start_server(_serve_h2, "127.0.0.1", 0, ssl=server_context)
+    port = server.sockets[0].getsockname()[1]
+    yield f"https://localhost:{port}", ssl.create_default_context(cadata=pem.decode())
+    server.close()
+    await server.wait_closed()
+
+
+class TestMeteredTransport:
+    def test_in_flight_until_stream_closed(self):
+        stats = PoolStats(max_connections=2)
+        with httpx.Client(transport=MeteredTransport(httpx.MockTransport(_ok), stats)) as http:
+            with http.stream("GET", "https://openrouter.ai/api/v1/x") as response:
+                assert stats.in_flight == 1
+                response.read()
+            assert stats.in_flight == 0
+        snapshot = stats.snapshot()
+        assert snapshot["total_requests"] == 1
+        assert snapshot["peak_in_flight"] == 1
+        assert snapshot["saturated_requests"] == 0
+
+    def test_saturation_counted_when_request_waits_for_pool(self, http_server):
+        stats = PoolStats(max_connections=1)
+        transport = MeteredTransport(
+            httpx.HTTPTransport(limits=httpx.Limits(max_connections=1)), stats
+        )
+        with httpx.Client(transport=transport) as http:
+            http.get(http_server)  # Free connection: no wait
+            with http.stream("GET", http_server):
+                waiting = threading.Thread(target=http.get, args=(http_server,))
+                waiting.start()
+                time.sleep(0.1)
+            waiting.join(timeout=5)
+
+        snapshot = stats.snapshot()
+        assert snapshot["total_requests"] == 3
+        assert snapshot["saturated_requests"] == 1
+        assert snapshot["max_pool_wait_ms"] >= 90
+        assert snapshot["in_flight"] == 0
+
+    def test_transport_error_releases_slot(self):
+        def fail(request):
+            raise httpx.ConnectError("boom")
+
+        stats = PoolStats(max_connections=1)
+        with httpx.Client(transport=MeteredTransport(httpx.MockTransport(fail), stats)) as http:
+            with pytest.raises(httpx.ConnectError):
+                http.get("https://openrouter.ai/api/v1/x")
+        assert stats.in_flight == 0
+
+    async def test_async_transport_releases_on_close(self):
+        stats = PoolStats(max_connections=2)
+        transport = AsyncMeteredTransport(httpx.MockTransport(_ok), stats)
+        async with httpx.AsyncClient(transport=transport) as http:
+            async with http.stream("GET", "https://openrouter.ai/api/v1/x"):
+                assert stats.in_flight == 1
+        assert stats.in_flight == 0
+
+
+class TestHttp2:
+    async def test_transport_negotiates_http2(self, h2_server, monkeypatch):
+        monkeypatch.setattr(clients.settings, "openrouter_http2", True)
+        monkeypatch.setattr(clients.settings, "openrouter_max_connections", 1)
+        assert clients.HTTP2_AVAILABLE
+        url, client_context = h2_server
+
+        # One connection carries all three requests
+        transport = AsyncMeteredTransport(
+            clients.build_async_transport(verify=client_context), PoolStats(max_connections=1)
+        )
+        async with httpx.AsyncClient(transport=transport) as http:
+            responses = await asyncio.gather(*(http.get(url) for _ in range(3)))
+
+        assert [r.http_version for r in responses] == ["HTTP/2"] * 3
+        assert [r.text for r in responses] == ["ok"] * 3
+
+    async def test_http1_when_disabled(self, h2_server, monkeypatch):
+        monkeypatch.setattr(clients.settings, "openrouter_http2", False)
+        url, client_context = h2_server
+        async with httpx.AsyncClient(
+            transport=clients.build_async_transport(verify=client_context)
+        ) as http:
+            with pytest.raises(httpx.HTTPError):
+                await http.get(url)  # The server only speaks h2
+
+
+class TestClientRegistry:
+    def test_sync_clients_share_one_pool(self):
+        assert clients.client._client is clients.client_with_tool_headers._client
+
+    async def test_async_client_is_per_loop(self):
+        first = clients.get_async_client()
+        assert clients.get_async_client() is first
+
+        other = await asyncio.to_thread(lambda: asyncio.run(_get_async_client()))
+        assert other is not first
+
+    def test_pool_stats_shape(self):
+        stats = clients.get_client_pool_stats()
+        assert set(stats) == {"http2", "sync", "async"}
+        assert stats["sync"]["max_connections"] > 0
+        assert stats["http2"] in (True, False)
+
+
+async def _get_async_client():
+    return clients.get_async_client()
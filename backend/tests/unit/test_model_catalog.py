@@ -0,0 +1,109 @@
+"""
+Unit tests for the precomputed /models responses.
+
+Tests cover:
+- Serialized bodies matching the payload built for each tier
+- Strong ETags and If-None-Match matching
+- Re-rendering after registry / snapshot reloads and token-limit refreshes
+"""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.llm import registry
+from app.services import model_catalog as catalog_module
+from app.services.model_catalog import CatalogResponse, ModelCatalog, build_models_payload
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    # Token limits come from OpenRouter; keep the tests offline
+    monkeypatch.setattr(catalog_module, "get_model_token_limits_from_openrouter", lambda mid: None)
+    monkeypatch.setattr(catalog_module, "_SOURCE_CHECK_INTERVAL_SECONDS", 3600.0)
+    return ModelCatalog()
+
+
+class TestModelCatalog:
+    @pytest.mark.parametrize(
+        "tier,is_trial_active",
+        [("unregistered", False), ("free", False), ("free", True), ("pro", True), ("odd", False)],
+    )
+    def test_body_matches_built_payload(self, catalog, tier, is_trial_active):
+        entry = catalog.get(tier, is_trial_active)
+        assert json.loads(entry.body) == build_models_payload(tier, is_trial_active)
+
+    def test_trial_unlocks_paid_models_for_free_tier_only(self, catalog):
+        trial = json.loads(catalog.get("free", True).body)
+        paid = [m for m in trial["models"] if m["tier_access"] == "paid"]
+        assert paid and all(m.get("trial_unlocked") for m in paid)
+        pro = json.loads(catalog.get("pro", True).body)
+        assert not any(m.get("trial_unlocked") for m in pro["models"])
+
+    def test_models_are_annotated(self, catalog):
+        models = json.loads(catalog.get("pro", False).body)["models"]
+        for model in models:
+            assert model["max_input_tokens"] == 8192
+            assert "supports_vision" in model
+            assert "is_thinking_model" in model
+            if model["supports_image_generation"]:
+                assert model["image_sizes"]
+
+    def test_same_response_object_until_sources_change(self, catalog):
+        first = catalog.get("free", False)
+        assert catalog.get("free", False) is first
+        assert catalog.get("pro", False).etag != first.etag
+
+    def test_registry_reload_renders_again(self, catalog, monkeypatch):
+        first = catalog.get("free", False)
+        monkeypatch.setattr(registry, "_capability_index", None)
+        second = catalog.get("free", False)
+        assert second is not first
+        assert second.etag == first.etag
+
+    def test_token_limit_refresh_renders_again(self, catalog, monkeypatch):
+        first = catalog.get("free", False)
+        monkeypatch.setattr(catalog_module, "get_model_token_limits_version", lambda: -1)
+        monkeypatch.setattr(
+            catalog_module,
+            "get_model_token_limits_from_openrouter",
+            lambda mid: {"max_input": 1000, "max_output": 100},
+        )
+        second = catalog.get("free", False)
+        assert second.etag != first.etag
+        assert json.loads(second.body)["models"][0]["max_input_tokens"] == 1000
+
+    def test_invalidate_drops_rendering(self, catalog):
+        first = catalog.get("free", False)
+        catalog.invalidate()
+        assert catalog.get("free", False) is not first
+
+
+class TestCatalogResponse:
+    def test_etag_is_strong_and_quoted(self, catalog):
+        etag = catalog.get("free", False).etag
+        assert etag.startswith('"') and etag.endswith('"')
+        assert not etag.startswith("W/")
+
+    @pytest.mark.parametrize(
+        "header,expected",
+        [
+            (None, False),
+            ("", False),
+            ('"abc"', True),
+            ('W/"abc"', True),
+            ('"other", "abc"', True),
+            ("*", True),
+            ('"other"', False),
+        ],
+    )
+    def test_if_none_match(self, header, expected):
+        assert CatalogResponse(body=b"{}", etag='"abc"').matches(header) is expected
+
+    def test_headers_allow_revalidation(self):
+        headers = CatalogResponse(body=b"{}", etag='"abc"').headers
+        assert headers["ETag"] == '"abc"'
+        assert "no-store" not in headers["Cache-Control"]
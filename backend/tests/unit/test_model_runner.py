@@ -4,16 +4,23 @@ Unit tests for model runner functionality.
 Tests cover:
 - Streaming model calling (mock mode)
 - Error handling
+- Concurrent web-search tool rounds
 """
 
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
 import pytest
 
 pytestmark = pytest.mark.unit
 
 
-from app.llm.streaming import REASONING_STREAM_TYPE
+from app.llm import streaming
+from app.llm.streaming import REASONING_STREAM_TYPE, USAGE_STREAM_TYPE, _ToolJob
 from app.model_runner import (
     call_openrouter_streaming,
+    call_openrouter_streaming_async,
 )
 
 
@@ -32,3 +39,150 @@ class TestModelRunnerMockMode:
             "content": "[Mock] Simulated planning step before answering.\n\n",
         }
         assert all(isinstance(chunk, str) for chunk in chunks[1:])
+
+
+def _chunk(content=None, finish_reason=None):
+    delta = SimpleNamespace(content=content, tool_calls=None, reasoning_details=None)
+    choice = SimpleNamespace(delta=delta, finish_reason=finish_reason, message=None)
+    return SimpleNamespace(choices=[choice], usage=None)
+
+
+class _FakeAsyncStream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestModelRunnerAsync:
+    """Tests for the asyncio streaming driver."""
+
+    async def test_mock_mode_matches_sync_driver(self):
+        sync_chunks = list(
+            call_openrouter_streaming(prompt="Test prompt", model_id="gpt-4", use_mock=True)
+        )
+        async_chunks = [
+            chunk
+            async for chunk in call_openrouter_streaming_async(
+                prompt="Test prompt", model_id="gpt-4", use_mock=True
+            )
+        ]
+        assert async_chunks[:-1] == sync_chunks
+        assert async_chunks[-1] == {"type": USAGE_STREAM_TYPE, "usage": None}
+
+    async def test_streams_content_and_closes_upstream(self):
+        stream = _FakeAsyncStream([_chunk("Hello"), _chunk(" world", finish_reason="stop")])
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(return_value=stream)
+
+        chunks = [
+            chunk
+            async for chunk in call_openrouter_streaming_async(
+                prompt="Hi", model_id="openai/gpt-4o", max_tokens_override=100, _client=fake_client
+            )
+        ]
+
+        assert chunks == ["Hello", " world", {"type": USAGE_STREAM_TYPE, "usage": None}]
+        assert stream.closed
+        kwargs = fake_client.chat.completions.create.call_args.kwargs
+        assert kwargs["stream"] is True
+        assert kwargs["max_tokens"] == 100
+
+    async def test_api_error_yields_error_message(self):
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(side_effect=Exception("Connection failed"))
+
+        chunks = [
+            chunk
+            async for chunk in call_openrouter_streaming_async(
+                prompt="Hi", model_id="openai/gpt-4o", max_tokens_override=100, _client=fake_client
+            )
+        ]
+
+        assert isinstance(chunks[0], str) and chunks[0].startswith("Error:")
+        assert chunks[-1] == {"type": USAGE_STREAM_TYPE, "usage": None}
+
+
+class _NoLimit:
+    cache = None
+
+    async def acquire(self, provider_name="default"):
+        pass
+
+    def release(self, provider_name="default"):
+        pass
+
+
+class _SlowSearch:
+    """Search provider that records overlap between concurrent searches."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.loops = set()
+
+    def get_provider_name(self):
+        return "fake"
+
+    async def search(self, query, max_results=5):
+        self.loops.add(asyncio.get_running_loop())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return [SimpleNamespace(title=query, url="https://example.com", snippet="s")]
+
+
+def _search_jobs(*queries):
+    return [
+        _ToolJob(f"call_{i}", "search_web", "{}", argument=query) for i, query in enumerate(queries)
+    ]
+
+
+class TestToolRounds:
+    """Tool calls from one assistant turn run together on an event loop."""
+
+    async def test_parallel_tool_calls_run_concurrently(self):
+        provider = _SlowSearch()
+        jobs = _search_jobs("a", "b", "c")
+        jobs[1].content = "already answered"
+
+        await streaming._run_tool_round(jobs, provider, _NoLimit(), "m", 1)
+
+        assert provider.max_active == 2
+        assert jobs[1].content == "already answered"
+        assert "a" in jobs[0].content and "c" in jobs[2].content
+        assert provider.loops == {asyncio.get_running_loop()}
+
+    async def test_search_timeout_becomes_tool_content(self, monkeypatch):
+        monkeypatch.setattr(streaming, "SEARCH_TIMEOUT", 0.01)
+        jobs = _search_jobs("slow")
+
+        await streaming._run_tool_round(jobs, _SlowSearch(delay=1), _NoLimit(), "m", 1)
+
+        assert "timed out" in jobs[0].content
+
+    def test_sync_driver_reuses_one_background_loop(self, monkeypatch):
+        monkeypatch.setattr(streaming, "TOOL_KEEPALIVE_INTERVAL", 0.01)
+        provider = _SlowSearch()
+        first, second = _search_jobs("a"), _search_jobs("b")
+
+        keepalives = list(streaming._run_tool_round_sync(first, provider, _NoLimit(), "m", 1))
+        list(streaming._run_tool_round_sync(second, provider, _NoLimit(), "m", 2))
+
+        assert keepalives and set(keepalives) == {" "}
+        assert first[0].content and second[0].content
+        assert len(provider.loops) == 1
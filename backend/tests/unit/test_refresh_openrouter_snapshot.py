@@ -9,6 +9,7 @@ import json
 from pathlib import Path
 
 from app.llm.registry import (
+    get_model_supports_vision,
     refresh_openrouter_snapshot_from_live_api,
     upsert_openrouter_snapshot_entries,
 )
@@ -19,12 +20,8 @@ def snapshot_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
     path = tmp_path / "openrouter_models.json"
     path.write_text('{"data": [{"id": "vendor/old", "architecture": {}}]}\n', encoding="utf-8")
     monkeypatch.setattr("app.llm.registry._OPENROUTER_MODELS_PATH", path)
-    monkeypatch.setattr("app.llm.registry._vision_support_cache", None)
-    monkeypatch.setattr("app.llm.registry._vision_probed_cache", None)
-    monkeypatch.setattr("app.llm.registry._temperature_support_cache", None)
-    monkeypatch.setattr("app.llm.registry._text_token_price_cache", None)
-    monkeypatch.setattr("app.llm.registry._openrouter_known_ids_cache", None)
-    monkeypatch.setattr("app.llm.registry._openrouter_thinking_model_ids_cache", None)
+    # Writes rebuild the capability index; restore the real one afterwards
+    monkeypatch.setattr("app.llm.registry._capability_index", None)
     return path
 
 
@@ -42,6 +39,7 @@ def test_upsert_adds_and_updates_row(snapshot_path: Path) -> None:
     root = json.loads(snapshot_path.read_text(encoding="utf-8"))
     old = next(m for m in root["data"] if m["id"] == "vendor/old")
     assert old["architecture"]["modality"] == "text+image->text"
+    assert get_model_supports_vision("vendor/old") is True
 
 
 def test_refresh_replaces_all_registry_rows(
@@ -5,6 +5,7 @@ import pytest
 pytestmark = pytest.mark.unit
 
 
+from decimal import Decimal
 from pathlib import Path
 
 from app.llm import registry
@@ -64,3 +65,104 @@ class TestTierFiltering:
         result = registry.filter_models_by_tier(models, "free")
         assert len(result) == 1
         assert result[0]["tier_access"] in ("unregistered", "free", "paid")
+
+
+class TestCapabilityIndex:
+    MODELS = {
+        "Vendor": [
+            {
+                "id": "vendor/chat",
+                "name": "Chat",
+                "supports_web_search": True,
+                "returns_multiple_images": True,
+            },
+            {"id": "vendor/painter", "name": "Painter", "supports_image_generation": True},
+        ],
+        "Other": [{"id": "vendor/chat", "name": "Duplicate"}],
+    }
+    SNAPSHOT = [
+        {
+            "id": "vendor/chat",
+            "context_length": 100000,
+            "top_provider": {"max_completion_tokens": 4000},
+            "pricing": {"prompt": "0.000001", "completion": "0.000002"},
+            "supported_parameters": ["reasoning", "tools"],
+        },
+        {
+            "id": "vendor/snapshot-only",
+            "architecture": {"output_modalities": ["image", "text"]},
+            "pricing": {"image": "0.04"},
+        },
+    ]
+
+    def build(self):
+        return registry.build_capability_index(self.MODELS, self.SNAPSHOT)
+
+    def test_records_cover_registry_then_snapshot_ids(self):
+        index = self.build()
+        assert list(index) == ["vendor/chat", "vendor/painter", "vendor/snapshot-only"]
+        assert index.registry_model_ids == ("vendor/chat", "vendor/painter")
+        assert index.web_search_model_ids == ("vendor/chat",)
+        assert "vendor/missing" not in index
+        assert index.get("vendor/missing") is None
+
+    def test_registry_fields_use_first_entry(self):
+        rec = self.build().get("vendor/chat")
+        assert rec.name == "Chat"
+        assert rec.provider == "Vendor"
+        assert rec.supports_web_search is True
+        assert rec.returns_multiple_images is True
+
+    def test_snapshot_fields(self):
+        index = self.build()
+        chat = index.get("vendor/chat")
+        assert chat.supports_temperature is False
+        assert chat.streams_reasoning is True
+        assert chat.is_thinking_model is True
+        assert chat.max_input_tokens == 100000
+        assert chat.max_output_tokens == 4000
+        assert chat.text_prices == (Decimal("0.000001"), Decimal("0.000002"))
+        painter = index.get("vendor/painter")
+        assert painter.in_snapshot is False
+        assert painter.supports_temperature is True
+        assert painter.streams_reasoning is None
+        assert painter.max_input_tokens is None
+
+    def test_image_generation_combines_registry_and_snapshot(self):
+        index = self.build()
+        assert index.get("vendor/painter").supports_image_generation is True
+        assert index.get("vendor/painter").outputs_images is False
+        snapshot_only = index.get("vendor/snapshot-only")
+        assert snapshot_only.supports_image_generation is True
+        assert snapshot_only.image_price == 0.04
+        assert index.get("vendor/chat").supports_image_generation is False
+
+    def test_resolve_falls_back_to_base_id(self):
+        index = self.build()
+        assert index.resolve("vendor/chat:free") is index.get("vendor/chat")
+        assert index.get("vendor/chat:free") is None
+
+    def test_records_are_immutable(self):
+        rec = self.build().get("vendor/chat")
+        with pytest.raises(AttributeError):
+            rec.supports_web_search = False
+
+    def test_getters_read_installed_index(self, monkeypatch):
+        monkeypatch.setattr(registry, "_capability_index", self.build())
+        assert registry.get_model_returns_multiple_images("vendor/chat") is True
+        assert registry.get_model_text_prices_per_token("vendor/chat:free") == (
+            Decimal("0.000001"),
+            Decimal("0.000002"),
+        )
+        assert registry.get_model_image_price_per_image("vendor/snapshot-only") == 0.04
+        assert registry.get_model_supports_image_generation("vendor/painter") is False
+        assert registry.get_openrouter_thinking_model_flag("vendor/painter") is None
+
+    def test_reload_swaps_index(self, monkeypatch):
+        monkeypatch.setattr(registry, "_capability_index", None)
+        monkeypatch.setattr(registry, "MODELS_BY_PROVIDER", self.MODELS)
+        first = registry.get_capability_index()
+        assert registry.get_capability_index() is first
+        second = registry.rebuild_capability_index()
+        assert second is not first
+        assert registry.get_capability_index() is second
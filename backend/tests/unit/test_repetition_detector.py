@@ -0,0 +1,89 @@
+"""
+Differential tests for the incremental repetition detector.
+
+Tests cover:
+- RepetitionDetector verdicts matching detect_repetition after every chunk
+- Recorded mock responses and synthetic looping answers, under varied chunkings
+- Window-edge words cut by the window start or still being streamed
+"""
+
+import random
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.llm.text_processing import RepetitionDetector, detect_repetition
+from app.mock_responses import MOCK_RESPONSE_EXTENDED, MOCK_RESPONSE_STANDARD
+
+LOOPING_PROSE = MOCK_RESPONSE_STANDARD[:900] + " Consider the important context again." * 40
+LOOPING_LINES = "We should consider the broader implications carefully.\n" * 30
+LOOPING_CODE = "```python\ndef handler(event):\n    return process(event)\n```\n" * 30
+NUMBERED_LIST = "".join(f"{i}. Step number {i} of the process\n" for i in range(1, 80))
+CHUNK_SIZES = [1, 2, 3, 4, 7, 15, 60]
+
+RECORDED = [
+    MOCK_RESPONSE_STANDARD,
+    MOCK_RESPONSE_EXTENDED,
+    LOOPING_PROSE,
+    LOOPING_LINES,
+    LOOPING_CODE,
+    NUMBERED_LIST,
+    "intro " * 10 + "supercalifragilistic " * 3 + LOOPING_LINES,
+    "x" * 700 + " word" * 200,
+    " \n\t " * 300,
+]
+
+
+def synthetic_loops(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    vocab = ["alpha", "beta", "gamma", "delta", "the", "of", "1.", "|", "def", "Mississippi"]
+    texts = []
+    for _ in range(count):
+        prefix = " ".join(rng.choice(vocab) for _ in range(rng.randint(0, 200)))
+        loop = " ".join(rng.choice(vocab) for _ in range(rng.randint(5, 9)))
+        texts.append(prefix + (loop + rng.choice([" ", "\n", "  "])) * rng.randint(5, 60))
+    return texts
+
+
+def assert_matches_reference(text: str, chunk_sizes: list[int]) -> None:
+    detector = RepetitionDetector()
+    pos = 0
+    for size in chunk_sizes:
+        if pos >= len(text):
+            break
+        pos += size
+        assert detector.feed(text[pos - size : pos]) == detect_repetition(text[:pos]), pos
+
+
+class TestRepetitionDetector:
+    @pytest.mark.parametrize("index", range(len(RECORDED)))
+    @pytest.mark.parametrize("size", CHUNK_SIZES)
+    def test_fixed_chunking_matches_reference(self, index, size):
+        text = RECORDED[index]
+        assert_matches_reference(text, [size] * len(text))
+
+    @pytest.mark.parametrize("text", RECORDED + synthetic_loops(seed=7, count=30))
+    def test_random_chunking_matches_reference(self, text):
+        rng = random.Random(len(text))
+        for _ in range(3):
+            assert_matches_reference(text, [rng.choice(CHUNK_SIZES) for _ in range(len(text))])
+
+    def test_recorded_loops_are_detected(self):
+        assert detect_repetition(LOOPING_PROSE)
+        assert not detect_repetition(MOCK_RESPONSE_EXTENDED)
+        detector = RepetitionDetector()
+        assert any(detector.feed(LOOPING_PROSE[i : i + 4]) for i in range(0, len(LOOPING_PROSE), 4))
+
+    def test_word_cut_by_window_start(self):
+        # Long words make the window start land inside a word on most offsets
+        text = "incomprehensibilities recapitulation " * 40
+        for offset in range(1, 12):
+            assert_matches_reference(text, [offset] + [5] * len(text))
+
+    def test_empty_chunk_keeps_verdict(self):
+        detector = RepetitionDetector()
+        verdict = detector.feed(LOOPING_PROSE)
+        assert verdict == detect_repetition(LOOPING_PROSE)
+        assert detector.feed("") == verdict
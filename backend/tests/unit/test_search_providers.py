@@ -7,8 +7,11 @@ Tests cover:
 - Search provider factory
 - Search result formatting
 - Error handling
+- Pooled HTTP client (closed with its loop) and coalescing of identical in-flight searches
 """
 
+import asyncio
+
 import pytest
 
 pytestmark = pytest.mark.unit
@@ -16,10 +19,12 @@ pytestmark = pytest.mark.unit
 
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from app.llm import streaming
 from app.models import AppSettings
 from app.search.base import SearchResult
-from app.search.brave import BraveSearchProvider
+from app.search.brave import BraveSearchProvider, close_pooled_clients
 from app.search.factory import SearchProviderFactory
+from app.search.rate_limiter import SearchRateLimiter, SearchSingleFlight
 
 
 @pytest.mark.unit
@@ -199,6 +204,162 @@ class TestBraveSearchProvider:
             assert results[0].url == ""  # Default empty string
             assert results[0].snippet == ""  # Default empty string
 
+    @pytest.mark.asyncio
+    async def test_http_client_pooled_per_loop(self):
+        """Provider instances on one loop share one long-lived client."""
+        first = BraveSearchProvider("key")._get_client()
+        second = BraveSearchProvider("key")._get_client()
+        assert first is second
+        assert not first.is_closed
+
+        async with BraveSearchProvider("key"):
+            pass
+        assert not first.is_closed
+
+        other = await asyncio.to_thread(
+            lambda: asyncio.run(_client_on_new_loop(BraveSearchProvider("key")))
+        )
+        assert other is not first
+
+    @pytest.mark.asyncio
+    async def test_close_pooled_clients(self):
+        """Closing drops the running loop's client; the next search opens a new one."""
+        client = BraveSearchProvider("key")._get_client()
+        await close_pooled_clients()
+        assert client.is_closed
+
+        replacement = BraveSearchProvider("key")._get_client()
+        assert replacement is not client
+        await close_pooled_clients()
+        await close_pooled_clients()  # Nothing left to close
+
+    def test_tool_loop_teardown_closes_its_client(self):
+        loop = streaming._get_tool_loop()
+        client = asyncio.run_coroutine_threadsafe(
+            _client_on_new_loop(BraveSearchProvider("key")), loop
+        ).result(timeout=5)
+
+        streaming.shutdown_tool_loop()
+        assert client.is_closed
+        assert streaming._get_tool_loop() is not loop
+
+
+async def _client_on_new_loop(provider):
+    return provider._get_client()
+
+
+@pytest.mark.unit
+class TestSearchSingleFlight:
+    """Identical concurrent searches share one provider call."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_queries_share_one_call(self):
+        single_flight = SearchSingleFlight()
+        calls = []
+
+        async def search():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["result"]
+
+        results = await asyncio.gather(
+            single_flight.run_search("brave", "Weather today", search),
+            single_flight.run_search("brave", "  weather TODAY ", search),
+            single_flight.run_search("brave", "weather today", search),
+        )
+
+        assert results == [["result"]] * 3
+        assert len(calls) == 1
+        assert single_flight.coalesced == 2
+
+    @pytest.mark.asyncio
+    async def test_different_queries_and_providers_not_coalesced(self):
+        single_flight = SearchSingleFlight()
+        calls = []
+
+        async def search():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return []
+
+        await asyncio.gather(
+            single_flight.run_search("brave", "a", search),
+            single_flight.run_search("brave", "b", search),
+            single_flight.run_search("tavily", "a", search),
+        )
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_error_shared_and_not_remembered(self):
+        single_flight = SearchSingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("429 rate limit")
+
+        results = await asyncio.gather(
+            single_flight.run_search("brave", "q", failing),
+            single_flight.run_search("brave", "q", failing),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        async def ok():
+            return ["fresh"]
+
+        assert await single_flight.run_search("brave", "q", ok) == ["fresh"]
+
+    @pytest.mark.asyncio
+    async def test_follower_takes_over_when_leader_cancelled(self):
+        single_flight = SearchSingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fast():
+            return ["follower"]
+
+        leader = asyncio.create_task(single_flight.run_search("brave", "q", slow))
+        await started.wait()
+        follower = asyncio.create_task(single_flight.run_search("brave", "q", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == ["follower"]
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    @pytest.mark.asyncio
+    async def test_models_asking_same_question_cost_one_provider_call(self):
+        from app.llm.streaming import _execute_search_with_rate_limit
+
+        provider = MagicMock()
+        provider.get_provider_name.return_value = "brave"
+
+        async def search(query, max_results=5):
+            await asyncio.sleep(0.01)
+            return [SearchResult(title="t", url="u", snippet="s", source="Brave Search")]
+
+        provider.search = AsyncMock(side_effect=search)
+        rate_limiter = SearchRateLimiter(
+            default_max_requests_per_minute=100,
+            default_max_concurrent=5,
+            default_delay_between_requests=0,
+        )
+
+        results = await asyncio.gather(
+            *(
+                _execute_search_with_rate_limit("same question", provider, rate_limiter, f"m{i}")
+                for i in range(4)
+            )
+        )
+
+        assert provider.search.await_count == 1
+        assert all(len(r) == 1 for r in results)
+        assert rate_limiter.get_stats()["coalesced_searches"] == 3
+
 
 @pytest.mark.unit
 class TestSearchProviderFactory:
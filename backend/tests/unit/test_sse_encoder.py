@@ -0,0 +1,131 @@
+"""
+Unit tests for the comparison stream SSE encoder.
+
+Tests cover:
+- Frames decoding to the same events the stream has always sent
+- JSON escaping of token content (orjson and stdlib fallback)
+- Token coalescing window and per-model ordering
+"""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.services import sse_encoder
+from app.services.sse_encoder import SSEEncoder, TokenCoalescer
+
+
+def decode(frames: bytes) -> list[dict]:
+    events = []
+    for frame in frames.decode("utf-8").split("\n\n"):
+        if frame:
+            assert frame.startswith("data: ")
+            events.append(json.loads(frame[len("data: ") :]))
+    return events
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 50.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSSEEncoder:
+    def test_model_frames(self):
+        encoder = SSEEncoder(["openai/gpt-4o"])
+        mid = "openai/gpt-4o"
+        frames = (
+            encoder.start(mid)
+            + encoder.text(mid, "chunk", "Hi")
+            + encoder.text(mid, "reasoning", "think")
+            + encoder.image(mid, "https://x/y.png")
+            + encoder.keepalive(mid)
+            + encoder.done(mid, False)
+        )
+        assert decode(frames) == [
+            {"model": mid, "type": "start"},
+            {"model": mid, "type": "chunk", "content": "Hi"},
+            {"model": mid, "type": "reasoning", "content": "think"},
+            {"model": mid, "type": "image", "url": "https://x/y.png"},
+            {"model": mid, "type": "keepalive"},
+            {"model": mid, "type": "done", "error": False},
+        ]
+
+    def test_image_frame_with_thumbnail(self):
+        encoder = SSEEncoder(["a/img"])
+        assert decode(encoder.image("a/img", "/api/attachments/x", "/api/attachments/t")) == [
+            {
+                "model": "a/img",
+                "type": "image",
+                "url": "/api/attachments/x",
+                "thumbnail_url": "/api/attachments/t",
+            }
+        ]
+
+    def test_unregistered_model_and_event(self):
+        encoder = SSEEncoder([])
+        assert decode(encoder.done("m", True)) == [{"model": "m", "type": "done", "error": True}]
+        assert decode(SSEEncoder.event({"type": "error", "message": "x"})) == [
+            {"type": "error", "message": "x"}
+        ]
+
+    @pytest.mark.parametrize("orjson_available", [True, False])
+    def test_content_escaping(self, monkeypatch, orjson_available):
+        monkeypatch.setattr(sse_encoder, "ORJSON_AVAILABLE", orjson_available)
+        content = 'line "one"\n\ndata: fake\t\\ é 漢 \U0001f600 </script>'
+        frames = SSEEncoder(["m"]).text("m", "chunk", content)
+        # Embedded newlines must be escaped or they would split the SSE frame.
+        assert frames.count(b"\n\n") == 1
+        assert decode(frames) == [{"model": "m", "type": "chunk", "content": content}]
+
+    def test_orjson_installed_and_used(self):
+        assert sse_encoder.ORJSON_AVAILABLE
+        # orjson writes non-ASCII as UTF-8; the stdlib fallback would escape it
+        assert "漢".encode() in SSEEncoder(["m"]).text("m", "chunk", "漢")
+
+    def test_lone_surrogate_falls_back_to_json(self):
+        frames = SSEEncoder(["m"]).text("m", "chunk", "bad \ud800")
+        assert b"\\ud800" in frames
+
+
+class TestTokenCoalescer:
+    def test_merges_runs_within_window(self):
+        clock = FakeClock()
+        coalescer = TokenCoalescer(SSEEncoder(["a", "b"]), window=0.005, clock=clock)
+        coalescer.add("a", "reasoning", "r1")
+        coalescer.add("a", "reasoning", "r2")
+        coalescer.add("b", "chunk", "x")
+        coalescer.add("a", "chunk", "c1")
+        coalescer.add("a", "chunk", "c2")
+        assert not coalescer.due()
+        assert coalescer.time_until_flush() == pytest.approx(0.005)
+        clock.now += 0.005
+        assert coalescer.due()
+        assert decode(coalescer.flush()) == [
+            {"model": "a", "type": "reasoning", "content": "r1r2"},
+            {"model": "a", "type": "chunk", "content": "c1c2"},
+            {"model": "b", "type": "chunk", "content": "x"},
+        ]
+        assert coalescer.time_until_flush() is None
+        assert coalescer.flush() == b""
+
+    def test_flush_single_model(self):
+        coalescer = TokenCoalescer(SSEEncoder(["a", "b"]), window=1.0, clock=FakeClock())
+        coalescer.add("a", "chunk", "1")
+        coalescer.add("b", "chunk", "2")
+        assert decode(coalescer.flush("a")) == [{"model": "a", "type": "chunk", "content": "1"}]
+        assert coalescer.flush("a") == b""
+        assert coalescer.time_until_flush() is not None
+        assert decode(coalescer.flush("b")) == [{"model": "b", "type": "chunk", "content": "2"}]
+        assert coalescer.time_until_flush() is None
+
+    def test_zero_window_is_always_due(self):
+        coalescer = TokenCoalescer(SSEEncoder(["a"]), window=0, clock=FakeClock())
+        assert not coalescer.due()
+        coalescer.add("a", "chunk", "t")
+        assert coalescer.due()
@@ -0,0 +1,80 @@
+"""
+Unit tests for the comparison stream deadline heap.
+
+Tests cover:
+- Keepalive / inactivity deadlines firing in order
+- Activity pushing deadlines back
+- Discarded models never firing
+"""
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.services.stream_deadlines import StreamDeadlines
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_deadlines(clock, models=("a", "b")):
+    return StreamDeadlines(models, {"keepalive": 10, "inactivity": 55}, clock=clock)
+
+
+class TestStreamDeadlines:
+    def test_nothing_due_before_first_deadline(self):
+        clock = FakeClock()
+        deadlines = make_deadlines(clock)
+        clock.now += 9.9
+        assert list(deadlines.pop_due()) == []
+        assert deadlines.next_timeout() == pytest.approx(0.1)
+
+    def test_keepalive_fires_for_idle_models(self):
+        clock = FakeClock()
+        deadlines = make_deadlines(clock)
+        clock.now += 10
+        assert sorted(deadlines.pop_due()) == [("a", "keepalive"), ("b", "keepalive")]
+        # Re-armed for the next interval
+        assert deadlines.next_timeout() == pytest.approx(10)
+
+    def test_touch_pushes_deadline_back(self):
+        clock = FakeClock()
+        deadlines = make_deadlines(clock, models=("a",))
+        clock.now += 8
+        deadlines.touch("a")
+        clock.now += 5
+        assert list(deadlines.pop_due()) == []
+        clock.now += 5
+        assert list(deadlines.pop_due()) == [("a", "keepalive")]
+
+    def test_touch_while_handling_suppresses_later_deadline(self):
+        clock = FakeClock()
+        deadlines = make_deadlines(clock, models=("a",))
+        clock.now += 60
+        fired = []
+        for model_id, kind in deadlines.pop_due():
+            fired.append(kind)
+            deadlines.touch(model_id)
+        assert fired == ["keepalive"]
+
+    def test_inactivity_fires_without_activity(self):
+        clock = FakeClock()
+        deadlines = StreamDeadlines(["a"], {"inactivity": 55}, clock=clock)
+        clock.now += 55
+        assert list(deadlines.pop_due()) == [("a", "inactivity")]
+
+    def test_discarded_model_never_fires(self):
+        clock = FakeClock()
+        deadlines = make_deadlines(clock)
+        deadlines.discard("a")
+        deadlines.touch("a")
+        clock.now += 100
+        assert {model_id for model_id, _ in deadlines.pop_due()} == {"b"}
+        deadlines.discard("b")
+        assert deadlines.next_timeout() is None
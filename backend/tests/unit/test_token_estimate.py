@@ -0,0 +1,162 @@
+"""
+Unit tests for the approximate token-count bounds.
+
+Tests cover:
+- Bounds containing the exact tiktoken count on long source text
+- Exact counts for short, already counted, or uncalibrated texts
+- Limit checks that only tokenize near (or over) the limit
+- Conversation bounds and credit reservations priced at the upper bound
+"""
+
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.llm import tokenizers
+from app.llm.token_estimate import (
+    APPROXIMATE_MIN_CHARS,
+    TokenBounds,
+    approximate_token_bounds,
+    count_tokens_under,
+    token_bounds,
+    token_bounds_batch,
+)
+from app.llm.tokenizers import TokenCountCache, count_tokens
+from app.llm.tokens import (
+    conversation_token_bounds,
+    count_conversation_tokens,
+    estimate_reserved_credits_for_compare,
+)
+
+APP_DIR = Path(__file__).resolve().parents[2] / "app"
+SOURCE_FILES = ("llm/tokens.py", "llm/registry.py", "routers/api/core.py", "rate_limiting.py")
+PROSE = (
+    "The committee reviewed the proposal on Tuesday and asked for a revised budget. "
+    "Über die Änderungen wird nächste Woche entschieden. Цены выросли на 12% за год. "
+    "会議は来週の月曜日に再開されます。 \U0001f680 Launch window: 2025-03-14 09:30 UTC.\n\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(tokenizers, "token_count_cache", TokenCountCache(max_entries=64))
+
+
+@pytest.fixture
+def no_tokenizing(monkeypatch):
+    """Fail the test if a long text is tokenized."""
+    real = tokenizers._encode_uncached
+
+    def encode(texts, chain):
+        assert all(len(t) < APPROXIMATE_MIN_CHARS for t in texts), "long text was tokenized"
+        return real(texts, chain)
+
+    monkeypatch.setattr(tokenizers, "_encode_uncached", encode)
+
+
+def long_text(chars: int = 20_000) -> str:
+    return (PROSE * (chars // len(PROSE) + 1))[:chars]
+
+
+class TestApproximateBounds:
+    @pytest.mark.parametrize("name", SOURCE_FILES)
+    @pytest.mark.parametrize("model_id", [None, "openai/gpt-4o"])
+    def test_source_files_within_bounds(self, name, model_id):
+        text = (APP_DIR / name).read_text(encoding="utf-8")
+        exact = count_tokens(text, model_id)
+        tokenizers.token_count_cache.clear()
+        bounds = token_bounds(text, model_id)
+        assert not bounds.exact
+        assert bounds.lower <= exact <= bounds.upper
+        assert bounds.lower <= bounds.estimate <= bounds.upper
+
+    def test_mixed_scripts_within_bounds(self):
+        text = long_text()
+        exact = count_tokens(text)
+        bounds = approximate_token_bounds(text)
+        assert bounds.lower <= exact <= bounds.upper
+
+    def test_upper_bound_capped_at_byte_length(self):
+        text = "\t" * 10_000
+        assert approximate_token_bounds(text).upper <= len(text) + 1
+
+    def test_uncalibrated_family_uses_widest_envelope(self):
+        text = long_text()
+        generic = approximate_token_bounds(text, "generic")
+        for family in ("cl100k_base", "o200k_base", "anthropic"):
+            bounds = approximate_token_bounds(text, family)
+            assert generic.lower <= bounds.lower and bounds.upper <= generic.upper
+
+    def test_empty_text(self):
+        assert approximate_token_bounds("") == TokenBounds(0, 0, 0)
+
+
+class TestTokenBounds:
+    def test_short_text_is_exact(self):
+        bounds = token_bounds(PROSE)
+        assert bounds.exact and bounds.estimate == count_tokens(PROSE)
+
+    def test_long_text_is_not_tokenized(self, no_tokenizing):
+        assert not token_bounds(long_text()).exact
+
+    def test_counted_text_is_exact(self):
+        text = long_text()
+        exact = count_tokens(text)
+        assert token_bounds(text) == TokenBounds(exact, exact, exact)
+
+    def test_length_estimate_fallback_is_exact(self, monkeypatch):
+        monkeypatch.setattr(tokenizers, "_encoder_chain", lambda model_id: [])
+        text = long_text()
+        assert token_bounds(text) == TokenBounds(*[len(text) // 4] * 3)
+
+    def test_batch_sums_short_and_long_texts(self, no_tokenizing):
+        texts = [PROSE, long_text(), "", PROSE * 2]
+        bounds = token_bounds_batch(texts)
+        short = count_tokens(PROSE) + count_tokens(PROSE * 2)
+        long_bounds = token_bounds(long_text())
+        assert bounds == TokenBounds(*(short + value for value in long_bounds))
+
+
+class TestCountTokensUnder:
+    def test_upper_bound_when_far_under_limit(self, no_tokenizing):
+        text = long_text()
+        result = count_tokens_under(text, None, 1_000_000)
+        assert result == token_bounds(text).upper
+
+    @pytest.mark.parametrize("limit", [0, 100, 5_000])
+    def test_exact_near_or_over_limit(self, limit):
+        text = long_text()
+        exact = count_tokens(text)
+        tokenizers.token_count_cache.clear()
+        assert count_tokens_under(text, None, limit) == exact
+
+    def test_decides_limit_like_exact_count(self):
+        text = long_text()
+        exact = count_tokens(text)
+        for limit in (exact - 1, exact, exact + 1, 2 * exact):
+            tokenizers.token_count_cache.clear()
+            assert (count_tokens_under(text, None, limit) <= limit) == (exact <= limit)
+
+
+class TestConversationBounds:
+    def test_contains_exact_count(self):
+        history = [
+            {"role": "user", "content": long_text()},
+            {"role": "assistant", "content": PROSE},
+        ]
+        bounds = conversation_token_bounds(history)
+        tokenizers.token_count_cache.clear()
+        exact = count_conversation_tokens(history)
+        assert bounds.lower <= exact <= bounds.upper
+
+    def test_reservation_from_upper_bound_is_not_lower(self):
+        history = [{"role": "user", "content": long_text()}]
+        args = (long_text(30_000), ["openai/gpt-4o-mini"], history, None, {})
+        approximate = estimate_reserved_credits_for_compare(*args, approximate=True)
+        tokenizers.token_count_cache.clear()
+        exact = estimate_reserved_credits_for_compare(*args)
+        assert approximate >= exact > Decimal(0)
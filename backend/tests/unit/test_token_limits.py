@@ -0,0 +1,92 @@
+"""
+Unit tests for model token-limit lookups.
+
+Tests cover:
+- Limits answered from the bundled snapshot without touching the network
+- Live limits from a refresh taking precedence, including for ``:variant`` ids
+- Background refresher cadence: interval after success, retry delay after failure
+"""
+
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from app.llm import tokens
+from app.llm.capabilities import extract_token_limits
+from app.llm.registry import get_capability_index
+
+
+@pytest.fixture
+def live_cache(monkeypatch):
+    monkeypatch.setattr(tokens, "_model_token_limits_cache", {})
+
+    def offline():
+        raise AssertionError("lookups must not fetch from OpenRouter")
+
+    monkeypatch.setattr(tokens, "fetch_all_models_from_openrouter", offline)
+    return tokens._model_token_limits_cache
+
+
+@pytest.fixture
+def snapshot_model():
+    index = get_capability_index()
+    rec = next(index.get(mid) for mid in index.registry_model_ids if index.get(mid).in_snapshot)
+    return rec
+
+
+class TestLookup:
+    def test_snapshot_answers_before_any_refresh(self, live_cache, snapshot_model):
+        limits = tokens.get_model_token_limits_from_openrouter(snapshot_model.model_id)
+        assert limits == {
+            "max_input": snapshot_model.max_input_tokens,
+            "max_output": snapshot_model.max_output_tokens,
+        }
+
+    def test_variant_falls_back_to_base_snapshot_row(self, live_cache, snapshot_model):
+        variant = f"{snapshot_model.model_id}:free"
+        limits = tokens.get_model_token_limits_from_openrouter(variant)
+        assert limits["max_input"] == snapshot_model.max_input_tokens
+
+    def test_live_limits_take_precedence(self, live_cache, snapshot_model):
+        live_cache[snapshot_model.model_id] = {"max_input": 1234, "max_output": 56}
+        assert tokens.get_model_max_input_tokens(snapshot_model.model_id) == 1234
+        assert tokens.get_model_max_input_tokens(f"{snapshot_model.model_id}:free") == 1234
+
+    def test_unknown_model_uses_defaults(self, live_cache):
+        assert tokens.get_model_token_limits_from_openrouter("nobody/unknown-model") is None
+        assert tokens.get_model_max_input_tokens("nobody/unknown-model") == 8192
+
+
+class TestRefresher:
+    def _run(self, monkeypatch, outcomes):
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+            if len(delays) > len(outcomes):
+                raise asyncio.CancelledError
+
+        results = iter(outcomes)
+        monkeypatch.setattr(tokens.asyncio, "sleep", fake_sleep)
+        monkeypatch.setattr(tokens, "preload_model_token_limits", lambda: next(results))
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(tokens.run_token_limits_refresher(3600, 60))
+        return delays
+
+    def test_interval_after_success_retry_after_failure(self, monkeypatch):
+        delays = self._run(monkeypatch, [False, True, True])
+        assert 0 <= delays[0] <= 5
+        assert delays[1:] == [60, 3600, 3600]
+
+    def test_preload_stores_registry_limits(self, live_cache, monkeypatch, snapshot_model):
+        entry = {"id": snapshot_model.model_id, "context_length": 100_000}
+        monkeypatch.setattr(
+            tokens, "fetch_all_models_from_openrouter", lambda: {snapshot_model.model_id: entry}
+        )
+        version = tokens.get_model_token_limits_version()
+        assert tokens.preload_model_token_limits() is True
+        assert live_cache[snapshot_model.model_id] == extract_token_limits(entry)
+        assert tokens.get_model_token_limits_version() == version + 1
@@ -0,0 +1,176 @@
+"""
+Unit tests for the tokenizer service.
+
+Tests cover:
+- Counts matching direct tiktoken encoding
+- LRU memoization by tokenizer and content, and hit-rate stats
+- Batched history counting that only encodes unseen messages
+- Fallback to the next tokenizer when one rejects a text
+- Background tokenizer loading: no waiting on a request, cl100k stand-in until ready
+"""
+
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+import tiktoken
+
+from app.llm import tokenizers
+from app.llm.tokenizers import (
+    TokenCountCache,
+    TokenizerRegistry,
+    _Encoder,
+    count_tokens,
+    count_tokens_batch,
+)
+from app.llm.tokens import count_conversation_tokens, estimate_token_count
+
+
+class CountingEncoder:
+    """Fake tokenizer: one token per word, records every batch it encodes."""
+
+    def __init__(self, key: str = "fake", reject: str | None = None):
+        self.batches: list[list[str]] = []
+        self.reject = reject
+        self.encoder = _Encoder(key, self.count_batch)
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        self.batches.append(list(texts))
+        if self.reject is not None and any(self.reject in t for t in texts):
+            raise ValueError("rejected")
+        return [len(t.split()) for t in texts]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(tokenizers, "token_count_cache", TokenCountCache(max_entries=8))
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    encoder = CountingEncoder()
+    monkeypatch.setattr(tokenizers, "_encoder_chain", lambda model_id: [encoder.encoder])
+    return encoder
+
+
+class TestCounts:
+    def test_matches_tiktoken(self):
+        text = "Explain quantum computing in simple terms, please."
+        expected = len(tiktoken.get_encoding("cl100k_base").encode(text))
+        assert estimate_token_count(text) == expected
+        assert estimate_token_count(text, model_id="openai/gpt-4o") == len(
+            tiktoken.get_encoding("o200k_base").encode(text)
+        )
+
+    def test_empty_text_is_zero(self, fake):
+        assert count_tokens("", "vendor/x") == 0
+        assert count_tokens_batch(["", "a b"], "vendor/x") == [0, 2]
+        assert fake.batches == [["a b"]]
+
+    def test_conversation_adds_per_message_overhead(self, fake):
+        messages = [{"role": "user", "content": "one two"}, {"role": "assistant", "content": ""}]
+        assert count_conversation_tokens(messages, "vendor/x") == 2 + 4 + 0 + 4
+
+
+class TestMemoization:
+    def test_repeated_text_is_not_reencoded(self, fake):
+        assert count_tokens("alpha beta gamma", "vendor/x") == 3
+        assert count_tokens("alpha beta gamma", "vendor/x") == 3
+        assert fake.batches == [["alpha beta gamma"]]
+        stats = tokenizers.get_token_count_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_follow_up_turn_only_encodes_new_message(self, fake):
+        history = [{"content": "first question"}, {"content": "first answer here"}]
+        count_conversation_tokens(history, "vendor/x")
+        history.append({"content": "second question"})
+        count_conversation_tokens(history, "vendor/x")
+        assert fake.batches == [["first question", "first answer here"], ["second question"]]
+
+    def test_duplicates_in_one_batch_are_encoded_once(self, fake):
+        assert count_tokens_batch(["a b", "c", "a b"], "vendor/x") == [2, 1, 2]
+        assert fake.batches == [["a b", "c"]]
+
+    def test_cache_is_keyed_by_tokenizer(self, monkeypatch):
+        first, second = CountingEncoder("first"), CountingEncoder("second")
+        monkeypatch.setattr(
+            tokenizers,
+            "_encoder_chain",
+            lambda model_id: [(first if model_id == "a/x" else second).encoder],
+        )
+        count_tokens("same text", "a/x")
+        count_tokens("same text", "b/x")
+        assert len(first.batches) == len(second.batches) == 1
+
+    def test_lru_evicts_oldest(self):
+        cache = TokenCountCache(max_entries=2)
+        cache.put(("k", b"1"), 1)
+        cache.put(("k", b"2"), 2)
+        assert cache.get(("k", b"1")) == 1
+        cache.put(("k", b"3"), 3)
+        assert cache.get(("k", b"2")) is None
+        assert cache.get(("k", b"1")) == 1
+        assert cache.stats()["entries"] == 2
+
+
+class TestFallback:
+    def test_rejected_text_falls_back_to_next_tokenizer(self, monkeypatch):
+        primary = CountingEncoder("primary", reject="<bad>")
+        backup = CountingEncoder("backup")
+        monkeypatch.setattr(
+            tokenizers, "_encoder_chain", lambda model_id: [primary.encoder, backup.encoder]
+        )
+        assert count_tokens_batch(["ok text", "<bad> text here"], "vendor/x") == [2, 3]
+        assert backup.batches == [["<bad> text here"]]
+
+    def test_no_tokenizer_uses_length_estimate(self, monkeypatch):
+        monkeypatch.setattr(tokenizers, "_encoder_chain", lambda model_id: [])
+        assert count_tokens("x" * 40, "vendor/x") == 10
+
+
+class TestTokenizerRegistry:
+    def test_get_does_not_wait_for_a_slow_load(self):
+        release = threading.Event()
+        loads = []
+
+        def slow_loader():
+            loads.append(1)
+            release.wait(5)
+            return "tokenizer"
+
+        registry = TokenizerRegistry()
+        assert registry.get("slow", slow_loader) is None
+        assert registry.get("slow", slow_loader) is None
+        assert registry.states() == {"slow": "loading"}
+        # Other tokenizers load while the first one is still busy
+        registry.load("fast", lambda: "other").result(timeout=5)
+        assert registry.get("fast", lambda: "unused") == "other"
+
+        release.set()
+        registry.load("slow", slow_loader).result(timeout=5)
+        assert registry.get("slow", slow_loader) == "tokenizer"
+        assert loads == [1]
+
+    def test_failed_load_is_not_retried(self):
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise OSError("no network")
+
+        registry = TokenizerRegistry()
+        registry.load("broken", broken).result(timeout=5)
+        assert registry.get("broken", broken) is None
+        assert registry.states() == {"broken": "unavailable"}
+        assert calls == [1]
+
+    def test_model_counts_with_cl100k_until_its_tokenizer_is_ready(self, monkeypatch):
+        monkeypatch.setattr(tokenizers, "tokenizer_registry", TokenizerRegistry())
+        monkeypatch.setattr(tokenizers, "_load_huggingface_tokenizer", lambda name: None)
+        chain = tokenizers._encoder_chain("meta-llama/llama-3.3-70b-instruct")
+        assert [encoder.key for encoder in chain] == ["tiktoken:cl100k_base"]
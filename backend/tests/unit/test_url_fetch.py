@@ -0,0 +1,182 @@
+"""
+Unit tests for the fetch_url page cache and text extraction.
+
+Tests cover:
+- Text extraction matching the previous BeautifulSoup output
+- Truncation and early stop of streamed downloads
+- LRU + TTL cache hits, ETag / Last-Modified revalidation
+- Coalescing of concurrent fetches of the same page
+"""
+
+import asyncio
+import re
+
+import httpx
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from bs4 import BeautifulSoup
+
+from app.llm import url_fetch
+from app.llm.streaming import fetch_url_content
+from app.llm.url_fetch import PageCache, _CachedPage, extract_text, normalize_url
+
+PAGE = """<html><head><title>Title</title><style>p {color: red}</style>
+<script>var x = "<p>not text</p>";</script></head>
+<body><header>Site header</header><nav><a href="/">Home</a></nav>
+<main><h1>Heading &amp; more</h1><p>First   paragraph
+ spans lines.</p><div>Caf&eacute; <b>bold</b>text</div></main>
+<aside>Related</aside><footer>Footer</footer></body></html>"""
+
+
+def bs4_text(html: str, max_length: int) -> str:
+    """The extraction fetch_url_content used before the page cache."""
+    soup = BeautifulSoup(html, "html.parser")
+    for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
+        script.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    text = re.sub(r"\s+", " ", text)
+    if len(text) > max_length:
+        text = text[:max_length] + "... [content truncated]"
+    return text.strip()
+
+
+class CountingStream(httpx.AsyncByteStream):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Route the page fetcher to an in-memory handler and start with an empty cache."""
+    requests: list[httpx.Request] = []
+    state = {"handler": lambda request: httpx.Response(200, html=PAGE)}
+
+    def handle(request):
+        requests.append(request)
+        return state["handler"](request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(url_fetch, "_get_client", lambda: client)
+    cache = PageCache(max_entries=2, ttl_seconds=60)
+    monkeypatch.setattr(url_fetch, "page_cache", cache)
+    state["requests"] = requests
+    state["cache"] = cache
+    return state
+
+
+class TestExtraction:
+    def test_matches_previous_extraction(self):
+        assert extract_text(PAGE, 10000) == bs4_text(PAGE, 10000)
+
+    @pytest.mark.parametrize("max_length", [5, 20, 31])
+    def test_truncation_matches_previous_extraction(self, max_length):
+        assert extract_text(PAGE, max_length) == bs4_text(PAGE, max_length)
+
+    def test_plain_text(self):
+        assert extract_text("just  some\ntext", 100) == "just some text"
+
+    def test_normalize_url(self):
+        assert normalize_url("HTTPS://Example.COM:443/Path?q=1#frag") == (
+            "https://example.com/Path?q=1"
+        )
+        assert normalize_url("http://example.com") == "http://example.com/"
+        assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+
+
+class TestPageCache:
+    async def test_second_fetch_served_from_cache(self, server):
+        first = await fetch_url_content("https://example.com/page#top")
+        second = await fetch_url_content("https://EXAMPLE.com/page")
+        assert first == second == bs4_text(PAGE, 10000)
+        assert len(server["requests"]) == 1
+        assert server["cache"].get_stats()["hits"] == 1
+
+    async def test_etag_revalidation(self, server):
+        server["handler"] = lambda request: httpx.Response(
+            200,
+            html=PAGE,
+            headers={"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"},
+        )
+        text = await fetch_url_content("https://example.com/page")
+        key = (normalize_url("https://example.com/page"), 10000)
+        server["cache"].get(key).expires_at = 0
+
+        server["handler"] = lambda request: httpx.Response(304)
+        assert await fetch_url_content("https://example.com/page") == text
+
+        conditional = server["requests"][-1]
+        assert conditional.headers["If-None-Match"] == '"v1"'
+        assert conditional.headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+        assert server["cache"].get(key).expires_at > 0
+        assert server["cache"].get_stats()["revalidations"] == 1
+
+    async def test_expired_entry_without_validators_is_refetched(self, server):
+        await fetch_url_content("https://example.com/page")
+        key = (normalize_url("https://example.com/page"), 10000)
+        server["cache"].get(key).expires_at = 0
+        await fetch_url_content("https://example.com/page")
+        assert len(server["requests"]) == 2
+        assert "If-None-Match" not in server["requests"][-1].headers
+
+    async def test_no_store_not_cached(self, server):
+        server["handler"] = lambda request: httpx.Response(
+            200, html=PAGE, headers={"Cache-Control": "no-store"}
+        )
+        await fetch_url_content("https://example.com/page")
+        await fetch_url_content("https://example.com/page")
+        assert len(server["requests"]) == 2
+
+    async def test_lru_eviction(self, server):
+        for path in ("a", "b", "a", "c"):
+            await fetch_url_content(f"https://example.com/{path}")
+        # "b" was least recently used when "c" was added to the 2-entry cache
+        await fetch_url_content("https://example.com/b")
+        assert [r.url.path for r in server["requests"]] == ["/a", "/b", "/c", "/b"]
+
+    async def test_concurrent_fetches_share_one_download(self, server):
+        async def slow(request):
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, html=PAGE)
+
+        server["handler"] = slow
+        results = await asyncio.gather(
+            *(fetch_url_content("https://example.com/shared") for _ in range(3))
+        )
+        assert len(set(results)) == 1
+        assert len(server["requests"]) == 1
+
+    async def test_http_error_not_cached(self, server):
+        server["handler"] = lambda request: httpx.Response(404)
+        with pytest.raises(Exception, match="HTTP error 404"):
+            await fetch_url_content("https://example.com/missing")
+        assert server["cache"].get_stats()["entries"] == 0
+
+
+class TestBoundedDownload:
+    async def test_stops_once_enough_text(self, server):
+        stream = CountingStream([b"<p>" + b"word " * 1000 + b"</p>"] * 50)
+        server["handler"] = lambda request: httpx.Response(200, stream=stream)
+        text = await fetch_url_content("https://example.com/long", max_length=100)
+        assert text.endswith("... [content truncated]")
+        assert stream.sent < 50
+
+    async def test_download_capped(self, server, monkeypatch):
+        monkeypatch.setattr(url_fetch.settings, "fetch_url_max_bytes", 10)
+        stream = CountingStream([b"0123456789abcdef", b"more"])
+        server["handler"] = lambda request: httpx.Response(200, stream=stream)
+        assert await fetch_url_content("https://example.com/big") == "0123456789"
+        assert stream.sent == 1
+
+
+def test_cached_page_revalidatable():
+    assert not _CachedPage(text="", expires_at=0).revalidatable
+    assert _CachedPage(text="", expires_at=0, etag='"x"').revalidatable
@@ -0,0 +1,174 @@
+"""
+Unit tests for the cached user snapshots used to authenticate requests.
+
+Tests cover:
+- Snapshot cache: expiry, eviction, version stamps refusing rows loaded before an update
+- Snapshots dropped by ORM updates of the user (flush and commit)
+- Authenticated requests after the first running no users query
+- last_access accesses coalesced per user and written in one UPDATE
+"""
+
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from sqlalchemy import event
+
+import app.database
+from app import dependencies
+from app.cache import UserSnapshotCache, invalidate_user_cache, user_cache
+from app.models import User
+from app.services.last_access import LastAccessRecorder, write_accesses
+from tests.factories import create_free_user
+
+
+class TestUserSnapshotCache:
+    def test_put_and_get(self):
+        cache = UserSnapshotCache()
+        cache.put(1, "snapshot", cache.version(1))
+        assert cache.get(1) == "snapshot"
+
+    def test_entries_expire(self):
+        cache = UserSnapshotCache(ttl_seconds=0.01)
+        cache.put(1, "snapshot", cache.version(1))
+        time.sleep(0.02)
+        assert cache.get(1) is None
+
+    def test_disabled_with_zero_ttl(self):
+        cache = UserSnapshotCache(ttl_seconds=0)
+        cache.put(1, "snapshot", cache.version(1))
+        assert cache.get(1) is None
+
+    def test_oldest_entry_evicted(self):
+        cache = UserSnapshotCache(max_entries=2)
+        for user_id in (1, 2, 3):
+            cache.put(user_id, f"user {user_id}", cache.version(user_id))
+        assert cache.get(1) is None
+        assert cache.get(3) == "user 3"
+
+    def test_load_older_than_invalidation_not_cached(self):
+        cache = UserSnapshotCache()
+        version = cache.version(1)
+        cache.invalidate(1)  # The row changed while it was being loaded
+        cache.put(1, "old row", version)
+        assert cache.get(1) is None
+
+
+class TestInvalidation:
+    def test_orm_update_drops_snapshot(self, db_session):
+        user = create_free_user(db_session)
+        user_cache.put(user.id, "snapshot", user_cache.version(user.id))
+
+        user.subscription_tier = "pro"
+        db_session.commit()
+        assert user_cache.get(user.id) is None
+
+    def test_snapshot_loaded_before_commit_refused(self, db_session):
+        user = create_free_user(db_session)
+        user.credits_used_this_period = 5
+        db_session.flush()
+
+        version = user_cache.version(user.id)  # A load seeing the uncommitted update's old row
+        db_session.commit()
+        user_cache.put(user.id, "old row", version)
+        assert user_cache.get(user.id) is None
+
+
+class TestCurrentUserFromCache:
+    @pytest.fixture
+    def users_queries(self):
+        engine = app.database.AsyncSessionLocal.kw["bind"].sync_engine
+        statements: list[str] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if "FROM users" in statement:
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", capture)
+        yield statements
+        event.remove(engine, "before_cursor_execute", capture)
+
+    def test_repeat_requests_skip_the_users_query(self, authenticated_client, users_queries):
+        client, _, _, _ = authenticated_client
+        assert client.get("/api/conversations").status_code == 200
+        assert len(users_queries) == 1
+
+        assert client.get("/api/conversations").status_code == 200
+        assert client.get("/api/conversations").status_code == 200
+        assert len(users_queries) == 1
+
+    def test_changed_user_reloaded(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        assert client.get("/api/conversations").status_code == 200
+
+        user.is_active = False
+        db_session.commit()
+        assert client.get("/api/conversations").status_code == 401
+
+    def test_explicit_invalidation(self, authenticated_client, db_session):
+        client, user, _, _ = authenticated_client
+        assert client.get("/api/conversations").status_code == 200
+
+        # Written around the ORM, so only the explicit invalidation drops the snapshot
+        db_session.execute(
+            User.__table__.update().where(User.__table__.c.id == user.id).values(is_active=False)
+        )
+        db_session.commit()
+        assert client.get("/api/conversations").status_code == 200
+        invalidate_user_cache(user.id)
+        assert client.get("/api/conversations").status_code == 401
+
+
+class TestLastAccess:
+    def test_accesses_coalesced_per_user(self):
+        recorder = LastAccessRecorder(min_interval=60)
+        stale = datetime.now(UTC) - timedelta(hours=1)
+        recorder.touch(1, stale)
+        recorder.touch(1, stale)
+        recorder.touch(2, None)
+        assert sorted(recorder.take()) == [1, 2]
+
+        recorder.touch(1, stale)  # Recorded within the last minute
+        assert recorder.take() == {}
+
+    def test_recent_last_access_not_recorded(self):
+        recorder = LastAccessRecorder(min_interval=60)
+        recorder.touch(1, datetime.now(UTC).replace(tzinfo=None))
+        assert recorder.take() == {}
+
+    def test_written_in_one_update(self, db_session):
+        users = [create_free_user(db_session) for _ in range(3)]
+        at = datetime(2026, 7, 1, 12, 0)
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            write_accesses(db_session, {user.id: at for user in users})
+            db_session.commit()
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        assert len([s for s in statements if s.startswith("UPDATE users")]) == 1
+        for user in users:
+            db_session.refresh(user)
+            assert user.last_access == at
+
+    def test_request_records_without_writing(self, authenticated_client, db_session, monkeypatch):
+        client, user, _, _ = authenticated_client
+        recorder = LastAccessRecorder()
+        monkeypatch.setattr(dependencies, "last_access_recorder", recorder)
+        user.last_access = datetime.now(UTC) - timedelta(hours=1)
+        db_session.commit()
+
+        assert client.get("/api/conversations").status_code == 200
+        db_session.refresh(user)
+        assert datetime.now(UTC) - user.last_access.replace(tzinfo=UTC) > timedelta(minutes=59)
+        assert list(recorder.take()) == [user.id]
@@ -0,0 +1,222 @@
+"""
+Unit tests for the post-stream write-behind queue.
+
+Tests cover:
+- Writes from many comparisons committed in one transaction
+- Batch size and latency bounds
+- A rejected write dropped without losing the rest of its batch
+- Transient database errors retried
+- Draining on stop, and writes without a running worker kept off the event loop
+- Awaited writes resolved once their batch is committed
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.models import UsageLog
+from app.services import write_behind
+from app.services.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def make_queue(db_session):
+    factory = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+
+    def make(**kwargs):
+        return WriteBehindQueue(factory, **kwargs)
+
+    return make
+
+
+def log_job(ip: str):
+    def job(db):
+        db.add(UsageLog(ip_address=ip, models_used=json.dumps(["a/model"])))
+
+    return job
+
+
+def logged_ips(db_session) -> list[str]:
+    db_session.expire_all()
+    return sorted(ip for (ip,) in db_session.query(UsageLog.ip_address))
+
+
+class TestBatching:
+    async def test_writes_share_one_transaction(self, make_queue, db_session):
+        queue = make_queue(max_delay=0.5)
+        await queue.start()
+        for i in range(20):
+            queue.submit(f"log {i}", log_job(f"10.0.0.{i}"))
+        assert queue.stats()["depth"] == 20
+        await queue.stop()
+
+        assert len(logged_ips(db_session)) == 20
+        stats = queue.stats()
+        assert stats["batches"] == 1
+        assert stats["written"] == 20
+        assert stats["depth"] == 0
+        assert stats["peak_depth"] == 20
+
+    async def test_batch_size_bounded(self, make_queue, db_session):
+        queue = make_queue(max_batch=8, max_delay=0.5)
+        await queue.start()
+        for i in range(20):
+            queue.submit(f"log {i}", log_job(f"10.0.0.{i}"))
+        await queue.stop()
+
+        assert len(logged_ips(db_session)) == 20
+        assert queue.stats()["batches"] == 3
+
+    async def test_written_within_max_delay(self, make_queue, db_session):
+        queue = make_queue(max_delay=0.05)
+        await queue.start()
+        try:
+            queue.submit("log", log_job("10.0.0.1"))
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if queue.stats()["written"]:
+                    break
+            assert logged_ips(db_session) == ["10.0.0.1"]
+            assert queue.running
+        finally:
+            await queue.stop()
+
+
+class TestFailures:
+    async def test_rejected_write_dropped_alone(self, make_queue, db_session):
+        def broken(db):
+            db.add(UsageLog(ip_address="10.0.0.9", models_used="[]"))
+            raise ValueError("bad data")
+
+        queue = make_queue(max_delay=0.5)
+        await queue.start()
+        queue.submit("log 1", log_job("10.0.0.1"))
+        queue.submit("broken", broken)
+        queue.submit("log 2", log_job("10.0.0.2"))
+        await queue.stop()
+
+        assert logged_ips(db_session) == ["10.0.0.1", "10.0.0.2"]
+        assert queue.stats()["failed"] == 1
+        assert queue.stats()["written"] == 2
+
+    def test_transient_error_retried(self, make_queue, db_session, monkeypatch):
+        monkeypatch.setattr(write_behind, "_RETRY_BACKOFF_SECONDS", 0)
+        calls = []
+
+        def flaky(db):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError("INSERT", {}, Exception("database is locked"))
+            log_job("10.0.0.1")(db)
+
+        queue = make_queue(max_attempts=3)
+        queue.submit("flaky", flaky)
+
+        assert logged_ips(db_session) == ["10.0.0.1"]
+        assert queue.stats()["retries"] == 1
+
+    async def test_gives_up_after_max_attempts(self, make_queue, db_session, monkeypatch):
+        monkeypatch.setattr(write_behind, "_RETRY_BACKOFF_SECONDS", 0)
+
+        def locked(db):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+        queue = make_queue(max_attempts=2, max_delay=0.5)
+        await queue.start()
+        queue.submit("log", log_job("10.0.0.1"))
+        queue.submit("locked", locked)
+        await queue.stop()
+
+        assert logged_ips(db_session) == []
+        assert queue.stats()["failed"] == 2
+        assert queue.stats()["retries"] == 1
+
+
+class TestAwaitedWrites:
+    async def test_resolved_after_commit(self, make_queue, db_session):
+        queue = make_queue(max_delay=0.05)
+        await queue.start()
+        try:
+            queue.submit("log 1", log_job("10.0.0.1"))
+            written = await asyncio.wait_for(queue.write("log 2", log_job("10.0.0.2")), 5)
+
+            assert written
+            assert logged_ips(db_session) == ["10.0.0.1", "10.0.0.2"]
+        finally:
+            await queue.stop()
+
+    async def test_rejected_write_reported(self, make_queue, db_session):
+        def broken(db):
+            raise ValueError("bad data")
+
+        queue = make_queue(max_delay=0.05)
+        await queue.start()
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    queue.write("log", log_job("10.0.0.1")), queue.write("broken", broken)
+                ),
+                5,
+            )
+
+            assert results == [True, False]
+            assert queue.stats()["batches"] == 1
+        finally:
+            await queue.stop()
+
+    async def test_without_worker(self, make_queue, db_session):
+        queue = make_queue()
+
+        assert await queue.write("log", log_job("10.0.0.1"))
+        assert logged_ips(db_session) == ["10.0.0.1"]
+
+
+class TestLifecycle:
+    async def test_stop_drains_queue(self, make_queue, db_session):
+        queue = make_queue(max_delay=30)
+        await queue.start()
+        queue.submit("log", log_job("10.0.0.1"))
+        await asyncio.wait_for(queue.stop(), 5)
+
+        assert logged_ips(db_session) == ["10.0.0.1"]
+        assert not queue.running
+
+    def test_writes_synchronously_without_worker(self, make_queue, db_session):
+        queue = make_queue()
+        queue.submit("log", log_job("10.0.0.1"))
+
+        assert logged_ips(db_session) == ["10.0.0.1"]
+        assert queue.stats()["depth"] == 0
+
+    async def test_writes_in_threadpool_without_worker_on_event_loop(self, make_queue, db_session):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def job(db):
+            threads.append(threading.get_ident())
+            log_job("10.0.0.1")(db)
+
+        queue = make_queue()
+        queue.submit("log", job)
+        await asyncio.wait_for(queue.stop(), 5)
+
+        assert logged_ips(db_session) == ["10.0.0.1"]
+        assert threads and threads[0] != loop_thread
+
+    async def test_restarts_after_stop(self, make_queue, db_session):
+        queue = make_queue(max_delay=0)
+        await queue.start()
+        await queue.stop()
+        await queue.start()
+        queue.submit("log", log_job("10.0.0.1"))
+        await queue.stop()
+
+        assert logged_ips(db_session) == ["10.0.0.1"]
@@ -24,6 +24,7 @@ import {
   deleteConversationAttachments,
   externalizeImageAttachmentsForStorage,
 } from '../utils/conversationAttachmentStore'
+import { summaryPromptMatches } from '../utils/format'
 import logger from '../utils/logger'
 
 export interface UseConversationHistoryOptions {
@@ -627,8 +628,12 @@ export function useConversationHistory({
           const modelsMatch =
             JSON.stringify(normalizedSummaryModels) === JSON.stringify(normalizedSelectedModels)
 
-          // Compare input data (exact match required)
-          const inputMatches = summary.input_data === inputData
+          // Compare input data (exact match, or prefix of a previewed long prompt)
+          const inputMatches = summaryPromptMatches(
+            inputData,
+            summary.input_data,
+            summary.input_truncated
+          )
 
           return modelsMatch && inputMatches
         })
@@ -10,7 +10,7 @@ import { useEffect, useRef } from 'react'
 
 import type { ConversationSummary, ModelConversation } from '../types'
 import { RESULT_TAB, createModelId } from '../types'
-import { getSafeId } from '../utils'
+import { getSafeId, summaryPromptMatches } from '../utils'
 import { landOnFollowUpComposerAfterTutorial } from '../utils/tutorialPositioning'
 
 import type { TutorialState } from './useTutorialComplete'
@@ -217,7 +217,11 @@ export function useMainPageEffects(config: UseMainPageEffectsConfig) {
           const modelsMatch =
             JSON.stringify([...current.models_used].sort()) ===
             JSON.stringify([...selectedModels].sort())
-          const inputMatch = current.input_data === firstUserMessage.content
+          const inputMatch = summaryPromptMatches(
+            firstUserMessage.content,
+            current.input_data,
+            current.input_truncated
+          )
           if (modelsMatch && inputMatch) return
         }
       }
@@ -225,7 +229,11 @@ export function useMainPageEffects(config: UseMainPageEffectsConfig) {
       const matching = conversationHistory.find(s => {
         const modelsMatch =
           JSON.stringify([...s.models_used].sort()) === JSON.stringify([...selectedModels].sort())
-        const inputMatch = s.input_data === firstUserMessage.content
+        const inputMatch = summaryPromptMatches(
+          firstUserMessage.content,
+          s.input_data,
+          s.input_truncated
+        )
         return modelsMatch && inputMatch
       })
 
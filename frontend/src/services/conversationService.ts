@@ -50,6 +50,8 @@ export interface ConversationMessage {
   created_at: string
   /** Generated image URLs (for image-generation model responses) */
   images?: string[]
+  /** Thumbnail URL of each generated image, in the order of `images` */
+  image_thumbnails?: (string | null)[]
 }
 
 /**
@@ -86,7 +88,34 @@ export async function getConversation(conversationId: ConversationId): Promise<C
     enableCache: false,
     retry: false,
   })
-  return response.data
+  const data = response.data
+  if (data.file_contents?.length) {
+    data.file_contents = await Promise.all(data.file_contents.map(fetchAttachmentBlob))
+  }
+  return data
+}
+
+function blobToBase64(blob: Blob): Promise<string> {
+  return new Promise((resolve, reject) => {
+    const reader = new FileReader()
+    reader.onload = () => resolve(String(reader.result).split(',', 2)[1] || '')
+    reader.onerror = () => reject(reader.error)
+    reader.readAsDataURL(blob)
+  })
+}
+
+/** Inline the bytes of an attachment the server returned as a blob store reference. */
+async function fetchAttachmentBlob(
+  record: StoredFileContentRecord
+): Promise<StoredFileContentRecord> {
+  if (record.base64_data || !record.blob_key) return record
+  try {
+    const response = await apiClient.get<Blob>(`/attachments/${record.blob_key}`, { retry: false })
+    return { ...record, base64_data: await blobToBase64(response.data) }
+  } catch {
+    // The conversation still loads; only this attachment is left out of follow-ups
+    return record
+  }
 }
 
 /**
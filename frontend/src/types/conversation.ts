@@ -97,8 +97,10 @@ export type ConversationType = (typeof CONVERSATION_TYPE)[keyof typeof CONVERSAT
 export interface ConversationSummary {
   /** Unique identifier for the conversation */
   id: ConversationId
-  /** Initial input data for the conversation */
+  /** Initial input data for the conversation (a preview when input_truncated) */
   input_data: string
+  /** Whether input_data is a preview of a longer prompt (API history list) */
+  input_truncated?: boolean
   /** Array of model IDs used in this conversation */
   models_used: ModelId[]
   /** Type of conversation: 'comparison' or 'breakout' */
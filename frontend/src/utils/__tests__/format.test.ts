@@ -9,6 +9,7 @@ import {
   formatTime,
   formatNumber,
   truncatePrompt,
+  summaryPromptMatches,
   formatConversationMessage,
 } from '../format'
 
@@ -124,6 +125,19 @@ describe('format utilities', () => {
     })
   })
 
+  describe('summaryPromptMatches', () => {
+    it('should require an exact match for untruncated summaries', () => {
+      expect(summaryPromptMatches('Hello', 'Hello')).toBe(true)
+      expect(summaryPromptMatches('Hello world', 'Hello')).toBe(false)
+    })
+
+    it('should match a previewed long prompt by prefix', () => {
+      const prompt = 'a'.repeat(300)
+      expect(summaryPromptMatches(prompt, prompt.slice(0, 200), true)).toBe(true)
+      expect(summaryPromptMatches('b' + prompt, prompt.slice(0, 200), true)).toBe(false)
+    })
+  })
+
   describe('formatConversationMessage', () => {
     it('should format user message correctly', () => {
       const result = formatConversationMessage('user', 'Hello world', '2025-01-15T12:00:00Z')
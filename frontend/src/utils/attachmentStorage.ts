@@ -9,6 +9,8 @@ export interface StoredFileContentRecord {
   base64_data?: string
   /** Present when image bytes are stored in IndexedDB instead of inline JSON. */
   attachment_ref?: string
+  /** Present when image bytes are in the server blob store (`GET /attachments/{blob_key}`). */
+  blob_key?: string | null
 }
 
 export function isImageStoredRecord(record: StoredFileContentRecord): boolean {
@@ -116,6 +116,30 @@ export function truncatePrompt(text: string, maxLength: number = 60): string {
   return text.substring(0, maxLength) + '...'
 }
 
+/**
+ * Whether a history summary's prompt is the given prompt. Summaries of long prompts carry
+ * only a preview (flagged input_truncated), which must be a prefix of the prompt.
+ *
+ * @param prompt - The full prompt to look for
+ * @param preview - The summary's input_data
+ * @param truncated - The summary's input_truncated flag
+ * @returns True if the summary is of this prompt
+ *
+ * @example
+ * ```typescript
+ * summaryPromptMatches('Hello', 'Hello'); // true
+ * summaryPromptMatches('Hello world', 'Hello', true); // true
+ * summaryPromptMatches('Hello world', 'Hello'); // false
+ * ```
+ */
+export function summaryPromptMatches(
+  prompt: string,
+  preview: string,
+  truncated: boolean = false
+): boolean {
+  return truncated ? prompt.startsWith(preview) : prompt === preview
+}
+
 /**
  * Format a conversation message for display with timestamp.
  *
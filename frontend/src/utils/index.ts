@@ -29,6 +29,7 @@ export {
   formatTime,
   formatNumber,
   truncatePrompt,
+  summaryPromptMatches,
   formatConversationMessage,
 } from './format'
 
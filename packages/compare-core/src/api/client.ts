@@ -115,6 +115,16 @@ export class CompareIntelApiClient {
     return res.json() as Promise<T>
   }
 
+  /** Absolute URL for a server-relative one, such as a generated image's `/api/attachments/…`. */
+  resolveUrl(url: string): string {
+    if (!url.startsWith('/') || url.startsWith('//')) return url
+    try {
+      return new URL(url, this.config.baseUrl).toString()
+    } catch {
+      return url
+    }
+  }
+
   async *stream(path: string, body: unknown): AsyncGenerator<string> {
     const payload = {
       ...body,
@@ -196,7 +196,8 @@ export function useComparisonPage(options: UseComparisonPageOptions) {
             }
 
             if (event.type === 'image' && typeof event.url === 'string') {
-              return { ...r, content: r.content + `\n![generated image](${event.url})\n` }
+              const url = apiClient.resolveUrl(event.url)
+              return { ...r, content: r.content + `\n![generated image](${url})\n` }
             }
 
             if (event.type === 'done') {